@@ -11,6 +11,7 @@ import numpy as np
 import pandas
 
 # Torch related stuff
+import torch
 import torch.utils.data as data
 
 
@@ -89,7 +90,7 @@ class Bidimensional(data.Dataset):
         self.target_transform = target_transform
 
         # Read data from the csv file
-        self.data = pandas.read_csv(self.path).as_matrix()
+        self.data = pandas.read_csv(self.path).values
 
         # Shuffle the data once (otherwise you get clusters of samples of same class in each minibatch for val and test)
         np.random.shuffle(self.data)
@@ -139,3 +140,86 @@ class Bidimensional(data.Dataset):
 
     def __len__(self):
         return len(self.data)
+
+    def normalized_tensors(self, mean, std):
+        """
+        Applies to all the points at once what __getitem__() does to each point with the transform of
+        template.setup.set_up_dataloaders(): scale into [0;255] and normalize. ToTensor() does not divide the
+        points by 255 as they are not uint8 images, hence they are normalized in the range [0;255].
+
+        Parameters
+        ----------
+        mean : ndarray[double]
+        std : ndarray[double]
+            Mean and std given to the Normalize() transform
+
+        Returns
+        -------
+        points : FloatTensor [N x 2 x 1 x 1]
+        targets : LongTensor [N]
+        """
+        points = np.divide((self.data[:, :2] - self.min_coords), np.subtract(self.max_coords, self.min_coords)) * 255
+        points = (points - np.asarray(mean)) / np.asarray(std)
+        points = torch.from_numpy(points.astype(np.float32)).view(-1, 2, 1, 1)
+        targets = torch.from_numpy(self.data[:, 2].astype(np.int64))
+        return points, targets
+
+
+class BatchedLoader(object):
+    """
+    Stands in for the DataLoader of a Bidimensional dataset.
+
+    A split of points is a few KB: it is normalized once into a single tensor (see
+    Bidimensional.normalized_tensors()) and each mini-batch is a slice of it, taken in the order of a permutation of
+    the indexes when shuffling. There is no per-sample Python code and no worker process.
+
+    Attributes
+    ----------
+    dataset : Bidimensional
+        The split (for its classes)
+    sampler : torch.utils.data.distributed.DistributedSampler or None
+        Sampler giving the indexes of this process, if distributed
+    """
+
+    def __init__(self, dataset, tensors, batch_size, shuffle=False, sampler=None):
+        """
+        Parameters
+        ----------
+        dataset : Bidimensional
+            The split
+        tensors : (FloatTensor, LongTensor)
+            The points and targets of the split, see Bidimensional.normalized_tensors()
+        batch_size : int
+            Number of points in a mini-batch
+        shuffle : bool
+            Iterate the points in a different random order every epoch
+        sampler : torch.utils.data.distributed.DistributedSampler or None
+            If given, the points are taken in the order of its indexes (shuffle is then ignored)
+        """
+        self.dataset = dataset
+        self.points, self.targets = tensors
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.sampler = sampler
+
+    def _order(self):
+        """Indexes of the points of this epoch, None for all of them in order"""
+        if self.sampler is not None:
+            return torch.as_tensor(list(self.sampler), dtype=torch.int64)
+        if self.shuffle:
+            return torch.randperm(len(self.targets))
+        return None
+
+    def __iter__(self):
+        order = self._order()
+        num_points = len(self.targets) if order is None else len(order)
+        for start in range(0, num_points, self.batch_size):
+            if order is None:
+                yield self.points[start:start + self.batch_size], self.targets[start:start + self.batch_size]
+            else:
+                index = order[start:start + self.batch_size]
+                yield self.points[index], self.targets[index]
+
+    def __len__(self):
+        num_points = len(self.targets) if self.sampler is None else len(self.sampler)
+        return int(np.ceil(num_points / self.batch_size))
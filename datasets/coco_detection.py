@@ -1,13 +1,19 @@
 import torch.utils.data as data
 from PIL import Image
+import hashlib
+import json
+import math
 import os
 import os.path
+from collections import defaultdict
 import numpy as np
 import cv2
 
 import torch
 
+from datasets.reduced_decode import load_image, reduce_mask
 from datasets.transform_library import functional
+from util.atomic_file import atomic_path
 
 class CocoDetection(data.Dataset):
     """
@@ -22,16 +28,25 @@ class CocoDetection(data.Dataset):
             and returns a transformed version. E.g, ``transforms.ToTensor``
         target_transform (callable, optional): A function/transform that takes in the
             target and transforms it.
+        mask_cache_folder (string, optional): Folder where the rasterized annotation masks are
+            cached. If None, the masks are rasterized on every access.
+        pad_to_batch_max (bool, optional): If True, images and masks are returned without padding
+            and the padding is done by ``pad_collate`` to the largest image of the mini-batch.
+        decode_scale (int, optional): The images are decoded at 1/decode_scale of their resolution (1, 2, 4 or 8)
+            and the masks are reduced with nearest neighbour, see datasets.reduced_decode.
     """
 
-    def __init__(self, root, annFile, resize_coco=False, name_onehotindex=None, category_id_name=None, **kwargs):
+    def __init__(self, root, annFile, resize_coco=False, name_onehotindex=None, category_id_name=None,
+                 mask_cache_folder=None, pad_to_batch_max=False, decode_scale=1, **kwargs):
         from pycocotools.coco import COCO
         self.root = root
         self.coco = COCO(annFile)
         self.ids = list(self.coco.imgs.keys())
         self.resize_coco = resize_coco
+        self.decode_scale = decode_scale
         self.img_size = max([item for sublist in [[img['height'], img['width']] for img in self.coco.dataset['images']] for item
          in sublist])
+        self.img_size = int(math.ceil(self.img_size / decode_scale))
         if not name_onehotindex:
             self.name_onehotindex = {d['name']: i + 1 for i, d in enumerate(self.coco.dataset['categories'])}
             self.name_onehotindex['background'] = 0
@@ -42,6 +57,56 @@ class CocoDetection(data.Dataset):
         else:
             self.category_id_name = category_id_name
 
+        # Padding to the batch maximum makes no sense if all images are resized to the same size anyway
+        self.pad_to_batch_max = pad_to_batch_max and not resize_coco
+
+        self.mask_cache = None
+        if mask_cache_folder is not None:
+            self.mask_cache = MaskCache(mask_cache_folder, annFile, self.name_onehotindex, self.category_id_name)
+
+    def get_mask(self, img_id):
+        """
+        Get the argmax ground truth mask of an image, rasterizing its annotations only if the
+        mask is not yet in the cache.
+
+        Parameters
+        ----------
+        img_id : int
+            COCO id of the image
+
+        Returns
+        -------
+        numpy.ndarray of size [H x W] and type uint8
+            argmax of the classes
+        """
+        if self.mask_cache is not None:
+            mask = self.mask_cache.get(img_id)
+            if mask is not None:
+                return mask
+
+        img_info = self.coco.loadImgs(img_id)[0]
+        target = self.coco.loadAnns(self.coco.getAnnIds(imgIds=img_id))
+        mask = np.array(functional.annotation_to_argmax((img_info['height'], img_info['width']), target,
+                                                        self.name_onehotindex, self.category_id_name)).astype('uint8')
+
+        if self.mask_cache is not None:
+            self.mask_cache.put(img_id, mask)
+        return mask
+
+    def get_image_sizes(self):
+        """
+        Returns the (height, width) of every image of the dataset as read from the annotation file,
+        i.e. without opening any image.
+
+        Returns
+        -------
+        numpy.ndarray of size [N x 2]
+            Height and width of every image (once decoded), in the same order as the dataset indexes
+        """
+        sizes = np.array([[self.coco.imgs[img_id]['height'], self.coco.imgs[img_id]['width']] for img_id in self.ids])
+        # ceil(size / decode_scale)
+        return -(-sizes // self.decode_scale)
+
     def __getitem__(self, index):
         """
         Args:
@@ -54,12 +119,17 @@ class CocoDetection(data.Dataset):
         resize_coco = self.resize_coco
         coco = self.coco
         img_id = self.ids[index]
-        ann_ids = coco.getAnnIds(imgIds=img_id)
-        target = coco.loadAnns(ann_ids)
 
         path = coco.loadImgs(img_id)[0]['file_name']
 
-        img = Image.open(os.path.join(self.root, path)).convert('RGB')
+        img = load_image(os.path.join(self.root, path), self.decode_scale)
+
+        # convert the annotations to argmax (or read them from the cache, at full resolution)
+        target = reduce_mask(self.get_mask(img_id), self.decode_scale)
+
+        # The padding is done in pad_collate() to the largest image of the mini-batch
+        if self.pad_to_batch_max:
+            return functional.to_tensor(img), torch.LongTensor(target.astype(np.int64))
 
         # determine the padding
         top = (self.img_size-img.height)//2
@@ -70,9 +140,8 @@ class CocoDetection(data.Dataset):
 
         size = (resize_coco, resize_coco)
 
-        # convert the annotations to argmax and pad to make quadratic
-        target = functional.annotation_to_argmax((img.height, img.width), target, self.name_onehotindex, self.category_id_name)
-        target = np.array(functional.pad(Image.fromarray(np.array(target).astype('uint8')), padding))
+        # pad to make quadratic
+        target = np.array(functional.pad(Image.fromarray(target), padding))
         if resize_coco:
             target = torch.LongTensor(cv2.resize(target, dsize=size, interpolation=cv2.INTER_NEAREST))
         else:
@@ -88,3 +157,148 @@ class CocoDetection(data.Dataset):
 
     def __len__(self):
         return len(self.ids)
+
+
+class MaskCache(object):
+    """
+    Stores the rasterized annotation masks of a COCO split as single channel uint8 PNG files, keyed by image id.
+
+    The masks depend on the annotation file and on the class mapping, therefore the files are stored in a
+    sub-folder whose name is a signature of both. Whenever one of them changes, a fresh cache is used.
+
+    Attributes
+    ----------
+    folder : string
+        Folder in which the mask files of this annotation file and class mapping are stored
+    """
+
+    def __init__(self, cache_folder, annFile, name_onehotindex, category_id_name):
+        """
+        Parameters
+        ----------
+        cache_folder : string
+            Root folder of the cache
+        annFile : string
+            Path to json annotation file the masks are rasterized from
+        name_onehotindex : dict
+            encodes the name and id for every class with the corresponding argmax number
+        category_id_name : dict
+            encodes the category id and the corresponding class name
+        """
+        stat = os.stat(annFile)
+        signature = json.dumps([os.path.basename(annFile), stat.st_size, int(stat.st_mtime),
+                                sorted(name_onehotindex.items()),
+                                sorted((int(k), v) for k, v in category_id_name.items())])
+        self.folder = os.path.join(cache_folder, hashlib.sha1(signature.encode('utf-8')).hexdigest()[:16])
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, img_id):
+        return os.path.join(self.folder, '{}.png'.format(img_id))
+
+    def get(self, img_id):
+        """
+        Returns the cached mask of the image or None if it is not in the cache yet.
+        """
+        path = self._path(img_id)
+        if not os.path.exists(path):
+            return None
+        return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+    def put(self, img_id, mask):
+        """
+        Writes the mask in the cache. The file is written to a temporary file and then renamed such that
+        concurrent dataloader workers never read a partially written mask.
+        """
+        with atomic_path(self._path(img_id)) as tmp_path:
+            cv2.imwrite(tmp_path, mask)
+
+
+class AspectRatioBatchSampler(data.Sampler):
+    """
+    Batch sampler which only puts images of similar aspect ratio and size in the same mini-batch.
+    Used together with ``pad_collate`` the images are only padded to the largest image of the mini-batch
+    instead of the largest image of the whole dataset.
+
+    Images are assigned to a bucket given by their aspect ratio and by the quantile of their size.
+    Mini-batches are then filled with the indexes of the same bucket in (shuffled) order.
+    """
+
+    def __init__(self, image_sizes, batch_size, shuffle=True, drop_last=False,
+                 aspect_ratio_bins=(0.5, 0.75, 1.0, 1.33, 2.0), size_buckets=4):
+        """
+        Parameters
+        ----------
+        image_sizes : numpy.ndarray of size [N x 2]
+            Height and width of every image of the dataset (see CocoDetection.get_image_sizes())
+        batch_size : int
+            Number of images per mini-batch
+        shuffle : bool
+            Iterate the images of each bucket in random order
+        drop_last : bool
+            Drop the last incomplete mini-batch of every bucket
+        aspect_ratio_bins : tuple of float
+            Boundaries (width / height) of the aspect ratio buckets
+        size_buckets : int
+            Number of quantiles of the image area used to further split the aspect ratio buckets
+        """
+        image_sizes = np.asarray(image_sizes, dtype=np.float64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        aspect_ratio_ids = np.digitize(image_sizes[:, 1] / image_sizes[:, 0], aspect_ratio_bins)
+        areas = image_sizes[:, 0] * image_sizes[:, 1]
+        size_bins = np.unique(np.percentile(areas, np.linspace(0, 100, size_buckets + 1)[1:-1]))
+        size_ids = np.digitize(areas, size_bins)
+        self.bucket_ids = aspect_ratio_ids * (len(size_bins) + 1) + size_ids
+
+    def __iter__(self):
+        order = torch.randperm(len(self.bucket_ids)).tolist() if self.shuffle else range(len(self.bucket_ids))
+        buckets = defaultdict(list)
+        for idx in order:
+            bucket = buckets[self.bucket_ids[idx]]
+            bucket.append(idx)
+            if len(bucket) == self.batch_size:
+                yield list(bucket)
+                del bucket[:]
+        # The remaining incomplete mini-batches
+        if not self.drop_last:
+            for bucket in buckets.values():
+                if len(bucket) > 0:
+                    yield list(bucket)
+
+    def __len__(self):
+        counts = np.bincount(self.bucket_ids)
+        counts = counts[counts > 0]
+        if self.drop_last:
+            return int(np.sum(counts // self.batch_size))
+        return int(np.sum(np.ceil(counts / self.batch_size)))
+
+
+def pad_collate(batch):
+    """
+    Collates a list of (image, target) pairs of different sizes in a mini-batch by centering them in
+    a zero padded tensor of the size of the largest image of the mini-batch.
+
+    Parameters
+    ----------
+    batch : list of tuple(torch.FloatTensor [C x H x W], torch.LongTensor [H x W])
+        The samples as returned by CocoDetection with pad_to_batch_max=True
+
+    Returns
+    -------
+    images : torch.FloatTensor of size [N x C x Hmax x Wmax]
+    targets : torch.LongTensor of size [N x Hmax x Wmax]
+    """
+    height = max(img.size(1) for img, _ in batch)
+    width = max(img.size(2) for img, _ in batch)
+
+    images = torch.zeros(len(batch), batch[0][0].size(0), height, width)
+    targets = torch.zeros(len(batch), height, width, dtype=torch.long)
+    for i, (img, target) in enumerate(batch):
+        top = (height - img.size(1)) // 2
+        left = (width - img.size(2)) // 2
+        images[i, :, top:top + img.size(1), left:left + img.size(2)] = img
+        targets[i, top:top + img.size(1), left:left + img.size(2)] = target
+    return images, targets
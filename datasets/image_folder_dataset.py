@@ -6,6 +6,7 @@ Load a dataset of images by specifying the folder where its located.
 import logging
 import os
 import sys
+from functools import partial
 from multiprocessing import Pool
 import cv2
 import numpy as np
@@ -15,10 +16,12 @@ import torch.utils.data as data
 import torchvision
 from PIL import Image
 
+from datasets import packed_dataset
+from datasets.reduced_decode import cv2_imread, load_image
 from util.misc import get_all_files_in_folders_and_subfolders, has_extension
 
 
-def load_dataset(dataset_folder, in_memory=False, workers=1):
+def load_dataset(dataset_folder, in_memory=False, workers=1, decode_scale=1):
     """
     Loads the dataset from file system and provides the dataset splits for train validation and test
 
@@ -51,6 +54,9 @@ def load_dataset(dataset_folder, in_memory=False, workers=1):
 
         train/"class_name"/*.png
 
+    Alternatively, the splits can be packed (see datasets.packed_dataset): they are then memory mapped, and
+    in_memory and decode_scale have no effect.
+
     Parameters
     ----------
     dataset_folder : string
@@ -63,6 +69,9 @@ def load_dataset(dataset_folder, in_memory=False, workers=1):
     workers: int
         Number of workers to use for the dataloaders
 
+    decode_scale : int
+        The images are decoded at 1/decode_scale of their resolution (1, 2, 4 or 8), see datasets.reduced_decode
+
     Returns
     -------
     train_ds : data.Dataset
@@ -72,6 +81,11 @@ def load_dataset(dataset_folder, in_memory=False, workers=1):
     test_ds : data.Dataset
         Train, validation and test splits
     """
+    # Packed datasets are memory mapped
+    if packed_dataset.is_packed(dataset_folder):
+        logging.info("Loading the packed dataset in " + dataset_folder)
+        return packed_dataset.load_dataset(dataset_folder)
+
     # Get the splits folders
     train_dir = os.path.join(dataset_folder, 'train')
     val_dir = os.path.join(dataset_folder, 'val')
@@ -91,15 +105,16 @@ def load_dataset(dataset_folder, in_memory=False, workers=1):
     # If its requested online, delegate to torchvision.datasets.ImageFolder()
     if not in_memory:
         # Get an online dataset for each split
-        train_ds = torchvision.datasets.ImageFolder(train_dir)
-        val_ds = torchvision.datasets.ImageFolder(val_dir)
-        test_ds = torchvision.datasets.ImageFolder(test_dir)
+        loader = {} if decode_scale == 1 else {'loader': partial(load_image, scale=decode_scale)}
+        train_ds = torchvision.datasets.ImageFolder(train_dir, **loader)
+        val_ds = torchvision.datasets.ImageFolder(val_dir, **loader)
+        test_ds = torchvision.datasets.ImageFolder(test_dir, **loader)
         return train_ds, val_ds, test_ds
     else:
         # Get an offline (in-memory) dataset for each split
-        train_ds = ImageFolderInMemory(train_dir, workers)
-        val_ds = ImageFolderInMemory(val_dir, workers)
-        test_ds = ImageFolderInMemory(test_dir, workers)
+        train_ds = ImageFolderInMemory(train_dir, workers=workers, decode_scale=decode_scale)
+        val_ds = ImageFolderInMemory(val_dir, workers=workers, decode_scale=decode_scale)
+        test_ds = ImageFolderInMemory(test_dir, workers=workers, decode_scale=decode_scale)
         return train_ds, val_ds, test_ds
 
 
@@ -112,7 +127,7 @@ class ImageFolderInMemory(data.Dataset):
     the user ensuring that the dataset actually fits in memory.
     """
 
-    def __init__(self, path, transform=None, target_transform=None, workers=1):
+    def __init__(self, path, transform=None, target_transform=None, workers=1, decode_scale=1):
         """
         Load the data in memory and prepares it as a dataset.
 
@@ -126,6 +141,8 @@ class ImageFolderInMemory(data.Dataset):
             Transformation to apply on the labels
         workers: int
             Number of workers to use for the dataloaders
+        decode_scale : int
+            The images are decoded at 1/decode_scale of their resolution (1, 2, 4 or 8)
         """
         self.dataset_folder = os.path.expanduser(path)
         self.transform = transform
@@ -143,7 +160,7 @@ class ImageFolderInMemory(data.Dataset):
 
         # Load all samples
         pool = Pool(workers)
-        self.data = pool.map(cv2.imread, file_names)
+        self.data = pool.map(partial(cv2_imread, scale=decode_scale), file_names)
         pool.close()
 
         # Set expected class attributes
@@ -8,9 +8,13 @@ import os
 import sys
 import math
 import os.path
+from functools import partial
 import numpy as np
 
 from datasets.transform_library import transforms, functional
+from datasets.transform_library.crop_sampler import ForegroundCropSampler, parse_class_ratios
+from datasets.page_geometry import PageGeometryIndex, read_page_sizes
+from datasets.reduced_decode import load_ground_truth, load_image, reduced_size
 
 # Torch related stuff
 import torch.utils.data as data
@@ -161,7 +165,9 @@ def load_dataset(dataset_folder, in_memory=False, workers=1, testing=False, **kw
         return train_dir, val_dir, test_dir
 
     # Get an online dataset for each split
-    train_ds = ImageFolder(train_dir, **kwargs)
+    # (only the training crops are biased towards the foreground, the validation crops stay uniform)
+    crop_foreground_ratios = kwargs.pop('crop_foreground_ratios', None)
+    train_ds = ImageFolder(train_dir, crop_foreground_ratios=crop_foreground_ratios, **kwargs)
     val_ds = ImageFolder(val_dir, **kwargs)
     test_ds = ImageFolder(test_dir, **kwargs)
     return train_ds, val_ds, test_ds
@@ -185,6 +191,10 @@ class ImageFolder(data.Dataset):
         target_transform (callable, optional): A function/transform that takes in the
             target and transforms it.
         loader (callable, optional): A function to load an image given its path.
+        crop_foreground_ratios (list or dict, optional): Fraction of the training crops drawn for each foreground
+            class e.g. ['2:0.2', '4:0.2'], see datasets.transform_library.crop_sampler. Default: uniform crops.
+        decode_scale (int, optional): The pages are decoded at 1/decode_scale of their resolution (1, 2, 4 or 8) and
+            the ground truths are reduced with nearest neighbour, see datasets.reduced_decode. Replaces the loader.
 
      Attributes:
         classes (list): List of the class names.
@@ -194,7 +204,7 @@ class ImageFolder(data.Dataset):
 
     # TODO: transform and target_transform could be the correct places for your cropping
     def __init__(self, root, gt_to_one_hot, num_classes, imgs_in_memory=3, crops_per_image=100, crop_size=10, transform=None, target_transform=None,
-                 loader=default_loader, **kwargs):
+                 loader=default_loader, crop_foreground_ratios=None, decode_scale=1, **kwargs):
 
         imgs = make_dataset(root)
         if len(imgs) == 0:
@@ -206,7 +216,9 @@ class ImageFolder(data.Dataset):
 
         self.transform = transform
         self.target_transform = target_transform
-        self.loader = loader
+        self.decode_scale = decode_scale
+        self.loader = loader if decode_scale == 1 else partial(load_image, scale=decode_scale)
+        self.gt_loader = loader if decode_scale == 1 else partial(load_ground_truth, scale=decode_scale)
         self.gt_to_one_hot = gt_to_one_hot
         self.num_classes = num_classes
 
@@ -221,31 +233,21 @@ class ImageFolder(data.Dataset):
         self.test_set = "test" in self.root
         self.images = [None] * imgs_in_memory
         self.gt = [None] * imgs_in_memory
+        self.memory_indexes = [None] * imgs_in_memory
+        # Foreground-aware crop positions, one sampler per page in memory
+        self.class_ratios = parse_class_ratios(crop_foreground_ratios) if crop_foreground_ratios else None
+        self.crop_samplers = [None] * imgs_in_memory
 
         # Variables for test set
         self.current_page = 0
 
         if self.test_set:
-            self.current_test_image = default_loader(self.imgs[0][0])
-            self.current_test_gt = default_loader(self.imgs[0][1])
-            self.current_test_gt_name = os.path.basename(self.imgs[0][1])[:-4]
-            self.current_test_image_counter = 0
-            self.crops_per_test_image = 0
-            self.get_item_number = 0
-
-            # TODO: super disgusting... but __len__() needs to know and for that we need
-            # TODO: the dimensions of the image
-            img = Image.open(open(self.imgs[0][0], 'rb'))
-            self.img_heigth = img.size[0]
-            self.img_width = img.size[1]
-            self.num_vert_crops = math.ceil(img.size[0] / (crop_size/2))
-            self.current_vert_crop = 0
-            self.num_horiz_crops = math.ceil(img.size[1] / (crop_size/2))
-            self.current_horiz_crop = 0
-            self.crops_per_image = self.num_vert_crops * self.num_horiz_crops
-            # logging.info("*** *** number horizontal_crops: " + str(self.num_horiz_crops))
-            # logging.info("*** *** number of vertical_crops: " + str(self.num_vert_crops))
-            # logging.info("*** *** length of the dataset: " + str(self.__len__()))
+            # The pages are decoded on demand, __len__() and the position of the crops only need their size
+            sizes = read_page_sizes(self.root, [img for img, _ in self.imgs])
+            self.geometry = PageGeometryIndex([reduced_size(size, decode_scale) for size in sizes], crop_size)
+            self.current_test_image = None
+            self.current_test_gt = None
+            self.current_test_image_counter = None
 
 
     def __getitem__(self, index, unittesting=False):
@@ -259,29 +261,10 @@ class ImageFolder(data.Dataset):
                 is_new_img), target)
         """
         if self.test_set:
-            # logging.info("*** v_crop: " + str(self.current_vert_crop) + "; h_crop: " + str(self.current_horiz_crop) +
-            #              "; of image: " + str(self.current_test_image_counter + 1) +
-            #              " of " + str(len(self.imgs)) + " self.current_crop: " + str(self.current_crop))
-
-            # load first image
-            if self.current_test_image_counter < len(self.imgs):
-                if self.current_vert_crop < self.num_vert_crops:
-                    if self.current_horiz_crop < self.num_horiz_crops: # current_horiz_crop < 15
-                        if self.current_horiz_crop == (self.num_horiz_crops - 1): # current_horiz_crop == 14
-                            output = self.test_crop()
-                            self.current_horiz_crop = 0
-                            self.current_vert_crop += 1
-                            return output
-                        else:
-                            output = self.test_crop()
-                            self.current_horiz_crop += 1
-                            return output
-
-                self.load_new_test_data()
-                self.reset_counter()
-                output = self.test_crop()
-                self.current_horiz_crop += 1
-                return output
+            page, x_position, y_position = self.geometry.locate(index)
+            if page != self.current_test_image_counter:
+                self.load_new_test_data(page)
+            return self.test_crop(x_position, y_position)
 
 
         # Think about moving this initialization to the constructor !!!
@@ -296,25 +279,22 @@ class ImageFolder(data.Dataset):
                 self.update_state_variables()
 
 
-    def load_new_test_data(self):
+    def load_new_test_data(self, page):
         # logging.info("*** loading next image ***")
-        self.current_test_image_counter += 1
-        self.current_test_image = default_loader(self.imgs[self.current_test_image_counter][0])
-        self.current_test_gt = default_loader(self.imgs[self.current_test_image_counter][1])
+        self.current_test_image_counter = page
+        self.current_test_image = self.loader(self.imgs[page][0])
+        self.current_test_gt = self.gt_loader(self.imgs[page][1])
 
-    def reset_counter(self):
-        # logging.info("*** resetting all counters ***")
-        self.current_horiz_crop = 0
-        self.current_vert_crop = 0
-
-    def test_crop(self):
+    def test_crop(self, x_position, y_position):
         """
 
+        :param x_position: int
+            row of the top left corner of the crop
+        :param y_position: int
+            column of the top left corner of the crop
         :return: (window_input,(original_img_shape), (top_left_coordinates_of_crop),
                     is_new_image, target)
         """
-        x_position, y_position = self.get_crop_coordinates()
-        # logging.info("x_position: " + str(x_position) + "  //  y_position: " + str(y_position) + "\n")
         window_input_image = functional.crop(self.current_test_image, x_position, y_position, self.crop_size, self.crop_size)
         window_target_image = functional.crop(self.current_test_gt, x_position, y_position, self.crop_size, self.crop_size)
 
@@ -329,21 +309,10 @@ class ImageFolder(data.Dataset):
 
         one_hot_matrix = self.gt_to_one_hot(window_target_torch, self.num_classes)
         self.current_crop += 1
-        return ((window_input_torch, (self.img_width, self.img_heigth), (x_position, y_position),
+        img_width, img_height = self.current_test_image.size
+        return ((window_input_torch, (img_height, img_width), (x_position, y_position),
                  os.path.basename(self.imgs[self.current_test_image_counter][1])[:]), one_hot_matrix)
 
-    def get_crop_coordinates(self):
-        if self.current_horiz_crop == (self.num_horiz_crops - 1):
-            x_position = self.img_width - self.crop_size
-        else:
-            x_position = int(self.crop_size/2) * self.current_horiz_crop
-
-        if self.current_vert_crop == (self.num_vert_crops - 1):
-            y_position = self.img_heigth - self.crop_size
-        else:
-            y_position = int(self.crop_size/2) * self.current_vert_crop
-        return x_position, y_position
-
 
     def apply_transformation(self, unittesting):
         """
@@ -354,7 +323,13 @@ class ImageFolder(data.Dataset):
         :return:
         """
         if self.transform is not None:
-            img, gt = self.transform(self.images[self.current_page], self.gt[self.current_page], self.crop_size)
+            img, gt = self.images[self.current_page], self.gt[self.current_page]
+            if self.crop_samplers[self.current_page] is not None:
+                # The random crop of the transform is then the whole (already cropped) window
+                i, j = self.crop_samplers[self.current_page].sample()
+                img = functional.crop(img, i, j, self.crop_size, self.crop_size)
+                gt = functional.crop(gt, i, j, self.crop_size, self.crop_size)
+            img, gt = self.transform(img, gt, self.crop_size)
             self.current_crop = self.current_crop + 1
             if unittesting:
                 return img, self.gt_to_one_hot(gt, self.num_classes), self.current_page, self.current_crop, self.memory_pass
@@ -386,7 +361,7 @@ class ImageFolder(data.Dataset):
         :return:
         """
         if self.test_set:
-            return self.crops_per_image * len(self.imgs)
+            return len(self.geometry)
         else:
             return len(self.imgs) * self.imgs_in_memory * self.crops_per_image
 
@@ -402,7 +377,9 @@ class ImageFolder(data.Dataset):
             self.next_image = self.next_image + 1
 
             self.images[i] = self.loader(temp_image)
-            self.gt[i] = self.loader(temp_gt)
+            self.gt[i] = self.gt_loader(temp_gt)
+            self.crop_samplers[i] = self._crop_sampler(self.gt[i])
+            self.memory_indexes[i] = i
 
     def update_memory(self):
         """
@@ -412,10 +389,79 @@ class ImageFolder(data.Dataset):
         :return:
         """
         new_image, new_gt = self.imgs[self.next_image % len(self.imgs)]
+        self.memory_indexes[self.memory_position_to_change] = self.next_image % len(self.imgs)
         self.next_image = (self.next_image + 1) % len(self.imgs)
 
         self.images[self.memory_position_to_change] = self.loader(new_image)
-        self.gt[self.memory_position_to_change] = self.loader(new_gt)
+        self.gt[self.memory_position_to_change] = self.gt_loader(new_gt)
+        self.crop_samplers[self.memory_position_to_change] = self._crop_sampler(self.gt[self.memory_position_to_change])
         self.memory_position_to_change = (self.memory_position_to_change + 1) % self.imgs_in_memory
 
+    def _crop_sampler(self, gt):
+        """
+        Builds the foreground-aware sampler of the crops of a page (None for uniform crops)
+
+        :param gt: PIL Image
+        :return: ForegroundCropSampler
+        """
+        if self.class_ratios is None or self.test_set:
+            return None
+        return ForegroundCropSampler(gt, self.crop_size, self.class_ratios)
+
+    def state_dict(self):
+        """
+        Returns the position of the dataset in its pass over the pages (which pages are in memory and which crop
+        is next). The pages themselves are not part of the state, they are re-loaded by load_state_dict().
+
+        :return: dict
+        """
+        return {'current_crop': self.current_crop,
+                'current_page': self.current_page,
+                'next_image': self.next_image,
+                'memory_position_to_change': self.memory_position_to_change,
+                'memory_pass': self.memory_pass,
+                'memory_indexes': list(self.memory_indexes)}
+
+    def load_state_dict(self, state_dict):
+        """
+        Restores the position of the dataset returned by state_dict() and loads the corresponding pages in memory.
+
+        :param state_dict: dict
+        :return:
+        """
+        self.current_crop = state_dict['current_crop']
+        self.current_page = state_dict['current_page']
+        self.next_image = state_dict['next_image']
+        self.memory_position_to_change = state_dict['memory_position_to_change']
+        self.memory_pass = state_dict['memory_pass']
+        self.memory_indexes = list(state_dict['memory_indexes'])
+        for i, index in enumerate(self.memory_indexes):
+            if index is None:
+                self.images[i], self.gt[i], self.crop_samplers[i] = None, None, None
+            else:
+                self.images[i] = self.loader(self.imgs[index][0])
+                self.gt[i] = self.gt_loader(self.imgs[index][1])
+                self.crop_samplers[i] = self._crop_sampler(self.gt[i])
 
+
+
+    def shard(self, rank, world_size):
+        """
+        Restricts the dataset to the pages of one of the processes of a distributed run (see util.distributed).
+
+        The pages are dealt round-robin. In the train and validation sets every process gets the same number of pages,
+        at least imgs_in_memory (wrapping around the list of pages if needed), such that the epochs of all processes
+        have the same length. The test pages are split without overlap: with fewer pages than processes, some
+        processes get none.
+
+        :param rank: int
+        :param world_size: int
+        :return:
+        """
+        if self.test_set:
+            self.imgs = self.imgs[rank::world_size]
+            self.geometry = self.geometry.select(slice(rank, None, world_size))
+            self.current_test_image_counter = None
+        else:
+            num_pages = max(math.ceil(len(self.imgs) / world_size), self.imgs_in_memory)
+            self.imgs = [self.imgs[(rank + i * world_size) % len(self.imgs)] for i in range(num_pages)]
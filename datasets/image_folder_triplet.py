@@ -18,12 +18,15 @@ import torchvision
 from PIL import Image
 from tqdm import trange
 
+from datasets.packed_dataset import IMAGES_FILENAME, PackedDataset
+
 
 def load_dataset(dataset_folder, num_triplets=None, in_memory=False, workers=1):
     """
     Loads the dataset from file system and provides the dataset splits for train validation and test.
 
-    The dataset is expected to be in the same structure as described in image_folder_dataset.load_dataset()
+    The dataset is expected to be in the same structure as described in image_folder_dataset.load_dataset(), the
+    splits can also be packed (see datasets.packed_dataset).
 
     Parameters
     ----------
@@ -107,14 +110,22 @@ class ImageFolderTriplet(data.Dataset):
         self.num_triplets = num_triplets
         self.in_memory = in_memory
 
-        dataset = torchvision.datasets.ImageFolder(path)
+        # Packed splits are memory mapped (see datasets.packed_dataset)
+        self.packed = None
+        if os.path.isfile(os.path.join(self.dataset_folder, IMAGES_FILENAME)):
+            self.packed = PackedDataset(self.dataset_folder)
+            self.in_memory = False
+            self.file_names = np.arange(len(self.packed))
+            self.labels = self.packed.labels
+        else:
+            dataset = torchvision.datasets.ImageFolder(path)
 
-        # Shuffle the data once (otherwise you get clusters of samples of same class in each batch for val and test)
-        np.random.shuffle(dataset.imgs)
+            # Shuffle the data once (otherwise you get clusters of samples of same class in each batch for val and test)
+            np.random.shuffle(dataset.imgs)
 
-        # Extract the actual file names and labels as entries
-        self.file_names = np.asarray([item[0] for item in dataset.imgs])
-        self.labels = np.asarray([item[1] for item in dataset.imgs])
+            # Extract the actual file names and labels as entries
+            self.file_names = np.asarray([item[0] for item in dataset.imgs])
+            self.labels = np.asarray([item[1] for item in dataset.imgs])
 
         # Set expected class attributes
         self.classes = np.unique(self.labels)
@@ -156,6 +167,16 @@ class ImageFolderTriplet(data.Dataset):
         logging.info('Finished generating {} triplets'.format(self.num_triplets))
         return triplets
 
+    def _image(self, index):
+        """
+        Returns the image at index as a PIL Image
+        """
+        if self.packed is not None:
+            return self.packed.image(index)
+        if self.in_memory:
+            return Image.fromarray(self.data[index])
+        return Image.fromarray(cv2.imread(self.file_names[index]))
+
     def __getitem__(self, index):
         """
         Retrieve a sample by index
@@ -176,10 +197,7 @@ class ImageFolderTriplet(data.Dataset):
         if not self.train:
             # a, pn, l = self.matches[index]
             l = self.labels[index]
-            if self.in_memory:
-                img_a = Image.fromarray(self.data[index])
-            else:
-                img_a = Image.fromarray(cv2.imread(self.file_names[index]))
+            img_a = self._image(index)
 
             if self.transform is not None:
                 img_a = self.transform(img_a)
@@ -188,14 +206,9 @@ class ImageFolderTriplet(data.Dataset):
         a, p, n = self.triplets[index]
 
         # Doing this so that it is consistent with all other datasets to return a PIL Image
-        if self.in_memory:
-            img_a = Image.fromarray(self.data[a])
-            img_p = Image.fromarray(self.data[p])
-            img_n = Image.fromarray(self.data[n])
-        else:
-            img_a = Image.fromarray(cv2.imread(self.file_names[a]))
-            img_p = Image.fromarray(cv2.imread(self.file_names[p]))
-            img_n = Image.fromarray(cv2.imread(self.file_names[n]))
+        img_a = self._image(a)
+        img_p = self._image(p)
+        img_n = self._image(n)
 
         if self.transform is not None:
             img_a = self.transform(img_a)
@@ -0,0 +1,173 @@
+"""
+Load a dataset of small images stored in a packed format.
+
+Instead of one image file per sample, each split folder contains:
+
+    'dataset_folder'/train/images.npy      uint8 array of shape N x H x W x C (C is 1 or 3)
+    'dataset_folder'/train/labels.npy      int64 array of shape N, the index of the class of each sample
+    'dataset_folder'/train/classes.txt     the name of the classes, one per line, in the order of their index
+
+and the same for val and test. The images are memory mapped: nothing is decoded when a sample is retrieved and the
+pages of the file are shared between the workers of the dataloaders (and cached by the OS across runs).
+Such a dataset can be created with util/data/get_a_dataset.py --packed.
+"""
+
+# Utils
+import logging
+import os
+import sys
+
+import numpy as np
+
+# Torch related stuff
+import torch.utils.data as data
+from PIL import Image
+
+# DeepDIVA
+from util.atomic_file import atomic_write
+
+IMAGES_FILENAME = 'images.npy'
+LABELS_FILENAME = 'labels.npy'
+CLASSES_FILENAME = 'classes.txt'
+
+
+def is_packed(dataset_folder):
+    """
+    Returns True if the splits of the dataset in dataset_folder are packed (see above)
+    """
+    return os.path.isfile(os.path.join(dataset_folder, 'train', IMAGES_FILENAME))
+
+
+def load_dataset(dataset_folder):
+    """
+    Loads the packed dataset from file system and provides the dataset splits for train validation and test
+
+    Parameters
+    ----------
+    dataset_folder : string
+        Path to the dataset on the file System, which contains the split sub-folders train/val/test
+
+    Returns
+    -------
+    train_ds : data.Dataset
+    val_ds : data.Dataset
+    test_ds : data.Dataset
+        Train, validation and test splits
+    """
+    splits = []
+    for split in ['train', 'val', 'test']:
+        split_dir = os.path.join(dataset_folder, split)
+        if not os.path.isfile(os.path.join(split_dir, IMAGES_FILENAME)):
+            logging.error("Packed {} split not found in the dataset_folder={}".format(split, dataset_folder))
+            sys.exit(-1)
+        splits.append(PackedDataset(split_dir))
+    return tuple(splits)
+
+
+def write_packed_split(folder, images, labels, classes):
+    """
+    Writes a split of a dataset in the packed format.
+
+    The files are written to temporary files which are then renamed, the images last: an interrupted export is
+    never mistaken for a complete split.
+
+    Parameters
+    ----------
+    folder : string
+        Folder of the split
+    images : numpy array [N x H x W] or [N x H x W x C]
+        The images (uint8)
+    labels : numpy array [N]
+        The index of the class of each image
+    classes : list of string
+        Name of each class
+    """
+    os.makedirs(folder, exist_ok=True)
+    images = np.asarray(images, dtype=np.uint8)
+    if images.ndim == 3:
+        images = images[:, :, :, None]
+    with atomic_write(os.path.join(folder, CLASSES_FILENAME), 'w') as f:
+        f.write(''.join(c + '\n' for c in classes))
+    with atomic_write(os.path.join(folder, LABELS_FILENAME)) as f:
+        np.save(f, np.asarray(labels, dtype=np.int64))
+    with atomic_write(os.path.join(folder, IMAGES_FILENAME)) as f:
+        np.save(f, images)
+
+
+class PackedDataset(data.Dataset):
+    """
+    A split of a packed dataset (see above).
+
+    It has the same interface as torchvision.datasets.ImageFolder: samples are (PIL image, class index) and the
+    images are RGB, as the image folder datasets load them.
+    """
+
+    def __init__(self, path, transform=None, target_transform=None):
+        """
+        Parameters
+        ----------
+        path : string
+            Path to the folder of the split
+        transform : torchvision.transforms
+            Transformation to apply on the data
+        target_transform : torchvision.transforms
+            Transformation to apply on the labels
+        """
+        self.dataset_folder = os.path.expanduser(path)
+        self.transform = transform
+        self.target_transform = target_transform
+
+        self.labels = np.load(os.path.join(self.dataset_folder, LABELS_FILENAME))
+        with open(os.path.join(self.dataset_folder, CLASSES_FILENAME)) as f:
+            self.classes = f.read().splitlines()
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+
+        # Opened on first access, such that the map is not pickled when the dataset is sent to the workers
+        self._images = None
+
+    @property
+    def images(self):
+        """Memory mapped numpy array [N x H x W x C] of the images"""
+        if self._images is None:
+            self._images = np.load(os.path.join(self.dataset_folder, IMAGES_FILENAME), mmap_mode='r')
+        return self._images
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def image(self, index):
+        """
+        Returns the image at index as an RGB PIL Image
+        """
+        img = self.images[index]
+        if img.shape[2] == 1:
+            return Image.fromarray(img[:, :, 0], mode='L').convert('RGB')
+        return Image.fromarray(np.asarray(img))
+
+    def __getitem__(self, index):
+        """
+        Retrieve a sample by index
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        img : FloatTensor
+        target : int
+            label of the image
+        """
+        img, target = self.image(index), int(self.labels[index])
+
+        if self.transform is not None:
+            img = self.transform(img)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return img, target
+
+    def __len__(self):
+        return len(self.labels)
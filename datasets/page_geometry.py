@@ -0,0 +1,159 @@
+"""
+Geometry of the pages of the segmentation datasets, read from the image headers only.
+
+The test set of the HisDB datasets is a sliding window over each page, so its length and the position of each crop
+depend on the size of every page. The sizes are read from the headers of the images (PIL only decodes the pixels
+on demand) by a pool of threads, and cached in a json file in the folder of the split. The cache entry of a file is
+re-used as long as its size and last modified time do not change.
+"""
+
+# Utils
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# DeepDIVA
+from util.atomic_file import atomic_write
+
+GEOMETRY_FILENAME = 'page_geometry.json'
+
+
+def _read_size(path):
+    """Returns (width, height) of an image without decoding it"""
+    with Image.open(path) as img:
+        return img.size
+
+
+def read_page_sizes(root, paths, workers=None):
+    """
+    Returns the size of the images, using the cache in the folder root when possible.
+
+    Parameters
+    ----------
+    root : string
+        Folder of the split, where the cache is stored
+    paths : list of string
+        Paths of the images
+    workers : int
+        Number of threads reading the headers. If None, the default of ThreadPoolExecutor is used.
+
+    Returns
+    -------
+    sizes : list of (int, int)
+        (width, height) of each image
+    """
+    cache_path = os.path.join(root, GEOMETRY_FILENAME)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    entries = {}
+    to_read = []
+    for path in paths:
+        name = os.path.relpath(path, root)
+        stat = os.stat(path)
+        entry = cache.get(name)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            to_read.append(name)
+        entries[name] = entry
+
+    if to_read:
+        logging.info('Reading the size of {} pages (out of {}) in {}'.format(len(to_read), len(paths), root))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            sizes = executor.map(_read_size, [os.path.join(root, name) for name in to_read])
+            for name, (width, height) in zip(to_read, sizes):
+                entries[name]['width'], entries[name]['height'] = width, height
+        _save_cache(cache_path, dict(cache, **entries))
+
+    return [(entries[name]['width'], entries[name]['height']) for name in (os.path.relpath(p, root) for p in paths)]
+
+
+def _save_cache(cache_path, cache):
+    """Writes the cache to a temporary file which is then renamed, such that concurrent runs never see it torn"""
+    try:
+        with atomic_write(cache_path, 'w') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        # e.g. a read-only dataset: the headers are then read again next time
+        logging.warning('Could not write the page geometry cache {}: {}'.format(cache_path, e))
+
+
+class PageGeometryIndex(object):
+    """
+    Position of the crops of the sliding window over a list of pages.
+
+    The window moves by half the crop size and the last crop of each row and column is aligned with the border of
+    the page. The crops of a page are numbered column after column, and the crops of all pages one page after the
+    other: the crop of a dataset index is found by binary search in the cumulative number of crops of the pages.
+
+    Attributes
+    ----------
+    sizes : numpy array [num_pages x 2]
+        (width, height) of each page
+    num_vert_crops : numpy array [num_pages]
+        Number of columns of crops of each page
+    num_horiz_crops : numpy array [num_pages]
+        Number of rows of crops of each page
+    offsets : numpy array [num_pages + 1]
+        Index of the first crop of each page, the last entry is the total number of crops
+    """
+
+    def __init__(self, sizes, crop_size):
+        """
+        Parameters
+        ----------
+        sizes : list of (int, int)
+            (width, height) of each page
+        crop_size : int
+            Size of the (square) crops
+        """
+        self.sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 2)
+        self.crop_size = crop_size
+        self.step = int(crop_size / 2)
+        self.num_vert_crops = np.ceil(self.sizes[:, 0] / (crop_size / 2)).astype(np.int64)
+        self.num_horiz_crops = np.ceil(self.sizes[:, 1] / (crop_size / 2)).astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.num_vert_crops * self.num_horiz_crops)])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def select(self, pages):
+        """Returns the index of a subset of the pages e.g. select(slice(rank, None, world_size))"""
+        return PageGeometryIndex(self.sizes[pages], self.crop_size)
+
+    def locate(self, index):
+        """
+        Parameters
+        ----------
+        index : int
+            Index of a crop in the dataset
+
+        Returns
+        -------
+        page : int
+            Index of the page of the crop
+        x_position, y_position : int
+            Top left corner (row, column) of the crop in the page
+        """
+        if not 0 <= index < len(self):
+            raise IndexError('Crop {} out of range ({} crops)'.format(index, len(self)))
+        page = int(np.searchsorted(self.offsets, index, side='right')) - 1
+        vert_crop, horiz_crop = divmod(int(index - self.offsets[page]), int(self.num_horiz_crops[page]))
+        width, height = self.sizes[page]
+
+        if horiz_crop == self.num_horiz_crops[page] - 1:
+            x_position = height - self.crop_size
+        else:
+            x_position = self.step * horiz_crop
+        if vert_crop == self.num_vert_crops[page] - 1:
+            y_position = width - self.crop_size
+        else:
+            y_position = self.step * vert_crop
+        return page, int(x_position), int(y_position)
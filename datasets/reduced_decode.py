@@ -0,0 +1,112 @@
+"""
+Decoding of the images directly at a reduced resolution.
+
+JPEG images are made of 8x8 DCT blocks: libjpeg can decode them at 1/2, 1/4 or 1/8 of their size by keeping only
+the low frequencies of each block, which is several times faster and needs a fraction of the memory of a full
+decoding followed by a resize. This is exposed by PIL with Image.draft() and by OpenCV with the IMREAD_REDUCED_*
+flags. The other formats (e.g. the PNG ground truths) are decoded at full resolution and then reduced.
+
+The images are reduced by averaging (box filter) and the ground truths by taking the top left pixel of every
+scale x scale block (nearest neighbour), such that no new label is created. Both have a size of
+ceil(width / scale) x ceil(height / scale) and stay aligned.
+"""
+
+# Utils
+import math
+
+import cv2
+import numpy as np
+from PIL import Image
+
+DECODE_SCALES = [1, 2, 4, 8]
+
+# OpenCV flags decoding a colour image at 1/scale of its size
+CV2_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                     8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def reduced_size(size, scale):
+    """
+    Size of an image decoded at 1/scale
+
+    Parameters
+    ----------
+    size : (int, int)
+        (width, height) at full resolution
+    scale : int
+        One of DECODE_SCALES
+
+    Returns
+    -------
+    (int, int)
+        (width, height) at 1/scale
+    """
+    return tuple(int(math.ceil(s / scale)) for s in size)
+
+
+def load_image(path, scale=1):
+    """
+    Loads an RGB image at 1/scale of its resolution.
+
+    Parameters
+    ----------
+    path : string
+        Path of the image
+    scale : int
+        One of DECODE_SCALES
+
+    Returns
+    -------
+    PIL Image (RGB)
+    """
+    with open(path, 'rb') as f:
+        with Image.open(f) as img:
+            if scale == 1:
+                return img.convert('RGB')
+            size = reduced_size(img.size, scale)
+            # Only has an effect on JPEG images, which are then decoded at 1/scale (PIL picks the largest reduction
+            # whose size is at least the requested one, rounding down the ratio)
+            img.draft('RGB', (img.size[0] // scale, img.size[1] // scale))
+            img = img.convert('RGB')
+            if img.size != size:
+                img = img.resize(size, Image.BOX)
+            return img
+
+
+def load_ground_truth(path, scale=1):
+    """
+    Loads an RGB ground truth at 1/scale of its resolution, keeping one pixel out of every scale x scale block.
+
+    Parameters
+    ----------
+    path : string
+        Path of the ground truth
+    scale : int
+        One of DECODE_SCALES
+
+    Returns
+    -------
+    PIL Image (RGB)
+    """
+    with open(path, 'rb') as f:
+        with Image.open(f) as img:
+            img = img.convert('RGB')
+    if scale == 1:
+        return img
+    return Image.fromarray(np.ascontiguousarray(np.asarray(img)[::scale, ::scale]))
+
+
+def reduce_mask(mask, scale):
+    """
+    Reduces a label mask (numpy array [H x W]) like load_ground_truth() does
+    """
+    if scale == 1:
+        return mask
+    return np.ascontiguousarray(mask[::scale, ::scale])
+
+
+def cv2_imread(path, scale=1):
+    """
+    cv2.imread() of a colour image at 1/scale of its resolution (BGR numpy array)
+    """
+    return cv2.imread(path, CV2_REDUCED_FLAGS[scale])
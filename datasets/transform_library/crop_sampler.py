@@ -0,0 +1,145 @@
+"""
+Foreground-aware sampling of the positions of the training crops of the segmentation datasets.
+
+The pages of historical documents are mostly background: crops taken uniformly over a page (RandomTwinCrop) often
+contain no foreground at all. The ForegroundCropSampler of a page draws a given fraction of the crops with a
+probability proportional to the number of pixels of a class they contain, the others uniformly.
+
+The number of pixels of a class in every crop is computed once per page with a summed-area table (integral image)
+of the class mask. The crop origins are taken on a grid (with a random offset within the cell of the grid) such that
+the tables of the distributions stay small, and each draw takes a constant expected time (guide table).
+"""
+
+# Utils
+import logging
+import random
+import sys
+
+import numpy as np
+
+
+def parse_class_ratios(values):
+    """
+    Parses the --crop-foreground-ratios argument.
+
+    Parameters
+    ----------
+    values : list of str or dict
+        Entries 'CODE:RATIO' where CODE is the value of the class in the blue channel of the ground truth and RATIO
+        the fraction of the crops drawn for this class e.g. ['2:0.2', '4:0.2', '8:0.2']
+
+    Returns
+    -------
+    class_ratios : dict
+        {code : ratio}
+    """
+    if isinstance(values, dict):
+        class_ratios = dict(values)
+    else:
+        class_ratios = {}
+        for value in values:
+            try:
+                code, ratio = value.split(':')
+                class_ratios[int(code)] = float(ratio)
+            except ValueError:
+                logging.error('Invalid foreground ratio {}. Expected CODE:RATIO e.g. 2:0.25'.format(value))
+                sys.exit(-1)
+    if any(ratio < 0 for ratio in class_ratios.values()) or sum(class_ratios.values()) > 1:
+        logging.error('The foreground ratios must be positive and sum to at most 1: {}'.format(class_ratios))
+        sys.exit(-1)
+    return class_ratios
+
+
+class ForegroundCropSampler(object):
+    """
+    Draws the top left corner of the crops of a page.
+
+    With probability ratio[c] a crop is drawn proportionally to the number of pixels of the class c it contains.
+    The pixels of the class c are the ones whose blue channel contains the bits of c (e.g. 2 is in 2, 6, 10 and 14
+    of the multi-label ground truths) and which are not boundary pixels. With the remaining probability (and for the
+    classes absent from the page) the crop is drawn uniformly, as RandomTwinCrop does.
+    """
+
+    def __init__(self, gt, crop_size, class_ratios, stride=None):
+        """
+        Parameters
+        ----------
+        gt : PIL Image
+            Ground truth of the page (RGB)
+        crop_size : int
+            Size of the (square) crops
+        class_ratios : dict
+            {code : fraction of the crops drawn for this class}, see parse_class_ratios()
+        stride : int
+            Spacing of the grid of the crop origins. Default is a quarter of the crop size.
+        """
+        gt = np.asarray(gt)
+        self.height, self.width = gt.shape[:2]
+        self.crop_size = crop_size
+        self.stride = stride or max(1, crop_size // 4)
+
+        max_i, max_j = self.height - crop_size, self.width - crop_size
+        if max_i < 0 or max_j < 0:
+            raise ValueError('Crop size {} larger than the page ({}x{})'.format(crop_size, self.height, self.width))
+        self.rows = np.arange(0, max_i + 1, self.stride)
+        self.cols = np.arange(0, max_j + 1, self.stride)
+
+        blue = gt[:, :, 2]
+        not_boundary = gt[:, :, 0] == 0
+        # [(cumulative probability, distribution over the grid cells)] of the classes present on the page
+        self.classes = []
+        cumulative = 0.
+        for code, ratio in sorted(class_ratios.items()):
+            if ratio == 0:
+                continue
+            counts = self._crop_counts(((blue & code) == code) & not_boundary)
+            if counts.sum() == 0:
+                continue
+            cumulative += ratio
+            self.classes.append((cumulative, _GuideTable(counts.ravel())))
+
+    def _crop_counts(self, mask):
+        """Number of pixels of the mask in the crop at each origin of the grid"""
+        # Summed-area table with a leading row and column of zeros: sat[i, j] = mask[:i, :j].sum()
+        sat = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1, out=sat[1:, 1:])
+        top, left = self.rows[:, None], self.cols[None, :]
+        bottom, right = top + self.crop_size, left + self.crop_size
+        return sat[bottom, right] - sat[top, right] - sat[bottom, left] + sat[top, left]
+
+    def sample(self):
+        """
+        Returns
+        -------
+        i, j : int
+            Top left corner (row, column) of the crop
+        """
+        u = random.random()
+        for cumulative, table in self.classes:
+            if u < cumulative:
+                cell = table.draw(random.random())
+                i = self.rows[cell // len(self.cols)]
+                j = self.cols[cell % len(self.cols)]
+                # Random offset within the cell of the grid
+                i += random.randint(0, min(self.stride, self.height - self.crop_size - i + 1) - 1)
+                j += random.randint(0, min(self.stride, self.width - self.crop_size - j + 1) - 1)
+                return int(i), int(j)
+        return random.randint(0, self.height - self.crop_size), random.randint(0, self.width - self.crop_size)
+
+
+class _GuideTable(object):
+    """
+    Discrete distribution drawn by inversion of its cumulative distribution, with a guide table giving for each of n
+    equal intervals of [0, 1) the first candidate index: a draw checks 2 entries in expectation.
+    """
+
+    def __init__(self, weights):
+        self.cdf = np.cumsum(weights, dtype=np.float64)
+        self.cdf /= self.cdf[-1]
+        self.guide = np.searchsorted(self.cdf, np.arange(len(self.cdf)) / len(self.cdf), side='right')
+
+    def draw(self, u):
+        index = self.guide[int(u * len(self.guide))]
+        while self.cdf[index] <= u:
+            index += 1
+        return index
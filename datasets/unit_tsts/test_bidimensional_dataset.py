@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import torch
+from torchvision import transforms
+
+from datasets.bidimensional_dataset import BatchedLoader, Bidimensional
+
+
+class Test_BatchedLoader(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rs = np.random.RandomState(0)
+        points = np.column_stack([rs.uniform(-3, 5, 50), rs.uniform(0, 2, 50), rs.randint(0, 3, 50)])
+        self.path = os.path.join(self.folder, 'data.csv')
+        pd.DataFrame(points).to_csv(self.path, index=False)
+        self.dataset = Bidimensional(self.path)
+        self.mean, self.std = np.array([0.4, 0.6]), np.array([0.3, 0.2])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_normalized_tensors(self):
+        points, targets = self.dataset.normalized_tensors(self.mean, self.std)
+        self.assertEqual(points.shape, (50, 2, 1, 1))
+        # Same as the samples of the dataset with the transform of template.setup.set_up_dataloaders()
+        self.dataset.transform = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize(mean=self.mean, std=self.std)
+        ])
+        for i in [0, 17, 49]:
+            point, target = self.dataset[i]
+            self.assertTrue(np.allclose(points[i].numpy(), point.numpy(), rtol=1e-5))
+            self.assertEqual(targets[i], target)
+
+    def test_batches(self):
+        tensors = self.dataset.normalized_tensors(self.mean, self.std)
+        loader = BatchedLoader(self.dataset, tensors, batch_size=16)
+        batches = list(loader)
+        self.assertEqual(len(loader), 4)
+        self.assertEqual([len(target) for _, target in batches], [16, 16, 16, 2])
+        self.assertTrue(torch.equal(torch.cat([point for point, _ in batches]), tensors[0]))
+
+    def test_shuffle(self):
+        tensors = self.dataset.normalized_tensors(self.mean, self.std)
+        loader = BatchedLoader(self.dataset, tensors, batch_size=16, shuffle=True)
+        points = torch.cat([point for point, _ in loader])
+        self.assertFalse(torch.equal(points, tensors[0]))
+        # Every point once per epoch
+        self.assertEqual(sorted(points.view(-1, 2).tolist()), sorted(tensors[0].view(-1, 2).tolist()))
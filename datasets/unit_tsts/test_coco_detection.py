@@ -0,0 +1,85 @@
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import torch
+
+from datasets.coco_detection import AspectRatioBatchSampler, MaskCache, pad_collate
+
+
+class Test_MaskCache(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ann_file = os.path.join(self.folder, 'instances_train.json')
+        with open(self.ann_file, 'w') as f:
+            f.write('{}')
+        self.cache = MaskCache(os.path.join(self.folder, 'cache'), self.ann_file, {'cat': 1}, {'17': 'cat'})
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_put_get(self):
+        mask = np.random.RandomState(0).randint(0, 3, size=(5, 7)).astype(np.uint8)
+        self.assertIsNone(self.cache.get(42))
+        self.cache.put(42, mask)
+        self.assertTrue((self.cache.get(42) == mask).all())
+        # No temporary file is left behind
+        self.assertEqual(os.listdir(self.cache.folder), ['42.png'])
+
+    def test_mode(self):
+        self.cache.put(42, np.zeros((2, 2), dtype=np.uint8))
+        umask = os.umask(0o022)
+        os.umask(umask)
+        # The permissions of a file created by open(), such that the cache can be shared
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(self.cache.folder, '42.png')).st_mode), 0o666 & ~umask)
+
+    def test_signature(self):
+        # The masks of another class mapping are stored apart
+        other = MaskCache(os.path.join(self.folder, 'cache'), self.ann_file, {'cat': 2}, {'17': 'cat'})
+        same = MaskCache(os.path.join(self.folder, 'cache'), self.ann_file, {'cat': 1}, {'17': 'cat'})
+        self.assertNotEqual(other.folder, self.cache.folder)
+        self.assertEqual(same.folder, self.cache.folder)
+
+
+class Test_AspectRatioBatchSampler(TestCase):
+    def setUp(self):
+        # (height, width): portrait, square and landscape images of two sizes
+        self.sizes = np.array([[400, 200], [300, 300], [200, 400], [40, 20], [30, 30], [20, 40]] * 5)
+
+    def test_batches(self):
+        sampler = AspectRatioBatchSampler(self.sizes, batch_size=2, shuffle=True, size_buckets=2)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        # Every image exactly once
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(self.sizes))))
+        # The images of a mini-batch have the same aspect ratio and size
+        for batch in batches:
+            self.assertLessEqual(len(batch), 2)
+            self.assertEqual(len(set(map(tuple, self.sizes[batch]))), 1)
+
+    def test_drop_last(self):
+        sampler = AspectRatioBatchSampler(self.sizes, batch_size=2, shuffle=False, drop_last=True, size_buckets=2)
+        batches = list(sampler)
+        # 6 buckets of 5 images
+        self.assertEqual(len(sampler), 12)
+        self.assertEqual(len(batches), 12)
+        self.assertTrue(all(len(batch) == 2 for batch in batches))
+
+
+class Test_pad_collate(TestCase):
+    def test_pad_collate(self):
+        batch = [(torch.ones(3, 4, 2), torch.full((4, 2), 2, dtype=torch.long)),
+                 (torch.ones(3, 2, 6), torch.full((2, 6), 3, dtype=torch.long))]
+        images, targets = pad_collate(batch)
+        self.assertEqual(images.shape, (2, 3, 4, 6))
+        self.assertEqual(targets.shape, (2, 4, 6))
+        # The images are centered in the zero padding
+        self.assertEqual(images[0].sum().item(), 3 * 4 * 2)
+        self.assertTrue((images[0, :, :, 2:4] == 1).all())
+        self.assertTrue((targets[0, :, 2:4] == 2).all())
+        self.assertTrue((images[1, :, 1:3, :] == 1).all())
+        self.assertTrue((targets[1, 1:3, :] == 3).all())
+        self.assertEqual(targets[1].sum().item(), 3 * 2 * 6)
@@ -0,0 +1,60 @@
+import random
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from datasets.transform_library.crop_sampler import ForegroundCropSampler, parse_class_ratios
+
+
+def _page(height=60, width=80):
+    # Background everywhere, a block of class 2 in the bottom right corner and a boundary row in it
+    gt = np.zeros((height, width, 3), dtype=np.uint8)
+    gt[:, :, 2] = 1
+    gt[40:55, 60:75, 2] = 2
+    gt[40, 60:75, 0] = 128
+    return gt
+
+
+class Test_ForegroundCropSampler(TestCase):
+    def test_crop_counts(self):
+        gt = _page()
+        sampler = ForegroundCropSampler(Image.fromarray(gt), crop_size=16, class_ratios={2: 0.5}, stride=3)
+        mask = (gt[:, :, 2] == 2) & (gt[:, :, 0] == 0)
+        counts = sampler._crop_counts(mask)
+        for a, i in enumerate(sampler.rows):
+            for b, j in enumerate(sampler.cols):
+                self.assertEqual(counts[a, b], mask[i:i + 16, j:j + 16].sum())
+
+    def test_sample_foreground(self):
+        random.seed(0)
+        sampler = ForegroundCropSampler(Image.fromarray(_page()), crop_size=16, class_ratios={2: 1.0})
+        for _ in range(200):
+            i, j = sampler.sample()
+            self.assertTrue(0 <= i <= 60 - 16 and 0 <= j <= 80 - 16)
+            # Every crop contains some pixels of class 2
+            self.assertTrue(i + 16 > 41 and j + 16 > 60)
+
+    def test_sample_uniform(self):
+        random.seed(0)
+        # The class 4 is not on the page: all crops are uniform
+        sampler = ForegroundCropSampler(Image.fromarray(_page()), crop_size=16, class_ratios={4: 0.5})
+        self.assertEqual(sampler.classes, [])
+        origins = np.array([sampler.sample() for _ in range(500)])
+        self.assertEqual(origins[:, 0].min(), 0)
+        self.assertEqual(origins[:, 1].max(), 80 - 16)
+
+    def test_crop_too_large(self):
+        with self.assertRaises(ValueError):
+            ForegroundCropSampler(Image.fromarray(_page()), crop_size=64, class_ratios={2: 0.5})
+
+
+class Test_parse_class_ratios(TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_class_ratios(['2:0.25', '4:0.5']), {2: 0.25, 4: 0.5})
+        self.assertEqual(parse_class_ratios({8: 0.1}), {8: 0.1})
+
+    def test_invalid(self):
+        for values in [['2-0.25'], ['2:0.75', '4:0.5'], ['2:-0.1']]:
+            with self.assertRaises(SystemExit):
+                parse_class_ratios(values)
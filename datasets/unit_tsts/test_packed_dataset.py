@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from datasets import image_folder_dataset
+from datasets.packed_dataset import PackedDataset, is_packed, write_packed_split
+
+
+class Test_PackedDataset(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.images = np.random.RandomState(0).randint(0, 256, size=(10, 8, 6), dtype=np.uint8)
+        self.labels = np.arange(10) % 3
+        for split in ['train', 'val', 'test']:
+            write_packed_split(os.path.join(self.root, split), self.images, self.labels, ['a', 'b', 'c'])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_sample(self):
+        ds = PackedDataset(os.path.join(self.root, 'train'))
+        self.assertEqual(len(ds), 10)
+        self.assertEqual(ds.classes, ['a', 'b', 'c'])
+        img, target = ds[4]
+        self.assertEqual(target, 1)
+        # Grey scale images are returned as RGB, like the image folder datasets do
+        self.assertEqual(img.mode, 'RGB')
+        self.assertEqual(img.size, (6, 8))
+        self.assertTrue((np.asarray(img)[:, :, 1] == self.images[4]).all())
+
+    def test_load_dataset(self):
+        self.assertTrue(is_packed(self.root))
+        train_ds, val_ds, test_ds = image_folder_dataset.load_dataset(self.root)
+        self.assertIsInstance(test_ds, PackedDataset)
+        self.assertEqual(len(train_ds.classes), 3)
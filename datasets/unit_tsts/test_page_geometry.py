@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from datasets.page_geometry import GEOMETRY_FILENAME, PageGeometryIndex, read_page_sizes
+
+
+class Test_PageGeometryIndex(TestCase):
+    def test_length(self):
+        # 1000 x 600 with crops of 256: ceil(1000 / 128) = 8 columns and ceil(600 / 128) = 5 rows
+        index = PageGeometryIndex([(1000, 600), (300, 300)], crop_size=256)
+        self.assertEqual(list(index.offsets), [0, 40, 49])
+        self.assertEqual(len(index), 49)
+
+    def test_locate(self):
+        index = PageGeometryIndex([(1000, 600), (300, 300)], crop_size=256)
+        self.assertEqual(index.locate(0), (0, 0, 0))
+        # The rows of the first column, the last one aligned with the bottom of the page
+        self.assertEqual(index.locate(1), (0, 128, 0))
+        self.assertEqual(index.locate(4), (0, 600 - 256, 0))
+        self.assertEqual(index.locate(5), (0, 0, 128))
+        self.assertEqual(index.locate(39), (0, 600 - 256, 1000 - 256))
+        self.assertEqual(index.locate(40), (1, 0, 0))
+        self.assertEqual(index.locate(48), (1, 300 - 256, 300 - 256))
+        with self.assertRaises(IndexError):
+            index.locate(49)
+
+    def test_select(self):
+        index = PageGeometryIndex([(1000, 600), (300, 300), (500, 500)], crop_size=256)
+        shard = index.select(slice(1, None, 2))
+        self.assertEqual(shard.sizes.tolist(), [[300, 300]])
+        self.assertEqual(len(shard), 9)
+
+
+class Test_read_page_sizes(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.paths = []
+        for i, size in enumerate([(40, 30), (20, 50)]):
+            path = os.path.join(self.root, 'page{}.png'.format(i))
+            Image.fromarray(np.zeros((size[1], size[0], 3), dtype=np.uint8)).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_read_and_cache(self):
+        self.assertEqual(read_page_sizes(self.root, self.paths), [(40, 30), (20, 50)])
+        self.assertTrue(os.path.exists(os.path.join(self.root, GEOMETRY_FILENAME)))
+
+        # A modified page is read again, the others come from the cache
+        Image.fromarray(np.zeros((10, 60, 3), dtype=np.uint8)).save(self.paths[1])
+        os.utime(self.paths[1], ns=(0, 0))
+        self.assertEqual(read_page_sizes(self.root, self.paths), [(40, 30), (60, 10)])
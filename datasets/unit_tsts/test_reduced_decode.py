@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from datasets.reduced_decode import DECODE_SCALES, cv2_imread, load_ground_truth, load_image, reduced_size
+
+
+class Test_reduced_decode(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # Odd sizes such that the reduced sizes are rounded up
+        gradient = np.linspace(0, 255, 203)[None, :, None].repeat(157, axis=0).repeat(3, axis=2).astype(np.uint8)
+        self.jpg = os.path.join(self.folder, 'page.jpg')
+        Image.fromarray(gradient).save(self.jpg, quality=95)
+        self.gt = np.zeros((157, 203, 3), dtype=np.uint8)
+        self.gt[:, :, 2] = np.random.RandomState(0).choice([1, 2, 4, 8], size=(157, 203))
+        self.gt_path = os.path.join(self.folder, 'page.png')
+        Image.fromarray(self.gt).save(self.gt_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_reduced_size(self):
+        self.assertEqual(reduced_size((203, 157), 1), (203, 157))
+        self.assertEqual(reduced_size((203, 157), 4), (51, 40))
+
+    def test_image_and_gt_aligned(self):
+        for scale in DECODE_SCALES:
+            img = load_image(self.jpg, scale)
+            gt = load_ground_truth(self.gt_path, scale)
+            self.assertEqual(img.size, reduced_size((203, 157), scale))
+            self.assertEqual(img.size, gt.size)
+            self.assertEqual(img.mode, 'RGB')
+
+    def test_image_content(self):
+        full = np.asarray(load_image(self.jpg), dtype=np.float64)
+        reduced = np.asarray(load_image(self.jpg, 2), dtype=np.float64)
+        # Close to the average of the 2x2 blocks
+        self.assertLess(np.abs(reduced[:78, :101] - full[:156, :202].reshape(78, 2, 101, 2, 3).mean((1, 3))).mean(), 3)
+
+    def test_gt_nearest(self):
+        gt = np.asarray(load_ground_truth(self.gt_path, 4))
+        # No new label is created, the pixels are the top left ones of each block
+        self.assertTrue((gt == self.gt[::4, ::4]).all())
+
+    def test_cv2_imread(self):
+        self.assertEqual(cv2_imread(self.jpg, 2).shape, (79, 102, 3))
@@ -1,27 +1,203 @@
-# Keep the list of models implemented up-2-date
-# MLP
-from .FC_simple import FC_simple
-from .FC_medium import FC_medium
-# CNN
-from .TNet import TNet
-from ._AlexNet import alexnet
-from .CNN_basic import CNN_basic
-from ._Inception_v3 import inception_v3
-from ._ResNet import resnet18, resnet34, resnet50, resnet101, resnet152
-from ._VGG import vgg11, vgg11_bn, vgg13, vgg13_bn, vgg16, vgg16_bn, vgg19, vgg19_bn
-from .BabyResNet import babyresnet18, babyresnet34, babyresnet50, babyresnet101, babyresnet152
-from ._DenseNet import densenet121, densenet161, densenet169, densenet201
-# FCN
-from .UNet import unet
-from .SegNet import SegNet
-from .Xception import xception
-from .FusionNet import FusionNet
-from .CAE_basic import CAE_basic
-from .Deeplabv3 import deeplabv3
-from .CAE_medium import CAE_medium
-from .BabyUnet import BabyUnet
-from .Tiramisu import fcdensenet57, fcdensenet67, fcdensenet103
-from .SimplisticFCN import SimplisticFCN
+"""
+Registry of the models implemented.
+
+The models are imported lazily: the module implementing a model is imported only the first time the model
+is requested (either with get_model() or as attribute of this package e.g. models.CNN_basic). This avoids
+importing every architecture (and their dependencies) for running a single one.
+"""
+
+# Utils
+import importlib
+import logging
+import time
+from collections import namedtuple
+
+# Static information about a model, available without importing or instantiating it.
+#
+# module : string
+#     Module implementing the model (relative to this package)
+# expected_input_size : tuple(int,int) or int or None
+#     Input size the model expects (the `expected_input_size` attribute of the model). None if the model is fully
+#     convolutional and works with any input size.
+# input_channels : int or None
+#     Number of channels of the input (None for models working on feature vectors, or taking it as required argument)
+# output_stride : int or None
+#     Ratio between input and output resolution for dense prediction models (None for models outputting a vector)
+# num_parameters : int or None
+#     Number of parameters of the model instantiated with the default arguments. None if the model cannot be
+#     instantiated without specifying its output channels.
+# tasks : tuple(string)
+#     Tasks the model is meant for
+ModelMetadata = namedtuple('ModelMetadata', ['module', 'expected_input_size', 'input_channels', 'output_stride',
+                                             'num_parameters', 'tasks'])
+
+_CLASSIFICATION = ('classification', 'triplet', 'apply_model')
+_SEGMENTATION = ('segmentation',)
+_AUTO_ENCODING = ('auto_encoding',)
+
+# Keep the list of models implemented up-2-date: {model name : metadata of the model}
+_MODELS = {
+    # MLP
+    'FC_simple': ModelMetadata('.FC_simple', 2, None, None, 165, ('bidimensional',)),
+    'FC_medium': ModelMetadata('.FC_medium', 2, None, None, 258, ('bidimensional',)),
+    # CNN
+    'TNet': ModelMetadata('.TNet', (32, 32), 3, None, 602944, ('triplet',)),
+    'alexnet': ModelMetadata('._AlexNet', (227, 227), 3, None, 61100840, _CLASSIFICATION),
+    'CNN_basic': ModelMetadata('.CNN_basic', (32, 32), 3, None, 46306, _CLASSIFICATION),
+    'inception_v3': ModelMetadata('._Inception_v3', (299, 299), 3, None, 27161264, _CLASSIFICATION),
+    'resnet18': ModelMetadata('._ResNet', (224, 224), 3, None, 11689512, _CLASSIFICATION),
+    'resnet34': ModelMetadata('._ResNet', (224, 224), 3, None, 21797672, _CLASSIFICATION),
+    'resnet50': ModelMetadata('._ResNet', (224, 224), 3, None, 25557032, _CLASSIFICATION),
+    'resnet101': ModelMetadata('._ResNet', (224, 224), 3, None, 44549160, _CLASSIFICATION),
+    'resnet152': ModelMetadata('._ResNet', (224, 224), 3, None, 60192808, _CLASSIFICATION),
+    'vgg11': ModelMetadata('._VGG', (224, 224), 3, None, 132863336, _CLASSIFICATION),
+    'vgg11_bn': ModelMetadata('._VGG', (224, 224), 3, None, 132868840, _CLASSIFICATION),
+    'vgg13': ModelMetadata('._VGG', (224, 224), 3, None, 133047848, _CLASSIFICATION),
+    'vgg13_bn': ModelMetadata('._VGG', (224, 224), 3, None, 133053736, _CLASSIFICATION),
+    'vgg16': ModelMetadata('._VGG', (224, 224), 3, None, 138357544, _CLASSIFICATION),
+    'vgg16_bn': ModelMetadata('._VGG', (224, 224), 3, None, 138365992, _CLASSIFICATION),
+    'vgg19': ModelMetadata('._VGG', (224, 224), 3, None, 143667240, _CLASSIFICATION),
+    'vgg19_bn': ModelMetadata('._VGG', (224, 224), 3, None, 143678248, _CLASSIFICATION),
+    'babyresnet18': ModelMetadata('.BabyResNet', (32, 32), 3, None, 12191848, _CLASSIFICATION),
+    'babyresnet34': ModelMetadata('.BabyResNet', (32, 32), 3, None, 22521448, _CLASSIFICATION),
+    'babyresnet50': ModelMetadata('.BabyResNet', (32, 32), 3, None, 26093672, _CLASSIFICATION),
+    'babyresnet101': ModelMetadata('.BabyResNet', (32, 32), 3, None, 45085800, _CLASSIFICATION),
+    'babyresnet152': ModelMetadata('.BabyResNet', (32, 32), 3, None, 60729448, _CLASSIFICATION),
+    'densenet121': ModelMetadata('._DenseNet', (224, 224), 3, None, 7978856, _CLASSIFICATION),
+    'densenet161': ModelMetadata('._DenseNet', (224, 224), 3, None, 28681000, _CLASSIFICATION),
+    'densenet169': ModelMetadata('._DenseNet', (224, 224), 3, None, 14149480, _CLASSIFICATION),
+    'densenet201': ModelMetadata('._DenseNet', (224, 224), 3, None, 20013928, _CLASSIFICATION),
+    # FCN
+    'unet': ModelMetadata('.UNet', None, 3, 1, 34531592, _SEGMENTATION),
+    'SegNet': ModelMetadata('.SegNet', None, 3, 1, None, _SEGMENTATION),
+    'xception': ModelMetadata('.Xception', (299, 299), 3, None, 22855952, _CLASSIFICATION),
+    'FusionNet': ModelMetadata('.FusionNet', None, None, 1, None, _SEGMENTATION),
+    'CAE_basic': ModelMetadata('.CAE_basic', (96, 96), 3, 1, 333994, _AUTO_ENCODING),
+    'deeplabv3': ModelMetadata('.Deeplabv3', None, 3, 1, None, _SEGMENTATION),
+    'CAE_medium': ModelMetadata('.CAE_medium', (32, 32), 3, 1, 473235, _AUTO_ENCODING),
+    'BabyUnet': ModelMetadata('.BabyUnet', None, 3, 1, 32523, _SEGMENTATION),
+    'fcdensenet57': ModelMetadata('.Tiramisu', None, 3, 1, 1376216, _SEGMENTATION),
+    'fcdensenet67': ModelMetadata('.Tiramisu', None, 3, 1, 3462376, _SEGMENTATION),
+    'fcdensenet103': ModelMetadata('.Tiramisu', None, 3, 1, 9321320, _SEGMENTATION),
+    'SimplisticFCN': ModelMetadata('.SimplisticFCN', None, 3, 1, 287539, _SEGMENTATION),
+}
+
+__all__ = list(_MODELS.keys())
+
+
+def get_metadata(model_name):
+    """
+    Returns the static metadata of a model, without importing or instantiating it.
+    E.g. get_metadata('vgg16').expected_input_size is (224, 224)
+
+    Parameters
+    ----------
+    model_name : string
+        Name of the model as listed in models.__all__
+
+    Returns
+    -------
+    ModelMetadata
+        The metadata of the model (see ModelMetadata above)
+    """
+    if model_name not in _MODELS:
+        raise AttributeError("module '{}' has no model '{}'".format(__name__, model_name))
+    return _MODELS[model_name]
+
+
+def check_metadata(model_name, model):
+    """
+    Verifies that the metadata of a model matches an instance of it and logs a warning if it does not.
+
+    The input channels are the ones of the first convolution of the model and the output stride is measured with a
+    forward pass of a dummy input (of the expected input size, or 64x64 for the fully convolutional models). The
+    model is expected to be instantiated in the mode of its task (e.g. CAE_basic in auto-encoder mode).
+
+    Parameters
+    ----------
+    model_name : string
+        Name of the model as listed in models.__all__
+    model : torch.nn.Module
+        An instance of the model
+
+    Returns
+    -------
+    bool
+        True if the expected input size, the input channels and the output stride declared in the metadata match
+        the ones of the model
+    """
+    import torch
+
+    metadata = get_metadata(model_name)
+    actual = {'expected_input_size': getattr(model, 'expected_input_size', None)}
+
+    # The first layer of the model: a convolution, or a fully connected layer for the models working on vectors
+    first_layer = next(m for m in model.modules() if isinstance(m, (torch.nn.Conv2d, torch.nn.Linear)))
+    if isinstance(first_layer, torch.nn.Conv2d):
+        actual['input_channels'] = first_layer.in_channels
+        height, width = actual['expected_input_size'] or (64, 64)
+        input = torch.zeros(1, first_layer.in_channels, height, width)
+    else:
+        actual['input_channels'] = None
+        input = torch.zeros(1, first_layer.in_features)
+    training = model.training
+    model.eval()
+    with torch.no_grad():
+        output = model(input)
+    model.train(training)
+    if isinstance(output, (tuple, list)):
+        # E.g. the models also returning their features
+        output = output[0]
+    # None if the model outputs a vector
+    actual['output_stride'] = input.size(2) // output.size(2) if output.dim() == 4 else None
+
+    if metadata.input_channels is None and isinstance(first_layer, torch.nn.Conv2d):
+        # The input channels are a required argument of the model (see FusionNet)
+        del actual['input_channels']
+
+    matches = True
+    for name, value in actual.items():
+        if getattr(metadata, name) != value:
+            logging.warning('Metadata of model {} does not match the model: {} is {} but the model has {}'
+                            .format(model_name, name, getattr(metadata, name), value))
+            matches = False
+    return matches
+
+
+def get_model(model_name):
+    """
+    Returns the class (or factory function) of a model, importing the module implementing it if necessary.
+
+    Parameters
+    ----------
+    model_name : string
+        Name of the model as listed in models.__all__
+
+    Returns
+    -------
+    callable
+        The model class or factory function
+    """
+    if model_name not in _MODELS:
+        raise AttributeError("module '{}' has no model '{}'".format(__name__, model_name))
+    start_time = time.time()
+    model = getattr(importlib.import_module(_MODELS[model_name].module, __name__), model_name)
+    # Importing a sub-module binds it on this package, which might shadow the model with the same name
+    globals()[model_name] = model
+    logging.debug('Model {} resolved in {:.3f}s'.format(model_name, time.time() - start_time))
+    return model
+
+
+def __getattr__(name):
+    # Called only for the names not (yet) in the namespace of the package
+    if name in _MODELS:
+        return get_model(name)
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
+
 
 """
 Formula to compute the output size of a conv. layer
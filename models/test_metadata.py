@@ -0,0 +1,51 @@
+import pytest
+import torch
+
+import models
+
+# The layer names of _DenseNet contain a '.', which recent versions of torch reject
+_DENSENETS = ['densenet121', 'densenet161', 'densenet169', 'densenet201']
+
+# The models which cannot be instantiated with the default arguments (num_parameters is None) or whose default mode
+# is not the one of their task
+_ARGUMENTS = {'CAE_basic': {'auto_encoder_mode': True},
+              'SegNet': {'output_channels': 4},
+              'FusionNet': {'input_nc': 3, 'output_nc': 4, 'ngf': 8},
+              'deeplabv3': {'output_channels': 4}}
+
+
+@pytest.mark.parametrize('model_name', [
+    pytest.param(name, marks=pytest.mark.xfail(reason="layer names not supported by this torch version"))
+    if name in _DENSENETS else name
+    for name in models.__all__])
+def test_metadata_matches_model(model_name):
+    metadata = models.get_metadata(model_name)
+    model = models.get_model(model_name)(**_ARGUMENTS.get(model_name, {}))
+
+    assert models.check_metadata(model_name, model)
+    if metadata.num_parameters is None:
+        assert model_name in _ARGUMENTS
+    else:
+        # The same layers in every mode
+        assert metadata.num_parameters == sum([p.numel() for p in model.parameters()])
+
+
+def test_metadata_unknown_model():
+    with pytest.raises(AttributeError):
+        models.get_metadata('not_a_model')
+
+
+def test_check_metadata_detects_mismatch():
+    model = torch.nn.Linear(2, 2)
+    model.expected_input_size = (64, 64)
+    assert not models.check_metadata('CNN_basic', model)
+
+
+def test_check_metadata_detects_wrong_channels_and_stride():
+    # A fully convolutional model with 1 input channel and an output stride of 2
+    model = torch.nn.Conv2d(1, 4, kernel_size=2, stride=2)
+    assert not models.check_metadata('BabyUnet', model)
+    model = torch.nn.Conv2d(3, 4, kernel_size=2, stride=2)
+    assert not models.check_metadata('BabyUnet', model)
+    model = torch.nn.Conv2d(3, 4, kernel_size=3, padding=1)
+    assert models.check_metadata('BabyUnet', model)
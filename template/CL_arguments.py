@@ -2,9 +2,6 @@
 import argparse
 import os
 
-# Torch
-import torch
-
 # DeepDIVA
 import models
 import sys
@@ -34,6 +31,16 @@ def parse_arguments(args=None):
     # Parse argument
     args = parser.parse_args(args)
 
+    # Keeping the last 0 checkpoints would mean not saving them at all
+    if args.checkpoint_keep_last is not None and args.checkpoint_keep_last < 1:
+        parser.error('--checkpoint-keep-last must be at least 1')
+
+    # Checked once parsed rather than with choices: listing them imports torch, which takes seconds (e.g. for --help)
+    optimizer_options = _optimizer_names()
+    if args.optimizer_name not in optimizer_options:
+        parser.error("argument --optimizer-name: invalid choice: '{}' (choose from {})"
+                     .format(args.optimizer_name, ', '.join("'{}'".format(name) for name in optimizer_options)))
+
     # Recover dataset name
     dataset = os.path.basename(os.path.normpath(args.dataset_folder))
 
@@ -128,6 +135,12 @@ def _data_options(parser):
                              default=False,
                              action='store_true',
                              help='Enable the deep dataset integrity verification')
+    parser_data.add_argument('--decode-scale',
+                             type=int,
+                             choices=[1, 2, 4, 8],
+                             default=1,
+                             help='decode the images at 1/N of their resolution (directly in the JPEG decoder when '
+                                  'possible, the ground truths with nearest neighbour)')
 
 
 def _training_options(parser):
@@ -136,7 +149,7 @@ def _training_options(parser):
     """
     # List of possible custom models already implemented
     # NOTE: If a model is missing and you get a argument parser error: check in the init file of models if its there!
-    model_options = [name for name in models.__dict__ if callable(models.__dict__[name])]
+    model_options = models.__all__
 
     parser_train = parser.add_argument_group('TRAIN', 'Training Options')
     parser_train.add_argument('--model-name',
@@ -177,6 +190,20 @@ def _training_options(parser):
                               action='store_true',
                               default=False,
                               help='make a checkpoint after every epoch')
+    parser_train.add_argument('--checkpoint-keep-last',
+                              type=int,
+                              default=None, metavar='K',
+                              help='with --checkpoint-all-epochs keep only the checkpoints of the last K epochs')
+    parser_train.add_argument('--checkpoint-interval',
+                              type=int,
+                              default=None, metavar='N',
+                              help='make a resumable checkpoint every N mini-batches (semantic_segmentation_hisdb), '
+                                   'written to checkpoint_step.pth.tar in the log folder')
+    parser_train.add_argument('--grid-resolution',
+                              type=int,
+                              default=100,
+                              help='points per axis of the grid on which the decision boundaries are plotted '
+                                   '(bidimensional)')
 
 def _apply_options(parser):
     """
@@ -196,21 +223,39 @@ def _apply_options(parser):
                               type=int,
                               default=None,
                               help='override the number of output channels for loading specific models')
+    parser_apply.add_argument('--quantize',
+                              choices=['dynamic', 'static', 'auto'],
+                              default=None,
+                              help='quantize the model in int8 before applying it (CPU only, see util.quantization)')
+    parser_apply.add_argument('--quantize-calibration-batches',
+                              type=int,
+                              default=10, metavar='N',
+                              help='number of mini-batches to calibrate the static quantization')
+    parser_apply.add_argument('--load-quantized',
+                              type=str,
+                              default=None,
+                              help='path to a quantized model saved by a previous run with --quantize')
+
+
+def _optimizer_names():
+    """
+    List of possible optimizers already implemented in PyTorch
+    """
+    import torch
+    return [name for name in torch.optim.__dict__ if callable(torch.optim.__dict__[name])]
 
 
 def _optimizer_options(parser):
     """
     Options specific for optimizers
     """
-    # List of possible optimizers already implemented in PyTorch
-    optimizer_options = [name for name in torch.optim.__dict__ if callable(torch.optim.__dict__[name])]
-
     parser_optimizer = parser.add_argument_group('OPTIMIZER', 'Optimizer Options')
 
     parser_optimizer.add_argument('--optimizer-name',
-                                  choices=optimizer_options,
+                                  type=str,
                                   default='SGD',
-                                  help='optimizer to be used for training')
+                                  help='optimizer to be used for training, one of the optimizers of torch.optim '
+                                       '(e.g. SGD, Adam)')
     parser_optimizer.add_argument('--lr',
                                   type=float,
                                   default=0.001,
@@ -245,6 +290,11 @@ def _system_options(parser):
                                action='store_true',
                                default=False,
                                help='run on CPU')
+    parser_system.add_argument('--precision',
+                               choices=['fp32', 'bf16'],
+                               default='fp32',
+                               help='precision of the forward passes: bf16 runs them under autocast with bfloat16 '
+                                    '(loss and metrics stay in float32)')
     parser_system.add_argument('--seed',
                                type=int,
                                default=None,
@@ -253,10 +303,28 @@ def _system_options(parser):
                                type=int,
                                default=20,
                                help='print loss/accuracy every N batches')
+    parser_system.add_argument('--tensorboard-mb-resolution',
+                               type=int,
+                               default=None, metavar='N',
+                               help='log the mean/min/max of the mini-batch scalars every N steps instead of each one')
+    parser_system.add_argument('--matplotlib-plots',
+                               default=False, action='store_true',
+                               help='render confusion matrices and curves with matplotlib (slower, higher quality)')
     parser_system.add_argument('-j', '--workers',
                                type=int,
                                default=4,
                                help='workers used for train/val loaders')
+    parser_system.add_argument('--persistent-workers',
+                               default=False, action='store_true',
+                               help='keep the workers of the train/val loaders alive across epochs')
+    parser_system.add_argument('--distributed',
+                               default=False, action='store_true',
+                               help='data-parallel training over the processes started with torchrun '
+                                    '(see util.distributed)')
+    parser_system.add_argument('--dist-backend',
+                               type=str,
+                               default='gloo',
+                               help='backend of torch.distributed: "gloo" (CPU/GPU) or "nccl" (GPU)')
 
 def _triplet_options(parser):
     """
@@ -317,6 +385,12 @@ def _semantic_segmentation_options(parser):
                                        type=int,
                                        default=50, metavar='N',
                                        help='number of crops per iterations per page')
+    semantic_segmentation.add_argument('--crop-foreground-ratios',
+                                       type=str, nargs='+',
+                                       default=None, metavar='CODE:RATIO',
+                                       help='fraction of the training crops drawn towards each foreground class, '
+                                            'given by its value in the blue channel of the ground truth, '
+                                            'e.g. 2:0.2 4:0.2 8:0.2 (the others are uniform)')
 
     semantic_segmentation.add_argument('--use-boundary-pixel',
                              default=False,
@@ -337,4 +411,14 @@ def _semantic_segmentation_options(parser):
     semantic_segmentation.add_argument('--resize-coco',
                                        type=int,
                                        default=None, metavar='size',
-                                       help='size you want coco input to be resized to')
\ No newline at end of file
+                                       help='size you want coco input to be resized to')
+    semantic_segmentation.add_argument('--disable-coco-mask-cache',
+                                       default=False,
+                                       action='store_true',
+                                       help='rasterize the coco annotations at every access instead of caching the '
+                                            'masks in dataset-folder/mask_cache')
+    semantic_segmentation.add_argument('--coco-bucketing',
+                                       default=False,
+                                       action='store_true',
+                                       help='batch coco images of similar aspect ratio and size together and pad them '
+                                            'only to the largest image of the mini-batch (ignored with --resize-coco)')
\ No newline at end of file
@@ -30,17 +30,12 @@ import datetime
 import json
 import logging
 import numpy as np
-from sklearn.model_selection import ParameterGrid
-
-# SigOpt
-from sigopt import Connection
 
 # DeepDIVA
+# NOTE: the heavy dependencies (the runners, the models, SigOpt, sklearn, ...) are imported only
+# when needed, such that parsing the arguments (e.g. --help) and starting small jobs is fast.
 import template.CL_arguments
 import template.runner
-from template.setup import set_up_env, set_up_logging, copy_code
-from util.misc import to_capital_camel_case, save_image_and_log_to_tensorboard
-from util.visualization.mean_std_plot import plot_mean_std
 
 
 ########################################################################################################################
@@ -112,6 +107,8 @@ class RunMe:
         None, None, None
             At the moment it is not necessary to return meaningful values from here
         """
+        from sigopt import Connection
+
         # Load parameters from file
         with open(args.sig_opt, 'r') as f:
             parameters = json.loads(f.read())
@@ -160,6 +157,8 @@ class RunMe:
         None, None, None
             At the moment it is not necessary to return meaningful values from here
         """
+        from sklearn.model_selection import ParameterGrid
+
         logging.info('Hyper Parameter Optimization mode')
         # Open file with the boundaries and create a grid-like list of parameters to try
         with open(args.hyper_param_optim, 'r') as f:
@@ -194,12 +193,24 @@ class RunMe:
         test_scores : float
             Score value for test split
         """
+        import_start_time = time.time()
+        from template.setup import set_up_env, set_up_logging, copy_code
+        import_time = time.time() - import_start_time
+
+        # Join the other processes of a distributed run (the folder and the logging depend on the rank)
+        if args.distributed:
+            RunMe._set_up_distributed(args)
+
         # Set up logging
         # Don't use args.output_folder as that breaks when using SigOpt
         current_log_folder, writer = set_up_logging(parser=RunMe.parser, args_dict=args.__dict__, **args.__dict__)
+        logging.info('Framework set up loaded in {:.3f}s'.format(import_time))
 
-        # Copy the code into the output folder
-        copy_code(output_folder=current_log_folder)
+        # Copy the code into the output folder. The snapshots are shared among all the runs in the output folder.
+        from util.distributed import is_main_process
+        if is_main_process():
+            copy_code(output_folder=current_log_folder,
+                      cache_folder=os.path.join(args.output_folder, '.code_snapshots'))
 
         # Check Git status to verify all local changes have been committed
         if args.ignoregit:
@@ -236,10 +247,9 @@ class RunMe:
         # Set up execution environment. Specify CUDA_VISIBLE_DEVICES and seeds
         set_up_env(**args.__dict__)
 
-        # Select with introspection which runner class should be used.
+        # Select which runner class should be used (its package is imported only now).
         # Default is runner.image_classification.image_classification
-        runner_class = getattr(sys.modules["template.runner." + args.runner_class],
-                               args.runner_class).__dict__[to_capital_camel_case(args.runner_class)]
+        runner_class = template.runner.get_runner(args.runner_class)
 
         try:
             # Run the actual experiment
@@ -271,6 +281,36 @@ class RunMe:
             print('All done! (Log files at {} )'.format(current_log_folder))
         return train_scores, val_scores, test_scores
 
+    # Runners whose train and evaluation routines support the distributed mode
+    DISTRIBUTED_RUNNERS = ['image_classification', 'semantic_segmentation_hisdb']
+
+    @staticmethod
+    def _set_up_distributed(args):
+        """
+        Joins the process group of a distributed run (see util.distributed) and checks that the options support it.
+
+        Parameters
+        ----------
+        args : dict
+            Contains all command line arguments parsed.
+
+        Returns
+        -------
+            None
+        """
+        from util.distributed import init_distributed
+
+        if args.runner_class not in RunMe.DISTRIBUTED_RUNNERS:
+            logging.error('The runner {} does not support --distributed. Supported runners: {}'
+                          .format(args.runner_class, ', '.join(RunMe.DISTRIBUTED_RUNNERS)))
+            sys.exit(-1)
+        init_distributed(backend=args.dist_backend, no_cuda=args.no_cuda)
+        if args.checkpoint_interval:
+            # The state of the data of the other processes would not be part of the checkpoints
+            logging.warning('Mid-epoch checkpoints are not supported in distributed mode: --checkpoint-interval '
+                            'is ignored')
+            args.checkpoint_interval = None
+
     @staticmethod
     def _multi_run(runner_class, writer, current_log_folder, args):
         """
@@ -301,6 +341,9 @@ class RunMe:
             Train, Val and Test results for each run (n) and epoch
         """
 
+        from util.misc import save_image_and_log_to_tensorboard
+        from util.visualization.mean_std_plot import plot_mean_std
+
         # Instantiate the scores tables which will stores the results.
         train_scores = np.zeros((args.multi_run, args.epochs))
         val_scores = np.zeros((args.multi_run, args.epochs + 1))
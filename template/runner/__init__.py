@@ -1,14 +1,57 @@
-from .apply_model import ApplyModel
-from .apply_model_hisdb import ApplyModelHisdb
-from .bidimensional import Bidimensional
-from .image_classification import ImageClassification
-from .triplet import Triplet
-from .image_auto_encoding import ImageAutoEncoding
-from .semantic_segmentation import SemanticSegmentation
-from .semantic_segmentation_hisdb import SemanticSegmentationHisdb
-from .semantic_segmentation_hisdb_singleclass import SemanticSegmentationHisdbSingleclass
-from .semantic_segmentation_coco import SemanticSegmentationCoco
-
-__all__ = ['ImageClassification', 'Bidimensional', 'Triplet', 'ApplyModel',
-           'ImageAutoEncoding', 'SemanticSegmentation', 'SemanticSegmentationHisdb',
-           'SemanticSegmentationHisdbSingleclass', 'ApplyModelHisdb', 'SemanticSegmentationCoco']
\ No newline at end of file
+"""
+Registry of the runner classes.
+
+A runner class is defined as a module in template.runner. The runners are imported lazily: the package of a
+runner (and therefore all its dependencies) is imported only when the runner is requested with get_runner().
+"""
+
+# Utils
+import importlib
+import logging
+import time
+
+# Keep the list of runners implemented up-2-date: {runner class (as in --runner-class) : name of the class}
+_RUNNERS = {
+    'image_classification': 'ImageClassification',
+    'bidimensional': 'Bidimensional',
+    'triplet': 'Triplet',
+    'apply_model': 'ApplyModel',
+    'image_auto_encoding': 'ImageAutoEncoding',
+    'semantic_segmentation': 'SemanticSegmentation',
+    'semantic_segmentation_hisdb': 'SemanticSegmentationHisdb',
+    'semantic_segmentation_hisdb_singleclass': 'SemanticSegmentationHisdbSingleclass',
+    'apply_model_hisdb': 'ApplyModelHisdb',
+    'semantic_segmentation_coco': 'SemanticSegmentationCoco',
+}
+
+__all__ = list(_RUNNERS.values())
+
+
+def get_runner(runner_class):
+    """
+    Returns the class of a runner, importing its package if necessary.
+
+    Parameters
+    ----------
+    runner_class : string
+        Name of the runner as in the --runner-class argument e.g. 'image_classification'
+
+    Returns
+    -------
+    class
+        The runner class e.g. ImageClassification
+    """
+    if runner_class not in _RUNNERS:
+        raise ValueError("Runner class '{}' does not exist".format(runner_class))
+    start_time = time.time()
+    runner = getattr(importlib.import_module('.' + runner_class, __name__), _RUNNERS[runner_class])
+    logging.info('Runner {} loaded in {:.3f}s'.format(_RUNNERS[runner_class], time.time() - start_time))
+    return runner
+
+
+def __getattr__(name):
+    # Allows the former from template.runner import ImageClassification
+    for runner_class, class_name in _RUNNERS.items():
+        if class_name == name:
+            return get_runner(runner_class)
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
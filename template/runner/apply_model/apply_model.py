@@ -17,6 +17,8 @@ import models
 from template.runner.apply_model import evaluate
 from template.runner.apply_model.setup import set_up_dataloader
 from template.setup import set_up_model
+from util.evaluation.metrics.accuracy import accuracy
+from util.quantization import set_up_quantized_model
 
 
 # Utils
@@ -66,7 +68,7 @@ class ApplyModel:
         """
 
         # Get the selected model input size
-        model_expected_input_size = models.__dict__[model_name]().expected_input_size
+        model_expected_input_size = models.get_metadata(model_name).expected_input_size
         logging.info('Model {} expects input size of {}'.format(model_name, model_expected_input_size))
 
         # Setting up the dataloaders
@@ -82,6 +84,16 @@ class ApplyModel:
                                          train_loader=None,
                                          **kwargs)
 
+        # Quantizing the model (if requested)
+        model = set_up_quantized_model(model=model,
+                                       data_loader=data_loader,
+                                       get_batch=ApplyModel._get_input_target,
+                                       metric=ApplyModel._accuracy if classify else None,
+                                       metric_name='accuracy',
+                                       current_log_folder=current_log_folder,
+                                       writer=writer,
+                                       **kwargs)
+
         logging.info('Apply model to dataset')
         results = ApplyModel._feature_extract(writer=writer,
                                               data_loader=data_loader,
@@ -93,6 +105,20 @@ class ApplyModel:
             pickle.dump(results, f)
         return None, None, None
 
+    @staticmethod
+    def _get_input_target(batch):
+        """Returns the input and the labels of a mini-batch of the data loader, with the multiple crops flattened"""
+        data, label, _ = batch
+        if len(data.size()) == 5:
+            data = data.view(-1, *data.size()[2:])
+        return data, label
+
+    @staticmethod
+    def _accuracy(output, label):
+        """Returns the accuracy of the output of a mini-batch, averaged over its multiple crops if any"""
+        output = output.view(len(label), -1, output.size(-1)).mean(1)
+        return accuracy(output, label)[0].item()
+
     ####################################################################################################################
     # These methods delegate their function to other classes in this package.
     # It is useful because sub-classes can selectively change the logic of certain parts only.
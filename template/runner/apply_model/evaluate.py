@@ -10,9 +10,10 @@ from tqdm import tqdm
 from util.misc import save_image_and_log_to_tensorboard
 # DeepDIVA
 from util.visualization.confusion_matrix_heatmap import make_heatmap
+from util.precision import forward
 
 
-def feature_extract(data_loader, model, writer, epoch, no_cuda, log_interval, classify, **kwargs):
+def feature_extract(data_loader, model, writer, epoch, no_cuda, log_interval, classify, precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -35,6 +36,8 @@ def feature_extract(data_loader, model, writer, epoch, no_cuda, log_interval, cl
 
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     classify : boolean
         Specifies whether to generate a classification report for the data or not.
@@ -64,7 +67,7 @@ def feature_extract(data_loader, model, writer, epoch, no_cuda, log_interval, cl
         data_a = Variable(data, volatile=True)
 
         # Compute output
-        out = model(data_a)
+        out = forward(model, data_a, precision, no_cuda)
 
         if multi_crop:
             out = out.view(bs, ncrops, -1).mean(1)
@@ -8,6 +8,7 @@ instead of hard-coding stuff.
 import logging
 import sys
 import os
+from functools import partial
 
 # Utils
 import numpy as np
@@ -22,6 +23,8 @@ from template.runner.apply_model_hisdb import evaluate
 from template.setup import set_up_model
 from .setup import set_up_dataloader
 from util.misc import checkpoint, adjust_learning_rate
+from util.evaluation.metrics.accuracy import accuracy_segmentation
+from util.quantization import set_up_quantized_model
 
 
 class ApplyModelHisdb:
@@ -84,6 +87,16 @@ class ApplyModelHisdb:
                                          train_loader=None,
                                          **kwargs)
 
+        # Quantizing the model (if requested)
+        model = set_up_quantized_model(model=model,
+                                       data_loader=aply_ds_loader,
+                                       get_batch=ApplyModelHisdb._get_input_target,
+                                       metric=partial(ApplyModelHisdb._mean_iu, num_classes=num_classes),
+                                       metric_name='meanIU',
+                                       current_log_folder=current_log_folder,
+                                       writer=writer,
+                                       **kwargs)
+
         # Test
         meanIU = ApplyModelHisdb._apply_model(aply_ds_loader, model, criterion, writer, epochs - 1, class_names, **kwargs)
         logging.info('Segmentation completed')
@@ -115,6 +128,17 @@ class ApplyModelHisdb:
                                   model_expected_input_size=model_expected_input_size))
             sys.exit(-1)
 
+    @staticmethod
+    def _get_input_target(batch):
+        """Returns the input patches of a mini-batch of the data loader and their class numbers"""
+        (input, _, _, _), target = batch
+        return input, target.argmax(1)
+
+    @staticmethod
+    def _mean_iu(output, target, num_classes):
+        """Returns the meanIU of the output of a mini-batch"""
+        return accuracy_segmentation(target.numpy(), output.argmax(1).numpy(), num_classes)[2]
+
     ####################################################################################################################
     """
     These methods delegate their function to other classes in this package. 
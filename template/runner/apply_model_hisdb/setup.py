@@ -1,8 +1,6 @@
 # Utils
 import logging
 import os
-from sklearn.preprocessing import OneHotEncoder
-
 
 # TODO: from __future__ import print_function
 import torch
@@ -14,6 +12,10 @@ from datasets.image_folder_segmentation_hisdb import ImageFolder
 from template.setup import _load_mean_std_from_file, _get_optimizer, \
     _load_class_frequencies_weights_from_file
 from datasets.transform_library import transforms
+from util.label_codec import LabelCodec
+
+# Classes of the network <-> values of the blue channel of the ground truth
+LABELS = LabelCodec(gt_codes=[1, 2, 4, 6, 8, 10, 12, 14])
 
 
 def set_up_dataloader(model_expected_input_size, dataset_folder, batch_size, workers, inmem, **kwargs):
@@ -91,19 +93,9 @@ def one_hot_to_np_bgr(matrix):
         sparse one-hot encoded matrix, where #C is the number of classes
     Returns
     -------
-    numpy array of size [C x H x W] (BGR)
+    numpy array of size [H x W x C] (BGR)
     """
-    B = np.argmax(matrix, axis=0)
-    class_to_B = {i: j for i, j in enumerate([1, 2, 4, 6, 8, 10, 12, 14])}
-
-    masks = [B == old for old in class_to_B.keys()]
-
-    for mask, (old, new) in zip(masks, class_to_B.items()):
-        B = np.where(mask, new, B)
-
-    bgr = np.dstack((B, np.zeros(shape=(B.shape[0], B.shape[1], 2), dtype=np.int8)))
-
-    return bgr
+    return LABELS.one_hot_to_np_bgr(matrix)
 
 
 def one_hot_to_full_output(one_hot, coordinates, combined_one_hot, output_dim):
@@ -126,7 +118,8 @@ def one_hot_to_full_output(one_hot, coordinates, combined_one_hot, output_dim):
     combined_one_hot: numpy matrix [#C x Htot x Wtot]
     """
     if len(combined_one_hot) == 0:
-        combined_one_hot = np.zeros((one_hot.shape[0], *output_dim))
+        # The canvas has the precision of the network output (float32) rather than float64: half the memory
+        combined_one_hot = np.zeros((one_hot.shape[0], *output_dim), dtype=one_hot.dtype)
 
     x1, y1 = coordinates
     x2, y2 = (min(x1 + one_hot.shape[1], output_dim[0]), min(y1 + one_hot.shape[2], output_dim[1]))
@@ -138,7 +131,8 @@ def one_hot_to_full_output(one_hot, coordinates, combined_one_hot, output_dim):
 
     return combined_one_hot
 
-def gt_to_one_hot(matrix, num_classes):
+
+def gt_to_one_hot(matrix, num_classes=None):
     """
     Convert ground truth tensor to one-hot encoded matrix
 
@@ -152,28 +146,21 @@ def gt_to_one_hot(matrix, num_classes):
     torch.LongTensor of size [#C x H x W]
         sparse one-hot encoded multi-class matrix, where #C is the number of classes
     """
-    # TODO: ugly fix -> better to not normalize in the first place
-    if type(matrix).__module__ == np.__name__:
-        im_np = matrix[:, :, 2].astype(np.uint8)
-        border_mask = matrix[:, :, 0].astype(np.uint8) != 0
-    else:
-        np_array = (matrix * 255).numpy().astype(np.uint8)
-        im_np = np_array[2, :, :].astype(np.uint8)
-        border_mask = np_array[0, :, :].astype(np.uint8) != 0
-
-    # ajust blue channel according to border pixel in red channel
-    im_np[border_mask] = 1
-
-    integer_encoded = np.array([i for i in range(num_classes)])
-    onehot_encoder = OneHotEncoder(sparse=False)
-    integer_encoded = integer_encoded.reshape(len(integer_encoded), 1)
-    onehot_encoded = onehot_encoder.fit_transform(integer_encoded).astype(np.int8)
-
-    np.place(im_np, im_np == 0, 1) # needed to deal with 0 fillers at the borders during testing (replace with background)
-    replace_dict = {k: v for k, v in zip([1, 2, 4, 6, 8, 10, 12, 14], onehot_encoded)}
-
-    # create the one hot matrix
-    one_hot_matrix = np.asanyarray(
-        [[replace_dict[im_np[i, j]] for j in range(im_np.shape[1])] for i in range(im_np.shape[0])]).astype(np.uint8)
-
-    return torch.LongTensor(one_hot_matrix.transpose((2, 0, 1)))
\ No newline at end of file
+    return LABELS.gt_to_one_hot(matrix, num_classes)
+
+
+def gt_to_classes(matrix):
+    """
+    Convert ground truth tensor to the matrix of the classes of its pixels
+
+    Parameters
+    -------
+    matrix: float tensor from to_tensor() or numpy array
+        shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) BGR
+
+    Returns
+    -------
+    numpy array of size [H x W]
+        class of each pixel
+    """
+    return LABELS.gt_to_classes(matrix)
@@ -26,7 +26,7 @@ from util.visualization.decision_boundaries import plot_decision_boundaries
 class Bidimensional(ImageClassification):
     @staticmethod
     def single_run(writer, current_log_folder, model_name, epochs, lr, decay_lr,
-                   validation_interval, checkpoint_all_epochs, **kwargs):
+                   validation_interval, checkpoint_all_epochs, grid_resolution=100, **kwargs):
         """
         This is the main routine where train(), validate() and test() are called.
 
@@ -50,6 +50,8 @@ class Bidimensional(ImageClassification):
             Run evaluation on validation set every N epochs
         checkpoint_all_epochs : bool
             If enabled, save checkpoint after every epoch.
+        grid_resolution : int
+            Number of points per axis of the grid on which the decision boundaries are evaluated
 
         Returns
         -------
@@ -62,7 +64,7 @@ class Bidimensional(ImageClassification):
         """
 
         # Get the selected model
-        model_expected_input_size = models.__dict__[model_name]().expected_input_size
+        model_expected_input_size = models.get_metadata(model_name).expected_input_size
         Bidimensional._validate_model_input_size(model_expected_input_size, model_name)
         logging.info('Model {} expects input size of {}'.format(model_name, model_expected_input_size))
 
@@ -82,17 +84,14 @@ class Bidimensional(ImageClassification):
         train_value = np.zeros((epochs - start_epoch))
 
         # Make data for points
-        grid_resolution = 100
-        mini_batches = np.array([input_mini_batch.numpy() for input_mini_batch, _ in val_loader])
-        val_coords = np.squeeze(np.array([sample for mini_batch in mini_batches for sample in mini_batch]))
+        val_coords = torch.cat([input_mini_batch for input_mini_batch, _ in val_loader]).view(-1, 2).numpy()
 
         min_x, min_y = np.min(val_coords[:, 0]), np.min(val_coords[:, 1])
         max_x, max_y = np.max(val_coords[:, 0]), np.max(val_coords[:, 1])
-        coords = np.array([[x, y]
-                           for x in np.linspace(min_x, max_x, grid_resolution)
-                           for y in np.linspace(min_y, max_y, grid_resolution)
-                           ])
-        coords = torch.autograd.Variable(torch.from_numpy(coords).type(torch.FloatTensor))
+        # All the points of the grid, x-major
+        grid_x, grid_y = np.meshgrid(np.linspace(min_x, max_x, grid_resolution),
+                                     np.linspace(min_y, max_y, grid_resolution), indexing='ij')
+        coords = torch.from_numpy(np.stack([grid_x.ravel(), grid_y.ravel()], axis=1)).type(torch.FloatTensor)
 
         if not kwargs['no_cuda']:
             coords = coords.cuda(async=True)
@@ -125,7 +124,8 @@ class Bidimensional(ImageClassification):
                                     best_value=best_value, model=model,
                                     optimizer=optimizer,
                                     log_dir=current_log_folder,
-                                    checkpoint_all_epochs=checkpoint_all_epochs)
+                                    checkpoint_all_epochs=checkpoint_all_epochs,
+                                    **kwargs)
 
             # PLOT: decision boundary routine
             Bidimensional._evaluate_and_plot_decision_boundary(model=model, val_coords=val_coords, coords=coords,
@@ -170,7 +170,7 @@ class Bidimensional(ImageClassification):
 
     @staticmethod
     def _evaluate_and_plot_decision_boundary(model, val_coords, coords, grid_resolution, val_loader, num_classes,
-                                             writer, epoch, no_cuda, epochs, **kwargs):
+                                             writer, epoch, no_cuda, epochs, chunk_size=2 ** 16, **kwargs):
         """
         This routine is responsible for creating the visualization "decision boundaries".
         See https://diva-dia.github.io/DeepDIVAweb/articles/visualize-results/ for more
@@ -182,8 +182,8 @@ class Bidimensional(ImageClassification):
             The model
         val_coords : list
             List of all validation points
-        coords : torch.autograd.Variable
-            List of all the points to be evaluated on the grid
+        coords : torch.FloatTensor
+            All the points of the grid to be evaluated (x-major)
         grid_resolution : int
             How many points per axis on the grid
         val_loader : torch.utils.data.DataLoader
@@ -198,6 +198,8 @@ class Bidimensional(ImageClassification):
             Number of the epoch
         no_cuda : boolean
             Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
+        chunk_size : int
+            Number of points of the grid evaluated at once
 
         Returns
         -------
@@ -207,25 +209,21 @@ class Bidimensional(ImageClassification):
         min_x, min_y = np.min(val_coords[:, 0]), np.min(val_coords[:, 1])
         max_x, max_y = np.max(val_coords[:, 0]), np.max(val_coords[:, 1])
 
-        # Create a list of points in a grid fashion
+        # Create a list of points in a grid fashion, indexed like coords (x-major)
         grid_x = np.linspace(min_x, max_x, grid_resolution)
         grid_y = np.linspace(min_y, max_y, grid_resolution)
-        grid_x, grid_y = np.meshgrid(grid_x, grid_y)
-
-        # Softmax for deciding the final color of the prediction
-        sm = nn.Softmax(dim=0)
-
-        # Forward pass on the points
-        if not no_cuda:
-            outputs = model(coords)
-            outputs = sm(outputs)
-            outputs = outputs.data.cpu().numpy()
-        else:
-            outputs = sm(model(coords)).data.numpy()
-
-        # Get classes and confidence for each point
-        output_winners = np.array([np.argmax(item) for item in outputs])
-        outputs_confidence = np.array([outputs[i, item] for i, item in enumerate(output_winners)])
+        grid_x, grid_y = np.meshgrid(grid_x, grid_y, indexing='ij')
+
+        # Forward pass on the points, a chunk at a time. The winner is the class with the highest softmax, which is
+        # the confidence deciding the final color of the prediction
+        output_winners, outputs_confidence = [], []
+        with torch.no_grad():
+            for chunk in torch.split(coords, chunk_size):
+                confidence, winners = nn.functional.softmax(model(chunk), dim=1).max(dim=1)
+                output_winners.append(winners.cpu())
+                outputs_confidence.append(confidence.cpu())
+        output_winners = torch.cat(output_winners).numpy()
+        outputs_confidence = torch.cat(outputs_confidence).numpy()
 
         # Create plot
         plot_decision_boundaries(output_winners=output_winners, output_confidence=outputs_confidence,
@@ -14,6 +14,7 @@ from util.evaluation.metrics import accuracy
 # DeepDIVA
 from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard
 from util.visualization.confusion_matrix_heatmap import make_heatmap
+from util.precision import forward
 
 
 def validate(val_loader, model, criterion, writer, epoch, no_cuda=False, log_interval=20, **kwargs):
@@ -26,7 +27,8 @@ def test(test_loader, model, criterion, writer, epoch, no_cuda=False, log_interv
     return _evaluate(test_loader, model, criterion, writer, epoch, 'test', no_cuda, log_interval, **kwargs)
 
 
-def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cuda=False, log_interval=10, **kwargs):
+def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cuda=False, log_interval=10,
+              precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -48,6 +50,8 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
@@ -81,7 +85,7 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         input_var = torch.autograd.Variable(input, volatile=True)
 
         # Compute output
-        output = model(input_var)
+        output = forward(model, input_var, precision, no_cuda)
 
         # Compute and record the loss
         loss = criterion(output, input_var)
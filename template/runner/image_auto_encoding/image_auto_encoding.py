@@ -55,7 +55,7 @@ class ImageAutoEncoding:
             Accuracy value for test split
         """
         # Get the selected model input size
-        model_expected_input_size = models.__dict__[model_name]().expected_input_size
+        model_expected_input_size = models.get_metadata(model_name).expected_input_size
         ImageAutoEncoding._validate_model_input_size(model_expected_input_size, model_name)
         logging.info('Model {} expects input size of {}'.format(model_name, model_expected_input_size))
 
@@ -84,7 +84,8 @@ class ImageAutoEncoding:
                 val_value[epoch] = ImageAutoEncoding._validate(val_loader, model, criterion, writer, epoch, **kwargs)
             if decay_lr is not None:
                 adjust_learning_rate(lr=lr, optimizer=optimizer, epoch=epoch, decay_lr_epochs=decay_lr)
-            best_value = checkpoint(epoch, val_value[epoch], best_value, model, optimizer, current_log_folder)
+            best_value = checkpoint(epoch, val_value[epoch], best_value, model, optimizer, current_log_folder,
+                                    **kwargs)
 
         # Test
         test_value = ImageAutoEncoding._test(test_loader, model, criterion, writer, epochs - 1, **kwargs)
@@ -14,6 +14,7 @@ import torch.utils.data
 import models
 from template.setup import _get_optimizer, verify_integrity_deep, verify_integrity_quick, _dataloaders_from_datasets, \
     image_folder_dataset, _load_mean_std_from_file, transforms
+from util.misc import wait_for_checkpoints
 
 
 def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cuda, resume, load_model,
@@ -72,10 +73,10 @@ def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cud
     logging.info('Setting up model {}'.format(model_name))
 
     output_channels = output_channels if num_classes == None else num_classes
-    model = models.__dict__[model_name](output_channels=output_channels,
-                                        pretrained=pretrained,
-                                        auto_encoder_mode=True,
-                                        **kwargs)
+    model = models.get_model(model_name)(output_channels=output_channels,
+                                         pretrained=pretrained,
+                                         auto_encoder_mode=True,
+                                         **kwargs)
 
     # Get the optimizer created with the specified parameters in kwargs (such as lr, momentum, ... )
     optimizer = _get_optimizer(optimizer_name, model, **kwargs)
@@ -91,6 +92,9 @@ def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cud
         criterion = criterion.cuda()
         cudnn.benchmark = True
 
+    # Make sure the checkpoints still being written in background are on disk before loading one
+    wait_for_checkpoints()
+
     # Load saved model
     if load_model:
         if os.path.isfile(load_model):
@@ -125,7 +129,8 @@ def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cud
     return model, criterion, optimizer, best_value, start_epoch
 
 def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, workers,
-                       disable_dataset_integrity, enable_deep_dataset_integrity,  inmem=False, **kwargs):
+                       disable_dataset_integrity, enable_deep_dataset_integrity,  inmem=False,
+                       persistent_workers=False, **kwargs):
     """
     Set up the dataloaders for the specified datasets.
 
@@ -142,6 +147,8 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
     inmem : boolean
         Flag: if False, the dataset is loaded in an online fashion i.e. only file names are stored and images are loaded
         on demand. This is slower than storing everything in memory.
+    persistent_workers : bool
+        Keep the workers of the train and validation loaders alive across epochs
 
     Returns
     -------
@@ -188,7 +195,7 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
         test_ds.transform = transform
 
         train_loader, val_loader, test_loader = _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds,
-                                                                           workers)
+                                                                           workers, persistent_workers)
         logging.info("Dataset loaded as images")
         return train_loader, val_loader, test_loader, len(train_ds.classes)
 
@@ -8,11 +8,12 @@ from tqdm import tqdm
 
 # DeepDIVA
 from util.misc import AverageMeter
+from util.precision import forward
 from util.evaluation.metrics import accuracy
 
 
 def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=False, log_interval=25,
-          **kwargs):
+          precision='fp32', **kwargs):
     """
     Training routine
 
@@ -34,6 +35,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     ----------
@@ -65,7 +68,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
         # Convert the input and its labels to Torch Variables
         input_var = torch.autograd.Variable(input)
 
-        loss = train_one_mini_batch(model, criterion, optimizer, input_var, loss_meter)
+        loss = train_one_mini_batch(model, criterion, optimizer, input_var, loss_meter,
+                                    precision=precision, no_cuda=no_cuda)
 
         # Add loss and accuracy to Tensorboard
         if multi_run is None:
@@ -94,7 +98,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
     return loss_meter.avg
 
 
-def train_one_mini_batch(model, criterion, optimizer, input_var, loss_meter):
+def train_one_mini_batch(model, criterion, optimizer, input_var, loss_meter, precision='fp32', no_cuda=False):
     """
     This routing train the model passed as parameter for one mini-batch
 
@@ -110,6 +114,10 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, loss_meter):
         The input data for the mini-batch
     loss_meter : AverageMeter
         Tracker for the overall loss
+    precision : str
+        Precision of the forward pass, see util.precision
+    no_cuda : bool
+        Specifies whether the GPU should be used or not.
 
     Returns
     -------
@@ -119,7 +127,7 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, loss_meter):
         Loss for this mini-batch
     """
     # Compute output
-    output = model(input_var)
+    output = forward(model, input_var, precision, no_cuda)
 
     # Compute and record the loss
     loss = criterion(output, input_var)
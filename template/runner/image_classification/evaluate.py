@@ -11,8 +11,10 @@ from tqdm import tqdm
 
 from util.evaluation.metrics import accuracy
 # DeepDIVA
+from util.distributed import all_gather_list, all_reduce_meter, is_main_process, local_model
 from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard
 from util.visualization.confusion_matrix_heatmap import make_heatmap
+from util.precision import forward, log_precision_delta
 
 
 def validate(val_loader, model, criterion, writer, epoch, no_cuda=False, log_interval=20, **kwargs):
@@ -25,7 +27,8 @@ def test(test_loader, model, criterion, writer, epoch, no_cuda=False, log_interv
     return _evaluate(test_loader, model, criterion, writer, epoch, 'test', no_cuda, log_interval, **kwargs)
 
 
-def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cuda=False, log_interval=10, **kwargs):
+def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cuda=False, log_interval=10,
+              precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -47,6 +50,8 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
@@ -63,8 +68,15 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
     top1 = AverageMeter()
     data_time = AverageMeter()
 
+    # With a reduced precision, the test accuracy is measured in float32 as well
+    compare_fp32 = logging_label == 'test' and precision != 'fp32'
+    top1_fp32 = AverageMeter()
+    agreement = AverageMeter()
+
     # Switch to evaluate mode (turn off dropout & such )
     model.eval()
+    # In distributed mode each process evaluates its own part of the split independently
+    model = local_model(model)
 
     # Iterate over whole evaluation set
     end = time.time()
@@ -76,7 +88,8 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
     total_length = len(data_loader)
     # length of the dataloader the size of the image array.
     # it's overlaoded and can be found in the dataset class
-    pbar = tqdm(enumerate(data_loader), total=len(data_loader), unit='batch', ncols=150, leave=False)
+    pbar = tqdm(enumerate(data_loader), total=len(data_loader), unit='batch', ncols=150, leave=False,
+                disable=not is_main_process())
     for batch_idx, (input, target) in pbar:
 
         if len(input.size()) == 5:
@@ -97,7 +110,7 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         target_var = torch.autograd.Variable(target, volatile=True)
 
         # Compute output
-        output = model(input_var)
+        output = forward(model, input_var, precision, no_cuda)
 
         if multi_crop:
             output = output.view(bs, ncrops, -1).mean(1)
@@ -110,6 +123,15 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         acc1 = accuracy(output.data, target, topk=(1,))[0]
         top1.update(acc1[0], input.size(0))
 
+        if compare_fp32:
+            with torch.no_grad():
+                output_fp32 = forward(model, input_var, 'fp32', no_cuda)
+            if multi_crop:
+                output_fp32 = output_fp32.view(bs, ncrops, -1).mean(1)
+            top1_fp32.update(accuracy(output_fp32.data, target, topk=(1,))[0][0], input.size(0))
+            agreement.update(100.0 * (output_fp32.data.max(1)[1] == output.data.max(1)[1]).float().mean().item(),
+                             input.size(0))
+
         # Get the predictions
         _ = [preds.append(item) for item in [np.argmax(item) for item in output.data.cpu().numpy()]]
         _ = [targets.append(item) for item in target.cpu().numpy()]
@@ -137,6 +159,14 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
                              Acc1='{top1.avg:.3f}\t'.format(top1=top1),
                              Data='{data_time.avg:.3f}\t'.format(data_time=data_time))
 
+    # In distributed mode, gather the results of all the processes
+    all_reduce_meter(losses)
+    all_reduce_meter(top1)
+    all_reduce_meter(top1_fp32)
+    all_reduce_meter(agreement)
+    preds = all_gather_list(preds)
+    targets = all_gather_list(targets)
+
     # Make a confusion matrix
     try:
         cm = confusion_matrix(y_true=targets, y_pred=preds)
@@ -163,6 +193,9 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
                  'Batch time={batch_time.avg:.3f} ({data_time.avg:.3f} to load data)'
                  .format(epoch, batch_time=batch_time, data_time=data_time, loss=losses, top1=top1))
 
+    if compare_fp32:
+        log_precision_delta(writer, logging_label, 'accuracy', top1.avg, top1_fp32.avg, agreement.avg, precision, epoch)
+
     # Generate a classification report for each epoch
     _log_classification_report(data_loader, epoch, preds, targets, writer)
 
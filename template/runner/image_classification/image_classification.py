@@ -58,7 +58,7 @@ class ImageClassification:
             Accuracy value for test split
         """
         # Get the selected model input size
-        model_expected_input_size = models.__dict__[model_name]().expected_input_size
+        model_expected_input_size = models.get_metadata(model_name).expected_input_size
         ImageClassification._validate_model_input_size(model_expected_input_size, model_name)
         logging.info('Model {} expects input size of {}'.format(model_name, model_expected_input_size))
 
@@ -92,7 +92,8 @@ class ImageClassification:
                                     best_value=best_value, model=model,
                                     optimizer=optimizer,
                                     log_dir=current_log_folder,
-                                    checkpoint_all_epochs=checkpoint_all_epochs)
+                                    checkpoint_all_epochs=checkpoint_all_epochs,
+                                    **kwargs)
 
 
         # Load the best model before evaluating on the test set.
@@ -7,12 +7,14 @@ import torch
 from tqdm import tqdm
 
 # DeepDIVA
+from util.distributed import all_reduce_meter, is_main_process, set_sampler_epoch
 from util.misc import AverageMeter
+from util.precision import forward
 from util.evaluation.metrics import accuracy
 
 
 def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=False, log_interval=25,
-          **kwargs):
+          precision='fp32', **kwargs):
     """
     Training routine
 
@@ -34,6 +36,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     ----------
@@ -55,9 +59,13 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
     # Switch to train mode (turn on dropout & stuff)
     model.train()
 
+    # In distributed mode, shuffle the shards differently every epoch
+    set_sampler_epoch(train_loader, epoch)
+
     # Iterate over whole training set
     end = time.time()
-    pbar = tqdm(enumerate(train_loader), total=len(train_loader), unit='batch', ncols=150, leave=False)
+    pbar = tqdm(enumerate(train_loader), total=len(train_loader), unit='batch', ncols=150, leave=False,
+                disable=not is_main_process())
     for batch_idx, (input, target) in pbar:
 
         if len(input.size()) == 5:
@@ -78,7 +86,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
         target_var = torch.autograd.Variable(target)
 
         acc, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_var, loss_meter, acc_meter,
-                                         multi_crop, bs, ncrops)
+                                         multi_crop, bs, ncrops, precision=precision, no_cuda=no_cuda)
 
         # Add loss and accuracy to Tensorboard
         if multi_run is None:
@@ -103,6 +111,10 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
                              Acc1='{acc_meter.avg:.3f}\t'.format(acc_meter=acc_meter),
                              Data='{data_time.avg:.3f}\t'.format(data_time=data_time))
 
+    # In distributed mode, average over all the processes
+    all_reduce_meter(loss_meter)
+    all_reduce_meter(acc_meter)
+
     # Logging the epoch-wise accuracy
     if multi_run is None:
         writer.add_scalar('train/accuracy', acc_meter.avg, epoch)
@@ -119,7 +131,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda=Fals
 
 
 def train_one_mini_batch(model, criterion, optimizer, input_var, target_var, loss_meter, acc_meter, multi_crop, bs,
-                         ncrops):
+                         ncrops, precision='fp32', no_cuda=False):
     """
     This routing train the model passed as parameter for one mini-batch
 
@@ -145,6 +157,10 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var, los
         Batch size
     ncrops : int
         Number of crops.
+    precision : str
+        Precision of the forward pass, see util.precision
+    no_cuda : bool
+        Specifies whether the GPU should be used or not.
 
     Returns
     -------
@@ -154,7 +170,7 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var, los
         Loss for this mini-batch
     """
     # Compute output
-    output = model(input_var)
+    output = forward(model, input_var, precision, no_cuda)
 
     if multi_crop:
         output = output.view(bs, ncrops, -1).mean(1)
@@ -11,6 +11,7 @@ from tqdm import tqdm
 
 # DeepDIVA
 from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard, tensor_to_image
+from util.precision import forward
 
 
 def validate(val_loader, model, criterion, writer, epoch, no_cuda=False, log_interval=20, **kwargs):
@@ -23,7 +24,8 @@ def test(test_loader, model, criterion, writer, epoch, no_cuda=False, log_interv
     return _evaluate(test_loader, model, criterion, writer, epoch, 'test', no_cuda, log_interval, **kwargs)
 
 
-def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cuda=False, log_interval=10, **kwargs):
+def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cuda=False, log_interval=10,
+              precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -45,6 +47,8 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
@@ -94,7 +98,7 @@ def _evaluate(data_loader, model, criterion, writer, epoch, logging_label, no_cu
         target_var = torch.autograd.Variable(map_image)
 
         # Compute output
-        output = model(input_var)
+        output = forward(model, input_var, precision, no_cuda)
 
         # Compute and record the loss
         loss = criterion(output, target_var)
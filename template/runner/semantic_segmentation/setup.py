@@ -23,7 +23,8 @@ from datasets.image_folder_segmentation_hisdb import load_dataset
 from template.setup import _dataloaders_from_datasets, _load_mean_std_from_file
 
 # TODO: refactor into the image_folder_segmentation_hisdb.py
-def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, workers, inmem, **kwargs):
+def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, workers, inmem,
+                       persistent_workers=False, **kwargs):
     """
     Set up the dataloaders for the specified datasets.
 
@@ -42,6 +43,8 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
     inmem : boolean
         Flag : if False, the dataset is loaded in an online fashion i.e. only file names are stored
         and images are loaded on demand. This is slower than storing everything in memory.
+    persistent_workers : bool
+        Keep the workers of the train and validation loaders alive across epochs
 
 
     Returns
@@ -80,5 +83,6 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
                                                                        train_ds=train_ds,
                                                                        val_ds=val_ds,
                                                                        test_ds=test_ds,
-                                                                       workers=workers)
+                                                                       workers=workers,
+                                                                       persistent_workers=persistent_workers)
     return train_loader, val_loader, test_loader
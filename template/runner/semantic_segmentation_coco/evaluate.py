@@ -17,10 +17,11 @@ from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_l
 from datasets.transform_library.functional import annotation_to_argmax
 from util.visualization.confusion_matrix_heatmap import make_heatmap
 from util.evaluation.metrics.accuracy import accuracy_segmentation
+from util.precision import forward
 
 
 def evaluate(logging_label, data_loader, model, criterion, writer, epoch, name_onehotindex, category_id_name,
-             no_val_conf_matrix, no_cuda=False, log_interval=10, **kwargs):
+             no_val_conf_matrix, no_cuda=False, log_interval=10, precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -42,6 +43,8 @@ def evaluate(logging_label, data_loader, model, criterion, writer, epoch, name_o
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
@@ -91,7 +94,7 @@ def evaluate(logging_label, data_loader, model, criterion, writer, epoch, name_o
         target_argmax_var = torch.autograd.Variable(target_argmax)
 
         # Compute output
-        output = model(input_var)
+        output = forward(model, input_var, precision, no_cuda)
         output_argmax = np.array([np.argmax(o, axis=0) for o in output.data.cpu().numpy()])
 
         # Compute and record the loss
@@ -145,7 +148,10 @@ def evaluate(logging_label, data_loader, model, criterion, writer, epoch, name_o
             # targets_flat = np.array(targets).flatten()
             # preds_flat = np.array(preds).flatten()
             # calculate confusion matrices
-            cm = confusion_matrix(y_true=np.array(targets).flatten(), y_pred=np.array(preds).flatten(), labels=[i for i in range(num_classes)])
+            # (mini-batches can have different sizes when bucketing is enabled)
+            cm = confusion_matrix(y_true=np.concatenate([t.flatten() for t in targets]),
+                                  y_pred=np.concatenate([p.flatten() for p in preds]),
+                                  labels=[i for i in range(num_classes)])
             confusion_matrix_heatmap = make_heatmap(cm, class_names)
 
             # load the weights
@@ -101,7 +101,8 @@ class SemanticSegmentationCoco:
                                     best_value=best_value, model=model,
                                     optimizer=optimizer,
                                     log_dir=current_log_folder,
-                                    checkpoint_all_epochs=checkpoint_all_epochs)
+                                    checkpoint_all_epochs=checkpoint_all_epochs,
+                                    **kwargs)
 
 
         # Load the best model before evaluating on the test set.
@@ -7,14 +7,17 @@ import sys
 import torchvision
 
 # Torch
+import torch
 
 # DeepDIVA
 from datasets.transform_library import transforms, functional
 from template.setup import _dataloaders_from_datasets
-from datasets.coco_detection import CocoDetection
+from datasets.coco_detection import CocoDetection, AspectRatioBatchSampler, pad_collate
+from util.persistent_loader import PersistentDataLoader, chain_phases
 
 
-def set_up_dataloaders(dataset_folder, batch_size, workers, **kwargs):
+def set_up_dataloaders(dataset_folder, batch_size, workers, disable_coco_mask_cache=False, coco_bucketing=False,
+                       persistent_workers=False, **kwargs):
     """
     Set up the dataloaders for the specified datasets.
 
@@ -33,6 +36,14 @@ def set_up_dataloaders(dataset_folder, batch_size, workers, **kwargs):
     inmem : boolean
         Flag : if False, the dataset is loaded in an online fashion i.e. only file names are stored
         and images are loaded on demand. This is slower than storing everything in memory.
+    disable_coco_mask_cache : boolean
+        Flag : if True, the annotations are rasterized at every access instead of being cached
+        in dataset_folder/mask_cache
+    coco_bucketing : boolean
+        Flag : if True, images of similar aspect ratio and size are batched together and only padded
+        to the largest image of the mini-batch
+    persistent_workers : bool
+        Keep the workers of the train and validation loaders alive across epochs
 
 
     Returns
@@ -87,14 +98,58 @@ def set_up_dataloaders(dataset_folder, batch_size, workers, **kwargs):
 
     # Setup dataloaders
     logging.debug('Setting up dataloaders')
-    train_ds = CocoDetection(train_dir, jsons['train'], **kwargs)
+    mask_cache = {s: None if disable_coco_mask_cache else os.path.join(dataset_folder, 'mask_cache', s)
+                  for s in ['train', 'val', 'test']}
+    train_ds = CocoDetection(train_dir, jsons['train'], mask_cache_folder=mask_cache['train'],
+                             pad_to_batch_max=coco_bucketing, **kwargs)
     name_onehotindex = train_ds.name_onehotindex
     category_id_name = train_ds.category_id_name
 
-    val_ds = CocoDetection(val_dir, jsons['val'], name_onehotindex=name_onehotindex, category_id_name=category_id_name, **kwargs)
+    val_ds = CocoDetection(val_dir, jsons['val'], name_onehotindex=name_onehotindex, category_id_name=category_id_name,
+                           mask_cache_folder=mask_cache['val'], pad_to_batch_max=coco_bucketing, **kwargs)
 
-    test_ds = CocoDetection(test_dir, jsons['test'], name_onehotindex=name_onehotindex, category_id_name=category_id_name, **kwargs)
+    test_ds = CocoDetection(test_dir, jsons['test'], name_onehotindex=name_onehotindex, category_id_name=category_id_name,
+                            mask_cache_folder=mask_cache['test'], pad_to_batch_max=coco_bucketing, **kwargs)
 
-    train_loader, val_loader, test_loader = _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds, workers)
+    if train_ds.pad_to_batch_max:
+        logging.info('Batching images by aspect ratio and size (padding to the largest image of each mini-batch)')
+        loader_class = PersistentDataLoader if persistent_workers else torch.utils.data.DataLoader
+        train_loader = _bucketed_dataloader(loader_class, train_ds, batch_size, workers, shuffle=True)
+        val_loader = _bucketed_dataloader(loader_class, val_ds, batch_size, workers, shuffle=False)
+        test_loader = _bucketed_dataloader(torch.utils.data.DataLoader, test_ds, batch_size, workers, shuffle=False)
+        if persistent_workers:
+            chain_phases(train_loader, val_loader)
+    else:
+        train_loader, val_loader, test_loader = _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds, workers,
+                                                                           persistent_workers)
 
     return train_loader, val_loader, test_loader, name_onehotindex, category_id_name
+
+
+def _bucketed_dataloader(loader_class, ds, batch_size, workers, shuffle):
+    """
+    Creates a dataloader batching the images of a split by aspect ratio and size, each mini-batch being padded to
+    its largest image (see datasets.coco_detection.AspectRatioBatchSampler and pad_collate)
+
+    Parameters
+    ----------
+    loader_class : class
+        torch.utils.data.DataLoader or util.persistent_loader.PersistentDataLoader
+    ds : CocoDetection
+        The split, with pad_to_batch_max=True
+    batch_size : int
+        The size of the mini batch
+    workers : int
+        Number of workers to use to load the data.
+    shuffle : bool
+        Iterate the images of each bucket in random order
+
+    Returns
+    -------
+    loader : torch.utils.data.DataLoader
+    """
+    return loader_class(ds,
+                        batch_sampler=AspectRatioBatchSampler(ds.get_image_sizes(), batch_size, shuffle=shuffle),
+                        collate_fn=pad_collate,
+                        num_workers=workers,
+                        pin_memory=True)
@@ -12,12 +12,13 @@ from tqdm import tqdm
 # DeepDIVA
 from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard, \
     save_image_and_log_to_tensorboard_segmentation
+from util.precision import forward
 from datasets.transform_library.functional import annotation_to_argmax
 from util.evaluation.metrics.accuracy import accuracy_segmentation
 
 
 def train(train_loader, model, criterion, optimizer, writer, epoch, name_onehotindex, category_id_name, no_cuda=False, log_interval=25,
-          **kwargs):
+          precision='fp32', **kwargs):
     """
     Training routine
 
@@ -39,6 +40,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, name_onehoti
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     ----------
@@ -80,7 +83,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, name_onehoti
         input_var = torch.autograd.Variable(input)
         target_argmax_var = torch.autograd.Variable(target_argmax)
 
-        mean_iu, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_argmax_var, loss_meter, meanIU, num_classes)
+        mean_iu, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_argmax_var, loss_meter, meanIU, num_classes,
+                                             precision=precision, no_cuda=no_cuda)
 
         # Add loss and accuracy to Tensorboard
         try:
@@ -132,7 +136,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, name_onehoti
     return meanIU.avg
 
 
-def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU_meter, num_classes):
+def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU_meter, num_classes, precision='fp32', no_cuda=False):
     """
     This routing train the model passed as parameter for one mini-batch
 
@@ -154,6 +158,10 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argm
         Tracker for the overall loss
     meanIU_meter : AverageMeter
         Tracker for the overall meanIU
+    precision : str
+        Precision of the forward pass, see util.precision
+    no_cuda : bool
+        Specifies whether the GPU should be used or not.
 
     Returns
     -------
@@ -163,7 +171,7 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argm
         Loss for this mini-batch
     """
     # Compute output
-    output = model(input_var)
+    output = forward(model, input_var, precision, no_cuda)
 
     # Compute and record the loss
     loss = criterion(output, target_var_argmax)
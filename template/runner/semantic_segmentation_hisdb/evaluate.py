@@ -13,14 +13,19 @@ from sklearn.metrics import classification_report, confusion_matrix
 from tqdm import tqdm
 
 # DeepDIVA
-from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard
+from util.distributed import all_reduce_array, all_reduce_meter, is_main_process, local_model
+from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard, \
+    save_image_and_log_to_tensorboard_segmentation, wait_for_segmentation_images, CLASS_COLOURS
 from util.visualization.confusion_matrix_heatmap import make_heatmap
 from util.evaluation.metrics.accuracy import accuracy_segmentation
+from util.evaluation.metrics.layout_analysis import LayoutAnalysisEvaluator
+from util.precision import forward, log_precision_delta
 from template.setup import _load_class_frequencies_weights_from_file
-from .setup import one_hot_to_np_bgr, one_hot_to_full_output, gt_to_one_hot
+from datasets.reduced_decode import load_ground_truth
+from .setup import one_hot_to_np_bgr, one_hot_to_full_output, gt_to_classes
 
 def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_folder, inmem, workers, runner_class,
-             no_val_conf_matrix, no_cuda=False, log_interval=10, myclone_env=False, **kwargs):
+             no_val_conf_matrix, no_cuda=False, log_interval=10, myclone_env=False, precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -42,6 +47,8 @@ def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
@@ -61,6 +68,8 @@ def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_
 
     # Switch to evaluate mode (turn off dropout & such )
     model.eval()
+    # In distributed mode each process evaluates its own pages independently
+    model = local_model(model)
 
     # Iterate over whole evaluation set
     end = time.time()
@@ -69,7 +78,8 @@ def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_
     preds = []
     targets = []
 
-    pbar = tqdm(enumerate(data_loader), total=len(data_loader), unit='batch', ncols=150, leave=False)
+    pbar = tqdm(enumerate(data_loader), total=len(data_loader), unit='batch', ncols=150, leave=False,
+                disable=not is_main_process())
     for batch_idx, (input, target) in pbar:
         # convert 3D one-hot encoded matrix to 2D matrix with class numbers (for CrossEntropy())
         target_argmax = torch.LongTensor(np.array([np.argmax(a, axis=0) for a in target.numpy()]))
@@ -89,7 +99,7 @@ def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_
         target_argmax_var = torch.autograd.Variable(target_argmax)
 
         # Compute output
-        output = model(input_var)
+        output = forward(model, input_var, precision, no_cuda)
         output_argmax = np.array([np.argmax(o, axis=0) for o in output.data.cpu().numpy()])
 
         # Compute and record the loss
@@ -135,13 +145,17 @@ def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_
                              meanIU='{meanIU.avg:.3f}\t'.format(meanIU=meanIU),
                              Data='{data_time.avg:.3f}\t'.format(data_time=data_time))
 
+    # In distributed mode, average over all the processes
+    all_reduce_meter(losses)
+    all_reduce_meter(meanIU)
+
     # Make a confusion matrix
     if not no_val_conf_matrix:
         try:
             # targets_flat = np.array(targets).flatten()
             # preds_flat = np.array(preds).flatten()
-            # calculate confusion matrices
-            cm = confusion_matrix(y_true=np.array(targets).flatten(), y_pred=np.array(preds).flatten(), labels=[i for i in range(num_classes)])
+            # calculate confusion matrices (summed over the processes in distributed mode)
+            cm = all_reduce_array(_confusion_matrix(targets, preds, num_classes))
             confusion_matrix_heatmap = make_heatmap(cm, class_names)
 
             # load the weights
@@ -187,7 +201,7 @@ def validate(data_loader, model, criterion, writer, epoch, class_names, dataset_
     return meanIU.avg
 
 
-def test(data_loader, model, criterion, writer, epoch, class_names, dataset_folder, inmem, workers, runner_class, use_boundary_pixel, no_cuda=False, log_interval=10, **kwargs):
+def test(data_loader, model, criterion, writer, epoch, class_names, dataset_folder, inmem, workers, runner_class, use_boundary_pixel, no_cuda=False, log_interval=10, precision='fp32', decode_scale=1, **kwargs):
     """
     The evaluation routine
 
@@ -209,6 +223,8 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
@@ -226,24 +242,31 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
     meanIU = AverageMeter()
     data_time = AverageMeter()
 
+    # With a reduced precision, the meanIU of the crops is measured in float32 as well
+    compare_fp32 = precision != 'fp32'
+    crops_meanIU = AverageMeter()
+    crops_meanIU_fp32 = AverageMeter()
+    agreement = AverageMeter()
+
     # Switch to evaluate mode (turn off dropout & such )
     model.eval()
+    # In distributed mode each process evaluates its own pages independently
+    model = local_model(model)
 
     # Iterate over whole evaluation set
     end = time.time()
 
-    # Empty lists to store the predictions and target values
-    preds = []
-    targets = []
+    # Metrics of the full pages, accumulated one page at a time
+    evaluator = LayoutAnalysisEvaluator(class_names)
 
     # needed for test phase output generation
     combined_one_hots = {}
     current_img_names = []
 
-    pbar = tqdm(enumerate(data_loader), total=len(data_loader), unit='batch', ncols=150, leave=False)
+    pbar = tqdm(enumerate(data_loader), total=len(data_loader), unit='batch', ncols=150, leave=False,
+                disable=not is_main_process())
     for batch_idx, (input, target) in pbar:
         input, orig_img_shape, top_left_coordinates, test_img_names = input
-        orig_img_shape = (orig_img_shape[0][0], orig_img_shape[1][0])
 
         # if not all('' == s or s.isspace() for s in test_img_names):
         #     print(test_img_names)
@@ -266,7 +289,7 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
         target_argmax_var = torch.autograd.Variable(target_argmax)
 
         # Compute output
-        output = model(input_var)
+        output = forward(model, input_var, precision, no_cuda)
         output_argmax = np.array([np.argmax(o, axis=0) for o in output.data.cpu().numpy()])
 
         # Compute and record the loss
@@ -281,6 +304,15 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
         acc_batch, acc_cls_batch, mean_iu_batch, fwavacc_batch = accuracy_segmentation(target_argmax.cpu().numpy(), output_argmax, num_classes)
         #meanIU.update(mean_iu, input.size(0))
 
+        if compare_fp32:
+            with torch.no_grad():
+                output_fp32 = forward(model, input_var, 'fp32', no_cuda)
+            output_argmax_fp32 = np.array([np.argmax(o, axis=0) for o in output_fp32.data.cpu().numpy()])
+            crops_meanIU.update(mean_iu_batch, input.size(0))
+            crops_meanIU_fp32.update(accuracy_segmentation(target_argmax.cpu().numpy(), output_argmax_fp32,
+                                                           num_classes)[2], input.size(0))
+            agreement.update(100.0 * np.mean(output_argmax_fp32 == output_argmax), input.size(0))
+
         # Add loss and accuracy to Tensorboard
         try:
             log_loss = loss.item()
@@ -312,7 +344,10 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
         # Output needs to be patched together to form the complete output of the full image
         # patches are returned as a sliding window over the full image, overlapping sections are averaged
         one_hots = output.data.cpu().numpy()
-        for one_hot, x, y, img_name in zip(one_hots, top_left_coordinates[0].numpy(), top_left_coordinates[1].numpy(), test_img_names):
+        # The pages may have different sizes, a mini-batch can contain the crops of two of them
+        for one_hot, x, y, height, width, img_name in zip(one_hots, top_left_coordinates[0].numpy(),
+                                                          top_left_coordinates[1].numpy(), orig_img_shape[0].numpy(),
+                                                          orig_img_shape[1].numpy(), test_img_names):
             # check if we are already working on the image passed in img_name
             if img_name not in current_img_names:
                 current_img_names.append(img_name)
@@ -322,46 +357,51 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
             if len(current_img_names) < 3:
                 # on the same image / first iteration
                 combined_one_hots[img_name] = one_hot_to_full_output(one_hot, (x, y), combined_one_hots[img_name],
-                                                          orig_img_shape)
+                                                          (height, width))
 
             # a third image was started -> we can save the first one
             else:
                 # save the old one before starting the new one
                 img_to_save = current_img_names.pop(0)
                 one_hot_finished = combined_one_hots.pop(img_to_save)
-                pred, target, mean_iu = _save_test_img_output(img_to_save, one_hot_finished, multi_run, dataset_folder, logging_label, writer, epoch, num_classes, use_boundary_pixel)
-                preds.append(pred)
-                targets.append(target)
+                mean_iu = _save_test_img_output(img_to_save, one_hot_finished, multi_run, dataset_folder, logging_label, writer, epoch, evaluator, use_boundary_pixel, decode_scale)
                 # update the meanIU
                 meanIU.update(mean_iu, 1)
 
                 # start the combination of the new image
                 logging.info("Starting segmentation of image {}".format(img_name))
                 combined_one_hots[img_name] = one_hot_to_full_output(one_hot, (x, y), combined_one_hots[img_name],
-                                                          orig_img_shape)
+                                                          (height, width))
 
     # save all the remaining images
     while len(current_img_names) > 0:
         img_to_save = current_img_names.pop(0)
         one_hot_finished = combined_one_hots.pop(img_to_save)
-        pred, target, mean_iu = _save_test_img_output(img_to_save, one_hot_finished, multi_run, dataset_folder, logging_label, writer, epoch, num_classes, use_boundary_pixel)
-        preds.append(pred)
-        targets.append(target)
+        mean_iu = _save_test_img_output(img_to_save, one_hot_finished, multi_run, dataset_folder, logging_label, writer, epoch, evaluator, use_boundary_pixel, decode_scale)
         # update the meanIU
         meanIU.update(mean_iu, 1)
 
+    # The outputs are written in background, make sure they are all on file
+    wait_for_segmentation_images()
+
+    # In distributed mode, average over all the processes
+    all_reduce_meter(losses)
+    all_reduce_meter(meanIU)
+    for meter in [crops_meanIU, crops_meanIU_fp32, agreement]:
+        all_reduce_meter(meter)
+    evaluator.all_reduce()
+
     # Make a confusion matrix
     try:
         #targets_flat = np.array(targets).flatten()
         #preds_flat = np.array(preds).flatten()
         # load the weights
         weights = _load_class_frequencies_weights_from_file(dataset_folder, inmem, workers, runner_class)
-        # calculate the confusion matrix
-        cm = confusion_matrix(y_true=np.array(targets).flatten(), y_pred=np.array(preds).flatten(), labels=[i for i in range(num_classes)])
-        cm_w = confusion_matrix(y_true=np.array(targets).flatten(), y_pred=np.array(preds).flatten(),
-                                labels=[i for i in range(num_classes)], sample_weight=[weights[i] for i in np.array(targets).flatten()])
+        # calculate the confusion matrix (summed over the processes in distributed mode)
+        cm = evaluator.confusion_matrix()
+        cm_w = evaluator.confusion_matrix(weights)
         confusion_matrix_heatmap = make_heatmap(cm, class_names)
-        confusion_matrix_heatmap_w = make_heatmap(np.round(cm_w*100).astype(np.int), class_names)
+        confusion_matrix_heatmap_w = make_heatmap(np.round(cm_w*100).astype(int), class_names)
 
     except ValueError:
         logging.warning('Confusion Matrix did not work as expected')
@@ -382,6 +422,10 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
         save_image_and_log_to_tensorboard(writer, tag=logging_label + '/confusion_matrix_weighted{}'.format(multi_run),
                                           image=confusion_matrix_heatmap_w, global_step=epoch)
 
+    # Metrics of the DIVA Layout Analysis Evaluator, over all the pages and per page
+    evaluator.add_scalars(writer, logging_label, epoch, '' if multi_run is None else '_{}'.format(multi_run))
+    logging.info('{} layout analysis: {}'.format(_prettyprint_logging_label(logging_label), evaluator.summary()))
+    _save_layout_analysis(evaluator, logging_label, multi_run)
 
     logging.info(_prettyprint_logging_label(logging_label) +
                  ' epoch[{}]: '
@@ -390,13 +434,62 @@ def test(data_loader, model, criterion, writer, epoch, class_names, dataset_fold
                  'Batch time={batch_time.avg:.3f} ({data_time.avg:.3f} to load data)'
                  .format(epoch, batch_time=batch_time, data_time=data_time, loss=losses, meanIU=meanIU))
 
+    if compare_fp32:
+        log_precision_delta(writer, logging_label, 'crops_meanIU', crops_meanIU.avg, crops_meanIU_fp32.avg,
+                            agreement.avg, precision, epoch)
+
     # # Generate a classification report for each epoch
     # _log_classification_report(data_loader, epoch, preds, targets, writer)
 
     return meanIU.avg
 
 
-def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, logging_label, writer, epoch, num_classes, use_boundary_pixel):
+def _confusion_matrix(targets, preds, num_classes):
+    """
+    Confusion matrix of the predictions of this process, with zeros if it has none (e.g. a process without test
+    pages in distributed mode) such that it can always be summed with the ones of the other processes
+
+    Parameters
+    ----------
+    targets, preds : list of numpy arrays
+        Target and predicted classes
+    num_classes : int
+        Number of classes
+
+    Returns
+    -------
+    cm : numpy array of size [num_classes x num_classes]
+    """
+    if len(targets) == 0:
+        return np.zeros((num_classes, num_classes), dtype=np.int64)
+    y_true = np.concatenate([np.asarray(t).flatten() for t in targets])
+    y_pred = np.concatenate([np.asarray(p).flatten() for p in preds])
+    return confusion_matrix(y_true=y_true, y_pred=y_pred, labels=[i for i in range(num_classes)])
+
+
+def _save_layout_analysis(evaluator, logging_label, multi_run):
+    """
+    Writes the metrics of the evaluator in a JSON file in the output folder ("layout_analysis_<label>.json")
+
+    Parameters
+    ----------
+    evaluator : LayoutAnalysisEvaluator
+        the evaluator of the split
+    logging_label : str
+        label of the split e.g. 'test'
+    multi_run : int
+        number of the run with --multi-run, None otherwise
+    """
+    if not is_main_process():
+        return
+    # Get output folder using the FileHandler from the logger.
+    # (Assumes the file handler is the last one)
+    output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
+    name = logging_label if multi_run is None else '{}_{}'.format(logging_label, multi_run)
+    evaluator.save(os.path.join(output_folder, 'layout_analysis_{}.json'.format(name)))
+
+
+def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, logging_label, writer, epoch, evaluator, use_boundary_pixel, decode_scale=1):
     """
     Helper function to save the output during testing
 
@@ -414,11 +507,17 @@ def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, loggi
         one hot encoded output of the network for the whole image
     dataset_folder: str
         path to the dataset folder
+    evaluator: LayoutAnalysisEvaluator
+        accumulates the metrics of the pages
+    use_boundary_pixel: bool
+        the boundary pixels are counted as correctly predicted
+    decode_scale: int
+        the pages were decoded at 1/decode_scale of their resolution, so is the ground truth
 
     Returns
     -------
-    pred, target: numpy arrays
-        argmax of the predicted and target values for the image
+    mean_iu: float
+        meanIU of the image
     """
     logging.info("Finished segmentation of image {}. Saving output...".format(img_to_save))
     np_bgr = one_hot_to_np_bgr(one_hot)
@@ -426,22 +525,17 @@ def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, loggi
     pred = np.argmax(one_hot, axis=0)
     # open full ground truth image
     gt_img_path = os.path.join(dataset_folder, logging_label, "gt", img_to_save)
-    with open(gt_img_path, 'rb') as f:
-        with Image.open(f) as img:
-            ground_truth = np.array(img.convert('RGB'))
-            # ajust blue channel according to border pixel in red channel
-            border_mask = ground_truth[:, :, 0].astype(np.uint8) != 0
-            ground_truth[:, :, 2][border_mask] = 1
-            # ground_truth_argmax = functional.to_tensor(ground_truth)
-
-    target = np.argmax(gt_to_one_hot(ground_truth, num_classes).numpy(), axis=0)
-
-    # Compute and record the meanIU of the whole image TODO check with Vinay & Michele if correct
-    acc, acc_cls, mean_iu, fwavacc = accuracy_segmentation(target, pred, num_classes)
-    logging.info("MeanIU {}: {}".format(img_to_save, mean_iu))
-    if use_boundary_pixel:
-        pred[border_mask] = target[border_mask]
-    acc, acc_cls, mean_iu, fwavacc = accuracy_segmentation(target, pred, num_classes)
+    ground_truth = np.array(load_ground_truth(gt_img_path, decode_scale))
+    # ajust blue channel according to border pixel in red channel
+    border_mask = ground_truth[:, :, 0].astype(np.uint8) != 0
+    ground_truth[:, :, 2][border_mask] = 1
+    # ground_truth_argmax = functional.to_tensor(ground_truth)
+
+    target = gt_to_classes(ground_truth)
+
+    # Compute and record the metrics of the whole image
+    page = evaluator.update(pred, target, border_mask if use_boundary_pixel else None, name=img_to_save)
+    mean_iu = page['iu']
     txt = " (adjusted for the boundary pixel)" if use_boundary_pixel else ""
     logging.info("MeanIU {}: {}{}".format(img_to_save, mean_iu, txt))
 
@@ -450,15 +544,17 @@ def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, loggi
         # writer.add_scalar(logging_label + '/meanIU', mean_iu, epoch)
         save_image_and_log_to_tensorboard_segmentation(writer, tag=logging_label + '/output_{}'.format(img_to_save),
                                                        image=np_bgr,
-                                                       gt_image=ground_truth[:, :, ::-1])  # ground_truth[:, :, ::-1] convert image to BGR
+                                                       gt_image=ground_truth[:, :, ::-1],  # ground_truth[:, :, ::-1] convert image to BGR
+                                                       class_colours=CLASS_COLOURS)
     else:
         # writer.add_scalar(logging_label + '/meanIU_{}'.format(multi_run), mean_iu, epoch)
         save_image_and_log_to_tensorboard_segmentation(writer, tag=logging_label + '/output_{}_{}'.format(multi_run,
                                                                                                           img_to_save),
                                                        image=np_bgr,
-                                                       gt_image=ground_truth[:, :, ::-1])  # ground_truth[:, :, ::-1] convert image to BGR
+                                                       gt_image=ground_truth[:, :, ::-1],  # ground_truth[:, :, ::-1] convert image to BGR
+                                                       class_colours=CLASS_COLOURS)
 
-    return pred, target, mean_iu
+    return mean_iu
 
 
 def _log_classification_report(data_loader, epoch, preds, targets, writer):
@@ -496,146 +592,3 @@ def _log_classification_report(data_loader, epoch, preds, targets, writer):
     classification_report_string = classification_report_string.replace('avg', '      avg', 1)
 
     writer.add_text('Classification Report for epoch {}\n'.format(epoch), '\n' + classification_report_string, epoch)
-
-
-def save_image_and_log_to_tensorboard_segmentation(writer=None, tag=None, image=None, global_step=None, gt_image=[]):
-    """Utility function to save image in the output folder and also log it to Tensorboard.
-    ALL IMAGES ARE IN BGR BECAUSE OF CV3.IMWRITE()!!
-
-    Parameters
-    ----------
-    writer : tensorboardX.writer.SummaryWriter object
-        The writer object for Tensorboard
-    tag : str
-        Name of the image.
-    image : ndarray [W x H x C]
-        Image to be saved and logged to Tensorboard.
-    global_step : int
-        Epoch/Mini-batch counter.
-
-    Returns
-    -------
-    None
-
-    """
-    int_val_to_class_name = {1: "background", 2: "comment", 4: "decoration", 8: "maintext"}
-
-    # 1. Create true output
-    # Log image to Tensorboard
-    #writer.add_image(tag=tag, img_tensor=image, global_step=global_step)
-
-    # Get output folder using the FileHandler from the logger.
-    # (Assumes the file handler is the last one)
-    output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
-
-    if global_step is not None:
-        dest_filename = os.path.join(output_folder, 'images', tag + '_{}'.format(global_step))
-    else:
-        dest_filename = os.path.join(output_folder, 'images', tag)
-
-    if not os.path.exists(os.path.dirname(dest_filename)):
-        os.makedirs(os.path.dirname(dest_filename))
-
-    cv2.imwrite(dest_filename, image)
-
-    # 2. Make a more human readable output -> one colour per class
-    # Write image to output folder
-    tag_col = "coloured_" + tag
-
-    # Get output folder using the FileHandler from the logger.
-    # (Assumes the file handler is the last one)
-    output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
-
-    if global_step is not None:
-        dest_filename = os.path.join(output_folder, 'images', tag_col + '_{}'.format(global_step))
-    else:
-        dest_filename = os.path.join(output_folder, 'images', tag_col)
-
-    if not os.path.exists(os.path.dirname(dest_filename)):
-        os.makedirs(os.path.dirname(dest_filename))
-
-    img = np.copy(image)
-    blue = image[:, :, 0]  # Extract just blue channel
-    masks = {c: (blue == i) > 0 for i, c in int_val_to_class_name.items()}
-    # Colours are in BGR
-    class_col = {"background": (0, 0, 0), "maintext": (255, 255, 0), "comment": (0, 255, 255),
-                 "decoration": (255, 0, 255)}
-
-    for c, mask in masks.items():
-        img[mask] = class_col[c]
-
-    #writer.add_image(tag=tag_col, img_tensor=np.moveaxis(img, -1, 0), global_step=global_step)
-    # Write image to output folder
-    cv2.imwrite(dest_filename, img)
-
-    # 3. Output image as described in https://github.com/DIVA-DIA/DIVA_Layout_Analysis_Evaluator
-    # GREEN: Foreground predicted correctly rgb(80, 140, 30)
-    # YELLOW: Foreground predicted - but the wrong class (e.g. Text instead of Comment) rgb(250, 230, 60)
-    # BLACK: Background predicted correctly rgb(0, 0, 0)
-    # RED: Background mis-predicted as Foreground rgb(240, 30, 20)
-    # BLUE: Foreground mis-predicted as Background rgb(0, 240, 255)
-    if len(gt_image) != 0:
-        class_col = {"fg_correct": (30, 160, 70), "fg_wrong_class": (60, 255, 255), "bg_correct": (0, 0, 0),
-                     "bg_as_fg": (20, 30, 240), "fg_as_bg": (255, 240, 0)}
-
-        img_la = np.copy(image)
-        tag_la = "layout_analysis_" + tag
-        # Get output folder using the FileHandler from the logger.
-        # (Assumes the file handler is the last one)
-        output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
-
-        if global_step is not None:
-            dest_filename = os.path.join(output_folder, 'images', tag_la + '_{}'.format(global_step))
-        else:
-            dest_filename = os.path.join(output_folder, 'images', tag_la)
-
-        if not os.path.exists(os.path.dirname(dest_filename)):
-            os.makedirs(os.path.dirname(dest_filename))
-
-        out_blue = image[:, :, 0]  # Extract just blue channel
-        gt_blue = gt_image[:, :, 0]
-
-        masks = {c: _get_mask(c, out_blue, gt_blue) for c in class_col.keys()}
-
-        for c, mask in masks.items():
-            img_la[mask] = class_col[c]
-
-        # img_la = np.array([[_get_colour(out_blue[x, y], gt_blue[x, y]) for y in range(out_blue.shape[1])]
-        #                    for x in range(out_blue.shape[0])])
-        # Write image to output folder
-        # TODO this does not work
-        #writer.add_image(tag=tag_la, img_tensor=np.moveaxis(img_la, -1, 0), global_step=global_step)
-        cv2.imwrite(dest_filename, img_la)
-
-    return
-
-def _get_mask(tag, output, gt):
-    if tag == "fg_correct":
-        return np.logical_and(output == gt, gt != 1)
-    elif tag == "bg_correct":
-        return np.logical_and(output == gt, gt == 1)
-    elif tag == "fg_wrong_class":
-        return np.logical_and(output != gt, np.logical_and(gt != 1, output != 1))
-    elif tag == "fg_as_bg":
-        return np.logical_and(output != gt, output == 1)
-    elif tag == "bg_as_fg":
-        return np.logical_and(output != gt, np.logical_and(output != 1, gt == 1))
-
-
-def _get_colour(output, gt):
-    # Colours are in BGR
-    class_col = {"fg_correct": (30, 160, 70), "fg_wrong_class": (60, 255, 255), "bg_correct": (0, 0, 0),
-                 "bg_as_fg": (20, 30, 240), "fg_as_bg": (255, 240, 0)}
-
-    if output == gt and gt in [2, 4, 8]:
-        return class_col["fg_correct"]
-    elif output == gt and gt == 1:
-        return class_col["bg_correct"]
-    elif output != gt and output in [2, 4, 8] and gt in [2, 4, 8]:
-        return class_col["fg_wrong_class"]
-    elif output != gt and output == 1:
-        return class_col["fg_as_bg"]
-    elif output != gt and output in [2, 4, 8]:
-        return class_col["bg_as_fg"]
-    else:
-        return (255, 255, 255)
\ No newline at end of file
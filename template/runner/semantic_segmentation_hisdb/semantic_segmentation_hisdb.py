@@ -21,7 +21,7 @@ import models
 from template.runner.semantic_segmentation_hisdb import evaluate, train
 from template.setup import set_up_model
 from .setup import set_up_dataloaders
-from util.misc import checkpoint, adjust_learning_rate
+from util.misc import checkpoint, adjust_learning_rate, load_train_state
 
 
 class SemanticSegmentationHisdb:
@@ -86,16 +86,21 @@ class SemanticSegmentationHisdb:
         # Input: (N, C, d_1, d_2, ..., d_K) where N is the mini-batch size, C are the number of classes and d_K the kth dimension
         # Target: (N, d_1, d_2, ..., d_K
 
+        # If the checkpoint to resume from has been made in the middle of an epoch, get the state of the training loop
+        train_state = load_train_state(kwargs['resume'])
+
         # Core routine
         logging.info('Begin training')
-        val_value = np.zeros((epochs + 1 - start_epoch))
-        train_value = np.zeros((epochs - start_epoch))
+        val_value = np.zeros((epochs + 1))
+        train_value = np.zeros((epochs))
 
         val_value[-1] = SemanticSegmentationHisdb._validate(val_loader, model, criterion, writer, -1, class_names, **kwargs)
         for epoch in range(start_epoch, epochs):
             # Train
             train_value[epoch] = SemanticSegmentationHisdb._train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
-                                                                  **kwargs)
+                                                                  log_dir=current_log_folder, best_value=best_value,
+                                                                  train_state=train_state, **kwargs)
+            train_state = None
 
             # Validate
             if epoch % validation_interval == 0:
@@ -107,7 +112,8 @@ class SemanticSegmentationHisdb:
                                     best_value=best_value, model=model,
                                     optimizer=optimizer,
                                     log_dir=current_log_folder,
-                                    checkpoint_all_epochs=checkpoint_all_epochs)
+                                    checkpoint_all_epochs=checkpoint_all_epochs,
+                                    **kwargs)
 
 
         # Load the best model before evaluating on the test set.
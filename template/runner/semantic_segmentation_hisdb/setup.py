@@ -1,8 +1,6 @@
 # Utils
 import logging
 import os
-from sklearn.preprocessing import OneHotEncoder
-
 
 # TODO: from __future__ import print_function
 import torch
@@ -14,9 +12,16 @@ from datasets.transform_library import transforms
 
 # DeepDIVA
 from datasets.image_folder_segmentation_hisdb import load_dataset
+from util.distributed import distributed_sampler
+from util.label_codec import LabelCodec
+from util.persistent_loader import PersistentDataLoader, chain_phases
+
+# Classes of the network <-> values of the blue channel of the ground truth
+LABELS = LabelCodec(gt_codes=[1, 2, 4])
 
 
-def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, workers, inmem, **kwargs):
+def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, workers, inmem,
+                       persistent_workers=False, checkpoint_interval=None, **kwargs):
     # TODO: refactor into the image_folder_segmentation_hisdb.py
     """
     Set up the dataloaders for the specified datasets.
@@ -36,6 +41,10 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
     inmem : boolean
         Flag : if False, the dataset is loaded in an online fashion i.e. only file names are stored
         and images are loaded on demand. This is slower than storing everything in memory.
+    persistent_workers : bool
+        Keep the workers of the train and validation loaders alive across epochs
+    checkpoint_interval : int
+        Interval of the mid-epoch checkpoints. Their replay needs fresh workers, hence disables persistent_workers.
 
 
     Returns
@@ -70,19 +79,31 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
 
     # Setup dataloaders
     logging.debug('Setting up dataloaders (#workers for test set to 1)')
-    train_loader = torch.utils.data.DataLoader(train_ds,
-                                               shuffle=True,
-                                               batch_size=batch_size,
-                                               num_workers=workers,
-                                               pin_memory=True)
-    val_loader = torch.utils.data.DataLoader(val_ds,
-                                             batch_size=batch_size,
-                                             num_workers=workers,
-                                             pin_memory=True)
+    if persistent_workers and checkpoint_interval:
+        logging.warning('Persistent workers disabled: resuming in the middle of an epoch requires fresh workers')
+        persistent_workers = False
+    # In distributed mode each process takes its crops from its own share of the pages
+    train_sampler = distributed_sampler(train_ds, shuffle=True)
+    # Persistent workers keep their pages in memory across epochs
+    loader_class = PersistentDataLoader if persistent_workers else torch.utils.data.DataLoader
+    train_loader = loader_class(train_ds,
+                                shuffle=train_sampler is None,
+                                sampler=train_sampler,
+                                batch_size=batch_size,
+                                num_workers=workers,
+                                pin_memory=True)
+    val_loader = loader_class(val_ds,
+                              sampler=distributed_sampler(val_ds, shuffle=False),
+                              batch_size=batch_size,
+                              num_workers=workers,
+                              pin_memory=True)
     test_loader = torch.utils.data.DataLoader(test_ds,
+                                              sampler=distributed_sampler(test_ds, shuffle=False),
                                               batch_size=batch_size,
                                               num_workers=1,
                                               pin_memory=True)
+    if persistent_workers:
+        chain_phases(train_loader, val_loader)
 
     return train_loader, val_loader, test_loader
 
@@ -97,19 +118,9 @@ def one_hot_to_np_bgr(matrix):
         sparse one-hot encoded matrix, where #C is the number of classes
     Returns
     -------
-    numpy array of size [C x H x W] (BGR)
+    numpy array of size [H x W x C] (BGR)
     """
-    B = np.argmax(matrix, axis=0)
-    class_to_B = {i: j for i, j in enumerate([1, 2, 4])}
-
-    masks = [B == old for old in class_to_B.keys()]
-
-    for mask, (old, new) in zip(masks, class_to_B.items()):
-        B = np.where(mask, new, B)
-
-    bgr = np.dstack((B, np.zeros(shape=(B.shape[0], B.shape[1], 2), dtype=np.int8)))
-
-    return bgr
+    return LABELS.one_hot_to_np_bgr(matrix)
 
 
 def one_hot_to_full_output(one_hot, coordinates, combined_one_hot, output_dim):
@@ -132,7 +143,8 @@ def one_hot_to_full_output(one_hot, coordinates, combined_one_hot, output_dim):
     combined_one_hot: numpy matrix [#C x Htot x Wtot]
     """
     if len(combined_one_hot) == 0:
-        combined_one_hot = np.zeros((one_hot.shape[0], *output_dim))
+        # The canvas has the precision of the network output (float32) rather than float64: half the memory
+        combined_one_hot = np.zeros((one_hot.shape[0], *output_dim), dtype=one_hot.dtype)
 
     x1, y1 = coordinates
     x2, y2 = (min(x1 + one_hot.shape[1], output_dim[0]), min(y1 + one_hot.shape[2], output_dim[1]))
@@ -144,7 +156,8 @@ def one_hot_to_full_output(one_hot, coordinates, combined_one_hot, output_dim):
 
     return combined_one_hot
 
-def gt_to_one_hot(matrix, num_classes):
+
+def gt_to_one_hot(matrix, num_classes=None):
     """
     Convert ground truth tensor to one-hot encoded matrix
 
@@ -158,28 +171,21 @@ def gt_to_one_hot(matrix, num_classes):
     torch.LongTensor of size [#C x H x W]
         sparse one-hot encoded multi-class matrix, where #C is the number of classes
     """
-    # TODO: ugly fix -> better to not normalize in the first place
-    if type(matrix).__module__ == np.__name__:
-        im_np = matrix[:, :, 2].astype(np.uint8)
-        border_mask = matrix[:, :, 0].astype(np.uint8) != 0
-    else:
-        np_array = (matrix * 255).numpy().astype(np.uint8)
-        im_np = np_array[2, :, :].astype(np.uint8)
-        border_mask = np_array[0, :, :].astype(np.uint8) != 0
-
-    # ajust blue channel according to border pixel in red channel
-    im_np[border_mask] = 1
-
-    integer_encoded = np.array([i for i in range(num_classes)])
-    onehot_encoder = OneHotEncoder(sparse=False)
-    integer_encoded = integer_encoded.reshape(len(integer_encoded), 1)
-    onehot_encoded = onehot_encoder.fit_transform(integer_encoded).astype(np.int8)
-
-    np.place(im_np, im_np == 0, 1) # needed to deal with 0 fillers at the borders during testing (replace with background)
-    replace_dict = {k: v for k, v in zip([1, 2, 4], onehot_encoded)}
-
-    # create the one hot matrix
-    one_hot_matrix = np.asanyarray(
-        [[replace_dict[im_np[i, j]] for j in range(im_np.shape[1])] for i in range(im_np.shape[0])]).astype(np.uint8)
-
-    return torch.LongTensor(one_hot_matrix.transpose((2, 0, 1)))
\ No newline at end of file
+    return LABELS.gt_to_one_hot(matrix, num_classes)
+
+
+def gt_to_classes(matrix):
+    """
+    Convert ground truth tensor to the matrix of the classes of its pixels
+
+    Parameters
+    -------
+    matrix: float tensor from to_tensor() or numpy array
+        shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) BGR
+
+    Returns
+    -------
+    numpy array of size [H x W]
+        class of each pixel
+    """
+    return LABELS.gt_to_classes(matrix)
@@ -10,13 +10,15 @@ import torch
 from tqdm import tqdm
 
 # DeepDIVA
+from util.distributed import all_reduce_meter, is_main_process
 from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard, \
-    save_image_and_log_to_tensorboard_segmentation
-from .setup import one_hot_to_np_bgr, gt_to_one_hot
+    save_image_and_log_to_tensorboard_segmentation, checkpoint_step, get_rng_state, set_rng_state
+from util.precision import forward
+from .setup import one_hot_to_np_bgr, gt_to_classes
 from util.evaluation.metrics.accuracy import accuracy_segmentation
 
 def train(train_loader, model, criterion, optimizer, writer, epoch, class_names, no_cuda=False, log_interval=25,
-          myclone_env=False, **kwargs):
+          myclone_env=False, checkpoint_interval=None, log_dir=None, best_value=None, train_state=None, precision='fp32', **kwargs):
     """
     Training routine
 
@@ -38,6 +40,17 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
+    checkpoint_interval : int
+        Save a checkpoint every N mini-batches (see util.misc.checkpoint_step). None to disable it.
+    log_dir : str
+        Output folder where to put the checkpoints.
+    best_value : float
+        Best value ever obtained (stored in the checkpoints).
+    train_state : dict
+        State of a previous, interrupted, run of this epoch as stored by util.misc.checkpoint_step.
+        If not None the epoch is resumed at the exact mini-batch where the checkpoint has been made.
 
     Returns
     ----------
@@ -53,13 +66,38 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
     meanIU = AverageMeter()
     data_time = AverageMeter()
 
+    meters = {'batch_time': batch_time, 'loss_meter': loss_meter, 'meanIU': meanIU, 'data_time': data_time}
+
     # Switch to train mode (turn on dropout & stuff)
     model.train()
 
+    # The order of the mini-batches (and the crops) depends on the state of the random number generators and of the
+    # dataset at the beginning of the epoch: with it the epoch can be replayed up to the mini-batch of the checkpoint.
+    if train_state is None:
+        start_batch_idx = 0
+        train_state = {'rng_state': get_rng_state(),
+                       'dataset_state': train_loader.dataset.state_dict()}
+    else:
+        start_batch_idx = train_state['batch_idx']
+        set_rng_state(train_state['rng_state'])
+        train_loader.dataset.load_state_dict(train_state['dataset_state'])
+        for name, meter in meters.items():
+            meter.load_state_dict(train_state['meters'][name])
+        logging.info('Resuming epoch {} at mini-batch {}'.format(epoch, start_batch_idx))
+
     # Iterate over whole training set
     end = time.time()
-    pbar = tqdm(enumerate(train_loader), total=len(train_loader), unit='batch', ncols=150, leave=False)
+    pbar = tqdm(enumerate(train_loader), total=len(train_loader), unit='batch', ncols=150, leave=False,
+                disable=not is_main_process())
     for batch_idx, (input, target_argmax) in pbar:
+        # Skip the mini-batches already processed before the checkpoint (they are loaded anyway to replay the
+        # state of the dataloader). The random number generators are then restored as they were at the checkpoint.
+        if batch_idx < start_batch_idx:
+            if batch_idx == start_batch_idx - 1:
+                set_rng_state(train_state['step_rng_state'])
+                end = time.time()
+            continue
+
         # convert 3D one-hot encoded matrix to 2D matrix with class numbers (for CrossEntropy())
         target_argmax = torch.LongTensor(np.array([np.argmax(a, axis=0) for a in target_argmax.numpy()]))
 
@@ -75,7 +113,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
         input_var = torch.autograd.Variable(input)
         target_var_argmax = torch.autograd.Variable(target_argmax)
 
-        mean_iu, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU, num_classes, myclone_env)
+        mean_iu, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU, num_classes, myclone_env,
+                                             precision=precision, no_cuda=no_cuda)
 
         # Add loss and accuracy to Tensorboard
         try:
@@ -105,6 +144,17 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
                              meanIU='{meanIU.avg:.3f}\t'.format(meanIU=meanIU),
                              Data='{data_time.avg:.3f}\t'.format(data_time=data_time))
 
+        # Checkpoint in the middle of the epoch
+        if checkpoint_interval and (batch_idx + 1) % checkpoint_interval == 0 and batch_idx + 1 < len(train_loader):
+            checkpoint_step(epoch=epoch, batch_idx=batch_idx + 1, best_value=best_value, model=model,
+                            optimizer=optimizer, log_dir=log_dir,
+                            train_state=dict(train_state,
+                                             meters={name: meter.state_dict() for name, meter in meters.items()}))
+
+    # In distributed mode, average over all the processes
+    all_reduce_meter(loss_meter)
+    all_reduce_meter(meanIU)
+
     # Logging the epoch-wise accuracy
     if multi_run is None:
         writer.add_scalar('train/meanIU', meanIU.avg, epoch)
@@ -127,7 +177,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
     return meanIU.avg
 
 
-def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU_meter, num_classes, myclone_env):
+def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU_meter, num_classes, myclone_env, precision='fp32', no_cuda=False):
     """
     This routing train the model passed as parameter for one mini-batch
 
@@ -149,6 +199,10 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argm
         Tracker for the overall loss
     meanIU_meter : AverageMeter
         Tracker for the overall meanIU
+    precision : str
+        Precision of the forward pass, see util.precision
+    no_cuda : bool
+        Specifies whether the GPU should be used or not.
 
     Returns
     -------
@@ -158,7 +212,7 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argm
         Loss for this mini-batch
     """
     # Compute output
-    output = model(input_var)
+    output = forward(model, input_var, precision, no_cuda)
 
     # Compute and record the loss
     loss = criterion(output, target_var_argmax)
@@ -218,7 +272,7 @@ def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, loggi
             ground_truth[:, :, 2][border_mask] = 1
 
             # ground_truth_argmax = functional.to_tensor(ground_truth)
-    target = np.argmax(gt_to_one_hot(ground_truth).numpy(), axis=0)
+    target = gt_to_classes(ground_truth)
 
     # TODO: also save input and gt image?
     if multi_run is None:
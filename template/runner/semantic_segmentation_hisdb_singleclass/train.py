@@ -12,11 +12,12 @@ from tqdm import tqdm
 # DeepDIVA
 from util.misc import AverageMeter, _prettyprint_logging_label, save_image_and_log_to_tensorboard, \
     save_image_and_log_to_tensorboard_segmentation
-from .setup import one_hot_to_np_bgr, gt_to_one_hot
+from util.precision import forward
+from .setup import one_hot_to_np_bgr, gt_to_classes
 from util.evaluation.metrics.accuracy import accuracy_segmentation
 
 def train(train_loader, model, criterion, optimizer, writer, epoch, class_names, no_cuda=False, log_interval=25,
-          **kwargs):
+          precision='fp32', **kwargs):
     """
     Training routine
 
@@ -38,6 +39,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     ----------
@@ -75,7 +78,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
         input_var = torch.autograd.Variable(input)
         target_var_argmax = torch.autograd.Variable(target_argmax)
 
-        mean_iu, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU, num_classes)
+        mean_iu, loss = train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU, num_classes,
+                                             precision=precision, no_cuda=no_cuda)
 
         # Add loss and accuracy to Tensorboard
         if multi_run is None:
@@ -122,7 +126,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, class_names,
     return meanIU.avg
 
 
-def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU_meter, num_classes):
+def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argmax, loss_meter, meanIU_meter, num_classes, precision='fp32', no_cuda=False):
     """
     This routing train the model passed as parameter for one mini-batch
 
@@ -144,6 +148,10 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argm
         Tracker for the overall loss
     meanIU_meter : AverageMeter
         Tracker for the overall meanIU
+    precision : str
+        Precision of the forward pass, see util.precision
+    no_cuda : bool
+        Specifies whether the GPU should be used or not.
 
     Returns
     -------
@@ -153,7 +161,7 @@ def train_one_mini_batch(model, criterion, optimizer, input_var, target_var_argm
         Loss for this mini-batch
     """
     # Compute output
-    output = model(input_var)
+    output = forward(model, input_var, precision, no_cuda)
 
     # Compute and record the loss
     loss = criterion(output, target_var_argmax)
@@ -210,7 +218,7 @@ def _save_test_img_output(img_to_save, one_hot, multi_run, dataset_folder, loggi
             ground_truth[:, :, 2][border_mask] = 1
 
             # ground_truth_argmax = functional.to_tensor(ground_truth)
-    target = np.argmax(gt_to_one_hot(ground_truth).numpy(), axis=0)
+    target = gt_to_classes(ground_truth)
 
     # TODO: also save input and gt image?
     if multi_run is None:
@@ -12,6 +12,7 @@ from tqdm import tqdm
 
 # DeepDIVA
 from util.evaluation.metrics import compute_mapk
+from util.precision import forward
 
 
 def validate(val_loader, model, criterion, writer, epoch, no_cuda=False, log_interval=20, **kwargs):
@@ -24,7 +25,8 @@ def test(test_loader, model, criterion, writer, epoch, no_cuda=False, log_interv
     return _evaluate_map(test_loader, model, criterion, writer, epoch, 'test', no_cuda, log_interval, **kwargs)
 
 
-def _evaluate_map(data_loader, model, criterion, writer, epoch, logging_label, no_cuda, log_interval, map, **kwargs):
+def _evaluate_map(data_loader, model, criterion, writer, epoch, logging_label, no_cuda, log_interval, map,
+                  precision='fp32', **kwargs):
     """
     The evaluation routine
 
@@ -46,6 +48,8 @@ def _evaluate_map(data_loader, model, criterion, writer, epoch, logging_label, n
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
     map : str
         Specify value for mAP computation. Possible values are ("auto", "full" or specify K for AP@K)
 
@@ -81,7 +85,7 @@ def _evaluate_map(data_loader, model, criterion, writer, epoch, logging_label, n
         data_a, label = Variable(data, volatile=True), Variable(label)
 
         # Compute output
-        out = model(data_a)
+        out = forward(model, data_a, precision, no_cuda)
 
         if multi_crop:
             out = out.view(bs, ncrops, -1).mean(1)
@@ -7,9 +7,11 @@ from tqdm import tqdm
 
 # DeepDIVA
 from util.misc import AverageMeter
+from util.precision import forward
 
 
-def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda, log_interval=25, **kwargs):
+def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda, log_interval=25, precision='fp32',
+          **kwargs):
     """
     Training routine
 
@@ -31,6 +33,8 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda, log
         Specifies whether the GPU should be used or not. A value of 'True' means the CPU will be used.
     log_interval : int
         Interval limiting the logging of mini-batches. Default value of 10.
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     ----------
@@ -70,7 +74,7 @@ def train(train_loader, model, criterion, optimizer, writer, epoch, no_cuda, log
         data_a, data_p, data_n = Variable(data_a), Variable(data_p), Variable(data_n)
 
         # Compute output
-        out_a, out_p, out_n = model(data_a), model(data_p), model(data_n)
+        out_a, out_p, out_n = (forward(model, data, precision, no_cuda) for data in (data_a, data_p, data_n))
 
         if len(data_a.size()) == 5:
             out_a = out_a.view(bs, ncrops, -1).mean(1)
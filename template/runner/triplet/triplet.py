@@ -80,7 +80,7 @@ class Triplet:
             sys.exit(-1)
 
         # Get the selected model input size
-        model_expected_input_size = models.__dict__[model_name]().expected_input_size
+        model_expected_input_size = models.get_metadata(model_name).expected_input_size
         Triplet._validate_model_input_size(model_expected_input_size, model_name)
         logging.info('Model {} expects input size of {}'.format(model_name, model_expected_input_size))
 
@@ -129,7 +129,8 @@ class Triplet:
                                     optimizer=optimizer,
                                     log_dir=current_log_folder,
                                     invert_best=True,
-                                    checkpoint_all_epochs=checkpoint_all_epochs)
+                                    checkpoint_all_epochs=checkpoint_all_epochs,
+                                    **kwargs)
 
             # Generate new triplets every N epochs
             if epoch % regenerate_every == 0:
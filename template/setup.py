@@ -4,10 +4,7 @@ import json
 import logging
 import os
 import random
-import shutil
 import sys
-import tarfile
-import tempfile
 import time
 
 import colorlog
@@ -20,8 +17,6 @@ import torch.nn.parallel
 import torch.optim
 import torch.utils.data
 import torchvision.transforms as transforms
-# import template.runner.triplet.transforms as ttran
-from template.runner.triplet.transforms import MultiCrop
 from tensorboardX import SummaryWriter
 
 # DeepDIVA
@@ -29,7 +24,14 @@ import models
 from datasets import image_folder_dataset, bidimensional_dataset
 from util.data.dataset_analytics import compute_mean_std, compute_mean_std_hisdb, compute_mean_std_coco
 from util.data.dataset_integrity import verify_integrity_quick, verify_integrity_deep
-from util.misc import get_all_files_in_folders_and_subfolders
+from util.buffered_writer import BufferedSummaryWriter
+from util.code_snapshot import snapshot_code
+from util.distributed import barrier, broadcast_object, distributed_sampler, get_rank, get_world_size, is_distributed, \
+    is_main_process, wrap_model, NullSummaryWriter
+from util.misc import wait_for_checkpoints
+from util.persistent_loader import PersistentDataLoader, chain_phases
+from util.precision import check_precision
+from util.visualization import use_matplotlib
 
 
 def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cuda, resume, load_model,
@@ -88,7 +90,9 @@ def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cud
     logging.info('Setting up model {}'.format(model_name))
 
     output_channels = output_channels if num_classes == None else num_classes
-    model = models.__dict__[model_name](output_channels=output_channels, pretrained=pretrained, **kwargs)
+    model = models.get_model(model_name)(output_channels=output_channels, pretrained=pretrained, **kwargs)
+    # The runners read the expected input size from the metadata: make sure it matches the actual model
+    models.check_metadata(model_name, model)
     numberOfParameters = sum(
         [p.numel() for p in model.parameters() if p.requires_grad])  # number of trainable parameters in the model
     logging.info("Number of parameters '{}'".format(numberOfParameters))
@@ -107,13 +111,25 @@ def set_up_model(output_channels, model_name, pretrained, optimizer_name, no_cud
             logging.warning('Unable to load information for data balancing. Using normal criterion')
             criterion = nn.CrossEntropyLoss()
 
+    # Distribute the model over the processes (its parameters are broadcast from the main one)
+    if is_distributed():
+        logging.info('Wrap model for distributed data-parallel training over {} processes'.format(get_world_size()))
+        model = wrap_model(model, no_cuda)
+        if not no_cuda:
+            criterion = criterion.cuda()
+            cudnn.benchmark = True
     # Transfer model to GPU (if desired)
-    if not no_cuda:
+    elif not no_cuda:
         logging.info('Transfer model to GPU')
         model = torch.nn.DataParallel(model).cuda()
         criterion = criterion.cuda()
         cudnn.benchmark = True
 
+    # Make sure the checkpoints still being written in background (by the main process) are on disk before
+    # loading one
+    wait_for_checkpoints()
+    barrier()
+
     # Load saved model
     if load_model:
         if os.path.isfile(load_model):
@@ -207,7 +223,8 @@ def _get_optimizer(optimizer_name, model, **kwargs):
 
 
 def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, workers,
-                       disable_dataset_integrity, enable_deep_dataset_integrity, inmem=False, **kwargs):
+                       disable_dataset_integrity, enable_deep_dataset_integrity, inmem=False,
+                       persistent_workers=False, decode_scale=1, **kwargs):
     """
     Set up the dataloaders for the specified datasets.
 
@@ -224,6 +241,10 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
     inmem : boolean
         Flag: if False, the dataset is loaded in an online fashion i.e. only file names are stored and images are loaded
         on demand. This is slower than storing everything in memory.
+    persistent_workers : bool
+        Keep the workers of the train and validation loaders alive across epochs
+    decode_scale : int
+        Decode the images at 1/decode_scale of their resolution (image folder datasets only)
 
     Returns
     -------
@@ -235,6 +256,9 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
         Number of classes for the model.
     """
 
+    # Imported here: the triplet package imports this module, which is the first one RunMe imports
+    from template.runner.triplet.transforms import MultiCrop
+
     # Recover dataset name
     dataset = os.path.basename(os.path.normpath(dataset_folder))
     logging.info('Loading {} from:{}'.format(dataset, dataset_folder))
@@ -242,7 +266,7 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
     ###############################################################################################
     # Load the dataset splits as images
     try:
-        train_ds, val_ds, test_ds = image_folder_dataset.load_dataset(dataset_folder, inmem, workers)
+        train_ds, val_ds, test_ds = image_folder_dataset.load_dataset(dataset_folder, inmem, workers, decode_scale)
 
         # Loads the analytics csv and extract mean and std
         mean, std = _load_mean_std_from_file(dataset_folder, inmem, workers, kwargs['runner_class'])
@@ -280,7 +304,7 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
         test_ds.transform = transform_mc
 
         train_loader, val_loader, test_loader = _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds,
-                                                                           workers)
+                                                                           workers, persistent_workers)
         logging.info("Dataset loaded as images")
         _verify_dataset_integrity(dataset_folder, disable_dataset_integrity, enable_deep_dataset_integrity)
         return train_loader, val_loader, test_loader, len(train_ds.classes)
@@ -313,8 +337,11 @@ def set_up_dataloaders(model_expected_input_size, dataset_folder, batch_size, wo
         val_ds.transform = transform
         test_ds.transform = transform
 
-        train_loader, val_loader, test_loader = _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds,
-                                                                           workers)
+        # The splits are normalized once and their mini-batches sliced from a tensor (no workers needed)
+        train_loader, val_loader, test_loader = [
+            bidimensional_dataset.BatchedLoader(ds, ds.normalized_tensors(mean, std), batch_size, shuffle=shuffle,
+                                                sampler=distributed_sampler(ds, shuffle=shuffle))
+            for ds, shuffle in [(train_ds, True), (val_ds, False), (test_ds, False)]]
         logging.info("Dataset loaded as bidimensional data")
         _verify_dataset_integrity(dataset_folder, disable_dataset_integrity, enable_deep_dataset_integrity)
         return train_loader, val_loader, test_loader, len(train_ds.classes)
@@ -428,7 +455,7 @@ def _load_analytics_csv(dataset_folder, inmem, workers, runner_class, **kwargs):
     return pd.read_csv(os.path.join(dataset_folder, "analytics.csv"), header=None)
 
 
-def _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds, workers):
+def _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds, workers, persistent_workers=False):
     """
     This function creates (and returns) dataloader from datasets objects
 
@@ -442,6 +469,9 @@ def _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds, workers):
         Train, validation and test splits
     workers:
         Number of workers to use to load the data.
+    persistent_workers : bool
+        Keep the workers of the train and validation loaders alive across epochs, and prefetch the first
+        mini-batches of each phase while the previous one ends (see util.persistent_loader)
 
     Returns
     -------
@@ -452,19 +482,27 @@ def _dataloaders_from_datasets(batch_size, train_ds, val_ds, test_ds, workers):
     """
     # Setup dataloaders
     logging.debug('Setting up dataloaders')
-    train_loader = torch.utils.data.DataLoader(train_ds,
-                                               shuffle=True,
-                                               batch_size=batch_size,
-                                               num_workers=workers,
-                                               pin_memory=True)
-    val_loader = torch.utils.data.DataLoader(val_ds,
-                                             batch_size=batch_size,
-                                             num_workers=workers,
-                                             pin_memory=True)
+    # In distributed mode each process loads its own part of the splits
+    train_sampler = distributed_sampler(train_ds, shuffle=True)
+    loader_class = PersistentDataLoader if persistent_workers else torch.utils.data.DataLoader
+    train_loader = loader_class(train_ds,
+                                shuffle=train_sampler is None,
+                                sampler=train_sampler,
+                                batch_size=batch_size,
+                                num_workers=workers,
+                                pin_memory=True)
+    val_loader = loader_class(val_ds,
+                              sampler=distributed_sampler(val_ds, shuffle=False),
+                              batch_size=batch_size,
+                              num_workers=workers,
+                              pin_memory=True)
     test_loader = torch.utils.data.DataLoader(test_ds,
+                                              sampler=distributed_sampler(test_ds, shuffle=False),
                                               batch_size=batch_size,
                                               num_workers=workers,
                                               pin_memory=True)
+    if persistent_workers:
+        chain_phases(train_loader, val_loader)
     return train_loader, val_loader, test_loader
 
 
@@ -492,8 +530,9 @@ def set_up_logging(parser, experiment_name, output_folder, quiet, args_dict, deb
     -------
     log_folder : String
         The final logging folder tree
-    writer : tensorboardX.writer.SummaryWriter
+    writer : util.buffered_writer.BufferedSummaryWriter
         The tensorboard writer object. Used to log values on file for the tensorboard visualization.
+        In distributed mode, only the main process has one (the others get a util.distributed.NullSummaryWriter).
     """
     LOG_FILE = 'logs.txt'
 
@@ -531,8 +570,14 @@ def set_up_logging(parser, experiment_name, output_folder, quiet, args_dict, deb
     # Build up final logging folder tree with the non-default training parameters
     log_folder = os.path.join(*[output_folder, experiment_name, dataset, *non_default_parameters,
                                 '{}'.format(time.strftime('%d-%m-%y-%Hh-%Mm-%Ss'))])
+    # In distributed mode all the processes log into the folder of the main one
+    log_folder = broadcast_object(log_folder)
     if not os.path.exists(log_folder):
-        os.makedirs(log_folder)
+        os.makedirs(log_folder, exist_ok=True)
+
+    # The other processes of a distributed run only print the warnings and log into their own file
+    if not is_main_process():
+        LOG_FILE = 'logs_rank{}.txt'.format(get_rank())
 
     # Setup logging
     root = logging.getLogger()
@@ -557,6 +602,8 @@ def set_up_logging(parser, experiment_name, output_folder, quiet, args_dict, deb
     if not quiet:
         ch = logging.StreamHandler()
         ch.setFormatter(formatter)
+        if not is_main_process():
+            ch.setLevel(logging.WARNING)
         root.addHandler(ch)
 
     fh = logging.FileHandler(os.path.join(log_folder, LOG_FILE))
@@ -564,6 +611,8 @@ def set_up_logging(parser, experiment_name, output_folder, quiet, args_dict, deb
     root.addHandler(fh)
 
     logging.info('Setup logging. Log file: {}'.format(os.path.join(log_folder, LOG_FILE)))
+    if not is_main_process():
+        return log_folder, NullSummaryWriter()
 
     # Save args to logs_folder
     logging.info('Arguments saved to: {}'.format(os.path.join(log_folder, 'args.txt')))
@@ -574,54 +623,47 @@ def set_up_logging(parser, experiment_name, output_folder, quiet, args_dict, deb
     logging.info('Initialize Tensorboard SummaryWriter')
 
     # Add all parameters to Tensorboard
-    writer = SummaryWriter(log_dir=log_folder)
+    # (the events are serialized by a background thread, see util.buffered_writer)
+    writer = BufferedSummaryWriter(SummaryWriter(log_dir=log_folder),
+                                   mb_resolution=kwargs.get('tensorboard_mb_resolution', None))
     writer.add_text('Args', json.dumps(args_dict))
 
     return log_folder, writer
 
 
-def copy_code(output_folder):
+def copy_code(output_folder, cache_folder=None):
     """
-    Makes a tar file with DeepDIVA that exists during runtime.
+    Saves a snapshot (tar file) of DeepDIVA as it exists during runtime.
+
+    The snapshots are stored once in a content-addressed cache and hardlinked into the output directory, see
+    util.code_snapshot for details.
 
     Parameters
     ----------
     output_folder : str
         Path to output directory
+    cache_folder : str
+        Path to the cache of the snapshots, shared among runs. By default a '.code_snapshots' folder next to
+        the output directory.
 
     Returns
     -------
         None
     """
     # All file extensions to be saved by copy-code.
-    FILE_TYPES = ['.sh', '.py']
+    FILE_TYPES = ('.sh', '.py')
 
     # Get DeepDIVA root
     cwd = os.getcwd()
     dd_root = os.path.join(cwd.split('DeepDIVA')[0], 'DeepDIVA')
 
-    files = get_all_files_in_folders_and_subfolders(dd_root)
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(os.path.normpath(output_folder)), '.code_snapshots')
 
-    # Get all files types in DeepDIVA as specified in FILE_TYPES
-    code_files = [item for item in files if item.endswith(tuple(FILE_TYPES))]
+    snapshot_code(root=dd_root, output_folder=output_folder, cache_folder=cache_folder, file_types=FILE_TYPES)
 
-    tmp_dir = tempfile.mkdtemp()
 
-    for item in code_files:
-        dest = os.path.join(tmp_dir, 'DeepDIVA', item.split('DeepDIVA')[1][1:])
-        if not os.path.exists(os.path.dirname(dest)):
-            os.makedirs(os.path.dirname(dest))
-        shutil.copy(item, dest)
-
-    # TODO: make it save a zipfile instead of a tarfile.
-    with tarfile.open(os.path.join(output_folder, 'DeepDIVA.tar.gz'), 'w:gz') as tar:
-        tar.add(tmp_dir, arcname='DeepDIVA')
-
-    # Clean up all temporary files
-    shutil.rmtree(tmp_dir)
-
-
-def set_up_env(gpu_id, seed, multi_run, no_cuda, **kwargs):
+def set_up_env(gpu_id, seed, multi_run, no_cuda, matplotlib_plots=False, precision='fp32', **kwargs):
     """
     Set up the execution environment.
 
@@ -635,11 +677,21 @@ def set_up_env(gpu_id, seed, multi_run, no_cuda, **kwargs):
         Number of runs over the same code to produce mean-variance graph.
     no_cuda : bool
         Specify whether to use the GPU or not
+    matplotlib_plots : bool
+        Render the plots with matplotlib instead of the raster renderer
+    precision : str
+        Precision of the forward passes, see util.precision
 
     Returns
     -------
         None
     """
+    # Select the renderer of the plots
+    use_matplotlib(matplotlib_plots)
+
+    # Make sure the precision is supported before starting
+    check_precision(precision, no_cuda)
+
     # Set visible GPUs
     if gpu_id is not None:
         os.environ['CUDA_VISIBLE_DEVICES'] = gpu_id
@@ -663,6 +715,9 @@ def set_up_env(gpu_id, seed, multi_run, no_cuda, **kwargs):
         if not no_cuda:
             torch.backends.cudnn.enabled = False
 
+    # The processes of a distributed run draw different crops and augmentations (the model is the same anyway)
+    seed = (seed + get_rank()) % 2 ** 32
+
     # Python
     random.seed(seed)
 
@@ -0,0 +1,92 @@
+"""
+Atomic creation of files: a file is created under a temporary name in its destination folder and then renamed, such
+that concurrent readers and interrupted runs never see it partially written.
+
+The temporary files are given the permissions of the file they replace, or of the files created by open() (0o666
+minus the umask) for a new file, instead of the private 0o600 of tempfile.mkstemp(): the renamed files are readable
+by the other users as usual.
+"""
+
+# Utils
+import contextlib
+import os
+import shutil
+import stat
+import tempfile
+
+# The umask can only be read by setting it: it is read once, when the module is imported
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+# Mode of the files created by open()
+FILE_MODE = 0o666 & ~_UMASK
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Context manager giving a temporary path in the folder of path, with the same extension (e.g. for the libraries
+    deducing the format from it), which is renamed to path when the context exits without exception and removed
+    otherwise. If path exists, its permissions are kept.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file to create
+
+    Yields
+    ------
+    tmp_path : str
+        Path of an empty temporary file, to be overwritten
+    """
+    mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1], prefix='.tmp_',
+                                    dir=os.path.dirname(path) or '.')
+    try:
+        try:
+            os.fchmod(fd, mode)
+        finally:
+            os.close(fd)
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='wb', fsync=False):
+    """
+    Context manager giving a file opened for writing, which is renamed to path once it is closed (see atomic_path()).
+
+    Parameters
+    ----------
+    path : str
+        Path of the file to create
+    mode : str
+        Mode in which the file is opened ('wb' or 'w')
+    fsync : bool
+        Whether to flush the file to disk before renaming it
+
+    Yields
+    ------
+    f : file object
+    """
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def atomic_link(src, dst):
+    """Makes dst a hardlink of src (or a copy if the file system does not support hardlinks)"""
+    tmp_path = os.path.join(os.path.dirname(dst), '.{}.tmp'.format(os.path.basename(dst)))
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
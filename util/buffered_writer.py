@@ -0,0 +1,118 @@
+"""
+Buffered sink between the runners and the tensorboardX.SummaryWriter.
+
+The runners log several scalars per mini-batch. Serializing each of them into an event on the training thread is
+costly and produces huge event files. The BufferedSummaryWriter offers the same interface as the SummaryWriter
+(add_scalar, add_image, add_text, ...) but only puts the calls in a queue, which is consumed by a background thread.
+Optionally, the mini-batch scalars (tags containing '/mb_') are reduced to one mean, min and max every N steps.
+"""
+
+# Utils
+import logging
+import queue
+import threading
+
+import numpy as np
+
+
+class BufferedSummaryWriter(object):
+    """
+    Wraps a tensorboardX.SummaryWriter such that all calls are executed by a background thread.
+
+    Attributes
+    ----------
+    writer : tensorboardX.writer.SummaryWriter
+        The wrapped writer
+    mb_resolution : int
+        Number of mini-batch steps summarized in a single mean/min/max value. With 1 (or None) every mini-batch
+        scalar is written as is.
+    """
+
+    # Tags containing this string are considered mini-batch scalars
+    MINI_BATCH_TAG = '/mb_'
+
+    def __init__(self, writer, mb_resolution=None, max_queue_size=100000):
+        """
+        Parameters
+        ----------
+        writer : tensorboardX.writer.SummaryWriter
+            The writer to wrap
+        mb_resolution : int
+            Number of mini-batch steps summarized in a single mean/min/max value
+        max_queue_size : int
+            Maximum number of calls buffered. If the background thread falls behind, the caller blocks.
+        """
+        self.writer = writer
+        self.mb_resolution = mb_resolution if mb_resolution is not None and mb_resolution > 1 else None
+        # {tag : (bucket, list of values)} partial summaries of the mini-batch scalars
+        self._buckets = {}
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='BufferedSummaryWriter', daemon=True)
+        self._thread.start()
+
+    def add_scalar(self, tag, scalar_value, global_step=None, *args, **kwargs):
+        self._queue.put(('add_scalar', (tag, scalar_value, global_step) + args, kwargs))
+
+    def flush(self):
+        """Blocks until all the buffered calls have been passed to the wrapped writer (partial summaries are kept)"""
+        self._queue.join()
+
+    def close(self):
+        """Writes the pending calls and the partial summaries, then closes the wrapped writer"""
+        self._queue.put(('_close', (), {}))
+        self._thread.join()
+
+    def __getattr__(self, name):
+        # Any other method of the SummaryWriter (add_image, add_text, ...) is executed in background as well
+        if name == 'writer' or name.startswith('__'):
+            raise AttributeError(name)
+        attribute = getattr(self.writer, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            # The caller may modify its arrays (e.g. a reused image buffer) before the call is executed
+            args = tuple(np.copy(arg) if isinstance(arg, np.ndarray) else arg for arg in args)
+            kwargs = {key: np.copy(value) if isinstance(value, np.ndarray) else value for key, value in kwargs.items()}
+            self._queue.put((name, args, kwargs))
+        return call
+
+    def _run(self):
+        while True:
+            name, args, kwargs = self._queue.get()
+            try:
+                if name == '_close':
+                    self._flush_buckets()
+                    self.writer.close()
+                    return
+                elif name == 'add_scalar':
+                    self._add_scalar(*args, **kwargs)
+                else:
+                    getattr(self.writer, name)(*args, **kwargs)
+            except Exception as exp:
+                logging.warning('Failed to write {} to Tensorboard: {}'.format(name, exp))
+            finally:
+                self._queue.task_done()
+
+    def _add_scalar(self, tag, scalar_value, global_step=None, *args, **kwargs):
+        if self.mb_resolution is None or global_step is None or self.MINI_BATCH_TAG not in tag:
+            self.writer.add_scalar(tag, scalar_value, global_step, *args, **kwargs)
+            return
+
+        bucket = global_step // self.mb_resolution
+        if tag in self._buckets and self._buckets[tag][0] != bucket:
+            self._write_bucket(tag)
+        if tag not in self._buckets:
+            self._buckets[tag] = (bucket, [])
+        self._buckets[tag][1].append(float(scalar_value))
+
+    def _write_bucket(self, tag):
+        bucket, values = self._buckets.pop(tag)
+        step = bucket * self.mb_resolution
+        self.writer.add_scalar(tag, np.mean(values), step)
+        self.writer.add_scalar(tag + '_min', np.min(values), step)
+        self.writer.add_scalar(tag + '_max', np.max(values), step)
+
+    def _flush_buckets(self):
+        for tag in list(self._buckets.keys()):
+            self._write_bucket(tag)
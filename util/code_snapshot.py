@@ -0,0 +1,119 @@
+"""
+Content-addressed store of the snapshots of the code.
+
+Every run saves the code it has been executed with in its log folder. Most runs of an experiment (e.g. a grid search)
+run exactly the same code, therefore each distinct snapshot is archived only once in a shared cache, named after the
+hash of its content, and hardlinked into the log folders next to a small manifest. The hashes of the files are kept
+in an index of the cache and recomputed only for the files whose size or modification time changed.
+"""
+
+# Utils
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import time
+
+# DeepDIVA
+from util.atomic_file import atomic_link, atomic_write
+
+# Name of the files in the log folder
+SNAPSHOT_FILE = 'DeepDIVA.tar.gz'
+MANIFEST_FILE = 'code_snapshot.json'
+# Name of the index {path : size, mtime and hash} in the cache folder
+INDEX_FILE = 'file_hashes.json'
+
+
+def snapshot_code(root, output_folder, cache_folder, file_types=('.sh', '.py'), arcname='DeepDIVA'):
+    """
+    Saves a snapshot of the code in the output folder, archiving it in the cache only if it is not there already.
+
+    Parameters
+    ----------
+    root : str
+        Root folder of the code
+    output_folder : str
+        Folder where the snapshot (hardlink) and its manifest are saved
+    cache_folder : str
+        Folder of the shared cache. Should be on the same file system as the output folder, otherwise the snapshot
+        is copied instead of hardlinked.
+    file_types : tuple(str)
+        Extensions of the files to be saved
+    arcname : str
+        Name of the root folder in the archive
+
+    Returns
+    -------
+    digest : str
+        Hash of the snapshot
+    """
+    start_time = time.time()
+    os.makedirs(cache_folder, exist_ok=True)
+
+    # Hash the files, reusing the hashes of the files which did not change
+    index = _load_json(os.path.join(cache_folder, INDEX_FILE))
+    hashes = {}
+    changed = False
+    for relpath in _list_files(root, file_types, exclude=[cache_folder]):
+        path = os.path.abspath(os.path.join(root, relpath))
+        stat = os.stat(path)
+        entry = index.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': _hash_file(path)}
+            index[path] = entry
+            changed = True
+        hashes[relpath] = entry['hash']
+    if changed:
+        _save_json(index, os.path.join(cache_folder, INDEX_FILE))
+
+    digest = hashlib.sha1(json.dumps(hashes, sort_keys=True).encode('utf-8')).hexdigest()
+    snapshot = os.path.join(cache_folder, digest + '.tar.gz')
+    if not os.path.exists(snapshot):
+        _write_archive(root, sorted(hashes.keys()), snapshot, arcname)
+        logging.info('New code snapshot {} archived in {}'.format(digest, cache_folder))
+
+    atomic_link(snapshot, os.path.join(output_folder, SNAPSHOT_FILE))
+    _save_json({'digest': digest, 'root': os.path.abspath(root), 'snapshot': os.path.abspath(snapshot),
+                'files': hashes}, os.path.join(output_folder, MANIFEST_FILE))
+    logging.debug('Code snapshot {} ({} files) saved in {:.3f}s'.format(digest, len(hashes), time.time() - start_time))
+    return digest
+
+
+def _list_files(root, file_types, exclude=()):
+    """Paths (relative to root) of the files with the given extensions, skipping the .git and excluded folders"""
+    exclude = [os.path.abspath(e) for e in exclude]
+    files = []
+    for path, subdirs, names in os.walk(root):
+        subdirs[:] = [d for d in subdirs if d != '.git' and os.path.abspath(os.path.join(path, d)) not in exclude]
+        files.extend(os.path.relpath(os.path.join(path, name), root) for name in names if name.endswith(file_types))
+    return files
+
+
+def _hash_file(path, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _write_archive(root, relpaths, filename, arcname):
+    """Writes the archive to a temporary file which is then renamed, such that concurrent runs never see it torn"""
+    with atomic_write(filename) as f, tarfile.open(fileobj=f, mode='w:gz') as tar:
+        for relpath in relpaths:
+            tar.add(os.path.join(root, relpath), arcname=os.path.join(arcname, relpath))
+
+
+def _load_json(filename):
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        # A missing or corrupted index only means that the files have to be hashed again
+        return {}
+
+
+def _save_json(obj, filename):
+    with atomic_write(filename, 'w') as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
@@ -4,47 +4,31 @@ This script parsed all images and prints the average width and heigth
 
 # Utils
 import argparse
-import os
-from PIL import Image
 
-from os import listdir
-from os.path import isfile, join
+# DeepDIVA
+from util.data import preprocess
 
 
-
-def print_average_width_length(dataset_folder):
+def print_average_width_length(dataset_folder, workers=None):
     """
-    Resize all images contained within dataset_folder.
+    Print the average width and length of all images contained within dataset_folder.
+
+    Only the headers of the images are read.
 
     Parameters
     ----------
     dataset_folder : str
         Path to the dataset folder
+    workers : int
+        Number of processes. If None, the number of CPUs.
 
     Returns
     -------
         None
     """
-    total_width = 0
-    total_length = 0
-    counter = 0
-
-    # Get all the files recursively from the given dataset_folder
-    recursiveFiles = [os.path.join(dp, f) for dp, dn, fn in os.walk(dataset_folder) for f in fn if f.endswith('png')]
-
-    for infile in recursiveFiles:
-        try:
-            counter += 1
-            im = Image.open(infile)
-            width, length = im.size
-            total_width += width
-            total_length += length
-        except:
-            print("FAIL");
-    print("average width: " + str(total_width / counter))
-    print("average length: " + str(total_length / counter))
-
-    return
+    sizes = preprocess.image_sizes(dataset_folder, extensions=('png',), workers=workers)
+    print("average width: " + str(sizes[:, 0].mean()))
+    print("average length: " + str(sizes[:, 1].mean()))
 
 
 if __name__ == "__main__":
@@ -57,6 +41,11 @@ if __name__ == "__main__":
                         type=str,
                         default=None)
 
+    parser.add_argument('--workers',
+                        help='number of processes (default: the number of CPUs)',
+                        type=int,
+                        default=None)
+
     args = parser.parse_args()
 
-    print_average_width_length(dataset_folder=args.dataset_folder)
+    print_average_width_length(dataset_folder=args.dataset_folder, workers=args.workers)
@@ -4,48 +4,28 @@ This script allows to crop the asbestos images into 256x256 images for input int
 
 # Utils
 import argparse
-import os
-from PIL import Image
 
-from os import listdir
-from os.path import isfile, join
+# DeepDIVA
+from util.data import preprocess
 
 
-
-def crop_images(dataset_folder):
+def crop_images(dataset_folder, workers=None):
     """
-    Resize all images contained within dataset_folder.
+    Crop all images contained within dataset_folder to 1200x1800 (written as png).
 
     Parameters
     ----------
     dataset_folder : str
         Path to the dataset folder
+    workers : int
+        Number of processes. If None, the number of CPUs.
 
     Returns
     -------
         None
     """
-
-    # Get all the files recursively from the given dataset_folder
-    recursiveFiles = [os.path.join(dp, f) for dp, dn, fn in os.walk(dataset_folder) for f in fn if f.endswith('jpg')]
-
-    print(recursiveFiles)
-
-    size = 1200, 1800
-
-    for infile in recursiveFiles:
-        try:
-            im = Image.open(infile)
-            out = im.crop((100, 100, 1300, 1900))
-            print("")
-            out.save(infile, "png")
-
-
-            print("SUCCESS")
-        except:
-            print("FAIL")
-
-    return
+    preprocess.crop_images(dataset_folder, box=(100, 100, 1300, 1900), extensions=('jpg',), format='png',
+                           workers=workers)
 
 
 if __name__ == "__main__":
@@ -58,6 +38,11 @@ if __name__ == "__main__":
                         type=str,
                         default=None)
 
+    parser.add_argument('--workers',
+                        help='number of processes (default: the number of CPUs)',
+                        type=int,
+                        default=None)
+
     args = parser.parse_args()
 
-    crop_images(dataset_folder=args.dataset_folder)
+    crop_images(dataset_folder=args.dataset_folder, workers=args.workers)
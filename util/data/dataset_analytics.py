@@ -48,7 +48,8 @@ import torchvision.datasets as datasets
 import torchvision.transforms as transforms
 
 # DeepDIVA
-from datasets import coco_detection
+from datasets import coco_detection, packed_dataset
+from datasets.reduced_decode import reduce_mask
 
 def compute_mean_std(dataset_folder, inmem, workers):
     """
@@ -76,17 +77,22 @@ def compute_mean_std(dataset_folder, inmem, workers):
         logging.warning("Train folder not found in the args.dataset_folder={}".format(dataset_folder))
         return
 
-    # Load the dataset file names
-    train_ds = datasets.ImageFolder(traindir, transform=transforms.Compose([transforms.ToTensor()]))
+    if packed_dataset.is_packed(dataset_folder):
+        # The images are already in a single array
+        train_ds = packed_dataset.PackedDataset(traindir)
+        mean, std = cms_packed(train_ds.images)
+    else:
+        # Load the dataset file names
+        train_ds = datasets.ImageFolder(traindir, transform=transforms.Compose([transforms.ToTensor()]))
 
-    # Extract the actual file names and labels as entries
-    file_names = np.asarray([item[0] for item in train_ds.imgs])
+        # Extract the actual file names and labels as entries
+        file_names = np.asarray([item[0] for item in train_ds.imgs])
 
-    # Compute mean and std
-    if inmem:
-        mean, std = cms_inmem(file_names)
-    else:
-        mean, std = cms_online(file_names, workers)
+        # Compute mean and std
+        if inmem:
+            mean, std = cms_inmem(file_names)
+        else:
+            mean, std = cms_online(file_names, workers)
 
     # Compute class frequencies weights
     class_frequencies_weights = _get_class_frequencies_weights(train_ds, workers)
@@ -125,7 +131,11 @@ def compute_mean_std_coco(dataset_folder, inmem, workers, **kwargs):
 
     # Load the dataset file names
     json = [os.path.join(gtdir, f) for f in os.listdir(gtdir) if 'instances_{}'.format('train')][0]
-    train_ds = coco_detection.CocoDetection(traindir, json, **kwargs)
+    # Re-use (and warm up) the same mask cache as the training dataloader
+    mask_cache_folder = None
+    if not kwargs.get('disable_coco_mask_cache', False):
+        mask_cache_folder = os.path.join(dataset_folder, 'mask_cache', 'train')
+    train_ds = coco_detection.CocoDetection(traindir, json, mask_cache_folder=mask_cache_folder, **kwargs)
 
     # Extract the actual file names and labels as entries
     file_names = np.asarray([os.path.join(traindir, i['file_name']) for i in train_ds.coco.dataset['images']])
@@ -137,7 +147,7 @@ def compute_mean_std_coco(dataset_folder, inmem, workers, **kwargs):
         mean, std = cms_online(file_names, workers)
 
     # Compute class frequencies weights
-    class_frequencies_weights = _get_class_frequencies_weights_coco(train_ds, **kwargs)
+    class_frequencies_weights = _get_class_frequencies_weights_coco(train_ds, workers=workers, **kwargs)
 
     # Save results as CSV file in the dataset folder
     df = pd.DataFrame([mean, std, class_frequencies_weights])
@@ -181,7 +191,7 @@ def compute_mean_std_hisdb(dataset_folder, inmem, workers):
         mean, std = cms_online(file_names_data, workers)
 
     # Compute class frequencies weights
-    class_frequencies_weights = _get_class_frequencies_weights_HisDB(file_names_gt)
+    class_frequencies_weights = _get_class_frequencies_weights_HisDB(file_names_gt, workers)
     # print(class_frequencies_weights)
     # Save results as CSV file in the dataset folder
     df = pd.DataFrame([mean, std, class_frequencies_weights])
@@ -278,6 +288,37 @@ def cms_inmem(file_names):
     return mean, std
 
 
+def cms_packed(images, chunk_size=4096):
+    """
+    Computes mean and standard deviation of the images of a packed dataset (see datasets.packed_dataset), a chunk
+    of images at a time.
+
+    Parameters
+    ----------
+    images : numpy array [N x H x W x C]
+        The images (uint8), grey scale (C = 1) or RGB (C = 3)
+    chunk_size : int
+        Number of images read at once
+
+    Returns
+    -------
+    mean : double
+    std : double
+    """
+    total = np.zeros(images.shape[3])
+    total_squares = np.zeros(images.shape[3])
+    for start in range(0, len(images), chunk_size):
+        chunk = np.asarray(images[start:start + chunk_size], dtype=np.float64) / 255.0
+        total += chunk.sum(axis=(0, 1, 2))
+        total_squares += np.square(chunk).sum(axis=(0, 1, 2))
+    count = np.prod(images.shape[:3])
+    mean = total / count
+    std = np.sqrt(np.maximum(total_squares / count - np.square(mean), 0))
+
+    # Grey scale images are loaded as RGB
+    return np.resize(mean, 3), np.resize(std, 3)
+
+
 def _get_class_frequencies_weights(dataset, workers):
     """
     Get the weights proportional to the inverse of their class frequencies.
@@ -319,7 +360,16 @@ def _get_class_frequencies_weights(dataset, workers):
     return (1 / num_samples_per_class) / ((1 / num_samples_per_class).sum())
 
 
-def _get_class_frequencies_weights_HisDB(gt_images):
+def _return_class_histogram_HisDB(gt_images):
+    # Loads a chunk of ground truth pages and returns the histogram of their blue channel (which encodes the class)
+    histogram = np.zeros(256, dtype=np.int64)
+    for path in gt_images:
+        # NOTE: cv2 opens bgr, hence the blue channel is the channel 0
+        histogram += np.bincount(cv2.imread(path)[:, :, 0].ravel(), minlength=256)
+    return histogram
+
+
+def _get_class_frequencies_weights_HisDB(gt_images, workers=1):
     """
     Get the weights proportional to the inverse of their class frequencies.
     The vector sums up to 1
@@ -329,42 +379,72 @@ def _get_class_frequencies_weights_HisDB(gt_images):
     gt_images: list of strings
         Path to all ground truth images, which contain the pixel-wise label
     workers: int
-        Number of workers to use for the mean/std computation
+        Number of workers to use for the class frequencies computation
 
     Returns
     -------
     ndarray[double] of size (num_classes)
         The weights vector as a 1D array normalized (sum up to 1)
     """
-    import skimage.io as io
     logging.info('Begin computing class frequencies weights')
-    all_labels = np.concatenate(np.array([np.array(io.imread(path))[:, :, 2].flatten() for path in gt_images]).flatten()).ravel()
 
-    total_num_samples = len(all_labels)
-    num_samples_per_class = np.unique(all_labels, return_counts=True)[1]
+    # Each worker computes the partial histogram of a chunk of pages, which are then summed up
+    with Pool(workers) as pool:
+        histogram = np.sum(pool.map(_return_class_histogram_HisDB, _split_in_chunks(gt_images, workers)), axis=0)
+
+    # Only the values which actually occur in the ground truth are classes
+    num_samples_per_class = histogram[histogram > 0]
+    total_num_samples = num_samples_per_class.sum()
 
     class_frequencies = (num_samples_per_class / total_num_samples)
     logging.info('Finished computing class frequencies weights')
     logging.info('Class frequencies (rounded): {class_frequencies}'
                  .format(class_frequencies=np.around(class_frequencies * 100, decimals=2)))
     # Normalize vector to sum up to 1.0 (in case the Loss function does not do it)
-    print("return val: " + str((1 / num_samples_per_class) / ((1 / num_samples_per_class).sum())))
     return (1 / num_samples_per_class) / ((1 / num_samples_per_class).sum())
 
 
-def _get_class_frequencies_weights_coco(dataset, name_onehotindex, **kwargs):
+# Dataset shared with the workers of the pool computing the coco class histograms
+_coco_dataset = None
+
+
+def _init_worker_coco(dataset):
+    global _coco_dataset
+    _coco_dataset = dataset
+
+
+def _return_class_histogram_coco(indexes, num_classes):
+    # Rasterizes the annotations of a chunk of images (without decoding them) and returns the histogram of the classes
+    histogram = np.zeros(num_classes, dtype=np.int64)
+    for index in indexes:
+        mask = reduce_mask(_coco_dataset.get_mask(_coco_dataset.ids[index]), _coco_dataset.decode_scale)
+        histogram += np.bincount(mask.ravel(), minlength=num_classes)
+        # As in the samples of the dataset, the padding making the masks square counts as background
+        histogram[0] += _coco_dataset.img_size ** 2 - mask.size
+    return histogram
+
+
+def _split_in_chunks(items, workers):
+    # Splits the items in some chunks per worker such that each worker returns only a few partial results
+    return [chunk for chunk in np.array_split(np.asarray(items), max(1, workers * 4)) if len(chunk) > 0]
+
+
+def _get_class_frequencies_weights_coco(dataset, name_onehotindex, workers=1, **kwargs):
     """
     Get the weights proportional to the inverse of their class frequencies.
     The vector sums up to 1
 
     Parameters
     ----------
-    dataset: pycocotools.coco.COCO
+    dataset: datasets.coco_detection.CocoDetection
         COCO dataset loaded with the pycocotools and the torchvision dataset loader
 
-    classes: dict
+    name_onehotindex: dict
         dictionary containing the class names and the corresponding index for argmax
 
+    workers: int
+        Number of workers to use for the class frequencies computation
+
     Returns
     -------
     ndarray[double] of size (num_classes)
@@ -372,14 +452,16 @@ def _get_class_frequencies_weights_coco(dataset, name_onehotindex, **kwargs):
     """
     logging.info('Begin computing class frequencies weights')
 
-    count_labels = {v: 0 for v in name_onehotindex.values()}
+    num_classes = max(name_onehotindex.values()) + 1
 
-    for (_, gt_mask) in dataset:
-        for k, v in zip(*np.unique(np.array(gt_mask).flatten(), return_counts=True)):
-            count_labels[k] += v
+    # Each worker computes the partial histogram of a chunk of images, which are then summed up
+    with Pool(workers, initializer=_init_worker_coco, initargs=(dataset,)) as pool:
+        histogram = np.sum(pool.starmap(_return_class_histogram_coco,
+                                        [(chunk, num_classes) for chunk in _split_in_chunks(range(len(dataset)), workers)]),
+                           axis=0)
 
-    total_num_samples = sum(count_labels.values())
-    num_samples_per_class = np.array([count_labels[k] for k in sorted(count_labels.keys())])
+    total_num_samples = histogram.sum()
+    num_samples_per_class = histogram[sorted(name_onehotindex.values())]
     class_frequencies = (num_samples_per_class / total_num_samples)
     logging.info('Finished computing class frequencies weights')
     logging.info('Class frequencies (rounded): {class_frequencies}'
@@ -2,9 +2,10 @@
 This script generate the integrity footprint on the dataset provided.
 Such a footprint can be used to verify that the data has no been modified, altered or manipulated.
 The integrity of the dataset can be verified in two ways: quick and deep.
-The former is very fast and uses a high level type of verification such as recently modified files and file counts.
-The latter basically re-compute the footprint and verifies if it matches the existing one. This is slow and should
-be used only when the integrity of the dataset is a critical matter.
+The former is very fast and uses a high level type of verification such as file sizes and last modified times.
+The latter verifies the hashes of the files as well. Since the footprint is a manifest storing the size and the
+last modified time of every file along with its hash, only the files whose size or last modified time changed
+are re-hashed. The hashing is done in a pool of threads.
 
 Structure of the dataset expected can be found at:
 https://diva-dia.github.io/DeepDIVAweb/articles/prepare-dataset/
@@ -16,11 +17,15 @@ import hashlib
 import json
 import logging
 import os
-from stat import S_ISDIR, S_ISREG
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+# Size of the blocks read when hashing a file. Large blocks reduce the number of system calls and
+# allow hashlib to release the GIL for most of the time, such that multiple threads hash in parallel.
+BLOCKSIZE = 1024 * 1024
 
-def generate_integrity_footprint(dataset_folder):
+
+def generate_integrity_footprint(dataset_folder, old_footprint=None, workers=None):
     """
     This function generates the integrity footprint on the dataset provided.
     Such a footprint can be used to verify that the data has no been modified, altered or manipulated.
@@ -28,32 +33,55 @@ def generate_integrity_footprint(dataset_folder):
     The footprint file will contain the following information in a JSON format:
 
     {
-        path : <string>                         // Path to this folder where the last step is the name of the folder
+        path : <string>                         // Path to the dataset folder
         last_modified : <date>                  // This correspond to the most recent 'last modified' in the dataset
-        files : {                               // For each file
-            {
-                file_name : <string>            // The filename as string
-                file_hash : <hash>              // This is the hash of the content
+        files : {                               // For each file (flat, no recursion)
+            <relative path> : {                 // The path of the file relative to the dataset folder
+                size : <int>                    // Size of the file in bytes
+                mtime : <int>                   // Last modified time of the file in nanoseconds
+                hash : <hash>                   // This is the hash of the content
             },
             ...
         }
-        folders : {                             // For each folder, recursion
-           // Recursion but NO last_modified (not needed anymore)
-        ]
     }
 
     Parameters
     ----------
     dataset_folder : String (path)
         Path to the dataset folder (see above for details)
+    old_footprint : dictionary
+        A previous footprint of the same folder. The hashes of the files whose size and last modified time did not
+        change are taken from it instead of being re-computed.
+    workers : int
+        Number of threads used to hash the files. If None, the default of ThreadPoolExecutor is used.
 
     Returns
     -------
         A dictionary of the format explained in generate_integrity_footprint() above.
     """
     logging.info("Generating the footprint of: {}".format(dataset_folder))
-    data = _process_folder(dataset_folder)
-    data['last_modified'] = get_last_modified(dataset_folder)
+    old_files = _get_manifest(old_footprint)
+    files = _scan_folder(dataset_folder)
+
+    # Re-use the hashes of the files which did not change
+    to_hash = []
+    for name, entry in files.items():
+        old_entry = old_files.get(name)
+        if old_entry is not None and old_entry.get('size') == entry['size'] and old_entry.get('mtime') == entry['mtime']:
+            entry['hash'] = old_entry['hash']
+        else:
+            to_hash.append(name)
+
+    logging.info("Hashing {} files (out of {})".format(len(to_hash), len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = executor.map(_process_file, [os.path.join(dataset_folder, name) for name in to_hash])
+        for name, file_hash in zip(to_hash, hashes):
+            files[name]['hash'] = file_hash
+
+    data = {}
+    data['path'] = dataset_folder
+    data['last_modified'] = _last_modified_from_manifest(files)
+    data['files'] = files
     logging.info('Footprint generated successfully')
     return data
 
@@ -77,66 +105,54 @@ def get_last_modified(dataset_folder):
         last_modified : String
             A string representing the last modified of the entire folder
     """
-    # NOTE: To speed up this process it would be possible to only look
-    # the last_modified of the files and folders in the root. This is
-    # dangerous because if a files gets modified in the sub-folders it
-    # does not modify the last_modified of its parent folder. However,
-    # that would be very quick.
-    last_modified = 0
-    for root, folders, files in os.walk(dataset_folder):
-        if 'footprint.json' in files:
-            files.remove('footprint.json')
-        if not files:
-            continue
-        tmp = max([os.path.getmtime(os.path.join(root, f)) for f in files])
-        last_modified = max(tmp, last_modified)
-    return str(time.ctime(last_modified))
-
-
-def _process_folder(path):
+    return _last_modified_from_manifest(_scan_folder(dataset_folder))
+
+
+def _last_modified_from_manifest(files):
+    last_modified = max([entry['mtime'] for entry in files.values()], default=0)
+    return str(time.ctime(last_modified / 1e9))
+
+
+def _scan_folder(dataset_folder):
     """
-    Recursively descend the directory tree rooted at path,
-    calling _process_file() function for each regular file
+    Recursively descend the directory tree rooted at dataset_folder and collect size and last modified time
+    of each regular file. The files are not opened.
 
     Parameters
     ----------
-    path : String (path)
+    dataset_folder : String (path)
         Path to folder to navigate
 
     Returns
     -------
-        A dictionary of the format explained in generate_integrity_footprint() above.
+        A dictionary {relative path : {'size' : <int>, 'mtime' : <int>}}
     """
-    logging.debug("Exploring folder: {}".format(path))
-
-    # Init the dictionary to host the data
-    data = {}
-    data['files'] = []
-    data['folders'] = []
-    data['path'] = path
-
-    # Iterate in all files into the folder
-    for f in os.scandir(path=path):
-        # Need to skip the footprint.json
-        if f.name == 'footprint.json':
-            continue
-        pathname = os.path.join(path, f.name)
-        mode = os.stat(pathname).st_mode
-        if S_ISDIR(mode):
-            # It's a directory, recurse into it
-            data['folders'].append(_process_folder(pathname))
-        elif S_ISREG(mode):
-            # It's a file, hash it
-            data['files'].append(_process_file(pathname))
-        else:
-            # Unknown file type, print a message
-            print('Unknown  file type, skipping %s' % pathname)
-    return data
+    files = {}
+    folders = ['']
+    while folders:
+        folder = folders.pop()
+        logging.debug("Exploring folder: {}".format(os.path.join(dataset_folder, folder)))
+        with os.scandir(os.path.join(dataset_folder, folder)) as it:
+            for f in it:
+                name = '/'.join([folder, f.name]) if folder else f.name
+                # Need to skip the footprints and the page geometry caches of the splits (at any depth)
+                if f.name in ['footprint.json', 'differences_footprint.json', 'page_geometry.json']:
+                    continue
+                if f.is_dir(follow_symlinks=True):
+                    # It's a directory, recurse into it
+                    folders.append(name)
+                elif f.is_file(follow_symlinks=True):
+                    stat = f.stat(follow_symlinks=True)
+                    files[name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+                else:
+                    # Unknown file type, print a message
+                    logging.warning('Unknown file type, skipping {}'.format(os.path.join(dataset_folder, name)))
+    return files
 
 
 def _process_file(path):
     """
-    Hashes a file and returns its filename with it in a dictionary format
+    Hashes a file
 
     Parameters
     ----------
@@ -145,28 +161,54 @@ def _process_file(path):
 
     Returns
     -------
-        A dictionary with the filename and its hash
+        String
+            The hex digest of the hash of the file
     """
-    BLOCKSIZE = 65536
     hasher = hashlib.sha1()
-    with open(path, 'rb') as afile:
+    with open(path, 'rb', buffering=0) as afile:
         buf = afile.read(BLOCKSIZE)
         while len(buf) > 0:
             hasher.update(buf)
             buf = afile.read(BLOCKSIZE)
-    data = {}
-    data['file_name'] = path
-    data['file_hash'] = hasher.hexdigest()
-    return data
+    return hasher.hexdigest()
+
+
+def _get_manifest(footprint):
+    """
+    Returns the flat manifest of files of a footprint or an empty one if the footprint is missing.
+    Footprints generated in the old nested format are flattened, their entries have a hash only.
+    """
+    if footprint is None:
+        return {}
+    if _is_nested_footprint(footprint):
+        files = {}
+        folders = [footprint]
+        while folders:
+            folder = folders.pop()
+            folders.extend(folder['folders'])
+            for f in folder['files']:
+                name = os.path.relpath(f['file_name'], footprint['path']).replace(os.sep, '/')
+                files[name] = {'hash': f['file_hash']}
+        return files
+    return footprint['files']
+
+
+def _is_nested_footprint(footprint):
+    return isinstance(footprint.get('files'), list)
+
+
+def _load_footprint(dataset_folder):
+    with open(os.path.join(dataset_folder, 'footprint.json')) as json_file:
+        return json.load(json_file)
 
 
 def verify_integrity_quick(dataset_folder):
     """
-    This function verifies that the 'last_modified' field still corresponds to the one contained in the footprint.
-    This check is verify fast, but it comes at a price.
-    The OS updates this number when files are added or removed to the folder, but NOT if a file is modified.
-    Because of this, it is not 100% safe and especially does NOT protect you against malicious attacks!
-    To have a safe check whether the data is the same you should rely on the slower
+    This function verifies that the files in the dataset folder still have the same size and last modified time
+    as in the footprint. This check is verify fast, but it comes at a price.
+    The content of the files is NOT verified, so a file modified while preserving its size and last modified time
+    is not detected. Because of this, it is not 100% safe and especially does NOT protect you against
+    malicious attacks! To have a safe check whether the data is the same you should rely on the slower
     verify_integrity_deep() function.
 
     Parameters
@@ -177,22 +219,11 @@ def verify_integrity_quick(dataset_folder):
     Returns
     -------
         Boolean
-            Is the 'last_modified' field still actual?
+            Are the files still the same as in the footprint?
     """
     logging.info("Verifying the dataset integrity - quick")
     try:
-        with open(os.path.join(dataset_folder, 'footprint.json')) as json_file:
-            data = json.load(json_file)
-            old_timestamp = data['last_modified']
-            new_timestamp = get_last_modified(dataset_folder)
-            logging.info("Newly measured timestamp: {}".format(new_timestamp))
-            if old_timestamp == new_timestamp:
-                logging.info("Dataset integrity verified (quick). The dataset has not been modified")
-                return True
-            else:
-                logging.error("The dataset has been modified. The last_modified field does not match: old[{}] new[{}]"
-                              .format(old_timestamp, new_timestamp))
-                return False
+        data = _load_footprint(dataset_folder)
     except FileNotFoundError:
         logging.error("Missing footprint. Cannot verify dataset integrity.")
         logging.warning("Creating a new footprint, since it is missing.")
@@ -200,16 +231,40 @@ def verify_integrity_quick(dataset_folder):
         save_footprint(dataset_folder=dataset_folder, filename='footprint.json', data=data)
         return False
 
+    if _is_nested_footprint(data):
+        # Footprint in the old nested format, fall back to the last_modified field
+        old_timestamp = data['last_modified']
+        new_timestamp = get_last_modified(dataset_folder)
+        logging.info("Newly measured timestamp: {}".format(new_timestamp))
+        if old_timestamp == new_timestamp:
+            logging.info("Dataset integrity verified (quick). The dataset has not been modified")
+            return True
+        logging.error("The dataset has been modified. The last_modified field does not match: old[{}] new[{}]"
+                      .format(old_timestamp, new_timestamp))
+        return False
+
+    new_files = _scan_folder(dataset_folder)
+    added, removed, modified = manifest_compare(data['files'], new_files, keys=['size', 'mtime'])
+    if not (added or removed or modified):
+        logging.info("Dataset integrity verified (quick). The dataset has not been modified")
+        return True
+    logging.error("The dataset has been modified: {} files added, {} removed, {} modified"
+                  .format(len(added), len(removed), len(modified)))
+    return False
 
-def verify_integrity_deep(dataset_folder):
+
+def verify_integrity_deep(dataset_folder, workers=None):
     """
-    This function basically re-compute the footprint and verifies if it matches the existing one.
-    This is slow and should be used only when the integrity of the dataset is a critical matter.
+    This function re-computes the footprint and verifies if it matches the existing one.
+    Only the files whose size or last modified time changed are re-hashed. If the footprint is in the old
+    (nested) format, all files are hashed and, if they match, the footprint is converted in the new format.
 
     Parameters
     ----------
     dataset_folder : String (path)
         Path to the dataset folder (see above for details)
+    workers : int
+        Number of threads used to hash the files. If None, the default of ThreadPoolExecutor is used.
 
     Returns
     -------
@@ -218,31 +273,58 @@ def verify_integrity_deep(dataset_folder):
     """
     logging.info("Verifying the dataset integrity - deep")
     try:
-        with open(os.path.join(dataset_folder, 'footprint.json')) as json_file:
-            old_data = json.load(json_file)
-            new_data = generate_integrity_footprint(dataset_folder)
-
-            if old_data == new_data:
-                logging.info("Dataset integrity verified (deep). The dataset has not been modified")
-                return True
-            else:
-                logging.error("The dataset has been modified. The footprints does not match.")
-                added, removed, modified, same = dict_compare(old_data, new_data)
-                data = {}
-                data['added'] = ', '.join(added)
-                data['removed'] = ', '.join(removed)
-                data['modified'] = modified
-                data['same'] = ', '.join(same)
-                with open(os.path.join(dataset_folder, 'differences_footprint.json'), 'w') as outfile:
-                    json.dump(data, outfile)
-                return False
+        old_data = _load_footprint(dataset_folder)
     except FileNotFoundError:
         logging.error("Missing footprint. Cannot verify dataset integrity.")
         logging.warning("Creating a new footprint, since it is missing.")
-        data = generate_integrity_footprint(dataset_folder=dataset_folder)
+        data = generate_integrity_footprint(dataset_folder=dataset_folder, workers=workers)
         save_footprint(dataset_folder=dataset_folder, filename='footprint.json', data=data)
         return False
 
+    new_data = generate_integrity_footprint(dataset_folder, old_footprint=old_data, workers=workers)
+    added, removed, modified = manifest_compare(_get_manifest(old_data), new_data['files'], keys=['hash'])
+
+    if not (added or removed or modified):
+        logging.info("Dataset integrity verified (deep). The dataset has not been modified")
+        # Files might have been touched without modifying them: store the new last modified times
+        # such that they are not re-hashed at the next verification
+        if new_data != old_data:
+            save_footprint(dataset_folder=dataset_folder, filename='footprint.json', data=new_data)
+        return True
+
+    logging.error("The dataset has been modified. The footprints does not match: {} files added, {} removed, "
+                  "{} modified".format(len(added), len(removed), len(modified)))
+    data = {}
+    data['added'] = added
+    data['removed'] = removed
+    data['modified'] = modified
+    save_footprint(dataset_folder=dataset_folder, filename='differences_footprint.json', data=data)
+    return False
+
+
+def manifest_compare(old_files, new_files, keys):
+    """
+    Compares two flat manifests of files
+
+    Parameters
+    ----------
+    old_files : Dictionary
+    new_files : Dictionary
+        Manifests {relative path : {'size' : <int>, 'mtime' : <int>, 'hash' : <string>}} to compare
+    keys : list of String
+        The fields of the entries which have to match for a file to be considered the same
+
+    Returns
+    -------
+        added, removed, modified
+            Sorted lists of the files which have been respectively added, removed or modified
+    """
+    added = sorted(new_files.keys() - old_files.keys())
+    removed = sorted(old_files.keys() - new_files.keys())
+    modified = sorted(name for name in old_files.keys() & new_files.keys()
+                      if any(old_files[name].get(k) != new_files[name].get(k) for k in keys))
+    return added, removed, modified
+
 
 def dict_compare(d1, d2):
     """
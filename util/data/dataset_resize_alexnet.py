@@ -4,15 +4,12 @@ This script allows to crop the asbestos images into 256x256 images for input int
 
 # Utils
 import argparse
-import os
-from PIL import Image
 
-from os import listdir
-from os.path import isfile, join
+# DeepDIVA
+from util.data import preprocess
 
 
-
-def resize_images(dataset_folder):
+def resize_images(dataset_folder, workers=None):
     """
     Resize all images contained within dataset_folder.
 
@@ -20,30 +17,14 @@ def resize_images(dataset_folder):
     ----------
     dataset_folder : str
         Path to the dataset folder
+    workers : int
+        Number of processes. If None, the number of CPUs.
 
     Returns
     -------
         None
     """
-
-    # Get all the files recursively from the given dataset_folder
-    recursiveFiles = [os.path.join(dp, f) for dp, dn, fn in os.walk(dataset_folder) for f in fn if f.endswith('png')]
-
-    print(recursiveFiles)
-
-    size = 256, 256
-
-    for infile in recursiveFiles:
-        try:
-            im = Image.open(infile)
-            out = im.resize((256, 256))
-            out.save(infile)
-
-            print("SUCCESS")
-        except:
-            print("FAIL");
-
-    return
+    preprocess.resize_images(dataset_folder, size=(256, 256), extensions=('png', 'jpg', 'jpeg'), workers=workers)
 
 
 if __name__ == "__main__":
@@ -56,6 +37,11 @@ if __name__ == "__main__":
                         type=str,
                         default=None)
 
+    parser.add_argument('--workers',
+                        help='number of processes (default: the number of CPUs)',
+                        type=int,
+                        default=None)
+
     args = parser.parse_args()
 
-    resize_images(dataset_folder=args.dataset_folder)
+    resize_images(dataset_folder=args.dataset_folder, workers=args.workers)
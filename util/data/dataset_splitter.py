@@ -15,11 +15,20 @@ import random
 import torchvision.datasets as datasets
 from sklearn.model_selection import train_test_split
 
+# DeepDIVA
+from util.data.preprocess import LINK_MODES, place_files
 
-def split_dataset(dataset_folder, split, symbolic):
+# Present in the dataset folder while the files of a split are being created
+SPLIT_IN_PROGRESS = '.split_in_progress'
+
+
+def split_dataset(dataset_folder, split, symbolic, link=None, workers=None):
     """
     Partition a dataset into train/val splits on the filesystem.
 
+    The files are copied (or linked) in parallel. If a previous run was interrupted, the split is resumed: the
+    partition is deterministic and the files already created are kept.
+
     Parameters
     ----------
     dataset_folder : str
@@ -28,17 +37,29 @@ def split_dataset(dataset_folder, split, symbolic):
         Specifies how much of the training set should be converted into the validation set.
     symbolic : bool
         Does not make a copy of the data, but only symbolic links to the original data
+    link : str
+        How the files of the splits are created, one of util.data.preprocess.LINK_MODES ('copy', 'hardlink',
+        'symlink' or 'reflink'). Overrides symbolic.
+    workers : int
+        Number of processes copying the files. If None, the number of CPUs.
 
     Returns
     -------
         None
     """
+    link = link or ('symlink' if symbolic else 'copy')
+    if link not in LINK_MODES:
+        print("Unknown link mode {} (expected one of {})".format(link, LINK_MODES))
+        sys.exit(-1)
 
     # Getting the train dir
     traindir = os.path.join(dataset_folder, 'train')
 
-    # Rename the original train dir
-    shutil.move(traindir, os.path.join(dataset_folder, 'original_train'))
+    # Rename the original train dir (unless an interrupted run did it already)
+    resume = os.path.exists(os.path.join(dataset_folder, SPLIT_IN_PROGRESS))
+    if not resume:
+        shutil.move(traindir, os.path.join(dataset_folder, 'original_train'))
+        open(os.path.join(dataset_folder, SPLIT_IN_PROGRESS), 'w').close()
     traindir = os.path.join(dataset_folder, 'original_train')
 
     # Sanity check on the training folder
@@ -68,48 +89,23 @@ def split_dataset(dataset_folder, split, symbolic):
     for c in train_ds.classes:
         print("split_val ({}) {}".format(c, np.size(np.where(y_val == train_ds.class_to_idx[c]))))
 
-    # Create the folder structure to accommodate the two new splits
+    # Create the folder structure to accommodate the two new splits (kept when resuming)
     split_train_dir = os.path.join(dataset_folder, "train")
-    if os.path.exists(split_train_dir):
-        shutil.rmtree(split_train_dir)
-    os.makedirs(split_train_dir)
-
-    for class_label in train_ds.classes:
-        path = os.path.join(split_train_dir, class_label)
-        if os.path.exists(path):
-            shutil.rmtree(path)
-        os.makedirs(path)
-
     split_val_dir = os.path.join(dataset_folder, "val")
-    if os.path.exists(split_val_dir):
-        shutil.rmtree(split_val_dir)
-    os.makedirs(split_val_dir)
-
-    for class_label in train_ds.classes:
-        path = os.path.join(split_val_dir, class_label)
-        if os.path.exists(path):
-            shutil.rmtree(path)
-        os.makedirs(path)
+    for split_dir in [split_train_dir, split_val_dir]:
+        if os.path.exists(split_dir) and not resume:
+            shutil.rmtree(split_dir)
+        for class_label in train_ds.classes:
+            os.makedirs(os.path.join(split_dir, class_label), exist_ok=True)
 
     # Copying the splits into their folders
-    for X, y in zip(X_train, y_train):
-        src = X
-        file_name = os.path.basename(src)
-        dest = os.path.join(split_train_dir, train_ds.classes[y], file_name)
-        if symbolic:
-            os.symlink(src, dest)
-        else:
-            shutil.copy(X, dest)
-
-    for X, y in zip(X_val, y_val):
-        src = X
-        file_name = os.path.basename(src)
-        dest = os.path.join(split_val_dir, train_ds.classes[y], file_name)
-        if symbolic:
-            os.symlink(src, dest)
-        else:
-            shutil.copy(X, dest)
+    pairs = [(X, os.path.join(split_train_dir, train_ds.classes[y], os.path.basename(X)))
+             for X, y in zip(X_train, y_train)]
+    pairs += [(X, os.path.join(split_val_dir, train_ds.classes[y], os.path.basename(X)))
+              for X, y in zip(X_val, y_val)]
+    place_files(pairs, link=link, workers=workers, desc='Splitting ({})'.format(link))
 
+    os.remove(os.path.join(dataset_folder, SPLIT_IN_PROGRESS))
     return
 
 def _get_file_with_parents(filepath, levels=1):
@@ -119,7 +115,7 @@ def _get_file_with_parents(filepath, levels=1):
     return os.path.relpath(filepath, common)
 
 
-def split_dataset_writerIdentification(dataset_folder, split):
+def split_dataset_writerIdentification(dataset_folder, split, workers=None):
     """
     Partition a dataset into train/val splits on the filesystem.
 
@@ -129,8 +125,8 @@ def split_dataset_writerIdentification(dataset_folder, split):
         Path to the dataset folder (see datasets.image_folder_dataset.load_dataset for details).
     split : float
         Specifies how much of the training set should be converted into the validation set.
-    symbolic : bool
-        Does not make a copy of the data, but only symbolic links to the original data
+    workers : int
+        Number of processes copying the files. If None, the number of CPUs.
 
     Returns
     -------
@@ -190,6 +186,7 @@ def split_dataset_writerIdentification(dataset_folder, split):
     os.makedirs(split_train_color_dir)
 
     print("Copying files to train folder\n")
+    pairs = []
     for tf in training_files:
         path_binarized = os.path.join(split_train_binarized_dir, tf)
         path_color = os.path.join(split_train_color_dir, tf)
@@ -204,12 +201,9 @@ def split_dataset_writerIdentification(dataset_folder, split):
         subfiles_binarized = os.listdir(binarized_file_path)
         colored_file_path = os.path.join(colored_traindir, tf)
         subfiles_colored = os.listdir(colored_file_path)
-        for i in range(len(subfiles_binarized)):
-            file = os.path.join(binarized_file_path, subfiles_binarized[i])
-            shutil.copy(file, path_binarized)
-        for i in range(len(subfiles_colored)):
-            file = os.path.join(colored_file_path, subfiles_colored[i])
-            shutil.copy(file, path_color)
+        pairs += [(os.path.join(binarized_file_path, f), os.path.join(path_binarized, f)) for f in subfiles_binarized]
+        pairs += [(os.path.join(colored_file_path, f), os.path.join(path_color, f)) for f in subfiles_colored]
+    place_files(pairs, link='copy', workers=workers, desc='Copying train')
 
     split_val_binarized_dir = os.path.join(binarized_dataset, "val")
     if os.path.exists(split_val_binarized_dir):
@@ -222,6 +216,7 @@ def split_dataset_writerIdentification(dataset_folder, split):
     os.makedirs(split_val_color_dir)
 
     print("Copying files to val folder\n")
+    pairs = []
     for vf in validation_files:
 
         path_binarized = os.path.join(split_val_binarized_dir, vf)
@@ -239,13 +234,9 @@ def split_dataset_writerIdentification(dataset_folder, split):
         colored_file_path = os.path.join(colored_traindir, vf)
         subfiles_colored = os.listdir(colored_file_path)
 
-        for i in range(len(subfiles_binarized)):
-            file = os.path.join(binarized_file_path, subfiles_binarized[i])
-            shutil.copy(file, path_binarized)
-
-        for i in range(len(subfiles_colored)):
-            file = os.path.join(colored_file_path, subfiles_colored[i])
-            shutil.copy(file, path_color)
+        pairs += [(os.path.join(binarized_file_path, f), os.path.join(path_binarized, f)) for f in subfiles_binarized]
+        pairs += [(os.path.join(colored_file_path, f), os.path.join(path_color, f)) for f in subfiles_colored]
+    place_files(pairs, link='copy', workers=workers, desc='Copying val')
 
     print("Splitting is done!")
 
@@ -274,10 +265,21 @@ if __name__ == "__main__":
                         action='store_true',
                         default=False)
 
+    parser.add_argument('--link',
+                        help='How the files of the splits are created (overrides --symbolic).',
+                        choices=LINK_MODES,
+                        default=None)
+
+    parser.add_argument('--workers',
+                        help='Number of processes copying the files (default: the number of CPUs).',
+                        type=int,
+                        default=None)
+
     args = parser.parse_args()
 
-    split_dataset(dataset_folder=args.dataset_folder, split=args.split, symbolic=args.symbolic)
+    split_dataset(dataset_folder=args.dataset_folder, split=args.split, symbolic=args.symbolic, link=args.link,
+                  workers=args.workers)
 
-    split_dataset_writerIdentification(dataset_folder=args.dataset_folder, split=args.split)
+    split_dataset_writerIdentification(dataset_folder=args.dataset_folder, split=args.split, workers=args.workers)
 
 
@@ -23,6 +23,7 @@ import codecs
 import gzip
 import requests
 from tqdm import tqdm
+from sklearn.model_selection import train_test_split
 
 # Torch
 import torch
@@ -31,6 +32,8 @@ from PIL import Image
 
 # DeepDIVA
 from util.data.dataset_splitter import split_dataset, split_dataset_writerIdentification
+from util.data.preprocess import extract_images, write_images
+from datasets.packed_dataset import write_packed_split
 
 
 def mnist(args):
@@ -59,30 +62,18 @@ def mnist(args):
                                                      'processed',
                                                      'test.pt'))
 
-    # Make output folders
+    # Write the images to the output folder
     dataset_root = os.path.join(args.output_folder, 'MNIST')
-    train_folder = os.path.join(dataset_root, 'train')
-    test_folder = os.path.join(dataset_root, 'test')
-
-    _make_folder_if_not_exists(dataset_root)
-    _make_folder_if_not_exists(train_folder)
-    _make_folder_if_not_exists(test_folder)
-
-    def _write_data_to_folder(arr, labels, folder):
-        for i, (img, label) in enumerate(zip(arr, labels)):
-            dest = os.path.join(folder, str(label))
-            _make_folder_if_not_exists(dest)
-            Image.fromarray(img.numpy(), mode='L').save(os.path.join(dest, str(i) + '.png'))
-
-    # Write the images to the folders
-    _write_data_to_folder(train_data, train_labels, train_folder)
-    _write_data_to_folder(test_data, test_labels, test_folder)
+    if args.packed:
+        _write_packed_dataset(dataset_root, train_data.numpy(), train_labels.numpy(),
+                              test_data.numpy(), test_labels.numpy())
+    else:
+        _write_image_folders(dataset_root, train_data.numpy(), train_labels.numpy(),
+                             test_data.numpy(), test_labels.numpy(), mode='L')
 
     shutil.rmtree(os.path.join(args.output_folder, 'raw'))
     shutil.rmtree(os.path.join(args.output_folder, 'processed'))
 
-    split_dataset(dataset_folder=dataset_root, split=0.2, symbolic=False)
-
 
 def svhn(args):
     """
@@ -116,30 +107,16 @@ def svhn(args):
     np.place(test_labels, test_labels == 10, 0)
     test_data = np.transpose(test_data, (3, 0, 1, 2))
 
-    # Make output folders
+    # Write the images to the output folder
     dataset_root = os.path.join(args.output_folder, 'SVHN')
-    train_folder = os.path.join(dataset_root, 'train')
-    test_folder = os.path.join(dataset_root, 'test')
-
-    _make_folder_if_not_exists(dataset_root)
-    _make_folder_if_not_exists(train_folder)
-    _make_folder_if_not_exists(test_folder)
-
-    def _write_data_to_folder(arr, labels, folder):
-        for i, (img, label) in enumerate(zip(arr, labels)):
-            dest = os.path.join(folder, str(label))
-            _make_folder_if_not_exists(dest)
-            Image.fromarray(img).save(os.path.join(dest, str(i) + '.png'))
-
-    # Write the images to the folders
-    _write_data_to_folder(train_data, train_labels, train_folder)
-    _write_data_to_folder(test_data, test_labels, test_folder)
+    if args.packed:
+        _write_packed_dataset(dataset_root, train_data, train_labels, test_data, test_labels)
+    else:
+        _write_image_folders(dataset_root, train_data, train_labels, test_data, test_labels)
 
     os.remove(os.path.join(args.output_folder, 'train_32x32.mat'))
     os.remove(os.path.join(args.output_folder, 'test_32x32.mat'))
 
-    split_dataset(dataset_folder=dataset_root, split=0.2, symbolic=False)
-
 
 def cifar10(args):
     """
@@ -165,30 +142,16 @@ def cifar10(args):
 
     test_data, test_labels = cifar_test.test_data, cifar_test.test_labels
 
-    # Make output folders
+    # Write the images to the output folder
     dataset_root = os.path.join(args.output_folder, 'CIFAR10')
-    train_folder = os.path.join(dataset_root, 'train')
-    test_folder = os.path.join(dataset_root, 'test')
-
-    _make_folder_if_not_exists(dataset_root)
-    _make_folder_if_not_exists(train_folder)
-    _make_folder_if_not_exists(test_folder)
-
-    def _write_data_to_folder(arr, labels, folder):
-        for i, (img, label) in enumerate(zip(arr, labels)):
-            dest = os.path.join(folder, str(label))
-            _make_folder_if_not_exists(dest)
-            Image.fromarray(img).save(os.path.join(dest, str(i) + '.png'))
-
-    # Write the images to the folders
-    _write_data_to_folder(train_data, train_labels, train_folder)
-    _write_data_to_folder(test_data, test_labels, test_folder)
+    if args.packed:
+        _write_packed_dataset(dataset_root, train_data, np.asarray(train_labels), test_data, np.asarray(test_labels))
+    else:
+        _write_image_folders(dataset_root, train_data, np.asarray(train_labels), test_data, np.asarray(test_labels))
 
     os.remove(os.path.join(args.output_folder, 'cifar-10-python.tar.gz'))
     shutil.rmtree(os.path.join(args.output_folder, 'cifar-10-batches-py'))
 
-    split_dataset(dataset_folder=dataset_root, split=0.2, symbolic=False)
-
 def diva_hisdb(args):
     """
     Fetches and prepares (in a DeepDIVA friendly format) the DIVA HisDB-all dataset for semantic segmentation to the location specified
@@ -341,12 +304,9 @@ def icdar2017_clamm(args):
             entry_index_infilenames = filenames.index(entry.filename[start_index:])
             sorted_labels[i] = labels[entry_index_infilenames]
 
-        for i, (enrty, label) in enumerate(zip(zipfile.infolist()[1:], sorted_labels)):
-            with zipfile.open(enrty) as file:
-                img = Image.open(file)
-                dest = os.path.join(folder, str(label))
-                _make_folder_if_not_exists(dest)
-                img.save(os.path.join(dest, str(i) + '.png'), "PNG", quality=100)
+        entries = [entry.filename for entry in zipfile.infolist()[1:]]
+        destinations = [os.path.join(folder, str(label), str(i) + '.png') for i, label in enumerate(sorted_labels)]
+        extract_images(zipfile.filename, entries[:len(destinations)], destinations)
 
     def getLabels(zfile):
         print("Extracting labels\n")
@@ -466,15 +426,10 @@ def historical_wi(args):
 
     def _write_data_to_folder(zipfile, labels, folder, isTrainingset):
         print("Writing data to folder\n")
-        for i, (enrty, label) in enumerate(zip(zipfile.infolist()[1:], labels)):
-            with zipfile.open(enrty) as file:
-                img = Image.open(file)
-                dest = os.path.join(folder, str(label))
-                _make_folder_if_not_exists(dest)
-                if isTrainingset == 1:
-                    img.save(os.path.join(dest, str(i) + '.png'))
-                else:
-                    img.save(os.path.join(dest, str(i) + '.jpg'))
+        extension = '.png' if isTrainingset == 1 else '.jpg'
+        entries = [entry.filename for entry in zipfile.infolist()[1:]]
+        destinations = [os.path.join(folder, str(label), str(i) + extension) for i, label in enumerate(labels)]
+        extract_images(zipfile.filename, entries[:len(destinations)], destinations)
 
     def _get_labels(zipfile, start_index):
         print("Extracting labels\n")
@@ -616,10 +571,7 @@ def kmnist(args):
     _make_folder_if_not_exists(test_folder)
 
     def _write_data_to_folder(arr, labels, folder):
-        for i, (img, label) in enumerate(zip(arr, labels)):
-            dest = os.path.join(folder, str(label))
-            _make_folder_if_not_exists(dest)
-            Image.fromarray(img.numpy(), mode='L').save(os.path.join(dest, str(i) + '.png'))
+        write_images(arr.numpy(), labels.numpy(), folder, mode='L')
 
     # Write the images to the folders
     _write_data_to_folder(train_data, train_labels, train_folder)
@@ -715,10 +667,7 @@ def fashion_mnist(args):
     _make_folder_if_not_exists(test_folder)
 
     def _write_data_to_folder(arr, labels, folder):
-        for i, (img, label) in enumerate(zip(arr, labels)):
-            dest = os.path.join(folder, str(label))
-            _make_folder_if_not_exists(dest)
-            Image.fromarray(img.numpy(), mode='L').save(os.path.join(dest, str(i) + '.png'))
+        write_images(arr.numpy(), labels.numpy(), folder, mode='L')
 
     # Write the images to the folders
     _write_data_to_folder(train_data, train_labels, train_folder)
@@ -730,6 +679,66 @@ def fashion_mnist(args):
     split_dataset(dataset_folder=dataset_root, split=0.2, symbolic=False)
 
 
+def _write_image_folders(dataset_root, train_data, train_labels, test_data, test_labels, mode=None):
+    """
+    Writes the images of a dataset to dataset_root/split/label/index.png and splits the training set into train/val.
+
+    Parameters
+    ----------
+    dataset_root : str
+        Folder of the dataset
+    train_data, test_data : numpy array [N x H x W] or [N x H x W x C]
+        The images (uint8) of the training and test sets
+    train_labels, test_labels : numpy array [N]
+        The label of each image
+    mode : str
+        PIL mode of the images (e.g. 'L'), if None it is deduced from the arrays
+    """
+    train_folder = os.path.join(dataset_root, 'train')
+    test_folder = os.path.join(dataset_root, 'test')
+
+    _make_folder_if_not_exists(dataset_root)
+    _make_folder_if_not_exists(train_folder)
+    _make_folder_if_not_exists(test_folder)
+
+    write_images(train_data, train_labels, train_folder, mode=mode)
+    write_images(test_data, test_labels, test_folder, mode=mode)
+
+    split_dataset(dataset_folder=dataset_root, split=0.2, symbolic=False)
+
+
+def _write_packed_dataset(dataset_root, train_data, train_labels, test_data, test_labels, split=0.2):
+    """
+    Writes a dataset in the packed format (see datasets.packed_dataset), with the training set split into train/val.
+
+    The classes are the labels sorted as strings, as they are when loaded from class folders, and the validation set
+    is drawn like util.data.dataset_splitter.split_dataset() does (stratified, with a fixed seed).
+
+    Parameters
+    ----------
+    dataset_root : str
+        Folder of the dataset
+    train_data, test_data : numpy array [N x H x W] or [N x H x W x C]
+        The images (uint8) of the training and test sets
+    train_labels, test_labels : numpy array [N]
+        The label of each image
+    split : float
+        Fraction of the training set that becomes the validation set
+    """
+    classes = sorted(set(str(label) for label in np.concatenate([train_labels, test_labels])))
+    class_to_idx = {c: i for i, c in enumerate(classes)}
+    train_targets = np.asarray([class_to_idx[str(label)] for label in train_labels])
+    test_targets = np.asarray([class_to_idx[str(label)] for label in test_labels])
+
+    train_index, val_index = train_test_split(np.arange(len(train_targets)), test_size=split, random_state=42,
+                                              stratify=train_targets)
+    for name, data, targets in [('train', train_data[train_index], train_targets[train_index]),
+                                ('val', train_data[val_index], train_targets[val_index]),
+                                ('test', test_data, test_targets)]:
+        print("Writing the packed {} split ({} images)".format(name, len(targets)))
+        write_packed_split(os.path.join(dataset_root, name), data, targets, classes)
+
+
 def _make_folder_if_not_exists(path):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -750,6 +759,11 @@ if __name__ == "__main__":
                         required=False,
                         type=str,
                         default='./data/')
+    parser.add_argument('--packed',
+                        help='write mnist, svhn and cifar10 as memory mappable arrays instead of image files '
+                             '(see datasets/packed_dataset.py)',
+                        action='store_true',
+                        default=False)
     args = parser.parse_args()
 
     getattr(sys.modules[__name__], args.dataset)(args)
@@ -0,0 +1,432 @@
+"""
+Parallel preprocessing of the image datasets: resize, crop, size statistics, train/val splits and writing of the
+downloaded datasets to image folders.
+
+The files are processed by a pool of processes with a progress bar. Every output is written to a temporary file in
+its destination folder which is then renamed, such that an interrupted run never leaves a truncated file behind and
+can simply be started again:
+
+- operations writing new files (splits, extraction of the downloaded datasets) skip the outputs which exist already
+- operations modifying the files in place (resize, crop) record the files done in a journal in the dataset folder,
+  which is removed once the whole folder has been processed. Each file is recorded by the process which replaced it,
+  and only if it succeeded: the files which could not be processed are retried by the next run. A file already of
+  the size of the output (i.e. replaced by a run killed before recording it) is not processed again.
+
+When splitting, the files can be hard links, symbolic links or reflinks (copy-on-write clones, on the file systems
+supporting them e.g. btrfs and xfs, otherwise a copy) of the original files instead of copies.
+
+Usage:
+
+    python util/data/preprocess.py resize --dataset-folder ~/data/asbestos --size 256 256
+    python util/data/preprocess.py split --dataset-folder ~/data/CB55 --split 0.2 --link hardlink
+    python util/data/preprocess.py sizes --dataset-folder ~/data/CB55
+"""
+
+# Utils
+import argparse
+import errno
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+# DeepDIVA
+from util.atomic_file import atomic_path
+
+LINK_MODES = ['copy', 'hardlink', 'symlink', 'reflink']
+
+# ioctl cloning a file on Linux (FICLONE = _IOW(0x94, 9, int))
+_FICLONE = 0x40049409
+
+
+def run_parallel(function, tasks, workers=None, desc=None, journal=None):
+    """
+    Applies a function to every task over a pool of processes, with a progress bar.
+
+    Parameters
+    ----------
+    function : callable
+        Function (defined at module level, such that it can be pickled) taking one task
+    tasks : list
+        Arguments of the calls. With a journal, each task is identified by its first element (or itself if it is
+        not a tuple), which must be a string e.g. the path of the file processed.
+    workers : int
+        Number of processes. If None, the number of CPUs.
+    desc : str
+        Description of the progress bar
+    journal : str
+        Path of a file in which the function records the tasks it completed (see _record_done()). The tasks
+        recorded in it by a previous (interrupted) run are skipped.
+
+    Returns
+    -------
+    results : list
+        Result of each task run (i.e. not skipped thanks to the journal), in the order of the tasks
+    """
+    tasks = list(tasks)
+    if journal is not None:
+        done = set()
+        if os.path.exists(journal):
+            with open(journal) as f:
+                done = set(line.rstrip('\n') for line in f)
+        tasks = [task for task in tasks if _task_key(task) not in done]
+        if done:
+            logging.info('Resuming: {} files already done'.format(len(done)))
+
+    results = [None] * len(tasks)
+    with Pool(workers) as pool:
+        # Small tasks are sent by chunks, while still giving a few chunks to each process
+        chunksize = max(1, min(64, len(tasks) // (4 * (workers or os.cpu_count() or 1))))
+        indexed = pool.imap_unordered(_indexed_call, [(function, i, task) for i, task in enumerate(tasks)],
+                                      chunksize=chunksize)
+        for i, result in tqdm(indexed, total=len(tasks), desc=desc, unit='file', ncols=150):
+            results[i] = result
+    return results
+
+
+def _indexed_call(args):
+    function, i, task = args
+    return i, function(task)
+
+
+def _task_key(task):
+    return task[0] if isinstance(task, tuple) else task
+
+
+def _record_done(journal, key):
+    # A single write in append mode, such that the lines of the processes are never interleaved
+    fd = os.open(journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (key + '\n').encode())
+    finally:
+        os.close(fd)
+
+
+def list_files(folder, extensions):
+    """Returns the sorted paths of the files in folder (recursively) with one of the extensions (case insensitive)"""
+    extensions = tuple(e.lower() for e in extensions)
+    return sorted(os.path.join(dp, f) for dp, dn, fn in os.walk(folder) for f in fn if f.lower().endswith(extensions))
+
+
+def _temporary_path(path):
+    """Returns the path of a new temporary file next to path, with the same extension (to be replaced by a link)"""
+    fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1], prefix='.tmp_', dir=os.path.dirname(path))
+    os.close(fd)
+    return tmp_path
+
+
+def save_image(img, path, format=None, **params):
+    """
+    Saves a PIL image atomically: it is written to a temporary file which is then renamed to path. A replaced image
+    keeps its permissions (see util.atomic_file.atomic_path()).
+    """
+    with atomic_path(path) as tmp_path:
+        # Without format, PIL deduces it from the extension, which the temporary file shares with path
+        img.save(tmp_path, format=format, **params)
+
+
+def place_file(src, dest, link='copy'):
+    """
+    Creates dest as a copy or a link of src. The file appears atomically under its final name.
+
+    Parameters
+    ----------
+    src : str
+        Path of the original file
+    dest : str
+        Path of the new file
+    link : str
+        One of LINK_MODES. 'reflink' falls back to a copy when the file system does not support it.
+    """
+    tmp_path = _temporary_path(dest)
+    os.remove(tmp_path)
+    try:
+        if link == 'symlink':
+            os.symlink(os.path.abspath(src), tmp_path)
+        elif link == 'hardlink':
+            os.link(src, tmp_path)
+        elif link == 'reflink':
+            _reflink_or_copy(src, tmp_path)
+        else:
+            shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _reflink_or_copy(src, dest):
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+            fcntl.ioctl(fdest.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dest)
+    except (ImportError, OSError) as e:
+        if isinstance(e, OSError) and e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                                                      errno.ENOSYS):
+            raise
+        shutil.copy2(src, dest)
+
+
+def _place_task(task):
+    src, dest, link = task
+    if not os.path.lexists(dest):
+        place_file(src, dest, link)
+
+
+def place_files(pairs, link='copy', workers=None, desc='Placing files'):
+    """
+    Copies or links files in parallel, skipping the destinations which exist already (see place_file()).
+
+    Parameters
+    ----------
+    pairs : list of (str, str)
+        (source, destination) of each file. The destination folders must exist.
+    link : str
+        One of LINK_MODES
+    workers : int
+        Number of processes. If None, the number of CPUs.
+    """
+    if link not in LINK_MODES:
+        raise ValueError('Unknown link mode {} (expected one of {})'.format(link, LINK_MODES))
+    run_parallel(_place_task, [(src, dest, link) for src, dest in pairs], workers, desc)
+
+
+def _resize_task(task):
+    path, size = task
+    with Image.open(path) as img:
+        if img.size == size:
+            return
+        # JPEG images are decoded directly at the largest reduction (1/2, 1/4 or 1/8) still larger than the output
+        img.draft(img.mode, size)
+        out = img.resize(size)
+    save_image(out, path)
+
+
+def resize_images(dataset_folder, size, extensions=('png', 'jpg', 'jpeg'), workers=None):
+    """
+    Resizes in place all the images contained within dataset_folder (recursively). The images which already have
+    the output size are left as is.
+
+    Parameters
+    ----------
+    dataset_folder : str
+        Path to the dataset folder
+    size : (int, int)
+        (width, height) of the resized images
+    extensions : tuple of str
+        Extensions of the images to resize
+    workers : int
+        Number of processes. If None, the number of CPUs.
+    """
+    _run_in_place(_resize_task, dataset_folder, extensions, tuple(size), workers, 'resize')
+
+
+def _crop_task(task):
+    path, (box, format) = task
+    left, upper, right, lower = box
+    with Image.open(path) as img:
+        if img.size == (right - left, lower - upper):
+            return
+        out = img.crop(box)
+    save_image(out, path, format=format)
+
+
+def crop_images(dataset_folder, box, extensions=('jpg',), format=None, workers=None):
+    """
+    Crops in place all the images contained within dataset_folder (recursively). The images which already have the
+    size of the crop are left as is.
+
+    Parameters
+    ----------
+    dataset_folder : str
+        Path to the dataset folder
+    box : (int, int, int, int)
+        (left, upper, right, lower) of the crop
+    extensions : tuple of str
+        Extensions of the images to crop
+    format : str
+        Format in which the crops are written (e.g. 'png'). If None, the format given by the extension.
+    workers : int
+        Number of processes. If None, the number of CPUs.
+    """
+    _run_in_place(_crop_task, dataset_folder, extensions, (tuple(box), format), workers, 'crop')
+
+
+def _run_in_place(function, dataset_folder, extensions, params, workers, name):
+    # The journal records the files done, such that an interrupted run does not process them twice
+    journal = os.path.join(dataset_folder, '.preprocess_{}.journal'.format(name))
+    files = list_files(dataset_folder, extensions)
+    tasks = [(path, (function, params, journal)) for path in files]
+    failures = [f for f in run_parallel(_in_place_task, tasks, workers, name, journal=journal) if f is not None]
+    for failure in failures:
+        logging.warning('Could not {} {}: {}'.format(name, *failure))
+    if failures:
+        # The journal is kept, such that the next run only retries the files which failed
+        logging.warning('{} files could not be processed, run again to retry them'.format(len(failures)))
+    elif os.path.exists(journal):
+        os.remove(journal)
+
+
+def _in_place_task(task):
+    # A file which is not a valid image is reported and left as is, the others are still processed.
+    # The file is recorded as done right after it has been replaced, by the process which replaced it.
+    path, (function, params, journal) = task
+    try:
+        function((path, params))
+    except OSError as e:
+        return path, str(e)
+    _record_done(journal, path)
+
+
+def _size_task(path):
+    # PIL only reads the header of the image here, the pixels are not decoded
+    with Image.open(path) as img:
+        return img.size
+
+
+def image_sizes(dataset_folder, extensions=('png',), workers=None):
+    """
+    Returns the (width, height) of all the images contained within dataset_folder (recursively).
+
+    Returns
+    -------
+    sizes : numpy array [N x 2]
+    """
+    files = list_files(dataset_folder, extensions)
+    return np.array(run_parallel(_size_task, files, workers, 'sizes'), dtype=np.int64).reshape(-1, 2)
+
+
+def _write_array_task(task):
+    dest, array, mode = task
+    if not os.path.exists(dest):
+        save_image(Image.fromarray(array, mode=mode), dest)
+
+
+def write_images(arrays, labels, folder, mode=None, workers=None):
+    """
+    Writes images given as arrays to folder/label/index.png, the image folder format of the datasets.
+
+    Parameters
+    ----------
+    arrays : iterable of numpy arrays
+        The images
+    labels : iterable
+        The label of each image
+    folder : str
+        Folder of the split
+    mode : str
+        PIL mode of the images (e.g. 'L'), if None it is deduced from the arrays
+    workers : int
+        Number of processes. If None, the number of CPUs.
+    """
+    tasks = []
+    for i, (array, label) in enumerate(zip(arrays, labels)):
+        dest = os.path.join(folder, str(label))
+        os.makedirs(dest, exist_ok=True)
+        tasks.append((os.path.join(dest, str(i) + '.png'), np.asarray(array), mode))
+    run_parallel(_write_array_task, tasks, workers, 'Writing {}'.format(folder))
+
+
+# Zip files opened by each worker process {path : zipfile.ZipFile}
+_zip_files = {}
+
+
+def _extract_image_task(task):
+    dest, (zip_path, entry) = task
+    if os.path.exists(dest):
+        return
+    if zip_path not in _zip_files:
+        _zip_files[zip_path] = zipfile.ZipFile(zip_path)
+    with _zip_files[zip_path].open(entry) as file:
+        with Image.open(file) as img:
+            save_image(img, dest)
+
+
+def extract_images(zip_path, entries, destinations, workers=None):
+    """
+    Converts images of a zip file to the format given by the extension of their destination, in parallel.
+
+    Parameters
+    ----------
+    zip_path : str
+        Path of the zip file
+    entries : list of str
+        Names of the images in the zip file
+    destinations : list of str
+        Path of each converted image. The folders are created if needed.
+    workers : int
+        Number of processes. If None, the number of CPUs.
+    """
+    for dest in set(os.path.dirname(d) for d in destinations):
+        os.makedirs(dest, exist_ok=True)
+    run_parallel(_extract_image_task, [(dest, (zip_path, entry)) for entry, dest in zip(entries, destinations)],
+                 workers, 'Extracting {}'.format(os.path.basename(zip_path)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description='This script preprocesses the images of a dataset in parallel')
+    parser.add_argument('--workers',
+                        help='number of processes (default: the number of CPUs)',
+                        type=int,
+                        default=None)
+    subparsers = parser.add_subparsers(dest='operation')
+    subparsers.required = True
+
+    parser_resize = subparsers.add_parser('resize', help='resize all the images in place')
+    parser_resize.add_argument('--dataset-folder', help='path to the dataset.', required=True, type=str)
+    parser_resize.add_argument('--size', help='width and height of the resized images', type=int, nargs=2,
+                               default=[256, 256])
+
+    parser_crop = subparsers.add_parser('crop', help='crop all the images in place')
+    parser_crop.add_argument('--dataset-folder', help='path to the dataset.', required=True, type=str)
+    parser_crop.add_argument('--box', help='left, upper, right and lower of the crop', type=int, nargs=4,
+                             required=True)
+    parser_crop.add_argument('--extensions', help='extensions of the images to crop', type=str, nargs='+',
+                             default=['jpg'])
+
+    parser_sizes = subparsers.add_parser('sizes', help='print the average width and height of the images')
+    parser_sizes.add_argument('--dataset-folder', help='path to the dataset.', required=True, type=str)
+    parser_sizes.add_argument('--extensions', help='extensions of the images', type=str, nargs='+', default=['png'])
+
+    parser_split = subparsers.add_parser('split', help='create a validation set from the training set')
+    parser_split.add_argument('--dataset-folder', help='path to root of the dataset.', required=True, type=str)
+    parser_split.add_argument('--split', help='ratio of the split for validation set.', type=float, default=0.2)
+    parser_split.add_argument('--link', help='how the files of the splits are created', choices=LINK_MODES,
+                              default='copy')
+
+    parser_shuffle = subparsers.add_parser('shuffle-labels', help='create a dataset with randomly shuffled labels')
+    parser_shuffle.add_argument('--dataset-folder', help='path to root of the dataset.', required=True, type=str)
+    parser_shuffle.add_argument('--output-folder', help='path to the shuffled dataset.', required=True, type=str)
+    parser_shuffle.add_argument('--link', help='how the files of the dataset are created', choices=LINK_MODES,
+                                default='symlink')
+
+    args = parser.parse_args()
+
+    if args.operation == 'resize':
+        resize_images(args.dataset_folder, args.size, workers=args.workers)
+    elif args.operation == 'crop':
+        crop_images(args.dataset_folder, args.box, extensions=args.extensions, workers=args.workers)
+    elif args.operation == 'sizes':
+        sizes = image_sizes(args.dataset_folder, extensions=args.extensions, workers=args.workers)
+        if len(sizes) == 0:
+            logging.error('No image found in {}'.format(args.dataset_folder))
+            sys.exit(-1)
+        print("average width: " + str(sizes[:, 0].mean()))
+        print("average length: " + str(sizes[:, 1].mean()))
+    elif args.operation == 'split':
+        from util.data.dataset_splitter import split_dataset
+        split_dataset(args.dataset_folder, args.split, symbolic=False, link=args.link, workers=args.workers)
+    elif args.operation == 'shuffle-labels':
+        from util.data.shuffle_labels import split_dataset as shuffle_labels
+        shuffle_labels(args.dataset_folder, args.output_folder, symbolic=False, link=args.link, workers=args.workers)
@@ -14,8 +14,11 @@ import numpy as np
 import torchvision.datasets as datasets
 from sklearn.model_selection import train_test_split
 
+# DeepDIVA
+from util.data.preprocess import LINK_MODES, place_files
 
-def split_dataset(dataset_folder, output_folder, symbolic):
+
+def split_dataset(dataset_folder, output_folder, symbolic, link=None, workers=None):
     """
     Partition a dataset into train/val splits on the filesystem.
 
@@ -27,11 +30,17 @@ def split_dataset(dataset_folder, output_folder, symbolic):
         Path to the output folder (see datasets.image_folder_dataset.load_dataset for details).
     symbolic : bool
         Does not make a copy of the data, but only symbolic links to the original data
+    link : str
+        How the files are created, one of util.data.preprocess.LINK_MODES. Overrides symbolic.
+    workers : int
+        Number of processes copying the files. If None, the number of CPUs.
 
     Returns
     -------
         None
     """
+    link = link or ('symlink' if symbolic else 'copy')
+
     # Getting the train dir
     traindir = os.path.join(dataset_folder, 'train')
 
@@ -64,14 +73,9 @@ def split_dataset(dataset_folder, output_folder, symbolic):
         os.makedirs(path)
 
     # Copying the splits into their folders
-    for X, y in zip(fileNames, labels):
-        src = X
-        file_name = os.path.basename(src)
-        dest = os.path.join(split_train_dir, train_ds.classes[y], file_name)
-        if symbolic:
-            os.symlink(src, dest)
-        else:
-            shutil.copy(X, dest)
+    pairs = [(X, os.path.join(split_train_dir, train_ds.classes[y], os.path.basename(X)))
+             for X, y in zip(fileNames, labels)]
+    place_files(pairs, link=link, workers=workers, desc='Shuffling labels ({})'.format(link))
 
     # Symlink val/test to train
     os.symlink(split_train_dir, os.path.join(output_folder, 'val'))
@@ -104,6 +108,17 @@ if __name__ == "__main__":
                         action='store_false',
                         default=True)
 
+    parser.add_argument('--link',
+                        help='How the files are created (overrides --symbolic).',
+                        choices=LINK_MODES,
+                        default=None)
+
+    parser.add_argument('--workers',
+                        help='Number of processes copying the files (default: the number of CPUs).',
+                        type=int,
+                        default=None)
+
     args = parser.parse_args()
 
-    split_dataset(dataset_folder=args.dataset_folder, output_folder=args.output_folder, symbolic=args.symbolic)
+    split_dataset(dataset_folder=args.dataset_folder, output_folder=args.output_folder, symbolic=args.symbolic,
+                  link=args.link, workers=args.workers)
@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from datasets.coco_detection import CocoDetection
+from datasets.reduced_decode import reduce_mask
+from util.data.dataset_analytics import _get_class_frequencies_weights_coco
+
+
+def _coco_dataset(root):
+    # Two images of different sizes, each with a polygon of each class
+    images = [{'id': 1, 'file_name': '1.png', 'height': 12, 'width': 20},
+              {'id': 2, 'file_name': '2.png', 'height': 16, 'width': 16}]
+    annotations = [{'id': 1, 'image_id': 1, 'category_id': 7, 'segmentation': [[1, 1, 1, 8, 6, 8, 6, 1]]},
+                   {'id': 2, 'image_id': 1, 'category_id': 9, 'segmentation': [[8, 2, 8, 10, 18, 10, 18, 2]]},
+                   {'id': 3, 'image_id': 2, 'category_id': 7, 'segmentation': [[2, 2, 2, 14, 14, 14, 14, 2]]},
+                   {'id': 4, 'image_id': 2, 'category_id': 9, 'segmentation': [[3, 3, 3, 6, 6, 6, 6, 3]]}]
+    categories = [{'id': 7, 'name': 'cat'}, {'id': 9, 'name': 'dog'}]
+    for img in images:
+        Image.new('RGB', (img['width'], img['height'])).save(os.path.join(root, img['file_name']))
+    ann_file = os.path.join(root, 'instances_train.json')
+    with open(ann_file, 'w') as f:
+        json.dump({'images': images, 'annotations': annotations, 'categories': categories}, f)
+    return ann_file
+
+
+@pytest.mark.parametrize('decode_scale', [1, 2])
+def test_class_frequencies_weights_coco(tmp_path, decode_scale):
+    root = str(tmp_path)
+    ds = CocoDetection(root, _coco_dataset(root), decode_scale=decode_scale)
+
+    weights = _get_class_frequencies_weights_coco(ds, ds.name_onehotindex, workers=2)
+
+    # The classes of the targets of the dataset, padded with background to make them square as in __getitem__()
+    counts = np.zeros(3)
+    for img_id in ds.ids:
+        target = reduce_mask(ds.get_mask(img_id), decode_scale)
+        height, width = target.shape
+        top, left = (ds.img_size - height) // 2, (ds.img_size - width) // 2
+        target = np.pad(target, ((top, ds.img_size - height - top), (left, ds.img_size - width - left)), 'constant')
+        counts += np.bincount(target.ravel(), minlength=3)
+    assert counts.min() > 0
+    assert np.allclose(weights, (1 / counts) / (1 / counts).sum())
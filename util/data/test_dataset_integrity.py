@@ -0,0 +1,110 @@
+import json
+import os
+
+from util.data import dataset_integrity
+from util.data.dataset_integrity import _get_manifest, _load_footprint, _process_file, _scan_folder, \
+    generate_integrity_footprint, manifest_compare, save_footprint, verify_integrity_deep, verify_integrity_quick
+
+
+def _write(path, content='content'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_scan_folder_skips_footprints_and_caches(tmp_path):
+    root = str(tmp_path)
+    for name in ['footprint.json', 'differences_footprint.json', 'train/a/0.png', 'test/0.png',
+                 'test/page_geometry.json', 'train/page_geometry.json']:
+        _write(os.path.join(root, name))
+
+    assert sorted(_scan_folder(root)) == ['test/0.png', 'train/a/0.png']
+
+
+def _dataset(root):
+    for name in ['train/a/0.png', 'train/b/1.png', 'val/a/2.png']:
+        _write(os.path.join(root, name), name)
+    data = generate_integrity_footprint(root)
+    save_footprint(root, 'footprint.json', data)
+    return data
+
+
+def _hashed_files(monkeypatch):
+    hashed = []
+
+    def process_file(path):
+        hashed.append(path)
+        return _process_file(path)
+
+    monkeypatch.setattr(dataset_integrity, '_process_file', process_file)
+    return hashed
+
+
+def test_incremental_rehash(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    old = _dataset(root)
+    hashed = _hashed_files(monkeypatch)
+
+    # Only the files whose size or last modified time changed are hashed again
+    assert generate_integrity_footprint(root, old_footprint=old) == old
+    assert hashed == []
+
+    path = os.path.join(root, 'train/b/1.png')
+    os.utime(path, ns=(0, old['files']['train/b/1.png']['mtime'] + 10 ** 9))
+    _write(os.path.join(root, 'val/a/2.png'), 'longer content')
+    new = generate_integrity_footprint(root, old_footprint=old)
+
+    assert sorted(hashed) == [path, os.path.join(root, 'val/a/2.png')]
+    assert new['files']['train/b/1.png']['hash'] == old['files']['train/b/1.png']['hash']
+    assert new['files']['val/a/2.png']['hash'] != old['files']['val/a/2.png']['hash']
+
+
+def test_verify_touched_file(tmp_path):
+    root = str(tmp_path)
+    old = _dataset(root)
+    os.utime(os.path.join(root, 'train/a/0.png'), ns=(0, old['files']['train/a/0.png']['mtime'] + 10 ** 9))
+
+    assert not verify_integrity_quick(root)
+    # Same content: the footprint is updated with the new last modified time
+    assert verify_integrity_deep(root)
+    assert verify_integrity_quick(root)
+
+
+def test_verify_differences(tmp_path):
+    root = str(tmp_path)
+    _dataset(root)
+    os.remove(os.path.join(root, 'train/b/1.png'))
+    _write(os.path.join(root, 'train/b/3.png'))
+    _write(os.path.join(root, 'val/a/2.png'), 'modified')
+
+    assert manifest_compare(_load_footprint(root)['files'], _scan_folder(root), keys=['size', 'mtime']) == \
+        (['train/b/3.png'], ['train/b/1.png'], ['val/a/2.png'])
+    assert not verify_integrity_quick(root)
+    assert not verify_integrity_deep(root)
+    with open(os.path.join(root, 'differences_footprint.json')) as f:
+        assert json.load(f) == {'added': ['train/b/3.png'], 'removed': ['train/b/1.png'], 'modified': ['val/a/2.png']}
+
+
+def test_nested_footprint_conversion(tmp_path):
+    root = str(tmp_path)
+    flat = _dataset(root)
+    # Footprint in the old nested format, with the full path of every file
+    nested = {'path': root, 'last_modified': flat['last_modified'], 'files': [], 'folders': []}
+    folders = {'': nested}
+    for name in sorted(flat['files']):
+        parent = ''
+        for folder in name.split('/')[:-1]:
+            path = '/'.join([parent, folder]) if parent else folder
+            if path not in folders:
+                folders[path] = {'path': os.path.join(root, path), 'files': [], 'folders': []}
+                folders[parent]['folders'].append(folders[path])
+            parent = path
+        folders[parent]['files'].append({'file_name': os.path.join(root, name),
+                                         'file_hash': flat['files'][name]['hash']})
+    save_footprint(root, 'footprint.json', nested)
+
+    assert _get_manifest(nested) == {name: {'hash': entry['hash']} for name, entry in flat['files'].items()}
+    assert verify_integrity_quick(root)
+    # The deep verification hashes all the files and converts the footprint to the flat format
+    assert verify_integrity_deep(root)
+    assert _load_footprint(root) == flat
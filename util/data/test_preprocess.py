@@ -0,0 +1,185 @@
+import errno
+import fcntl
+import os
+import stat
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from util.data.dataset_splitter import SPLIT_IN_PROGRESS, split_dataset
+from util.data.preprocess import LINK_MODES, crop_images, place_file, resize_images, write_images
+
+
+def _write_images(folder, n, size=(16, 12)):
+    os.makedirs(folder, exist_ok=True)
+    rs = np.random.RandomState(0)
+    arrays = {}
+    for i in range(n):
+        path = os.path.join(folder, '{}.png'.format(i))
+        arrays[path] = rs.randint(0, 256, size=(size[1], size[0]), dtype=np.uint8)
+        Image.fromarray(arrays[path]).save(path)
+    return arrays
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def _listing(folder):
+    return sorted(os.path.relpath(os.path.join(dp, f), folder) for dp, dn, fn in os.walk(folder) for f in fn)
+
+
+@pytest.mark.parametrize('link', LINK_MODES)
+def test_place_file(tmp_path, link):
+    src = str(tmp_path / 'src.txt')
+    dest = str(tmp_path / 'dest.txt')
+    with open(src, 'w') as f:
+        f.write('content')
+
+    place_file(src, dest, link)
+
+    with open(dest) as f:
+        assert f.read() == 'content'
+    assert os.path.islink(dest) == (link == 'symlink')
+    assert os.path.samefile(src, dest) == (link in ['symlink', 'hardlink'])
+    # No temporary file is left behind
+    assert sorted(os.listdir(str(tmp_path))) == ['dest.txt', 'src.txt']
+
+
+def test_reflink_falls_back_to_copy(tmp_path, monkeypatch):
+    def ioctl(*args):
+        raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+
+    monkeypatch.setattr(fcntl, 'ioctl', ioctl)
+    src = str(tmp_path / 'src.txt')
+    dest = str(tmp_path / 'dest.txt')
+    with open(src, 'w') as f:
+        f.write('content')
+
+    place_file(src, dest, 'reflink')
+
+    with open(dest) as f:
+        assert f.read() == 'content'
+    assert not os.path.samefile(src, dest)
+
+
+def test_reflink_error_is_raised(tmp_path, monkeypatch):
+    def ioctl(*args):
+        raise OSError(errno.EIO, 'Input/output error')
+
+    monkeypatch.setattr(fcntl, 'ioctl', ioctl)
+    src = str(tmp_path / 'src.txt')
+    with open(src, 'w') as f:
+        f.write('content')
+
+    with pytest.raises(OSError):
+        place_file(src, str(tmp_path / 'dest.txt'), 'reflink')
+    assert os.listdir(str(tmp_path)) == ['src.txt']
+
+
+def test_split_dataset_resume(tmp_path):
+    for folder in ['complete', 'interrupted']:
+        for label in ['a', 'b']:
+            _write_images(str(tmp_path / folder / 'train' / label), 10)
+    split_dataset(str(tmp_path / 'complete'), 0.2, symbolic=False, workers=2)
+
+    # Interrupted after half of the files of the splits were created
+    interrupted = str(tmp_path / 'interrupted')
+    split_dataset(interrupted, 0.2, symbolic=False, workers=2)
+    created = [os.path.join(interrupted, split, f) for split in ['train', 'val']
+               for f in _listing(os.path.join(interrupted, split))]
+    for path in created[::2]:
+        os.remove(path)
+    open(os.path.join(interrupted, SPLIT_IN_PROGRESS), 'w').close()
+    kept = {path: os.stat(path).st_ino for path in created[1::2]}
+
+    split_dataset(interrupted, 0.2, symbolic=False, workers=2)
+
+    assert _listing(interrupted) == _listing(str(tmp_path / 'complete'))
+    assert not os.path.exists(os.path.join(interrupted, SPLIT_IN_PROGRESS))
+    # The files created before the interruption are kept
+    assert all(os.stat(path).st_ino == ino for path, ino in kept.items())
+
+
+def test_crop_skips_journaled_files(tmp_path):
+    folder = str(tmp_path)
+    arrays = _write_images(folder, 4)
+    done = os.path.join(folder, '0.png')
+    with open(os.path.join(folder, '.preprocess_crop.journal'), 'w') as f:
+        f.write(done + '\n')
+
+    crop_images(folder, (2, 3, 10, 9), extensions=('png',), workers=2)
+
+    for path, array in arrays.items():
+        img = np.asarray(Image.open(path))
+        if path == done:
+            assert (img == array).all()
+        else:
+            assert (img == array[3:9, 2:10]).all()
+    assert not os.path.exists(os.path.join(folder, '.preprocess_crop.journal'))
+
+
+def test_crop_resumed_after_replace(tmp_path):
+    # A run killed after replacing a file but before recording it in the journal
+    folder = str(tmp_path)
+    arrays = _write_images(folder, 3)
+    replaced = os.path.join(folder, '1.png')
+    Image.fromarray(arrays[replaced][3:9, 2:10]).save(replaced)
+
+    crop_images(folder, (2, 3, 10, 9), extensions=('png',), workers=2)
+
+    for path, array in arrays.items():
+        assert (np.asarray(Image.open(path)) == array[3:9, 2:10]).all()
+
+
+def test_crop_retries_failures(tmp_path):
+    folder = str(tmp_path)
+    arrays = _write_images(folder, 3)
+    journal = os.path.join(folder, '.preprocess_crop.journal')
+    broken = os.path.join(folder, 'broken.png')
+    with open(broken, 'w') as f:
+        f.write('not an image')
+
+    crop_images(folder, (2, 3, 10, 9), extensions=('png',), workers=2)
+
+    # The journal is kept with the files done only
+    with open(journal) as f:
+        assert sorted(f.read().splitlines()) == sorted(arrays)
+
+    array = np.zeros((12, 16), dtype=np.uint8)
+    array[3:9, 2:10] = 255
+    Image.fromarray(array).save(broken)
+    crop_images(folder, (2, 3, 10, 9), extensions=('png',), workers=2)
+
+    assert (np.asarray(Image.open(broken)) == 255).all()
+    for path, array in arrays.items():
+        assert (np.asarray(Image.open(path)) == array[3:9, 2:10]).all()
+    assert not os.path.exists(journal)
+
+
+
+def test_resize_keeps_mode(tmp_path):
+    folder = str(tmp_path)
+    arrays = _write_images(folder, 2)
+    for path, mode in zip(sorted(arrays), [0o644, 0o640]):
+        os.chmod(path, mode)
+
+    resize_images(folder, (8, 6), extensions=('png',), workers=2)
+
+    for path, mode in zip(sorted(arrays), [0o644, 0o640]):
+        assert Image.open(path).size == (8, 6)
+        assert _mode(path) == mode
+
+
+def test_write_images_mode(tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    arrays = np.zeros((3, 4, 5), dtype=np.uint8)
+
+    write_images(arrays, [0, 1, 0], str(tmp_path), workers=2)
+
+    assert _listing(str(tmp_path)) == ['0/0.png', '0/2.png', '1/1.png']
+    for path in ['0/0.png', '0/2.png', '1/1.png']:
+        # The permissions of a file created by open(), not the 0o600 of the temporary files
+        assert _mode(str(tmp_path / path)) == 0o666 & ~umask
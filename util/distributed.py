@@ -0,0 +1,189 @@
+"""
+Multi-process data-parallel training with torch.distributed.
+
+Each process trains the model on its own shard of the data, the gradients are averaged by DistributedDataParallel.
+The processes are started with torch.distributed.run (torchrun), which sets the RANK, WORLD_SIZE, LOCAL_RANK,
+MASTER_ADDR and MASTER_PORT environment variables. E.g. 8 processes on the CPUs of each of 2 nodes:
+
+    torchrun --nnodes 2 --nproc_per_node 8 --rdzv_backend c10d --rdzv_endpoint HOST:29500 \\
+        template/RunMe.py --distributed --no-cuda -j 1 ...
+
+The output folder (and the datasets) must be on a file system shared by all the nodes. Only the main process
+(rank 0) writes the logs, the Tensorboard events, the images and the checkpoints. The metrics of the evaluators
+are reduced over all the processes.
+"""
+
+# Utils
+import logging
+import os
+import sys
+
+import numpy as np
+
+# Torch
+import torch
+import torch.distributed as dist
+import torch.utils.data.distributed
+from torch.nn.parallel import DistributedDataParallel
+
+# Environment variables set by the launcher
+ENV_VARIABLES = ['RANK', 'WORLD_SIZE', 'MASTER_ADDR', 'MASTER_PORT']
+
+
+def init_distributed(backend='gloo', no_cuda=True):
+    """
+    Joins the process group of the run. Does nothing if the process already belongs to it, such that the
+    experiments can be executed several times in the same process (e.g. hyper-parameter optimization).
+
+    Parameters
+    ----------
+    backend : str
+        Backend of torch.distributed: 'gloo' (CPU and GPU) or 'nccl' (GPU only)
+    no_cuda : bool
+        If False, each process uses the GPU of index LOCAL_RANK
+
+    Returns
+    -------
+        None
+    """
+    if is_distributed():
+        return
+    missing = [name for name in ENV_VARIABLES if name not in os.environ]
+    if missing:
+        logging.error('Distributed mode needs the environment variables {} (start the processes with torchrun)'
+                      .format(', '.join(missing)))
+        sys.exit(-1)
+    if not no_cuda:
+        torch.cuda.set_device(int(os.environ.get('LOCAL_RANK', 0)))
+    dist.init_process_group(backend=backend, init_method='env://')
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def broadcast_object(obj):
+    """Returns the object of the main process (any picklable object) in all the processes"""
+    if not is_distributed():
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
+
+
+def all_reduce_meter(meter):
+    """
+    Sums the sum and the count of an util.misc.AverageMeter over all the processes, such that its average
+    is the one of the whole split. The value of the last update is left untouched.
+
+    Parameters
+    ----------
+    meter : util.misc.AverageMeter
+        The meter of this process
+
+    Returns
+    -------
+    meter : util.misc.AverageMeter
+        The same meter, updated in place
+    """
+    if not is_distributed():
+        return meter
+    totals = torch.tensor([float(meter.sum), float(meter.count)], dtype=torch.float64)
+    dist.all_reduce(totals)
+    meter.sum, meter.count = totals[0].item(), totals[1].item()
+    meter.avg = meter.sum / meter.count if meter.count > 0 else 0
+    return meter
+
+
+def all_reduce_array(array):
+    """Returns the element-wise sum of a numpy array (e.g. a confusion matrix) over all the processes"""
+    if not is_distributed():
+        return array
+    tensor = torch.from_numpy(np.ascontiguousarray(array, dtype=np.float64))
+    dist.all_reduce(tensor)
+    return tensor.numpy().astype(np.asarray(array).dtype)
+
+
+def all_gather_list(values):
+    """Returns the concatenation (in rank order) of the lists of all the processes e.g. predictions or targets"""
+    if not is_distributed():
+        return values
+    lists = [None] * get_world_size()
+    dist.all_gather_object(lists, list(values))
+    return [value for rank_values in lists for value in rank_values]
+
+
+def distributed_sampler(dataset, shuffle):
+    """
+    Splits the dataset among the processes.
+
+    Datasets which do not support random access (e.g. the HisDB crop datasets, which take their crops from the pages
+    in memory whatever the index) provide a shard(rank, world_size) method restricting them to their part of the
+    data, and keep their normal sampler. The others get a DistributedSampler, which pads the split with the first
+    samples such that all the processes have the same number of mini-batches.
+
+    Parameters
+    ----------
+    dataset : torch.utils.data.Dataset
+        The dataset of this process
+    shuffle : bool
+        Shuffle the samples (every epoch, see set_sampler_epoch())
+
+    Returns
+    -------
+    sampler : torch.utils.data.distributed.DistributedSampler or None
+        The sampler to pass to the DataLoader, None if not distributed or if the dataset has been sharded
+    """
+    if not is_distributed():
+        return None
+    if hasattr(dataset, 'shard'):
+        dataset.shard(get_rank(), get_world_size())
+        return None
+    return torch.utils.data.distributed.DistributedSampler(dataset, shuffle=shuffle)
+
+
+def set_sampler_epoch(data_loader, epoch):
+    """Seeds the shuffling of the DistributedSampler (if any) of the loader with the epoch"""
+    if isinstance(data_loader.sampler, torch.utils.data.distributed.DistributedSampler):
+        data_loader.sampler.set_epoch(epoch)
+
+
+def wrap_model(model, no_cuda):
+    """Wraps the model in a DistributedDataParallel, on the GPU of the process if no_cuda is False"""
+    if no_cuda:
+        return DistributedDataParallel(model)
+    return DistributedDataParallel(model.cuda(), device_ids=[torch.cuda.current_device()])
+
+
+def local_model(model):
+    """
+    Returns the module wrapped in a DistributedDataParallel (the model itself otherwise). The evaluators run it
+    directly, since the processes do not evaluate the same number of mini-batches and must not synchronize.
+    """
+    return model.module if isinstance(model, DistributedDataParallel) else model
+
+
+class NullSummaryWriter(object):
+    """Stands in for the Tensorboard writer in the processes other than the main one: every call is ignored"""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
@@ -0,0 +1,169 @@
+"""
+Streaming evaluation of the segmentation of full pages, with the metrics of the DIVA Layout Analysis Evaluator
+(https://github.com/DIVA-DIA/DIVA_Layout_Analysis_Evaluator).
+
+The pages are added one at a time and only their confusion matrix is kept, such that the memory does not grow with
+the number (and the size) of the evaluated pages.
+"""
+
+# Utils
+import json
+
+import numpy as np
+
+# DeepDIVA
+from util.distributed import all_reduce_array, all_gather_list
+
+METRICS = ['iu', 'f1', 'precision', 'recall']
+
+
+class LayoutAnalysisEvaluator(object):
+    """
+    Accumulates the confusion matrix of the pages and computes, per page and over all of them, the IU, F1, precision
+    and recall of each class, their mean and their frequency weighted mean, as well as the pixel accuracy.
+    All metrics are in percent.
+
+    Attributes
+    ----------
+    class_names : list of str
+        Name of each class
+    cm : numpy array [num_classes x num_classes] (int64)
+        Confusion matrix of all the pages added so far (rows: target, columns: prediction)
+    pages : list of dict
+        Metrics of each page added so far
+    """
+
+    def __init__(self, class_names):
+        """
+        Parameters
+        ----------
+        class_names : list of str
+            Name of each class. The classes are the indexes in this list.
+        """
+        self.class_names = list(class_names)
+        self.num_classes = len(self.class_names)
+        self.cm = np.zeros((self.num_classes, self.num_classes), dtype=np.int64)
+        self.pages = []
+
+    def update(self, pred, target, boundary_mask=None, name=None):
+        """
+        Adds a page.
+
+        Parameters
+        ----------
+        pred : numpy array [H x W]
+            Predicted class of each pixel
+        target : numpy array [H x W]
+            Target class of each pixel
+        boundary_mask : numpy array [H x W] (bool)
+            If given, the boundary pixels are counted as correctly predicted whatever their prediction
+        name : str
+            Name of the page in the per-page metrics
+
+        Returns
+        -------
+        page : dict
+            Metrics of the page, see metrics()
+        """
+        target = np.asarray(target, dtype=np.int64).ravel()
+        pred = np.asarray(pred, dtype=np.int64).ravel()
+        if boundary_mask is not None:
+            pred = np.where(np.asarray(boundary_mask).ravel(), target, pred)
+        cm = np.bincount(target * self.num_classes + pred, minlength=self.num_classes ** 2)
+        cm = cm.reshape(self.num_classes, self.num_classes)
+        self.cm += cm
+
+        page = dict(name=name, **self.metrics(cm))
+        self.pages.append(page)
+        return page
+
+    def confusion_matrix(self, weights=None):
+        """
+        Returns the confusion matrix of all the pages
+
+        Parameters
+        ----------
+        weights : numpy array [num_classes]
+            If given, each pixel counts as the weight of its target class (e.g. the inverse of the class frequencies)
+
+        Returns
+        -------
+        cm : numpy array [num_classes x num_classes]
+        """
+        if weights is None:
+            return self.cm.copy()
+        # The weight of a pixel only depends on its target class, i.e. on the row of the confusion matrix
+        return self.cm * np.asarray(weights, dtype=np.float64)[:, None]
+
+    def metrics(self, cm=None):
+        """
+        Computes the metrics of a confusion matrix
+
+        Parameters
+        ----------
+        cm : numpy array [num_classes x num_classes]
+            Confusion matrix, by default the one of all the pages
+
+        Returns
+        -------
+        metrics : dict
+            'accuracy' and for each of METRICS: '<metric>' its mean over the classes present in the target or in the
+            prediction, 'fw_<metric>' its mean weighted by the frequency of the classes in the target and
+            'class_<metric>' {class name : value} (None for the absent classes)
+        """
+        cm = self.cm if cm is None else cm
+        cm = cm.astype(np.float64)
+        tp = np.diag(cm)
+        support = cm.sum(axis=1)
+        predicted = cm.sum(axis=0)
+        total = cm.sum()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = {'iu': tp / (support + predicted - tp),
+                      'f1': 2 * tp / (support + predicted),
+                      'precision': tp / predicted,
+                      'recall': tp / support}
+        freq = support / total if total > 0 else support
+        # Classes neither in the target nor in the prediction are ignored, the others score 0 if undefined (e.g. the
+        # precision of a class never predicted)
+        present = support + predicted > 0
+
+        metrics = {'accuracy': float(100. * tp.sum() / total) if total > 0 else None}
+        for metric in METRICS:
+            value = np.where(present, np.nan_to_num(values[metric]), np.nan)
+            metrics[metric] = float(100. * value[present].mean()) if present.any() else None
+            metrics['fw_' + metric] = float(100. * (freq[present] * value[present]).sum())
+            metrics['class_' + metric] = {name: float(100. * v) if not np.isnan(v) else None
+                                          for name, v in zip(self.class_names, value)}
+        return metrics
+
+    def all_reduce(self):
+        """Sums the confusion matrices and gathers the pages of all the processes (in distributed mode)"""
+        self.cm = all_reduce_array(self.cm)
+        self.pages = all_gather_list(self.pages)
+
+    def summary(self):
+        """Returns a one line summary of the metrics of all the pages"""
+        metrics = self.metrics()
+        return ' '.join('{}={}'.format(k, '{:.2f}'.format(metrics[k]) if metrics[k] is not None else 'n/a')
+                        for k in ['accuracy'] + METRICS + ['fw_' + m for m in METRICS])
+
+    def add_scalars(self, writer, logging_label, epoch, suffix=''):
+        """Logs the means of the metrics of all the pages on Tensorboard ('<logging_label>/layout_<metric><suffix>')"""
+        metrics = self.metrics()
+        for metric in METRICS:
+            if metrics[metric] is not None:
+                writer.add_scalar('{}/layout_{}{}'.format(logging_label, metric, suffix), metrics[metric], epoch)
+
+    def to_dict(self):
+        """Returns the metrics of all the pages ('aggregate'), the metrics of each page ('pages') and the confusion
+        matrix ('confusion_matrix')"""
+        return {'classes': self.class_names,
+                'aggregate': self.metrics(),
+                'pages': self.pages,
+                'confusion_matrix': self.cm.tolist()}
+
+    def save(self, filename):
+        """Writes to_dict() to a JSON file"""
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
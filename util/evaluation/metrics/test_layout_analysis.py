@@ -0,0 +1,70 @@
+import numpy as np
+from sklearn.metrics import confusion_matrix, f1_score, precision_score, recall_score
+
+from util.evaluation.metrics.accuracy import accuracy_segmentation
+from util.evaluation.metrics.layout_analysis import LayoutAnalysisEvaluator
+
+
+def _random_pages(num_pages=3, num_classes=4, seed=0):
+    rng = np.random.RandomState(seed)
+    return [(rng.randint(num_classes, size=(20, 30)), rng.randint(num_classes, size=(20, 30)))
+            for _ in range(num_pages)]
+
+
+def test_confusion_matrix():
+    evaluator = LayoutAnalysisEvaluator(['a', 'b', 'c', 'd'])
+    pages = _random_pages()
+    for pred, target in pages:
+        evaluator.update(pred, target)
+
+    y_pred = np.concatenate([pred.ravel() for pred, _ in pages])
+    y_true = np.concatenate([target.ravel() for _, target in pages])
+    assert (evaluator.confusion_matrix() == confusion_matrix(y_true, y_pred, labels=range(4))).all()
+
+    weights = np.array([0.1, 0.2, 0.3, 0.4])
+    expected = confusion_matrix(y_true, y_pred, labels=range(4), sample_weight=weights[y_true])
+    assert np.allclose(evaluator.confusion_matrix(weights), expected)
+
+
+def test_metrics():
+    evaluator = LayoutAnalysisEvaluator(['a', 'b', 'c', 'd'])
+    pred, target = _random_pages(num_pages=1)[0]
+    page = evaluator.update(pred, target)
+
+    acc, _, mean_iu, fwavacc = accuracy_segmentation([target], [pred], 4)
+    assert np.isclose(page['accuracy'], acc)
+    assert np.isclose(page['iu'], mean_iu)
+    assert np.isclose(page['fw_iu'], fwavacc)
+    assert np.isclose(page['f1'], 100 * f1_score(target.ravel(), pred.ravel(), average='macro'))
+    assert np.isclose(page['fw_precision'], 100 * precision_score(target.ravel(), pred.ravel(), average='weighted'))
+    assert np.isclose(page['recall'], 100 * recall_score(target.ravel(), pred.ravel(), average='macro'))
+
+
+def test_absent_classes():
+    evaluator = LayoutAnalysisEvaluator(['a', 'b', 'c'])
+    # 'b' is never predicted and 'c' is in neither
+    page = evaluator.update(np.array([0, 0, 0]), np.array([0, 0, 1]))
+    assert np.isclose(page['class_iu']['a'], 100 * 2 / 3)
+    assert page['class_iu']['b'] == 0
+    assert page['class_iu']['c'] is None
+    assert page['class_precision']['b'] == 0
+    assert np.isclose(page['iu'], 100 * (2 / 3) / 2)
+
+
+def test_boundary_pixels():
+    evaluator = LayoutAnalysisEvaluator(['a', 'b'])
+    page = evaluator.update(np.array([1, 1, 0]), np.array([0, 1, 0]), boundary_mask=np.array([True, False, False]))
+    assert page['accuracy'] == 100
+    assert (evaluator.confusion_matrix() == np.array([[2, 0], [0, 1]])).all()
+
+
+def test_aggregate_and_pages():
+    evaluator = LayoutAnalysisEvaluator(['a', 'b', 'c', 'd'])
+    pages = _random_pages()
+    for i, (pred, target) in enumerate(pages):
+        evaluator.update(pred, target, name='page{}'.format(i))
+
+    result = evaluator.to_dict()
+    assert [page['name'] for page in result['pages']] == ['page0', 'page1', 'page2']
+    _, _, mean_iu, _ = accuracy_segmentation([t for _, t in pages], [p for p, _ in pages], 4)
+    assert np.isclose(result['aggregate']['iu'], mean_iu)
@@ -0,0 +1,287 @@
+"""
+Look-up table codecs between the ground truth labels of the segmentation datasets, the classes of the networks and
+the colours of the outputs.
+
+The HisDB ground truths encode the class of each pixel in the blue channel (the "gt code" e.g. 1 for background,
+2 for comment, ...) and mark the boundary pixels in the red channel. Every conversion is a single gather in a
+precomputed table indexed by the gt code (at most 256 of them in an 8 bit channel) or by the pair (output code,
+gt code), instead of a pass per class or a dictionary look-up per pixel.
+
+The multi-label ground truths, where a pixel has every class whose bit is set in its gt code (e.g. 6 is comment and
+decoration), are converted to and from multi-hot matrices with bitwise operations (see multi_hot_encode()).
+"""
+
+# Utils
+import numpy as np
+
+# Torch
+import torch
+
+# Output image as described in https://github.com/DIVA-DIA/DIVA_Layout_Analysis_Evaluator (colours are in BGR)
+# GREEN: Foreground predicted correctly rgb(80, 140, 30)
+# YELLOW: Foreground predicted - but the wrong class (e.g. Text instead of Comment) rgb(250, 230, 60)
+# BLACK: Background predicted correctly rgb(0, 0, 0)
+# RED: Background mis-predicted as Foreground rgb(240, 30, 20)
+# BLUE: Foreground mis-predicted as Background rgb(0, 240, 255)
+LAYOUT_ANALYSIS_COLOURS = {"fg_correct": (30, 160, 70), "fg_wrong_class": (60, 255, 255), "bg_correct": (0, 0, 0),
+                           "bg_as_fg": (20, 30, 240), "fg_as_bg": (255, 240, 0)}
+
+# Look-up table {gt code : (gt code, 0, 0)} i.e. the gt code in the blue channel of a BGR image
+LABEL_TO_BGR = np.zeros((256, 3), dtype=np.uint8)
+LABEL_TO_BGR[:, 0] = np.arange(256)
+
+# The gt code of the background, which is also given to the boundary pixels and to the 0 fillers of the test crops
+BACKGROUND = 1
+
+
+def multi_hot_encode(values, n_bits):
+    """
+    Bit-encoding to multi-hot: the channel i is the bit i of the values (e.g. 6 -> [0, 1, 1, 0] with 4 bits)
+
+    Parameters
+    -------
+    values: numpy array of non-negative integers
+        bit-encoded labels e.g. the blue channel of a ground truth image [H x W]
+    n_bits: int
+        number of bits (classes) to decode
+    Returns
+    -------
+    numpy array of size [n_bits x H x W] (uint8)
+        multi-hot encoded matrix
+    """
+    values = np.asarray(values).astype(np.int64)
+    bits = np.arange(n_bits).reshape((-1,) + (1,) * values.ndim)
+    return ((values[None] >> bits) & 1).astype(np.uint8)
+
+
+def multi_hot_decode(matrix):
+    """
+    Multi-hot to bit-encoding, the inverse of multi_hot_encode(): the weighted sum of the channels by 2^i
+
+    Parameters
+    -------
+    matrix: numpy array of size [#C x H x W]
+        multi-hot encoded matrix, where #C is the number of bits (classes)
+    Returns
+    -------
+    numpy array of size [H x W] (int64)
+        bit-encoded labels
+    """
+    weights = np.left_shift(1, np.arange(len(matrix), dtype=np.int64))
+    return np.tensordot(weights, np.asarray(matrix).astype(np.int64), axes=1)
+
+
+class LabelCodec(object):
+    """
+    Conversions between the gt codes of a dataset and the classes of the network, which are the indexes of the gt
+    codes in the list given at construction.
+
+    Attributes
+    ----------
+    gt_codes : list of int
+        The gt code of each class
+    num_classes : int
+        Number of classes
+    code_to_class : numpy array [256] (int64)
+        Class of each gt code, -1 for the codes which are not used by the dataset
+    class_to_code : numpy array [num_classes] (uint8)
+        Gt code of each class
+    """
+
+    def __init__(self, gt_codes, aliases=None):
+        """
+        Parameters
+        ----------
+        gt_codes : list of int
+            The gt code of each class. It must contain the background (1).
+        aliases : dict
+            Additional gt codes mapped to the class of another code {gt code : gt code} e.g. to merge the multi-label
+            codes with the class of one of their labels
+        """
+        self.gt_codes = list(gt_codes)
+        self.num_classes = len(self.gt_codes)
+        self.code_to_class = np.full(256, -1, dtype=np.int64)
+        self.code_to_class[self.gt_codes] = np.arange(self.num_classes)
+        for code, target in (aliases or {}).items():
+            self.code_to_class[code] = self.code_to_class[target]
+        self.code_to_class[0] = self.code_to_class[BACKGROUND]
+        self.class_to_code = np.array(self.gt_codes, dtype=np.uint8)
+
+    def gt_to_classes(self, matrix):
+        """
+        Convert a ground truth image to the matrix of the classes of its pixels
+
+        Parameters
+        -------
+        matrix: float tensor from to_tensor() or numpy array
+            shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) RGB
+
+        Returns
+        -------
+        numpy array of size [H x W] (int64)
+            class of each pixel
+        """
+        blue = _gt_codes(matrix)
+        classes = self.code_to_class[blue]
+        if classes.min() < 0:
+            raise ValueError('Unknown ground truth values {} (expected {})'
+                             .format(np.unique(blue[classes < 0]).tolist(), self.gt_codes))
+        return classes
+
+    def gt_to_one_hot(self, matrix, num_classes=None):
+        """
+        Convert ground truth tensor to one-hot encoded matrix
+
+        Parameters
+        -------
+        matrix: float tensor from to_tensor() or numpy array
+            shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) RGB
+        num_classes: int
+            number of channels of the one-hot matrix (default: the number of classes of the codec)
+
+        Returns
+        -------
+        torch.LongTensor of size [#C x H x W]
+            sparse one-hot encoded multi-class matrix, where #C is the number of classes
+        """
+        one_hot = np.eye(num_classes or self.num_classes, dtype=np.uint8)[self.gt_to_classes(matrix)]
+        return torch.LongTensor(one_hot.transpose((2, 0, 1)))
+
+    def one_hot_to_np_bgr(self, matrix):
+        """
+        Convert the one-hot encoded output of the network to an image like it was provided in the ground truth
+
+        Parameters
+        -------
+        matrix: numpy array of size [#C x H x W]
+            sparse one-hot encoded matrix (or scores), where #C is the number of classes
+
+        Returns
+        -------
+        numpy array of size [H x W x C] (BGR, uint8)
+            the gt code of each pixel in the blue channel
+        """
+        return LABEL_TO_BGR[self.class_to_code[np.argmax(matrix, axis=0)]]
+
+    def _class_bits(self):
+        """Bit of the gt code of each class, for the multi-label conversions"""
+        if any(code & (code - 1) for code in self.gt_codes):
+            raise ValueError('The gt codes {} are not all single bits'.format(self.gt_codes))
+        return [int(code).bit_length() - 1 for code in self.gt_codes]
+
+    def gt_to_multi_hot(self, matrix):
+        """
+        Convert a multi-label ground truth to a multi-hot matrix: a pixel has every class whose bit is set in its gt
+        code. The gt codes of the classes must be single bits (e.g. 1, 2, 4, 8).
+
+        Parameters
+        -------
+        matrix: float tensor from to_tensor() or numpy array
+            shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) RGB
+
+        Returns
+        -------
+        torch.LongTensor of size [#C x H x W]
+            multi-hot encoded matrix, where #C is the number of classes
+        """
+        return torch.LongTensor(multi_hot_encode(_gt_codes(matrix), 8)[self._class_bits()])
+
+    def multi_hot_to_np_bgr(self, matrix, threshold=0.5):
+        """
+        Convert a multi-hot matrix (e.g. the sigmoid outputs of a multi-label network) to an image like it was
+        provided in the ground truth, the inverse of gt_to_multi_hot()
+
+        Parameters
+        -------
+        matrix: numpy array of size [#C x H x W]
+            multi-hot encoded matrix (or probabilities), where #C is the number of classes
+        threshold: float
+            a pixel has the classes whose value is above the threshold
+
+        Returns
+        -------
+        numpy array of size [H x W x C] (BGR, uint8)
+            the gt code of each pixel in the blue channel
+        """
+        matrix = np.asarray(matrix)
+        bits = np.zeros((8,) + matrix.shape[1:], dtype=np.uint8)
+        bits[self._class_bits()] = matrix > threshold
+        return LABEL_TO_BGR[multi_hot_decode(bits)]
+
+
+def _gt_codes(matrix):
+    """
+    The gt code of each pixel of a ground truth (float tensor from to_tensor() (C x H x W) or numpy array (H x W x C)
+    RGB), the boundary pixels (marked in the red channel) and the 0 fillers being background
+    """
+    # TODO: ugly fix -> better to not normalize in the first place
+    if type(matrix).__module__ == np.__name__:
+        blue = matrix[:, :, 2].astype(np.uint8)
+        border_mask = matrix[:, :, 0].astype(np.uint8) != 0
+    else:
+        np_array = (matrix * 255).numpy().astype(np.uint8)
+        blue = np_array[2, :, :]
+        border_mask = np_array[0, :, :] != 0
+    return np.where(border_mask | (blue == 0), BACKGROUND, blue).astype(np.uint8)
+
+
+def class_colours_lut(class_colours):
+    """
+    Look-up table {gt code : colour}. The gt codes without colour are kept as they are (in the blue channel).
+
+    Parameters
+    ----------
+    class_colours : dict
+        Colour of each class {gt code : colour in BGR}
+
+    Returns
+    -------
+    numpy array of size [256 x 3] (uint8)
+    """
+    lut = LABEL_TO_BGR.copy()
+    for label, colour in class_colours.items():
+        lut[label] = colour
+    return lut
+
+
+def layout_analysis_lut():
+    """
+    Look-up table {(output gt code << 8) | gt code : colour} of the layout analysis evaluation (see
+    LAYOUT_ANALYSIS_COLOURS)
+
+    Returns
+    -------
+    numpy array of size [65536 x 3] (uint8)
+    """
+    global _LAYOUT_ANALYSIS_LUT
+    if _LAYOUT_ANALYSIS_LUT is None:
+        output, gt = np.meshgrid(np.arange(256), np.arange(256), indexing='ij')
+        lut = np.zeros((256, 256, 3), dtype=np.uint8)
+        lut[np.logical_and(output == gt, gt != BACKGROUND)] = LAYOUT_ANALYSIS_COLOURS["fg_correct"]
+        lut[np.logical_and(output == gt, gt == BACKGROUND)] = LAYOUT_ANALYSIS_COLOURS["bg_correct"]
+        lut[(output != gt) & (gt != BACKGROUND) & (output != BACKGROUND)] = LAYOUT_ANALYSIS_COLOURS["fg_wrong_class"]
+        lut[np.logical_and(output != gt, output == BACKGROUND)] = LAYOUT_ANALYSIS_COLOURS["fg_as_bg"]
+        lut[(output != gt) & (output != BACKGROUND) & (gt == BACKGROUND)] = LAYOUT_ANALYSIS_COLOURS["bg_as_fg"]
+        _LAYOUT_ANALYSIS_LUT = lut.reshape(-1, 3)
+    return _LAYOUT_ANALYSIS_LUT
+
+
+def layout_analysis_image(output_codes, gt_codes):
+    """
+    Render the layout analysis evaluation of an output
+
+    Parameters
+    ----------
+    output_codes : numpy array [H x W] (uint8)
+        gt code of each pixel of the output
+    gt_codes : numpy array [H x W] (uint8)
+        gt code of each pixel of the ground truth
+
+    Returns
+    -------
+    numpy array of size [H x W x 3] (BGR, uint8)
+    """
+    return layout_analysis_lut()[(output_codes.astype(np.uint16) << 8) | gt_codes]
+
+
+_LAYOUT_ANALYSIS_LUT = None
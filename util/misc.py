@@ -4,17 +4,29 @@ General purpose utility functions.
 """
 
 # Utils
+import atexit
+import concurrent.futures
 import logging
 import os
 import os.path
+import queue
+import random
+import re
 import shutil
 import string
+import threading
 
 import cv2
 
 import numpy as np
 import torch
 
+# DeepDIVA
+from util.atomic_file import atomic_link, atomic_write
+from util.distributed import is_main_process
+from util.label_codec import LABEL_TO_BGR, LAYOUT_ANALYSIS_COLOURS, class_colours_lut, layout_analysis_image, \
+    multi_hot_decode, multi_hot_encode
+
 
 def _prettyprint_logging_label(logging_label):
     """Format the logging label in a pretty manner.
@@ -57,6 +69,12 @@ class AverageMeter(object):
         self.count += n
         self.avg = self.sum / self.count
 
+    def state_dict(self):
+        return {'val': self.val, 'avg': self.avg, 'sum': self.sum, 'count': self.count}
+
+    def load_state_dict(self, state_dict):
+        self.__dict__.update(state_dict)
+
     """
     Computes the accuracy@K for the specified values of K
 
@@ -110,9 +128,13 @@ def adjust_learning_rate(lr, optimizer, epoch, decay_lr_epochs):
 
 
 def checkpoint(epoch, new_value, best_value, model, optimizer, log_dir,
-               invert_best=False, checkpoint_all_epochs=False):
+               invert_best=False, checkpoint_all_epochs=False, checkpoint_keep_last=None, **kwargs):
     """Saves the current training checkpoint and the best valued checkpoint to file.
 
+    The state of the model and of the optimizer is copied to CPU memory and written to file by a background
+    thread, such that the training does not wait on the file system. Use wait_for_checkpoints() before
+    reading a checkpoint file. In distributed mode only the main process writes the checkpoints.
+
     Parameters
     ----------
     epoch : int
@@ -135,6 +157,8 @@ def checkpoint(epoch, new_value, best_value, model, optimizer, log_dir,
         (useful when metric evaluted is error rate)
     checkpoint_all_epochs : bool
         If enabled, save checkpoint after every epoch.
+    checkpoint_keep_last : int
+        If enabled together with checkpoint_all_epochs, only the last N epoch checkpoints are kept on disk.
 
     Returns
     -------
@@ -148,22 +172,190 @@ def checkpoint(epoch, new_value, best_value, model, optimizer, log_dir,
     else:
         is_best = new_value > best_value
         best_value = max(new_value, best_value)
-    filename = os.path.join(log_dir, 'checkpoint.pth.tar')
-    torch.save({
+    # If enabled, save all checkpoints with epoch number.
+    if checkpoint_all_epochs == True:
+        filename = os.path.join(log_dir, 'checkpoint_{}.pth.tar'.format(epoch))
+    else:
+        filename = os.path.join(log_dir, 'checkpoint.pth.tar')
+    # In distributed mode the model is the same in all the processes: only the main one saves it
+    if not is_main_process():
+        return best_value
+    state = _to_cpu({
         'epoch': epoch + 1,
         'arch': str(type(model)),
         'state_dict': model.state_dict(),
         'best_value': best_value,
         'optimizer': optimizer.state_dict(),
-    }, filename)
-    if is_best:
-        shutil.copyfile(filename, os.path.join(os.path.split(filename)[0], 'model_best.pth.tar'))
-    # If enabled, save all checkpoints with epoch number.
-    if checkpoint_all_epochs == True:
-        shutil.move(filename, os.path.join(os.path.split(filename)[0], 'checkpoint_{}.pth.tar'.format(epoch)))
+    })
+    _get_checkpoint_writer().submit(state, filename, is_best,
+                                    checkpoint_keep_last if checkpoint_all_epochs else None)
     return best_value
 
 
+def checkpoint_step(epoch, batch_idx, best_value, model, optimizer, log_dir, train_state):
+    """Saves a checkpoint in the middle of an epoch, from which the training can be resumed at the exact mini-batch.
+
+    The checkpoint is written (in background, see checkpoint()) to 'checkpoint_step.pth.tar' and can be passed to
+    --resume. It has its own file such that it never overwrites the checkpoints of the epochs: each one overwrites
+    the previous mid-epoch checkpoint only.
+    Since 'epoch' is the current epoch (and not the next one), set_up_model() resumes the epoch which was
+    interrupted and the runner continues it from the state stored in 'train_state'.
+
+    Parameters
+    ----------
+    epoch : int
+        Current epoch
+    batch_idx : int
+        Index of the next mini-batch to be processed
+    best_value : float
+        Best value ever obtained.
+    model : torch.nn.module object
+        The model we are checkpointing
+    optimizer :
+        The optimizer that is being used to train this model.
+    log_dir : str
+        Output folder where to put the checkpoint.
+    train_state : dict
+        State of the training loop which is not part of the model and optimizer e.g. the state of the meters,
+        of the dataset and of the random number generators at the beginning of the epoch.
+
+    Returns
+    -------
+        None
+    """
+    if not is_main_process():
+        return
+    state = _to_cpu({
+        'epoch': epoch,
+        'arch': str(type(model)),
+        'state_dict': model.state_dict(),
+        'best_value': best_value,
+        'optimizer': optimizer.state_dict(),
+        'train_state': dict(train_state, batch_idx=batch_idx, step_rng_state=get_rng_state()),
+    })
+    _get_checkpoint_writer().submit(state, os.path.join(log_dir, 'checkpoint_step.pth.tar'), False)
+
+
+def load_train_state(resume):
+    """Returns the state of the training loop stored by checkpoint_step() or None if the checkpoint has been
+    saved at the end of an epoch.
+    """
+    if not resume:
+        return None
+    wait_for_checkpoints()
+    return torch.load(resume).get('train_state', None)
+
+
+def get_rng_state():
+    """Returns the state of all random number generators (Python, NumPy, torch and CUDA)"""
+    np_state = np.random.get_state()
+    return {
+        'python': random.getstate(),
+        # Converted to Python types to keep the checkpoint free of numpy objects
+        'numpy': (np_state[0], np_state[1].tolist()) + tuple(np_state[2:]),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state):
+    """Restores the state of all random number generators as returned by get_rng_state()"""
+    random.setstate(state['python'])
+    np.random.set_state((state['numpy'][0], np.array(state['numpy'][1], dtype=np.uint32)) + tuple(state['numpy'][2:]))
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def wait_for_checkpoints():
+    """Blocks until all the checkpoints submitted so far are written to file.
+    Raises the exception of the background writer, if writing a checkpoint failed.
+    """
+    if _checkpoint_writer is not None:
+        _checkpoint_writer.wait()
+
+
+def _to_cpu(obj):
+    """Returns a copy of a (nested) state dict where all tensors are cloned to CPU memory"""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, _to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+
+class CheckpointWriter(object):
+    """Writes checkpoints to file from a background thread.
+
+    Every file is written to a temporary file which is then renamed, such that a killed job never leaves a torn
+    checkpoint behind. The best model is a hardlink to the checkpoint rather than a copy of it.
+    """
+
+    def __init__(self, max_pending=1):
+        """
+        Parameters
+        ----------
+        max_pending : int
+            Maximum number of checkpoints waiting to be written. Submitting more blocks the training, which
+            bounds the memory used by the CPU copies of the state dicts.
+        """
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._exception = None
+        self._thread = threading.Thread(target=self._run, name='CheckpointWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, state, filename, is_best, keep_last=None):
+        self._raise_exception()
+        self._queue.put((state, filename, is_best, keep_last))
+
+    def wait(self):
+        self._queue.join()
+        self._raise_exception()
+
+    def _raise_exception(self):
+        if self._exception is not None:
+            exception, self._exception = self._exception, None
+            raise exception
+
+    def _run(self):
+        while True:
+            state, filename, is_best, keep_last = self._queue.get()
+            try:
+                self._write(state, filename, is_best, keep_last)
+            except Exception as exp:
+                logging.error('Failed to write checkpoint {}: {}'.format(filename, exp))
+                self._exception = exp
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(state, filename, is_best, keep_last):
+        log_dir = os.path.dirname(filename)
+        with atomic_write(filename, fsync=True) as f:
+            torch.save(state, f)
+        if is_best:
+            atomic_link(filename, os.path.join(log_dir, 'model_best.pth.tar'))
+        if keep_last is not None:
+            matches = [re.match(r'checkpoint_(\d+)\.pth\.tar$', f) for f in os.listdir(log_dir)]
+            epochs = sorted(int(m.group(1)) for m in matches if m is not None)
+            for epoch in epochs[:max(len(epochs) - keep_last, 0)]:
+                os.remove(os.path.join(log_dir, 'checkpoint_{}.pth.tar'.format(epoch)))
+
+
+_checkpoint_writer = None
+
+
+def _get_checkpoint_writer():
+    global _checkpoint_writer
+    if _checkpoint_writer is None:
+        _checkpoint_writer = CheckpointWriter()
+        # Make sure the pending checkpoints are written before the interpreter exits
+        atexit.register(wait_for_checkpoints)
+    return _checkpoint_writer
+
+
 def to_capital_camel_case(s):
     """Converts a string to camel case.
 
@@ -270,6 +462,10 @@ def save_image_and_log_to_tensorboard(writer=None, tag=None, image=None, global_
     None
 
     """
+    # In distributed mode the images of the whole run (e.g. confusion matrices) are saved by the main process
+    if not is_main_process():
+        return
+
     # Log image to Tensorboard
     writer.add_image(tag=tag, img_tensor=image, global_step=global_step)
 
@@ -299,154 +495,130 @@ def save_image_and_log_to_tensorboard(writer=None, tag=None, image=None, global_
 
     return
 
-def save_image_and_log_to_tensorboard_segmentation(writer=None, tag=None, image=None, global_step=None, gt_image=[]):
-    """Utility function to save image in the output folder and also log it to Tensorboard.
-    ALL IMAGES ARE IN BGR BECAUSE OF CV3.IMWRITE()!!
+# Colours (BGR) of the classes in the segmentation outputs: {value of the blue channel : colour}
+CLASS_COLOURS = {1: (0, 0, 0), 2: (0, 255, 255), 4: (255, 0, 255), 8: (255, 255, 0)}
+# Colours of the multi-label outputs, where a pixel can belong to several foreground classes at once
+MULTI_LABEL_CLASS_COLOURS = {1: (0, 0, 0), 2: (0, 255, 255), 4: (255, 0, 255), 6: (0, 125, 255), 8: (255, 255, 0),
+                             10: (0, 200, 0), 12: (200, 0, 200), 14: (255, 255, 255)}
+
+
+def save_image_and_log_to_tensorboard_segmentation(writer=None, tag=None, image=None, global_step=None, gt_image=[],
+                                                   class_colours=MULTI_LABEL_CLASS_COLOURS):
+    """Utility function to save a segmentation output in the output folder.
+    ALL IMAGES ARE IN BGR BECAUSE OF CV2.IMWRITE()!!
+
+    Three images are written: the output as is, the output with one colour per class ("coloured_" prefix) and, if the
+    ground truth is given, the layout analysis evaluation ("layout_analysis_" prefix). The images are rendered and
+    encoded in background, use wait_for_segmentation_images() to make sure they have been written.
 
     Parameters
     ----------
     writer : tensorboardX.writer.SummaryWriter object
-        The writer object for Tensorboard
+        The writer object for Tensorboard (not used, the full page images are too large for it)
     tag : str
         Name of the image.
     image : ndarray [W x H x C]
-        Image to be saved and logged to Tensorboard.
+        Output to be saved. The class of each pixel is encoded in the blue channel, the other channels are empty.
     global_step : int
         Epoch/Mini-batch counter.
+    gt_image : ndarray [W x H x C]
+        Ground truth in the same format as image (optional)
+    class_colours : dict
+        Colour of each class {value of the blue channel : colour in BGR}
 
     Returns
     -------
     None
 
     """
-    #TODO pass this as argument
-    int_val_to_class_name = {1: "background", 2: "comment", 4: "decoration", 6: "comment_decoration",
-                             8: "maintext", 10: "maintext_comment", 12: "maintext_decoration",
-                             14: "maintext_comment_decoration"}
+    gt_labels = np.array(gt_image)[:, :, 0] if len(gt_image) != 0 else None
+    _get_segmentation_image_writer().submit(tag=tag, labels=np.asarray(image)[:, :, 0], global_step=global_step,
+                                            gt_labels=gt_labels, class_colours=class_colours)
 
-    # 1. Create true output
-    # Log image to Tensorboard
-    #writer.add_image(tag=tag, img_tensor=image, global_step=global_step)
 
-    # Get output folder using the FileHandler from the logger.
-    # (Assumes the file handler is the last one)
-    output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
+def wait_for_segmentation_images():
+    """Blocks until all the segmentation outputs submitted so far are written to file."""
+    global _segmentation_image_writer
+    if _segmentation_image_writer is not None:
+        # The next outputs might belong to a different run, hence the output folder is resolved again
+        writer, _segmentation_image_writer = _segmentation_image_writer, None
+        writer.close()
 
-    if global_step is not None:
-        dest_filename = os.path.join(output_folder, 'images', tag + '_{}'.format(global_step))
-    else:
-        dest_filename = os.path.join(output_folder, 'images', tag)
 
-    if not os.path.exists(os.path.dirname(dest_filename)):
-        os.makedirs(os.path.dirname(dest_filename))
+class SegmentationImageWriter(object):
+    """Renders and writes segmentation outputs to file with a pool of threads.
 
-    cv2.imwrite(dest_filename, image)
+    The outputs are passed as label maps (the blue channel of the image). Each visualization is rendered with a single
+    look-up table pass, which as well as the PNG encoding releases the GIL.
+    """
 
-    # 2. Make a more human readable output -> one colour per class
-    # Write image to output folder
-    tag_col = "coloured_" + tag
+    def __init__(self, output_folder, workers=2, max_pending=4):
+        """
+        Parameters
+        ----------
+        output_folder : string
+            Folder where the 'images' folder is created
+        workers : int
+            Number of threads rendering and encoding the images
+        max_pending : int
+            Maximum number of outputs waiting to be written. Submitting more blocks the caller, which bounds the
+            memory used by the full page label maps.
+        """
+        self.output_folder = output_folder
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                               thread_name_prefix='SegmentationImageWriter')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+
+    def submit(self, tag, labels, global_step=None, gt_labels=None, class_colours=MULTI_LABEL_CLASS_COLOURS):
+        self._slots.acquire()
+        # The copies guarantee that the caller can modify its arrays while the images are being written
+        labels = np.array(labels, dtype=np.uint8)
+        gt_labels = np.array(gt_labels, dtype=np.uint8) if gt_labels is not None else None
+        future = self._executor.submit(self._write, tag, labels, global_step, gt_labels, class_colours)
+        future.add_done_callback(lambda f: self._slots.release())
+        self._futures = [f for f in self._futures if not f.done()] + [future]
+
+    def close(self):
+        """Waits for the pending images to be written and stops the threads"""
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            if future.exception() is not None:
+                logging.error('Failed to write segmentation output: {}'.format(future.exception()))
+        self._futures = []
+
+    def _filename(self, tag, global_step):
+        if global_step is not None:
+            tag = tag + '_{}'.format(global_step)
+        dest_filename = os.path.join(self.output_folder, 'images', tag)
+        os.makedirs(os.path.dirname(dest_filename), exist_ok=True)
+        return dest_filename
 
-    # Get output folder using the FileHandler from the logger.
-    # (Assumes the file handler is the last one)
-    output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
+    def _write(self, tag, labels, global_step, gt_labels, class_colours):
+        # 1. The output as is (class in the blue channel)
+        cv2.imwrite(self._filename(tag, global_step), LABEL_TO_BGR[labels])
 
-    if global_step is not None:
-        dest_filename = os.path.join(output_folder, 'images', tag_col + '_{}'.format(global_step))
-    else:
-        dest_filename = os.path.join(output_folder, 'images', tag_col)
+        # 2. Make a more human readable output -> one colour per class
+        cv2.imwrite(self._filename("coloured_" + tag, global_step), class_colours_lut(class_colours)[labels])
 
-    if not os.path.exists(os.path.dirname(dest_filename)):
-        os.makedirs(os.path.dirname(dest_filename))
+        # 3. Output image for the layout analysis evaluation
+        if gt_labels is not None:
+            cv2.imwrite(self._filename("layout_analysis_" + tag, global_step), layout_analysis_image(labels, gt_labels))
 
-    img = np.copy(image)
-    blue = image[:, :, 0]  # Extract just blue channel
-    masks = {c: (blue == i) > 0 for i, c in int_val_to_class_name.items()}
-    # Colours are in BGR
-    class_col = {"background": (0, 0, 0), "maintext": (255, 255, 0), "comment": (0, 255, 255),
-                 "decoration": (255, 0, 255),
-                 "comment_decoration": (0, 125, 255), "maintext_comment": (0, 200, 0),
-                 "maintext_decoration": (200, 0, 200),
-                 "maintext_comment_decoration": (255, 255, 255)}
 
-    for c, mask in masks.items():
-        img[mask] = class_col[c]
+_segmentation_image_writer = None
+# Make sure the pending images are written before the interpreter exits
+atexit.register(wait_for_segmentation_images)
 
-    #writer.add_image(tag=tag_col, img_tensor=np.moveaxis(img, -1, 0), global_step=global_step)
-    # Write image to output folder
-    cv2.imwrite(dest_filename, img)
-
-    # 3. Output image as described in https://github.com/DIVA-DIA/DIVA_Layout_Analysis_Evaluator
-    # GREEN: Foreground predicted correctly rgb(80, 140, 30)
-    # YELLOW: Foreground predicted - but the wrong class (e.g. Text instead of Comment) rgb(250, 230, 60)
-    # BLACK: Background predicted correctly rgb(0, 0, 0)
-    # RED: Background mis-predicted as Foreground rgb(240, 30, 20)
-    # BLUE: Foreground mis-predicted as Background rgb(0, 240, 255)
-    if len(gt_image) != 0:
-        class_col = {"fg_correct": (30, 160, 70), "fg_wrong_class": (60, 255, 255), "bg_correct": (0, 0, 0),
-                     "bg_as_fg": (20, 30, 240), "fg_as_bg": (255, 240, 0)}
-
-        img_la = np.copy(image)
-        tag_la = "layout_analysis_" + tag
+
+def _get_segmentation_image_writer():
+    global _segmentation_image_writer
+    if _segmentation_image_writer is None:
         # Get output folder using the FileHandler from the logger.
         # (Assumes the file handler is the last one)
         output_folder = os.path.dirname(logging.getLogger().handlers[-1].baseFilename)
-
-        if global_step is not None:
-            dest_filename = os.path.join(output_folder, 'images', tag_la + '_{}'.format(global_step))
-        else:
-            dest_filename = os.path.join(output_folder, 'images', tag_la)
-
-        if not os.path.exists(os.path.dirname(dest_filename)):
-            os.makedirs(os.path.dirname(dest_filename))
-
-        out_blue = image[:, :, 0]  # Extract just blue channel
-        gt_blue = gt_image[:, :, 0]
-
-        masks = {c: _get_mask(c, out_blue, gt_blue) for c in class_col.keys()}
-
-        for c, mask in masks.items():
-            img_la[mask] = class_col[c]
-
-        # img_la = np.array([[_get_colour(out_blue[x, y], gt_blue[x, y]) for y in range(out_blue.shape[1])]
-        #                    for x in range(out_blue.shape[0])])
-        # Write image to output folder
-        # TODO this does not work
-        #writer.add_image(tag=tag_la, img_tensor=np.moveaxis(img_la, -1, 0), global_step=global_step)
-        cv2.imwrite(dest_filename, img_la)
-
-    return
-
-
-def _get_mask(tag, output, gt):
-    if tag == "fg_correct":
-        return np.logical_and(output == gt, gt != 1)
-    elif tag == "bg_correct":
-        return np.logical_and(output == gt, gt == 1)
-    elif tag == "fg_wrong_class":
-        return np.logical_and(output != gt, np.logical_and(gt != 1, output != 1))
-    elif tag == "fg_as_bg":
-        return np.logical_and(output != gt, output == 1)
-    elif tag == "bg_as_fg":
-        return np.logical_and(output != gt, np.logical_and(output != 1, gt == 1))
-
-
-def _get_colour(output, gt):
-    # Colours are in BGR
-    class_col = {"fg_correct": (30, 160, 70), "fg_wrong_class": (60, 255, 255), "bg_correct": (0, 0, 0),
-                 "bg_as_fg": (20, 30, 240), "fg_as_bg": (255, 240, 0)}
-
-    if output == gt and gt in [2, 4, 6, 8, 10, 12, 14]:
-        return class_col["fg_correct"]
-    elif output == gt and gt == 1:
-        return class_col["bg_correct"]
-    elif output != gt and output in [2, 4, 6, 8, 10, 12, 14] and gt in [2, 4, 6, 8, 10, 12, 14]:
-        return class_col["fg_wrong_class"]
-    elif output != gt and output == 1:
-        return class_col["fg_as_bg"]
-    elif output != gt and output in [2, 4, 6, 8, 10, 12, 14]:
-        return class_col["bg_as_fg"]
-    else:
-        return (255, 255, 255)
+        _segmentation_image_writer = SegmentationImageWriter(output_folder)
+    return _segmentation_image_writer
 
 
 def has_extension(filename, extensions):
@@ -491,8 +663,8 @@ def int_to_one_hot(x, n_classes):
 
 def multi_label_img_to_multi_hot(np_array):
     """
-    TODO: There must be a faster way of doing this + ajust to correct input format (see gt_tensor_to_one_hot)
-    Convert ground truth label image to multi-one-hot encoded matrix of size image height x image width x #classes
+    Convert ground truth label image to multi-one-hot encoded matrix of size image height x image width x #classes.
+    The first channel is the most significant bit of the blue channel.
 
     Parameters
     -------
@@ -503,15 +675,9 @@ def multi_label_img_to_multi_hot(np_array):
     numpy array of size [#C x W x H]
         sparse one-hot encoded multi-class matrix, where #C is the number of classes
     """
-    im_np = np_array[:, :, 2].astype(np.int8)
-    nb_classes = len(int_to_one_hot(im_np.max(), ''))
-
-    class_dict = {x: int_to_one_hot(x, nb_classes) for x in np.unique(im_np)}
-    # create the one hot matrix
-    one_hot_matrix = np.asanyarray(
-        [[class_dict[im_np[i, j]] for j in range(im_np.shape[1])] for i in range(im_np.shape[0])])
-
-    return np.rollaxis(one_hot_matrix.astype(np.uint8), 2, 0)
+    im_np = np_array[:, :, 2].astype(np.uint8)
+    nb_classes = max(int(im_np.max()).bit_length(), 1)
+    return multi_hot_encode(im_np, nb_classes)[::-1].copy()
 
 
 def multi_one_hot_to_output(matrix):
@@ -521,19 +687,13 @@ def multi_one_hot_to_output(matrix):
     Parameters
     -------
     tensor of size [#C x W x H]
-        sparse one-hot encoded multi-class matrix, where #C is the number of classes
+        sparse one-hot encoded multi-class matrix, where #C is the number of classes (most significant bit first)
     Returns
     -------
     np_array: numpy array
-        RGB image [C x W x H]
+        RGB image [W x H x C]
     """
-    # TODO: fix input and output dims (see one_hot_to_output)
-    # create RGB
-    matrix = np.rollaxis(np.char.mod('%d', matrix.numpy()), 0, 3)
-    zeros = (32 - matrix.shape[2]) * '0'
-    B = np.array([[int('{}{}'.format(zeros, ''.join(matrix[i][j])), 2) for j in range(matrix.shape[1])] for i in
-                  range(matrix.shape[0])])
-
-    RGB = np.dstack((np.zeros(shape=(matrix.shape[0], matrix.shape[1], 2), dtype=np.int8), B))
+    B = multi_hot_decode(matrix.numpy()[::-1])
+    RGB = np.dstack((np.zeros(shape=(B.shape[0], B.shape[1], 2), dtype=np.int8), B))
 
     return RGB
@@ -0,0 +1,84 @@
+"""
+DataLoader keeping its worker processes alive across epochs and phases.
+
+By default every iteration over a torch.utils.data.DataLoader forks a new set of worker processes, each with a fresh
+copy of the dataset. With datasets which are expensive to set up in the workers (e.g. the HisDB pages loaded in
+memory) this stalls the beginning of every train/validation phase. The PersistentDataLoader keeps its workers (and
+their copy of the dataset) alive for the whole run and can start loading its first mini-batches while the previous
+phase is still running.
+
+Note that the workers do not see the changes made to the dataset in the main process after the first iteration,
+hence loaders of datasets modified between epochs (e.g. the triplets re-generated every N epochs) must not persist.
+"""
+
+# Utils
+import inspect
+import logging
+
+# Torch
+import torch.utils.data
+
+
+class PersistentDataLoader(torch.utils.data.DataLoader):
+    """
+    A DataLoader whose workers persist across epochs and which prefetches the first mini-batches of the loader of the
+    next phase (see chain_phases()) when its own epoch is about to end.
+
+    Attributes
+    ----------
+    next_phase : PersistentDataLoader or None
+        Loader iterated after this one e.g. the validation loader for the training one
+    """
+
+    def __init__(self, dataset, **kwargs):
+        if kwargs.get('num_workers', 0) > 0:
+            if 'persistent_workers' in inspect.signature(torch.utils.data.DataLoader.__init__).parameters:
+                kwargs['persistent_workers'] = True
+            else:
+                logging.warning('This version of PyTorch does not support persistent workers: '
+                                'workers are re-started every epoch')
+        super(PersistentDataLoader, self).__init__(dataset, **kwargs)
+        self.next_phase = None
+        self._prefetched = None
+
+    def prefetch(self):
+        """Starts the workers on the first mini-batches of the next iteration over this loader"""
+        if self._prefetched is None and self.num_workers > 0:
+            self._prefetched = super(PersistentDataLoader, self).__iter__()
+
+    def __iter__(self):
+        iterator, self._prefetched = self._prefetched, None
+        if iterator is None:
+            iterator = super(PersistentDataLoader, self).__iter__()
+        if self.next_phase is None:
+            return iterator
+        return self._prefetch_next_phase(iterator)
+
+    def _prefetch_next_phase(self, iterator):
+        # The workers are busy with the last mini-batches once the iterator has dispatched all the indexes, which
+        # happens when the number of mini-batches left is the number of mini-batches in flight (2 per worker)
+        ahead = 2 * self.num_workers
+        for remaining, batch in zip(range(len(self) - 1, -1, -1), iterator):
+            if remaining == ahead:
+                self.next_phase.prefetch()
+            yield batch
+        if len(self) <= ahead:
+            self.next_phase.prefetch()
+
+
+def chain_phases(*loaders):
+    """
+    Declares the order in which the loaders are iterated, such that each one prefetches the first mini-batches of
+    the following one. The last loader is followed by the first one (e.g. train -> val -> train -> ...).
+
+    Parameters
+    ----------
+    loaders : PersistentDataLoader
+        The loaders in the order of their phases
+
+    Returns
+    -------
+        None
+    """
+    for loader, next_loader in zip(loaders, loaders[1:] + loaders[:1]):
+        loader.next_phase = next_loader if next_loader is not loader else None
@@ -0,0 +1,124 @@
+"""
+Reduced-precision forward passes (--precision).
+
+With 'bf16' the forward passes of the train and evaluation loops run under torch.autocast with bfloat16, which is much
+faster than float32 for the matmuls and convolutions of recent CPUs (AVX512-BF16/AMX) and GPUs. The outputs are cast
+back to float32, such that the loss (e.g. CrossEntropyLoss with class weights), its gradient and all the metrics are
+computed in full precision. Since bfloat16 has the exponent range of float32, no loss scaling is needed.
+
+To keep track of the cost in accuracy, the evaluators of the test split run the float32 forward pass as well and
+report the difference of their metric (see log_precision_delta()).
+"""
+
+# Utils
+import contextlib
+import logging
+import sys
+
+# Torch
+import torch
+
+PRECISIONS = ['fp32', 'bf16']
+
+
+def check_precision(precision, no_cuda):
+    """Exits with an error if this PyTorch does not support the precision on the selected device"""
+    if precision not in PRECISIONS:
+        logging.error('Unknown precision {}. Options are: {}'.format(precision, ', '.join(PRECISIONS)))
+        sys.exit(-1)
+    if precision == 'fp32':
+        return
+    if not hasattr(torch, 'autocast'):
+        logging.error('Precision {} requires PyTorch 1.10 or newer'.format(precision))
+        sys.exit(-1)
+    if not no_cuda and not torch.cuda.is_bf16_supported():
+        logging.error('Precision {} is not supported by this GPU'.format(precision))
+        sys.exit(-1)
+
+
+def autocast(precision='fp32', no_cuda=False):
+    """
+    Context manager running the forward passes of its block in the given precision.
+
+    Parameters
+    ----------
+    precision : str
+        One of PRECISIONS
+    no_cuda : bool
+        The model runs on the CPU
+
+    Returns
+    -------
+    context manager
+    """
+    if precision == 'fp32':
+        # Nothing to do (and works with the versions of PyTorch without autocast)
+        return contextlib.ExitStack()
+    return torch.autocast(device_type='cpu' if no_cuda else 'cuda', dtype=torch.bfloat16)
+
+
+def forward(model, input, precision='fp32', no_cuda=False):
+    """
+    Computes the output of the model in the given precision and returns it in float32.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The model
+    input : torch.Tensor
+        The input mini-batch
+    precision : str
+        One of PRECISIONS
+    no_cuda : bool
+        The model runs on the CPU
+
+    Returns
+    -------
+    output : torch.Tensor or tuple of torch.Tensor
+        The output(s) of the model, in float32
+    """
+    with autocast(precision, no_cuda):
+        output = model(input)
+    return _to_float(output)
+
+
+def _to_float(output):
+    if isinstance(output, (tuple, list)):
+        return type(output)(_to_float(item) for item in output)
+    if torch.is_tensor(output) and output.is_floating_point() and output.dtype != torch.float32:
+        return output.float()
+    return output
+
+
+def log_precision_delta(writer, logging_label, metric, value, value_fp32, agreement, precision, epoch):
+    """
+    Reports how much a metric evaluated in reduced precision differs from the one in float32, on the console and
+    on Tensorboard ('<logging_label>/<metric>_fp32' and '<logging_label>/<metric>_delta_<precision>').
+
+    Parameters
+    ----------
+    writer : tensorboardX.writer.SummaryWriter
+        The tensorboard writer object
+    logging_label : str
+        Label of the split e.g. 'test'
+    metric : str
+        Name of the metric e.g. 'accuracy'
+    value : float
+        The metric in reduced precision
+    value_fp32 : float
+        The same metric in float32
+    agreement : float
+        Percentage of the predictions which are the same in both precisions
+    precision : str
+        The reduced precision
+    epoch : int
+        Number of the epoch (for logging purposes)
+
+    Returns
+    -------
+        None
+    """
+    logging.info('{} {} in {}={:.3f} in fp32={:.3f} (delta={:+.3f}), predictions agreement={:.2f}%'
+                 .format(logging_label, metric, precision, value, value_fp32, value - value_fp32, agreement))
+    writer.add_scalar('{}/{}_fp32'.format(logging_label, metric), value_fp32, epoch)
+    writer.add_scalar('{}/{}_delta_{}'.format(logging_label, metric, precision), value - value_fp32, epoch)
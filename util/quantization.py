@@ -0,0 +1,282 @@
+"""
+Post-training int8 quantization of a trained model for inference (--quantize).
+
+Two flavours are supported:
+
+- 'dynamic': the weights of the nn.Linear layers are stored in int8 and their activations are quantized on the fly.
+  No calibration is needed. This is what pays off for the fully connected models (FC_*) and the classifier heads.
+- 'static': weights (per-channel) and activations of the whole network are quantized in int8. The ranges of the
+  activations are calibrated on a few mini-batches of the dataset. This is what pays off for the convolutional
+  networks (CNN_basic, resnet*, unet, BabyUnet, SegNet, ...).
+
+'auto' selects 'static' if the model contains convolutions and 'dynamic' otherwise.
+
+The quantized kernels run on the CPU only. Before being used, the quantized model is compared with the float one on
+held-out mini-batches (not used for the calibration): the degradation of the metric of the runner (accuracy or
+meanIU), the agreement of the predictions and the speedup are reported on the console and on Tensorboard. The
+quantized model is then saved as TorchScript in the log folder, such that it can be re-used with --load-quantized.
+"""
+
+# Utils
+import logging
+import os
+import sys
+import time
+
+# Torch
+import torch
+import torch.nn as nn
+
+QUANTIZATION_MODES = ['dynamic', 'static', 'auto']
+QUANTIZED_MODEL_FILENAME = 'model_quantized.pt'
+
+
+def quantize_model(model, mode, calibration_inputs=None):
+    """
+    Returns an int8 quantized copy of the model.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The (float, CPU) model to quantize
+    mode : str
+        One of QUANTIZATION_MODES
+    calibration_inputs : list of torch.Tensor
+        Input mini-batches used to calibrate the ranges of the activations. Only used with the mode 'static'.
+
+    Returns
+    -------
+    quantized_model : torch.nn.Module
+        The quantized model, in eval mode
+    """
+    try:
+        from torch.ao import quantization
+        from torch.ao.quantization import quantize_fx
+    except ImportError:
+        logging.error('Quantization requires PyTorch 1.10 or newer')
+        sys.exit(-1)
+
+    if mode not in QUANTIZATION_MODES:
+        logging.error('Unknown quantization mode {}. Options are: {}'.format(mode, ', '.join(QUANTIZATION_MODES)))
+        sys.exit(-1)
+    if mode == 'auto':
+        mode = 'static' if any(isinstance(m, nn.modules.conv._ConvNd) for m in model.modules()) else 'dynamic'
+    logging.info('Quantizing the model in int8 ({})'.format(mode))
+
+    _set_quantized_engine()
+    model = model.cpu().eval()
+
+    if mode == 'dynamic':
+        return quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    if not calibration_inputs:
+        logging.error('Static quantization requires calibration data')
+        sys.exit(-1)
+    qconfig_mapping = quantization.get_default_qconfig_mapping(torch.backends.quantized.engine)
+    try:
+        prepared = quantize_fx.prepare_fx(model, qconfig_mapping, example_inputs=(calibration_inputs[0],))
+    except Exception as e:
+        logging.error('Model {} can not be statically quantized ({}). Try --quantize dynamic'
+                      .format(type(model).__name__, e))
+        sys.exit(-1)
+    with torch.no_grad():
+        for input in calibration_inputs:
+            prepared(input)
+    quantized_model = quantize_fx.convert_fx(prepared)
+    _replace_view_with_reshape(quantized_model)
+    return quantized_model.eval()
+
+
+def _set_quantized_engine():
+    # Prefer the x86 kernels (per-channel weights) over the mobile ones when available
+    engines = torch.backends.quantized.supported_engines
+    for engine in ['x86', 'fbgemm']:
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return
+
+
+def _replace_view_with_reshape(graph_module):
+    """
+    Quantized convolutions return channels-last tensors, on which the .view() used by the models to flatten the
+    features fails. .reshape() computes the same and copies only when needed.
+    """
+    changed = False
+    for node in graph_module.graph.nodes:
+        if node.op == 'call_method' and node.target == 'view':
+            node.target = 'reshape'
+            changed = True
+    if changed:
+        graph_module.recompile()
+
+
+def compare_models(model, quantized_model, batches, metric, metric_name, writer, logging_label='apply'):
+    """
+    Evaluates the float and the quantized models on the same mini-batches and reports the degradation of the metric,
+    the agreement of their predictions and the speedup, on the console and on Tensorboard
+    ('<logging_label>/<metric_name>_fp32' and '<logging_label>/<metric_name>_delta_int8').
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The float model
+    quantized_model : torch.nn.Module
+        The quantized model
+    batches : list of tuple(torch.Tensor, torch.Tensor)
+        The (input, target) mini-batches. They should not have been used for the calibration.
+    metric : function
+        metric(output, target) -> float of the runner e.g. the accuracy. If None, only the agreement is reported.
+    metric_name : str
+        Name of the metric e.g. 'accuracy'
+    writer : tensorboardX.writer.SummaryWriter
+        The tensorboard writer object
+    logging_label : str
+        Label of the runner e.g. 'apply'
+
+    Returns
+    -------
+    value : float
+        The metric of the quantized model (None if metric is None)
+    value_fp32 : float
+        The metric of the float model (None if metric is None)
+    agreement : float
+        Percentage of the predictions which are the same for both models
+    """
+    outputs, time_fp32 = _run(model, batches)
+    quantized_outputs, time_int8 = _run(quantized_model, batches)
+
+    matching, total = 0, 0
+    for output, quantized_output in zip(outputs, quantized_outputs):
+        matching += (output.argmax(1) == quantized_output.argmax(1)).sum().item()
+        total += output.argmax(1).numel()
+    agreement = 100. * matching / total
+    speedup = time_fp32 / max(time_int8, 1e-9)
+
+    value = value_fp32 = None
+    if metric is not None:
+        targets = [target for _, target in batches]
+        value_fp32 = _mean(metric(output, target) for output, target in zip(outputs, targets))
+        value = _mean(metric(output, target) for output, target in zip(quantized_outputs, targets))
+        logging.info('{} {} in int8={:.3f} in fp32={:.3f} (delta={:+.3f})'
+                     .format(logging_label, metric_name, value, value_fp32, value - value_fp32))
+        writer.add_scalar('{}/{}_fp32'.format(logging_label, metric_name), value_fp32)
+        writer.add_scalar('{}/{}_delta_int8'.format(logging_label, metric_name), value - value_fp32)
+    logging.info('{} int8 predictions agreement={:.2f}%, speedup={:.2f}x ({:.3f}s in fp32, {:.3f}s in int8)'
+                 .format(logging_label, agreement, speedup, time_fp32, time_int8))
+    writer.add_scalar('{}/agreement_int8'.format(logging_label), agreement)
+    writer.add_scalar('{}/speedup_int8'.format(logging_label), speedup)
+    return value, value_fp32, agreement
+
+
+def _run(model, batches):
+    model.eval()
+    outputs = []
+    with torch.no_grad():
+        # Warm up (allocations, TorchScript optimizations)
+        model(batches[0][0])
+        start = time.time()
+        for input, _ in batches:
+            outputs.append(model(input))
+    return outputs, time.time() - start
+
+
+def _mean(values):
+    values = list(values)
+    return float(sum(values)) / len(values)
+
+
+def save_quantized_model(quantized_model, example_input, filename):
+    """
+    Saves the quantized model as TorchScript, which (unlike the state_dict) does not require to re-create and
+    re-calibrate the model to be loaded.
+
+    Parameters
+    ----------
+    quantized_model : torch.nn.Module
+        The quantized model
+    example_input : torch.Tensor
+        An input mini-batch, used to trace the model
+    filename : str
+        Where to save the model
+
+    Returns
+    -------
+        None
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized_model, example_input)
+    torch.jit.save(traced, filename)
+    logging.info('Quantized model saved to {}'.format(filename))
+
+
+def set_up_quantized_model(model, quantize, load_quantized, data_loader, get_batch, metric, metric_name,
+                           current_log_folder, writer, quantize_calibration_batches=10, no_cuda=False,
+                           precision='fp32', **kwargs):
+    """
+    Quantizes the model (or loads an already quantized one) for the apply runners.
+
+    The first `quantize_calibration_batches` mini-batches of the data loader calibrate the model and the following
+    ones (as many) measure the degradation with respect to the float model, see compare_models().
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The float model
+    quantize : str
+        One of QUANTIZATION_MODES or None to keep the float model
+    load_quantized : str
+        Path to a quantized model saved by a previous run. If specified, it replaces the model.
+    data_loader : torch.utils.data.DataLoader
+        The data loader of the runner
+    get_batch : function
+        get_batch(batch) -> (input, target) extracts the input and the target from a mini-batch of the data loader
+    metric : function
+        metric(output, target) -> float, see compare_models()
+    metric_name : str
+        Name of the metric
+    current_log_folder : str
+        Where the quantized model is saved
+    writer : tensorboardX.writer.SummaryWriter
+        The tensorboard writer object
+    quantize_calibration_batches : int
+        Number of mini-batches to calibrate the model
+    no_cuda : bool
+        The model runs on the CPU
+    precision : str
+        Precision of the forward passes, see util.precision
+
+    Returns
+    -------
+    model : torch.nn.Module
+        The quantized model or the unchanged model if neither quantize nor load_quantized are specified
+    """
+    if quantize is None and load_quantized is None:
+        return model
+    if not no_cuda:
+        logging.error('Quantized models run on the CPU only. Use --no-cuda')
+        sys.exit(-1)
+    if precision != 'fp32':
+        logging.error('Quantized models can not be run in precision {}'.format(precision))
+        sys.exit(-1)
+
+    if load_quantized is not None:
+        if not os.path.isfile(load_quantized):
+            logging.error("No quantized model found at '{}'".format(load_quantized))
+            sys.exit(-1)
+        logging.info('Loading quantized model from {}'.format(load_quantized))
+        _set_quantized_engine()
+        return torch.jit.load(load_quantized).eval()
+
+    batches = []
+    for batch in data_loader:
+        batches.append(get_batch(batch))
+        if len(batches) == 2 * quantize_calibration_batches:
+            break
+    calibration_batches = batches[:quantize_calibration_batches]
+    # Small datasets: better to evaluate on the calibration data than not at all
+    evaluation_batches = batches[quantize_calibration_batches:] or calibration_batches
+
+    quantized_model = quantize_model(model, quantize, [input for input, _ in calibration_batches])
+    compare_models(model, quantized_model, evaluation_batches, metric, metric_name, writer)
+    save_quantized_model(quantized_model, batches[0][0], os.path.join(current_log_folder, QUANTIZED_MODEL_FILENAME))
+    return quantized_model
@@ -0,0 +1,63 @@
+import os
+import stat
+
+import pytest
+import torch
+
+from util.atomic_file import atomic_link, atomic_write
+from util.misc import CheckpointWriter
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def _open_mode():
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def test_atomic_write_mode(tmp_path):
+    path = str(tmp_path / 'file.json')
+    with atomic_write(path, 'w') as f:
+        f.write('content')
+
+    with open(path) as f:
+        assert f.read() == 'content'
+    # Same permissions as a file created by open(), not the 0o600 of mkstemp()
+    assert _mode(path) == _open_mode()
+    assert os.listdir(str(tmp_path)) == ['file.json']
+
+
+def test_atomic_write_failure(tmp_path):
+    path = str(tmp_path / 'file.txt')
+    with open(path, 'w') as f:
+        f.write('old')
+
+    with pytest.raises(ValueError):
+        with atomic_write(path, 'w') as f:
+            f.write('new')
+            raise ValueError()
+
+    with open(path) as f:
+        assert f.read() == 'old'
+    assert os.listdir(str(tmp_path)) == ['file.txt']
+
+
+def test_checkpoint_mode(tmp_path):
+    filename = str(tmp_path / 'checkpoint.pth.tar')
+    CheckpointWriter._write({'weights': torch.ones(3)}, filename, is_best=True, keep_last=None)
+
+    best = str(tmp_path / 'model_best.pth.tar')
+    assert torch.equal(torch.load(best)['weights'], torch.ones(3))
+    assert _mode(filename) == _mode(best) == _open_mode()
+    assert sorted(os.listdir(str(tmp_path))) == ['checkpoint.pth.tar', 'model_best.pth.tar']
+
+
+def test_atomic_link(tmp_path):
+    src = str(tmp_path / 'src')
+    with open(src, 'w') as f:
+        f.write('content')
+    atomic_link(src, str(tmp_path / 'dst'))
+    assert os.path.samefile(src, str(tmp_path / 'dst'))
@@ -0,0 +1,63 @@
+import threading
+
+import numpy as np
+
+from util.buffered_writer import BufferedSummaryWriter
+
+
+class _RecordingWriter(object):
+    # Records the calls as a SummaryWriter would write them
+    def __init__(self):
+        self.scalars = []
+        self.images = []
+        self.closed = False
+
+    def add_scalar(self, tag, scalar_value, global_step=None):
+        self.scalars.append((tag, scalar_value, global_step))
+
+    def add_image(self, tag, img_tensor, global_step=None):
+        self.images.append((tag, img_tensor, global_step))
+
+    def wait(self, event):
+        event.wait()
+
+    def close(self):
+        self.closed = True
+
+
+def test_mini_batch_buckets():
+    writer = _RecordingWriter()
+    buffered = BufferedSummaryWriter(writer, mb_resolution=4)
+    for step in range(10):
+        buffered.add_scalar('train/mb_loss', step * 2, step)
+    buffered.add_scalar('train/loss', 1.5, 0)
+    buffered.flush()
+
+    # The steps 0-3 and 4-7 are summarized, the values of the steps 8 and 9 are kept until close()
+    assert writer.scalars == [('train/mb_loss', 3.0, 0), ('train/mb_loss_min', 0.0, 0), ('train/mb_loss_max', 6.0, 0),
+                              ('train/mb_loss', 11.0, 4), ('train/mb_loss_min', 8.0, 4),
+                              ('train/mb_loss_max', 14.0, 4),
+                              ('train/loss', 1.5, 0)]
+    assert not writer.closed
+
+    buffered.close()
+    assert writer.scalars[7:] == [('train/mb_loss', 17.0, 8), ('train/mb_loss_min', 16.0, 8),
+                                  ('train/mb_loss_max', 18.0, 8)]
+    assert writer.closed
+
+
+def test_arrays_are_copied():
+    writer = _RecordingWriter()
+    buffered = BufferedSummaryWriter(writer)
+    # The background thread is blocked until the caller has modified its buffer
+    event = threading.Event()
+    buffered.wait(event)
+    image = np.zeros((3, 4, 4))
+    buffered.add_image('image', image, 0)
+    buffered.add_image('image', img_tensor=image, global_step=1)
+    image[:] = 1
+    event.set()
+    buffered.close()
+
+    assert [(tag, step) for tag, _, step in writer.images] == [('image', 0), ('image', 1)]
+    assert all((img == 0).all() for _, img, _ in writer.images)
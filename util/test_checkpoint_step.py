@@ -0,0 +1,83 @@
+import os
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.utils.data as data
+
+from util.misc import AverageMeter, checkpoint_step, get_rng_state, load_train_state, set_rng_state, \
+    wait_for_checkpoints
+
+NUM_BATCHES = 10
+
+
+def _set_up(seed):
+    torch.manual_seed(seed)
+    # Dropout and shuffling: the result depends on the state of the random number generators
+    model = nn.Sequential(nn.Linear(4, 8), nn.Dropout(0.5), nn.Linear(8, 3))
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+    generator = torch.Generator().manual_seed(0)
+    dataset = data.TensorDataset(torch.randn(4 * NUM_BATCHES, 4, generator=generator),
+                                 torch.randint(0, 3, (4 * NUM_BATCHES,), generator=generator))
+    return model, optimizer, data.DataLoader(dataset, batch_size=4, shuffle=True)
+
+
+def _train(model, optimizer, loader, log_dir=None, checkpoint_interval=None, train_state=None, killed_at=None):
+    # The epoch as replayed by template/runner/semantic_segmentation_hisdb/train.py
+    meters = {'loss_meter': AverageMeter()}
+    if train_state is None:
+        start_batch_idx = 0
+        train_state = {'rng_state': get_rng_state()}
+    else:
+        start_batch_idx = train_state['batch_idx']
+        set_rng_state(train_state['rng_state'])
+        for name, meter in meters.items():
+            meter.load_state_dict(train_state['meters'][name])
+
+    for batch_idx, (input, target) in enumerate(loader):
+        if batch_idx < start_batch_idx:
+            if batch_idx == start_batch_idx - 1:
+                set_rng_state(train_state['step_rng_state'])
+            continue
+        if batch_idx == killed_at:
+            return None
+
+        loss = F.cross_entropy(model(input), target)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        meters['loss_meter'].update(loss.item(), input.size(0))
+
+        if checkpoint_interval and (batch_idx + 1) % checkpoint_interval == 0 and batch_idx + 1 < len(loader):
+            checkpoint_step(epoch=0, batch_idx=batch_idx + 1, best_value=0.0, model=model, optimizer=optimizer,
+                            log_dir=log_dir, train_state=dict(train_state, meters={name: meter.state_dict()
+                                                                                   for name, meter in meters.items()}))
+    return meters
+
+
+def test_resume_at_mini_batch(tmp_path):
+    model, optimizer, loader = _set_up(seed=1)
+    meters = _train(model, optimizer, loader)
+
+    # Killed after mini-batch 7, the last checkpoint being made after mini-batch 6
+    log_dir = str(tmp_path)
+    _train(*_set_up(seed=1), log_dir=log_dir, checkpoint_interval=3, killed_at=7)
+    wait_for_checkpoints()
+    assert os.listdir(log_dir) == ['checkpoint_step.pth.tar']
+
+    # Resumed in a new process: different initialization and random state, restored from the checkpoint
+    resume = os.path.join(log_dir, 'checkpoint_step.pth.tar')
+    resumed_model, resumed_optimizer, loader = _set_up(seed=2)
+    checkpoint = torch.load(resume)
+    assert checkpoint['epoch'] == 0
+    resumed_model.load_state_dict(checkpoint['state_dict'])
+    resumed_optimizer.load_state_dict(checkpoint['optimizer'])
+    train_state = load_train_state(resume)
+    assert train_state['batch_idx'] == 6
+    resumed_meters = _train(resumed_model, resumed_optimizer, loader, train_state=train_state)
+
+    # Bit-identical to the uninterrupted run
+    for name, value in model.state_dict().items():
+        assert torch.equal(resumed_model.state_dict()[name], value)
+    for name, meter in meters.items():
+        assert resumed_meters[name].state_dict() == meter.state_dict()
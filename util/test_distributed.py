@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+
+import numpy as np
+import torch.multiprocessing as mp
+from PIL import Image
+
+from datasets.image_folder_segmentation_hisdb import ImageFolder
+from util import distributed
+from util.misc import AverageMeter
+
+WORLD_SIZE = 2
+
+
+def _make_split(folder, num_pages):
+    for name in ['data', 'gt']:
+        os.makedirs(os.path.join(folder, name))
+    for i in range(num_pages):
+        for name in ['data', 'gt']:
+            Image.new('RGB', (20 + i, 30)).save(os.path.join(folder, name, 'page{}.png'.format(i)))
+
+
+def _worker(rank, folder, port):
+    os.environ.update(RANK=str(rank), WORLD_SIZE=str(WORLD_SIZE), MASTER_ADDR='127.0.0.1', MASTER_PORT=str(port))
+    distributed.init_distributed()
+
+    # Rank 0 has seen the values 1 and 1, rank 1 the value 4
+    meter = AverageMeter()
+    for value in [[1.0, 1.0], [4.0]][rank]:
+        meter.update(value)
+    distributed.all_reduce_meter(meter)
+
+    array = distributed.all_reduce_array(np.array([[rank, 1], [2, 3 * rank]], dtype=np.int64))
+    gathered = distributed.all_gather_list([rank] * (rank + 1))
+
+    pages = {}
+    for split in ['train', 'test']:
+        dataset = ImageFolder(os.path.join(folder, split), gt_to_one_hot=None, num_classes=4, imgs_in_memory=3,
+                              crop_size=10)
+        assert distributed.distributed_sampler(dataset, shuffle=True) is None
+        pages[split] = [os.path.basename(img) for img, _ in dataset.imgs]
+        if split == 'test':
+            # The pages are 20 + i pixels wide
+            pages['test_widths'] = dataset.geometry.sizes[:, 0].tolist()
+
+    with open(os.path.join(folder, '{}.json'.format(rank)), 'w') as f:
+        json.dump({'meter': [meter.sum, meter.count, meter.avg], 'array': array.tolist(), 'dtype': str(array.dtype),
+                   'gathered': gathered, 'pages': pages}, f)
+    distributed.barrier()
+
+
+def test_distributed():
+    # The test split of the HisDB datasets is recognized by its path, which must not contain 'test' otherwise
+    folder = tempfile.mkdtemp(prefix='hisdb_')
+    _make_split(os.path.join(folder, 'train'), 5)
+    _make_split(os.path.join(folder, 'test'), 3)
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    mp.spawn(_worker, args=(folder, port), nprocs=WORLD_SIZE)
+
+    results = []
+    for rank in range(WORLD_SIZE):
+        with open(os.path.join(folder, '{}.json'.format(rank))) as f:
+            results.append(json.load(f))
+    shutil.rmtree(folder)
+    for result in results:
+        assert result['meter'] == [6.0, 3.0, 2.0]
+        assert result['array'] == [[1, 2], [4, 3]]
+        assert result['dtype'] == 'int64'
+        assert result['gathered'] == [0, 1, 1]
+
+    # The train pages are dealt round-robin, at least imgs_in_memory per process
+    assert results[0]['pages']['train'] == ['page0.png', 'page2.png', 'page4.png']
+    assert results[1]['pages']['train'] == ['page1.png', 'page3.png', 'page0.png']
+    # The test pages are split without overlap
+    assert results[0]['pages']['test'] == ['page0.png', 'page2.png']
+    assert results[1]['pages']['test'] == ['page1.png']
+    # The geometry of the test pages is sharded as well
+    assert results[0]['pages']['test_widths'] == [20, 22]
+    assert results[1]['pages']['test_widths'] == [21]
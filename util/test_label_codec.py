@@ -0,0 +1,75 @@
+import numpy as np
+import torch
+
+from util.label_codec import LabelCodec, multi_hot_decode, multi_hot_encode
+from util.misc import int_to_one_hot, multi_label_img_to_multi_hot, multi_one_hot_to_output
+
+
+def _string_multi_label_img_to_multi_hot(np_array):
+    # The former implementation of multi_label_img_to_multi_hot(), with a string per pixel
+    im_np = np_array[:, :, 2].astype(np.int8)
+    nb_classes = len(int_to_one_hot(im_np.max(), ''))
+    class_dict = {x: int_to_one_hot(x, nb_classes) for x in np.unique(im_np)}
+    one_hot_matrix = np.asanyarray([[class_dict[im_np[i, j]] for j in range(im_np.shape[1])]
+                                    for i in range(im_np.shape[0])])
+    return np.rollaxis(one_hot_matrix.astype(np.uint8), 2, 0)
+
+
+def _string_multi_one_hot_to_output(matrix):
+    # The former implementation of multi_one_hot_to_output(), with a string per pixel
+    matrix = np.rollaxis(np.char.mod('%d', matrix.numpy()), 0, 3)
+    zeros = (32 - matrix.shape[2]) * '0'
+    B = np.array([[int('{}{}'.format(zeros, ''.join(matrix[i][j])), 2) for j in range(matrix.shape[1])]
+                  for i in range(matrix.shape[0])])
+    return np.dstack((np.zeros(shape=(matrix.shape[0], matrix.shape[1], 2), dtype=np.int8), B))
+
+
+def _gt_image(blue):
+    img = np.zeros(blue.shape + (3,), dtype=np.uint8)
+    img[:, :, 2] = blue
+    return img
+
+
+def test_multi_hot_encode_decode():
+    values = np.array([[0, 1, 6], [9, 14, 15]])
+    encoded = multi_hot_encode(values, 4)
+    assert encoded.shape == (4, 2, 3)
+    assert encoded[:, 0, 2].tolist() == [0, 1, 1, 0]
+    assert encoded[:, 1, 0].tolist() == [1, 0, 0, 1]
+    assert (multi_hot_decode(encoded) == values).all()
+
+
+def test_round_trip_against_string_implementation():
+    for max_value in [1, 6, 14, 127]:
+        blue = np.random.RandomState(max_value).randint(0, max_value + 1, size=(5, 7))
+        blue[0, 0] = max_value
+        img = _gt_image(blue)
+
+        multi_hot = multi_label_img_to_multi_hot(img)
+        assert (multi_hot == _string_multi_label_img_to_multi_hot(img)).all()
+
+        output = multi_one_hot_to_output(torch.from_numpy(multi_hot))
+        assert (output == _string_multi_one_hot_to_output(torch.from_numpy(multi_hot))).all()
+        assert (output[:, :, 2] == blue).all()
+
+
+def test_codec_multi_hot():
+    codec = LabelCodec(gt_codes=[1, 2, 4, 8])
+    img = _gt_image(np.array([[1, 2, 6], [0, 14, 8]]))
+    # The boundary pixels are background
+    img[1, 2, 0] = 128
+
+    multi_hot = codec.gt_to_multi_hot(img)
+    assert multi_hot.shape == (4, 2, 3)
+    assert multi_hot[:, 0, 2].tolist() == [0, 1, 1, 0]
+    assert multi_hot[:, 1, 0].tolist() == [1, 0, 0, 0]
+    assert multi_hot[:, 1, 1].tolist() == [0, 1, 1, 1]
+    assert multi_hot[:, 1, 2].tolist() == [1, 0, 0, 0]
+
+    # Same from the tensor of to_tensor()
+    tensor = torch.from_numpy(np.rollaxis(img, 2, 0).astype(np.float32) / 255)
+    assert torch.equal(codec.gt_to_multi_hot(tensor), multi_hot)
+
+    bgr = codec.multi_hot_to_np_bgr(multi_hot.numpy() * 0.8)
+    assert bgr[:, :, 0].tolist() == [[1, 2, 6], [1, 14, 1]]
+    assert (bgr[:, :, 1:] == 0).all()
@@ -0,0 +1,38 @@
+import pytest
+import torch
+import torch.utils.data as data
+
+from util.persistent_loader import PersistentDataLoader, chain_phases
+
+
+def _loader(size, num_workers, shuffle=False):
+    return PersistentDataLoader(data.TensorDataset(torch.arange(size)), batch_size=2, shuffle=shuffle,
+                                num_workers=num_workers)
+
+
+def _epoch(loader):
+    return [int(value) for batch, in loader for value in batch]
+
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+@pytest.mark.parametrize('val_size', [2, 7, 20])
+def test_chain_phases(num_workers, val_size):
+    # With 2 workers the next phase is prefetched 4 mini-batches before the end, or at the end of short phases
+    train_loader, val_loader = _loader(21, num_workers, shuffle=True), _loader(val_size, num_workers)
+    chain_phases(train_loader, val_loader)
+    assert train_loader.next_phase is val_loader and val_loader.next_phase is train_loader
+
+    for epoch in range(3):
+        train_values = _epoch(train_loader)
+        # The first mini-batches of the validation are in flight, they come back first, in order and only once
+        assert (val_loader._prefetched is not None) == (num_workers > 0)
+        assert sorted(train_values) == list(range(21))
+        assert _epoch(val_loader) == list(range(val_size))
+        assert (train_loader._prefetched is not None) == (num_workers > 0)
+
+
+def test_single_phase():
+    loader = _loader(5, num_workers=2)
+    chain_phases(loader)
+    assert loader.next_phase is None
+    assert _epoch(loader) == _epoch(loader) == list(range(5))
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+import torch
+
+import models
+from util.distributed import NullSummaryWriter
+from util.quantization import quantize_model, set_up_quantized_model
+
+
+def _batches(model_name, num_batches=4):
+    generator = torch.Generator().manual_seed(0)
+    size = models.get_metadata(model_name).expected_input_size
+    shape = (8, size) if isinstance(size, int) else (8, 3) + size
+    return [(torch.rand(shape, generator=generator), torch.randint(0, 3, (8,), generator=generator))
+            for _ in range(num_batches)]
+
+
+@pytest.mark.parametrize('model_name, quantized_module', [('CNN_basic', torch.ao.nn.quantized.Conv2d),
+                                                          ('FC_simple', torch.ao.nn.quantized.dynamic.Linear)])
+def test_quantize_auto(model_name, quantized_module):
+    torch.manual_seed(0)
+    model = models.get_model(model_name)(output_channels=3).eval()
+    batches = _batches(model_name)
+
+    # Convolutional models are quantized statically, the fully connected ones dynamically
+    quantized_model = quantize_model(model, 'auto', [input for input, _ in batches])
+    assert any(isinstance(m, quantized_module) for m in quantized_model.modules())
+
+    with torch.no_grad():
+        for input, _ in batches:
+            output, quantized_output = model(input), quantized_model(input)
+            assert quantized_output.shape == output.shape
+            assert torch.allclose(quantized_output, output, atol=0.1 * output.abs().max().item())
+
+
+@pytest.mark.parametrize('model_name', ['CNN_basic', 'FC_simple'])
+def test_torchscript_round_trip(tmp_path, model_name):
+    torch.manual_seed(0)
+    model = models.get_model(model_name)(output_channels=3).eval()
+    batches = _batches(model_name)
+    get_batch = lambda batch: batch
+
+    quantized_model = set_up_quantized_model(model, 'auto', None, batches, get_batch, None, 'accuracy',
+                                             str(tmp_path), NullSummaryWriter(), quantize_calibration_batches=2,
+                                             no_cuda=True)
+    filename = os.path.join(str(tmp_path), 'model_quantized.pt')
+    assert os.path.isfile(filename)
+
+    # The reloaded model (--load-quantized) computes the same as the quantized one
+    loaded_model = set_up_quantized_model(model, None, filename, batches, get_batch, None, 'accuracy',
+                                          str(tmp_path), NullSummaryWriter(), no_cuda=True)
+    with torch.no_grad():
+        for input, _ in batches:
+            assert torch.equal(loaded_model(input), quantized_model(input))
+
@@ -0,0 +1,29 @@
+"""
+Visualization utilities.
+
+The plots logged during training are rendered with the lightweight renderer in util.visualization.raster.
+Matplotlib is used only if requested with use_matplotlib() (--matplotlib-plots), e.g. for high quality exports.
+"""
+
+_USE_MATPLOTLIB = False
+
+
+def use_matplotlib(enabled=True):
+    """
+    Selects the renderer of make_heatmap() and plot_mean_std().
+
+    Parameters
+    ----------
+    enabled : bool
+        If True, the plots are rendered with matplotlib (slow, high quality) instead of the raster renderer.
+
+    Returns
+    -------
+        None
+    """
+    global _USE_MATPLOTLIB
+    _USE_MATPLOTLIB = enabled
+
+
+def matplotlib_enabled():
+    return _USE_MATPLOTLIB
@@ -1,14 +1,10 @@
-import matplotlib as mpl
-# To facilitate plotting on a headless server
-mpl.use('Agg')
-
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
-import pandas as pd
+
+from util.visualization import matplotlib_enabled
+from util.visualization.raster import render_heatmap
 
 
-def make_heatmap(confusion_matrix, class_names):
+def make_heatmap(confusion_matrix, class_names, high_quality=None):
     """
     This function prints and plots the confusion matrix.
 
@@ -17,15 +13,32 @@ def make_heatmap(confusion_matrix, class_names):
     Parameters
     ----------
     confusion_matrix : numpy.ndarray
-        Array containing the confusion matrix to be plotted
+        Array containing the confusion matrix to be plotted
     class_names: list of strings
         Names of the different classes
+    high_quality : bool or None
+        Plot with seaborn/matplotlib instead of the raster renderer. By default (None) matplotlib is used only if
+        enabled with util.visualization.use_matplotlib()
 
     Returns
     -------
     data : numpy.ndarray
         Contains an RGB image of the plotted confusion matrix
     """
+    if not np.issubdtype(np.asarray(confusion_matrix).dtype, np.integer):
+        raise ValueError("Confusion matrix values must be integers.")
+
+    if high_quality is None:
+        high_quality = matplotlib_enabled()
+    if not high_quality:
+        return render_heatmap(confusion_matrix, class_names)
+
+    import matplotlib as mpl
+    # To facilitate plotting on a headless server
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import pandas as pd
 
     df_cm = pd.DataFrame(
         confusion_matrix, index=class_names, columns=class_names,
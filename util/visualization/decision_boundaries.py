@@ -5,6 +5,77 @@ import matplotlib.pyplot as plt
 import numpy as np
 from util.misc import save_image_and_log_to_tensorboard
 
+# Color of each class: for its points and for the colormap of the confidence of the network in it
+COLORS = ['blue', 'orange', 'green', 'red', 'purple']
+COLORS_POINTS = {'blue': '#000099',
+                 'orange': '#e68a00',
+                 'red': '#b30000',
+                 'green': '#009900',
+                 'purple': '#7300e6'}
+COLORMAPS = {'blue': 'Blues',
+             'orange': 'Oranges',
+             'red': 'Reds',
+             'green': 'Greens',
+             'purple': 'Purples'}
+
+
+def _colormap_luts(alpha=0.9, levels=256):
+    """
+    Look-up tables [len(COLORS) x levels x 3] of the RGB colors of the colormaps of the classes, blended with alpha
+    over the white background of the plot
+    """
+    luts = np.stack([plt.get_cmap(COLORMAPS[color])(np.linspace(0, 1, levels))[:, :3] for color in COLORS])
+    return np.round((alpha * luts + (1 - alpha)) * 255).astype(np.uint8)
+
+
+_COLORMAP_LUTS = _colormap_luts()
+
+
+def decision_boundary_image(output_winners, output_confidence, grid_shape):
+    """
+    Renders the confidence of the network in its winning class at each location of the grid as an RGB image, with
+    the colormap of the class.
+
+    As imshow() does for each class, the confidences of a class are scaled between their min and max. The colors
+    are blended into the image with look-up tables, in a few passes over the grid whatever its resolution.
+
+    Parameters
+    ----------
+    output_winners: numpy.ndarray
+        which class is the 'winner' of the network at each location, in the order of the points of the grid
+        (x-major)
+    output_confidence: numpy.ndarray
+        confidence value of the network for the 'winner' class
+    grid_shape: tuple
+        number of locations of the grid along (x, y)
+
+    Returns
+    -------
+    numpy.ndarray [grid_shape[1] x grid_shape[0] x 3]
+        The image (uint8), the first row being the highest y
+    """
+    # Quantize the confidences (in [0, 1]) finely: each point is then a key (class, bin) and the scaling of each
+    # class becomes a look-up too
+    bins = 2 ** 16
+    winners = np.asarray(output_winners, dtype=np.int64).ravel()
+    confidence = np.asarray(output_confidence, dtype=np.float32).ravel()
+    keys = winners * bins + np.clip((confidence * (bins - 1)).astype(np.int64), 0, bins - 1)
+
+    # For each class, the color of each bin, scaling the bins between the lowest and the highest used one
+    num_levels = _COLORMAP_LUTS.shape[1]
+    histogram = np.bincount(keys, minlength=len(COLORS) * bins).reshape(-1, bins)
+    colors = np.zeros(histogram.shape, dtype=np.int64)
+    for i in np.flatnonzero(histogram.any(axis=1)):
+        used = np.flatnonzero(histogram[i])
+        scaled = (np.arange(bins) - used[0]) / ((used[-1] - used[0]) or 1)
+        # Same quantization as the colormaps of matplotlib
+        colors[i] = i * num_levels + np.clip((scaled * num_levels).astype(np.int64), 0, num_levels - 1)
+
+    # Rows of the image along y (highest first) and columns along x
+    keys = keys.reshape(grid_shape)[:, ::-1].T
+    return _COLORMAP_LUTS.reshape(-1, 3).take(colors.ravel().take(keys), axis=0)
+
+
 def plot_decision_boundaries(output_winners, output_confidence, grid_x, grid_y, point_x, point_y,
                              point_class, num_classes, step, writer, epochs, **kwargs):
     """
@@ -17,7 +88,8 @@ def plot_decision_boundaries(output_winners, output_confidence, grid_x, grid_y,
     output_confidence: numpy.ndarray
         confidence value of the network for the 'winner' class
     grid_x: numpy.ndarray
-        X axis locations of the decision grid
+        X axis locations of the decision grid, of shape (number along x, number along y) i.e. indexed like
+        np.meshgrid(..., indexing='ij')
     grid_y: numpy.ndarray
         Y axis locations of the decision grid
     point_x: numpy.ndarray
@@ -49,38 +121,21 @@ def plot_decision_boundaries(output_winners, output_confidence, grid_x, grid_y,
     fig = plt.figure(1)
     axs = plt.gca()
 
-    colors = ['blue', 'orange', 'green', 'red', 'purple']
-    colors_points = {'blue': '#000099',
-                     'orange': '#e68a00',
-                     'red': '#b30000',
-                     'green': '#009900',
-                     'purple': '#7300e6'}
-    colors_contour = {'blue': plt.get_cmap('Blues'),
-                      'orange': plt.get_cmap('Oranges'),
-                      'red': plt.get_cmap('Reds'),
-                      'green': plt.get_cmap('Greens'),
-                      'purple': plt.get_cmap('Purples')}
-
-    for i in np.unique(output_winners):
-        locs = np.where(output_winners == i)
-        tmp = np.zeros(output_confidence.shape)
-        tmp[:] = np.NaN
-        tmp[locs[0]] = output_confidence[locs[0]]
-        grid_vals = np.flip(tmp.reshape(grid_x.shape), 1).T
-        axs.imshow(grid_vals, extent=(np.min(grid_x), np.max(grid_x), np.min(grid_y), np.max(grid_y)),
-                   cmap=colors_contour[colors[i]], alpha=0.9)
+    # Draw the decision boundaries, all the classes at once
+    axs.imshow(decision_boundary_image(output_winners, output_confidence, grid_x.shape),
+               extent=(np.min(grid_x), np.max(grid_x), np.min(grid_y), np.max(grid_y)))
 
     # Draw all the points
     for i in range(1, num_classes + 1):
         locs = np.where(point_class == i)
-        axs.scatter(point_x[locs], point_y[locs], c=colors_points[colors[i - 1]], edgecolor='w', lw=0.75)
+        axs.scatter(point_x[locs], point_y[locs], c=COLORS_POINTS[COLORS[i - 1]], edgecolor='w', lw=0.75)
 
     # Draw image
     fig.canvas.draw()
 
     # Get image
-    data = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8, sep='')
-    data = data.reshape(fig.canvas.get_width_height()[::-1] + (3,))
+    width, height = fig.canvas.get_width_height()
+    data = np.frombuffer(fig.canvas.buffer_rgba(), dtype=np.uint8).reshape(height, width, 4)[:, :, :3].copy()
 
     overview_epochs = [-1, 0]
     if epochs > 10:
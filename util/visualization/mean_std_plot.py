@@ -1,12 +1,11 @@
-import matplotlib as mpl
-# To facilitate plotting on a headless server
-mpl.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 
+from util.visualization import matplotlib_enabled
+from util.visualization.raster import render_line_plot
 
-def plot_mean_std(x=None, arr=None, suptitle='', title='', xlabel='X', ylabel='Y', xlim=None, ylim=None):
+
+def plot_mean_std(x=None, arr=None, suptitle='', title='', xlabel='X', ylabel='Y', xlim=None, ylim=None,
+                  high_quality=None):
     """
     Plots the accuracy/loss curve over several runs with standard deviation and mean.
     Parameters
@@ -27,17 +26,38 @@ def plot_mean_std(x=None, arr=None, suptitle='', title='', xlabel='X', ylabel='Y
         optionally specify a upper limit on the x-axis
     ylim: float or None
         optionally specify a upper limit on the y-axis
+    high_quality : bool or None
+        Plot with seaborn/matplotlib instead of the raster renderer. By default (None) matplotlib is used only if
+        enabled with util.visualization.use_matplotlib()
 
     Returns
     -------
     data: numpy.ndarray
         Contains an RGB image of the plotted accuracy curves
     """
-    fig = plt.figure(1)
     arr_mean = np.mean(arr, 0)
     arr_std = np.std(arr, 0)
     arr_min = np.min(arr, 0)
     arr_max = np.max(arr, 0)
+
+    if high_quality is None:
+        high_quality = matplotlib_enabled()
+    if not high_quality:
+        ticks = np.arange(len(arr_mean)) if x is None else np.asarray(x)
+        curves = [dict(x=ticks, y=arr_mean, colour=(0, 0, 179), label='Score'),
+                  dict(x=ticks, y=arr_min, colour=(77, 77, 255), dashed=True, label='Min'),
+                  dict(x=ticks, y=arr_max, colour=(77, 77, 255), dashed=True, label='Max')]
+        fills = [dict(x=ticks, y_low=arr_mean - arr_std, y_high=arr_mean + arr_std, colour=(153, 153, 255), alpha=0.2)]
+        return render_line_plot(curves, fills, suptitle=suptitle, title=title, xlabel=xlabel, ylabel=ylabel,
+                                xlim=xlim, ylim=ylim)
+
+    import matplotlib as mpl
+    # To facilitate plotting on a headless server
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig = plt.figure(1)
     with sns.axes_style('darkgrid'):
         fig.suptitle(suptitle)
         plt.title(title)
@@ -0,0 +1,287 @@
+"""
+Lightweight raster renderer for the plots logged during training (confusion matrices, curves).
+
+The images are drawn directly into NumPy arrays with OpenCV primitives, which takes a few milliseconds instead of the
+hundreds of milliseconds needed to set up, draw and rasterize a matplotlib figure. The output arrays are RGB images
+[H x W x 3] of type uint8, ready for save_image_and_log_to_tensorboard().
+"""
+
+# Utils
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+WHITE = (255, 255, 255)
+# Colours in the style of seaborn 'darkgrid'
+AXES_BACKGROUND = (234, 234, 242)
+TEXT_COLOUR = (38, 38, 38)
+
+# Anchors of the 'Blues' colormap (colorbrewer), from the lowest to the highest value
+_BLUES = [(247, 251, 255), (222, 235, 247), (198, 219, 239), (158, 202, 225), (107, 174, 214),
+          (66, 146, 198), (33, 113, 181), (8, 81, 156), (8, 48, 107)]
+
+
+def colormap_lut(anchors=_BLUES):
+    """
+    Interpolates the anchors of a colormap into a look-up table of 256 colours.
+
+    Parameters
+    ----------
+    anchors : list of tuple(int,int,int)
+        Colours (RGB) of the colormap equally spaced from the lowest to the highest value
+
+    Returns
+    -------
+    lut : numpy.ndarray [256 x 3]
+        Colour (RGB) of each of the 256 levels
+    """
+    anchors = np.array(anchors, dtype=np.float64)
+    positions = np.linspace(0, 255, len(anchors))
+    levels = np.arange(256)
+    lut = np.stack([np.interp(levels, positions, anchors[:, c]) for c in range(3)], axis=1)
+    return np.round(lut).astype(np.uint8)
+
+
+def render_heatmap(matrix, class_names, annotate=None, size=640):
+    """
+    Renders a matrix (e.g. a confusion matrix) as a heatmap with the values written in the cells.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray [N x M]
+        Values to be plotted
+    class_names : list of strings
+        Names of the rows/columns
+    annotate : bool or None
+        Write the values in the cells. By default (None) the values are written if they fit into the cells.
+    size : int
+        Approximate size in pixels of the side of the heatmap
+
+    Returns
+    -------
+    data : numpy.ndarray [H x W x 3]
+        RGB image of the heatmap
+    """
+    matrix = np.asarray(matrix)
+    rows, cols = matrix.shape
+    cell = int(np.clip(size // max(rows, cols), 1, 64))
+
+    # Cells: one look-up in the colormap, then each value is repeated on a cell x cell block
+    low, high = float(matrix.min()), float(matrix.max())
+    levels = np.zeros(matrix.shape, dtype=np.uint8) if high == low else \
+        np.round((matrix - low) / (high - low) * 255).astype(np.uint8)
+    lut = colormap_lut()
+    cells = np.ascontiguousarray(np.repeat(np.repeat(lut[levels], cell, axis=0), cell, axis=1))
+
+    # Values, in white on the dark cells and in black on the light ones
+    values = [['{:d}'.format(int(v)) if float(v).is_integer() else '{:.2f}'.format(v) for v in row] for row in matrix]
+    font_scale = min(0.5, cell / 60.0)
+    if annotate is None:
+        widest = max(cv2.getTextSize(v, FONT, font_scale, 1)[0][0] for row in values for v in row) if matrix.size else 0
+        annotate = matrix.size <= 10000 and cell >= 16 and widest <= cell - 4
+    if annotate:
+        for i in range(rows):
+            for j in range(cols):
+                (w, h), _ = cv2.getTextSize(values[i][j], FONT, font_scale, 1)
+                colour = WHITE if levels[i, j] > 127 else TEXT_COLOUR
+                cv2.putText(cells, values[i][j], (j * cell + (cell - w) // 2, i * cell + (cell + h) // 2),
+                            FONT, font_scale, colour, 1, cv2.LINE_AA)
+
+    # Class names on the left (rows) and below (columns, rotated) if there is enough space to read them
+    label_scale = 0.45
+    if cell >= 10:
+        class_names = [str(c) for c in class_names]
+        row_labels = _text_column(class_names[:rows], cell, label_scale, align_right=True)
+        col_labels = np.rot90(_text_column(class_names[:cols], cell, label_scale, align_right=True), k=1)
+    else:
+        row_labels = np.full((rows * cell, 5, 3), 255, dtype=np.uint8)
+        col_labels = np.full((5, cols * cell, 3), 255, dtype=np.uint8)
+
+    # Color bar on the right
+    bar = np.repeat(lut[np.linspace(255, 0, rows * cell).astype(np.uint8)][:, None], 15, axis=1)
+    bar_labels = _text_column([_format_number(high)] + [''] * (rows - 2) + [_format_number(low)] if rows > 1
+                              else [_format_number(high)], cell, label_scale, align_right=False)
+
+    margin = 10
+    top = np.concatenate([row_labels, cells, np.full((rows * cell, margin, 3), 255, np.uint8), bar, bar_labels], 1)
+    bottom = np.full((col_labels.shape[0], top.shape[1], 3), 255, dtype=np.uint8)
+    bottom[:, row_labels.shape[1]:row_labels.shape[1] + cols * cell] = col_labels
+    data = np.concatenate([np.full((margin, top.shape[1], 3), 255, np.uint8), top, bottom], 0)
+    return np.pad(data, ((0, margin), (margin, margin), (0, 0)), constant_values=255)
+
+
+def render_line_plot(curves, fills=(), suptitle='', title='', xlabel='X', ylabel='Y', xlim=None, ylim=None,
+                     size=(640, 480)):
+    """
+    Renders line curves, optionally with shaded areas, on a grid in the style of seaborn 'darkgrid'.
+
+    Parameters
+    ----------
+    curves : list of dict
+        Each curve is a dict with the keys 'x', 'y' (numpy.ndarray), 'colour' (RGB tuple) and optionally
+        'dashed' (bool) and 'label' (str, shown in the legend)
+    fills : list of dict
+        Each shaded area is a dict with the keys 'x', 'y_low', 'y_high' (numpy.ndarray), 'colour' (RGB tuple)
+        and 'alpha' (float)
+    suptitle : str
+        Title of the plot
+    title : str
+        Sub-title of the plot
+    xlabel : str
+        Label of the x-axis
+    ylabel : str
+        Label of the y-axis
+    xlim : tuple(float,float) or None
+        Limits of the x-axis. By default the range of the data.
+    ylim : tuple(float,float) or None
+        Limits of the y-axis. By default the range of the data.
+    size : tuple(int,int)
+        Width and height of the image
+
+    Returns
+    -------
+    data : numpy.ndarray [H x W x 3]
+        RGB image of the plot
+    """
+    width, height = size
+    left, right, top, bottom = 70, 20, 55, 50
+    axes_w, axes_h = width - left - right, height - top - bottom
+
+    xs = np.concatenate([np.asarray(c['x'], dtype=np.float64) for c in curves])
+    ys = np.concatenate([np.asarray(c['y'], dtype=np.float64) for c in curves] +
+                        [np.asarray(f[k], dtype=np.float64) for f in fills for k in ['y_low', 'y_high']])
+    xlim = _limits(xs, 0.0) if xlim is None else xlim
+    ylim = _limits(ys, 0.05) if ylim is None else ylim
+
+    def to_pixels(x, y):
+        px = (np.asarray(x, dtype=np.float64) - xlim[0]) / (xlim[1] - xlim[0]) * (axes_w - 1)
+        py = (1 - (np.asarray(y, dtype=np.float64) - ylim[0]) / (ylim[1] - ylim[0])) * (axes_h - 1)
+        points = np.stack([px, py], axis=1)
+        return np.round(points[np.all(np.isfinite(points), axis=1)]).astype(np.int32)
+
+    # Axes with white grid lines at the ticks
+    axes = np.empty((axes_h, axes_w, 3), dtype=np.uint8)
+    axes[:] = AXES_BACKGROUND
+    x_ticks, y_ticks = _ticks(*xlim), _ticks(*ylim)
+    for px in to_pixels(x_ticks, np.full(len(x_ticks), ylim[0]))[:, 0]:
+        cv2.line(axes, (int(px), 0), (int(px), axes_h - 1), WHITE, 1)
+    for py in to_pixels(np.full(len(y_ticks), xlim[0]), y_ticks)[:, 1]:
+        cv2.line(axes, (0, int(py)), (axes_w - 1, int(py)), WHITE, 1)
+
+    for fill in fills:
+        upper = to_pixels(fill['x'], fill['y_high'])
+        lower = to_pixels(fill['x'], fill['y_low'])[::-1]
+        overlay = axes.copy()
+        cv2.fillPoly(overlay, [np.concatenate([upper, lower])], fill['colour'], cv2.LINE_AA)
+        axes = cv2.addWeighted(overlay, fill.get('alpha', 0.2), axes, 1 - fill.get('alpha', 0.2), 0)
+
+    for curve in curves:
+        points = to_pixels(curve['x'], curve['y'])
+        if curve.get('dashed', False):
+            _dashed_polyline(axes, points, curve['colour'])
+        else:
+            cv2.polylines(axes, [points], False, curve['colour'], 2, cv2.LINE_AA)
+
+    _legend(axes, [c for c in curves if c.get('label')])
+
+    # Figure: axes, tick labels, titles and axis labels
+    data = np.full((height, width, 3), 255, dtype=np.uint8)
+    data[top:top + axes_h, left:left + axes_w] = axes
+    for x, px in zip(x_ticks, to_pixels(x_ticks, np.full(len(x_ticks), ylim[0]))[:, 0]):
+        _put_text(data, _format_number(x), (left + px, top + axes_h + 6), 0.4, 'center', 'top')
+    for y, py in zip(y_ticks, to_pixels(np.full(len(y_ticks), xlim[0]), y_ticks)[:, 1]):
+        _put_text(data, _format_number(y), (left - 6, top + py), 0.4, 'right', 'center')
+    _put_text(data, suptitle, (width // 2, 8), 0.6, 'center', 'top')
+    _put_text(data, title, (left + axes_w // 2, 32), 0.5, 'center', 'top')
+    _put_text(data, xlabel, (left + axes_w // 2, height - 8), 0.5, 'center', 'bottom')
+
+    (w, h), baseline = cv2.getTextSize(ylabel, FONT, 0.5, 1)
+    label = np.full((h + baseline + 4, w + 4, 3), 255, dtype=np.uint8)
+    _put_text(label, ylabel, (2, 2), 0.5, 'left', 'top')
+    label = np.rot90(label, k=1)
+    y0 = max(0, top + (axes_h - label.shape[0]) // 2)
+    data[y0:y0 + label.shape[0], 4:4 + label.shape[1]] = label[:height - y0]
+    return data
+
+
+def _text_column(texts, cell, font_scale, align_right):
+    """Renders the texts one below each other, each centered in a row of height `cell`"""
+    widths = [cv2.getTextSize(t, FONT, font_scale, 1)[0][0] for t in texts]
+    width = max(widths + [0]) + 12
+    column = np.full((len(texts) * cell, width, 3), 255, dtype=np.uint8)
+    for i, text in enumerate(texts):
+        x = width - 6 if align_right else 6
+        _put_text(column, text, (x, i * cell + cell // 2), font_scale, 'right' if align_right else 'left', 'center')
+    return column
+
+
+def _put_text(image, text, position, font_scale, horizontal='left', vertical='top', colour=TEXT_COLOUR):
+    """Writes text on the image, aligned with respect to the position"""
+    if not text:
+        return
+    (w, h), _ = cv2.getTextSize(text, FONT, font_scale, 1)
+    x, y = int(position[0]), int(position[1])
+    x -= {'left': 0, 'center': w // 2, 'right': w}[horizontal]
+    y += {'top': h, 'center': h // 2, 'bottom': 0}[vertical]
+    cv2.putText(image, text, (x, y), FONT, font_scale, colour, 1, cv2.LINE_AA)
+
+
+def _dashed_polyline(image, points, colour, dash=8, gap=5):
+    """Draws a dashed polyline. The pattern continues across the vertices."""
+    if len(points) < 2:
+        return
+    segments = np.diff(points, axis=0).astype(np.float64)
+    lengths = np.hypot(segments[:, 0], segments[:, 1])
+    start = np.concatenate([[0], np.cumsum(lengths)])
+    for on in np.arange(0, start[-1], dash + gap):
+        # Points of the polyline at distance [on, on + dash] from its beginning
+        distances = np.concatenate([[on], start[(start > on) & (start < on + dash)], [min(on + dash, start[-1])]])
+        x = np.interp(distances, start, points[:, 0])
+        y = np.interp(distances, start, points[:, 1])
+        cv2.polylines(image, [np.round(np.stack([x, y], axis=1)).astype(np.int32)], False, colour, 1, cv2.LINE_AA)
+
+
+def _legend(axes, curves):
+    """Draws the legend of the labelled curves in the upper right corner of the axes"""
+    if not curves:
+        return
+    font_scale, line_h, sample_w = 0.4, 18, 24
+    text_w = max(cv2.getTextSize(c['label'], FONT, font_scale, 1)[0][0] for c in curves)
+    box_w, box_h = text_w + sample_w + 20, line_h * len(curves) + 8
+    x0, y0 = axes.shape[1] - box_w - 8, 8
+    cv2.rectangle(axes, (x0, y0), (x0 + box_w, y0 + box_h), WHITE, -1)
+    cv2.rectangle(axes, (x0, y0), (x0 + box_w, y0 + box_h), (204, 204, 204), 1)
+    for i, curve in enumerate(curves):
+        y = y0 + 4 + i * line_h + line_h // 2
+        sample = np.array([[x0 + 6, y], [x0 + 6 + sample_w, y]], dtype=np.int32)
+        if curve.get('dashed', False):
+            _dashed_polyline(axes, sample, curve['colour'], dash=6, gap=3)
+        else:
+            cv2.polylines(axes, [sample], False, curve['colour'], 2, cv2.LINE_AA)
+        _put_text(axes, curve['label'], (x0 + sample_w + 12, y), font_scale, 'left', 'center')
+
+
+def _limits(values, padding):
+    """Range of the finite values, enlarged by `padding` times the range on each side"""
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return 0.0, 1.0
+    low, high = float(values.min()), float(values.max())
+    if high == low:
+        return low - 1, high + 1
+    span = high - low
+    return low - padding * span, high + padding * span
+
+
+def _ticks(low, high, n=6):
+    """About n round values (multiples of 1, 2 or 5 times a power of 10) within [low, high]"""
+    raw_step = (high - low) / n
+    magnitude = 10 ** np.floor(np.log10(raw_step))
+    step = magnitude * min([m for m in [1, 2, 5, 10] if m * magnitude >= raw_step])
+    # Adding 0 turns -0.0 into 0.0
+    return np.arange(np.ceil(low / step) * step, high + step * 1e-6, step) + 0.0
+
+
+def _format_number(value):
+    """Short representation of a number for tick labels"""
+    return '{:g}'.format(float('{:.4g}'.format(value)))
@@ -0,0 +1,32 @@
+import numpy as np
+
+from util.visualization.decision_boundaries import _COLORMAP_LUTS, decision_boundary_image
+
+
+def test_decision_boundary_image():
+    # Grid of 3 locations along x and 2 along y, the points in x-major order: (x0, y0), (x0, y1), (x1, y0), ...
+    winners = np.array([0, 1, 0, 1, 0, 2])
+    confidence = np.array([0.2, 0.5, 0.6, 0.9, 1.0, 0.7])
+
+    image = decision_boundary_image(winners, confidence, (3, 2))
+
+    # Each class is scaled between its min and max confidence, a single value being the lowest color
+    expected = np.array([[_COLORMAP_LUTS[1][0], _COLORMAP_LUTS[1][255], _COLORMAP_LUTS[2][0]],
+                         [_COLORMAP_LUTS[0][0], _COLORMAP_LUTS[0][128], _COLORMAP_LUTS[0][255]]])
+    assert image.dtype == np.uint8
+    assert image.shape == (2, 3, 3)
+    # The first row is the highest y and the columns go along x
+    assert (image == expected).all()
+
+
+def test_decision_boundary_image_meshgrid():
+    # The grid of the bidimensional runner: x-major points of a meshgrid indexed 'ij'
+    grid_x, grid_y = np.meshgrid(np.linspace(0, 1, 4), np.linspace(0, 1, 3), indexing='ij')
+    winners = (grid_x.ravel() > 0.5).astype(np.int64)
+    confidence = 0.2 + 0.8 * grid_y.ravel()
+
+    image = decision_boundary_image(winners, confidence, grid_x.shape)
+
+    assert image.shape == (3, 4, 3)
+    assert (image[:, :2] == _COLORMAP_LUTS[0][[255, 128, 0]][:, None]).all()
+    assert (image[:, 2:] == _COLORMAP_LUTS[1][[255, 128, 0]][:, None]).all()
@@ -55,7 +55,7 @@ def main(args):
     None
 
     """
-    model = models.__dict__[args.model_name](pretrained=args.pretrained)
+    model = models.get_model(args.model_name)(pretrained=args.pretrained)
 
     # Resume from checkpoint
     if args.checkpoint: